@@ -0,0 +1,206 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import sys
+
+from twisted.internet import defer
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.DataCollector.zendisc import ZenDisc
+
+
+class FakeDiscoverService(object):
+    """
+    Records remote calls.  The calls zendisc waits for are answered by the
+    test, in the order they were made.
+    """
+    immediate = ('pingStatus', 'succeedDiscovery')
+
+    def __init__(self):
+        self.calls = []
+        self.pending = []
+
+    def callRemote(self, method, *args, **kw):
+        self.calls.append((method,) + args)
+        if method in self.immediate:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.pending.append((method, d))
+        return d
+
+    def _next(self, method):
+        for i, (name, d) in enumerate(self.pending):
+            if name == method:
+                del self.pending[i]
+                return d
+        raise AssertionError("No %s call is waiting" % method)
+
+    def answer(self, method, result):
+        self._next(method).callback(result)
+
+    def fail(self, method, error):
+        self._next(method).errback(error)
+
+    def callsOf(self, method):
+        return [call[1:] for call in self.calls if call[0] == method]
+
+
+class FakeDevice(object):
+    temp_device = False
+
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeNetwork(object):
+    zAutoDiscover = True
+
+    def __init__(self, name, ips):
+        self.name = name
+        self.ips = ips
+
+    def children(self):
+        return []
+
+    def getNetworkName(self):
+        return self.name
+
+    def fullIpList(self):
+        return self.ips
+
+
+class FakePingResult(object):
+    isUp = True
+
+    def __init__(self, address):
+        self.address = address
+
+
+class TestZenDisc(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestZenDisc, self).afterSetUp()
+        self.before, sys.argv = sys.argv, ['zendisc',
+                                           '--ping-parallel=2',
+                                           '--discover-parallel=3',
+                                           '--create-parallel=1']
+        self.disc = ZenDisc()
+        self.hub = FakeDiscoverService()
+        self.disc.config = lambda: self.hub
+        self.events = []
+        self.disc.sendEvent = self.events.append
+
+    def beforeTearDown(self):
+        sys.argv = self.before
+        super(TestZenDisc, self).beforeTearDown()
+
+    def fakeProbes(self):
+        """
+        Replace the SNMP and DNS probe of an IP with a deferred that the
+        test fires, returning the dictionary of those by IP.
+        """
+        probes = {}
+
+        def probe(ip, devicepath, prodState, deviceConfig):
+            d = probes[ip] = defer.Deferred()
+            return d
+        self.disc._probeDevice = probe
+        return probes
+
+    def testCachedRemote(self):
+        results = []
+        first = self.disc.cachedRemote('getDeviceClassSnmpConfig', '/Server')
+        second = self.disc.cachedRemote('getDeviceClassSnmpConfig', '/Server')
+        other = self.disc.cachedRemote('getDeviceClassSnmpConfig', '/Network')
+        # Calls in flight are shared
+        self.assertEqual(self.hub.calls,
+                         [('getDeviceClassSnmpConfig', '/Server'),
+                          ('getDeviceClassSnmpConfig', '/Network')])
+        first.addCallback(results.append)
+        second.addCallback(results.append)
+        self.hub.answer('getDeviceClassSnmpConfig', {'zSnmpPort': 161})
+        self.assertEqual(results, [{'zSnmpPort': 161}] * 2)
+        # and results are kept for the run
+        self.disc.cachedRemote('getDeviceClassSnmpConfig', '/Server'
+                               ).addCallback(results.append)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self.hub.calls), 2)
+        # but failures are not
+        failures = []
+        other.addErrback(failures.append)
+        self.hub.fail('getDeviceClassSnmpConfig', RuntimeError('hub is down'))
+        self.assertEqual(len(failures), 1)
+        self.disc.cachedRemote('getDeviceClassSnmpConfig', '/Network')
+        self.assertEqual(len(self.hub.calls), 3)
+
+    def testPingParallel(self):
+        pings = []
+
+        def pingMany(ipList):
+            d = defer.Deferred()
+            pings.append(d)
+            return d
+        self.disc.pingMany = pingMany
+        nets = [FakeNetwork('10.0.%d.0' % i, ['10.0.%d.1' % i])
+                for i in range(4)]
+        ips = []
+        self.disc.discoverIps(nets).addCallback(ips.extend)
+        self.assertEqual(len(pings), 2)
+        # Networks are reported in order, whatever order their pings end in
+        pings[1].callback([FakePingResult('10.0.1.1')])
+        self.assertEqual(len(pings), 3)
+        self.assertEqual(self.hub.callsOf('pingStatus'), [])
+        pings[0].callback([FakePingResult('10.0.0.1')])
+        self.assertEqual(len(pings), 4)
+        self.assertEqual([call[0] for call in self.hub.callsOf('pingStatus')],
+                         nets[:2])
+        pings[3].callback([FakePingResult('10.0.3.1')])
+        pings[2].callback([FakePingResult('10.0.2.1')])
+        self.assertEqual([call[0] for call in self.hub.callsOf('pingStatus')],
+                         nets)
+        self.assertEqual(ips, ['10.0.0.1', '10.0.1.1', '10.0.2.1',
+                               '10.0.3.1'])
+
+    def testDiscoverAndCreateParallel(self):
+        probes = self.fakeProbes()
+        ips = ['10.0.0.%d' % i for i in range(1, 7)]
+        devices = []
+        self.disc.discoverDevices(ips).addCallback(devices.extend)
+        self.assertEqual(sorted(probes), ips[:3])
+        for ip in ips[:3]:
+            probes[ip].callback(dict(deviceName=ip))
+        # Each finished probe starts the next one, creations wait in line
+        self.assertEqual(sorted(probes), ips)
+        self.assertEqual(self.hub.callsOf('createDevice'), [(ips[0],)])
+        for ip in ips[3:]:
+            probes[ip].callback(dict(deviceName=ip))
+        for i, ip in enumerate(ips):
+            self.assertEqual(len(self.hub.callsOf('createDevice')), i + 1)
+            self.hub.answer('createDevice', (FakeDevice(ip), True))
+        self.assertEqual([dev.id for dev in devices], ips)
+
+    def testDiscoveredInIpOrder(self):
+        probes = self.fakeProbes()
+        ips = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+        devices = []
+        self.disc.discoverDevices(ips).addCallback(devices.extend)
+        for ip in reversed(ips):
+            name = 'dev' + ip[-1]
+            probes[ip].callback(dict(deviceName=name))
+            self.hub.answer('createDevice', (FakeDevice(name), True))
+        self.assertEqual([dev.id for dev in devices],
+                         ['dev1', 'dev2', 'dev3'])
+        self.assertEqual(self.disc.discovered, ['dev1', 'dev2', 'dev3'])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestZenDisc))
+    return suite
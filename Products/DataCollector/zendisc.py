@@ -28,6 +28,7 @@ from optparse import SUPPRESS_HELP
 
 from twisted.internet import defer, reactor
 from twisted.names.error import DNSNameError
+from twisted.python.failure import Failure
 
 import Globals
 
@@ -85,6 +86,14 @@ class ZenDisc(ZenModeler):
         """
         ZenModeler.__init__(self, single)
         self.discovered = []
+        self._remoteResults = {}
+        self._remoteWaiters = {}
+        self._pings = defer.DeferredSemaphore(
+            max(self.options.pingParallel, 1))
+        self._probes = defer.DeferredSemaphore(
+            max(self.options.discoverParallel, 1))
+        self._creates = defer.DeferredSemaphore(
+            max(self.options.createParallel, 1))
 
     def config(self):
         """
@@ -95,6 +104,37 @@ class ZenDisc(ZenModeler):
         """
         return self.services.get('DiscoverService', FakeRemote())
 
+    def cachedRemote(self, method, *args):
+        """
+        Call a DiscoverService method once per set of arguments for the
+        whole run.  Callers asking while the call is in flight share it;
+        failed calls are not remembered.
+
+        @return: Twisted deferred
+        """
+        key = (method,) + args
+        if key in self._remoteResults:
+            return defer.succeed(self._remoteResults[key])
+        d = defer.Deferred()
+        waiters = self._remoteWaiters.get(key)
+        if waiters is not None:
+            waiters.append(d)
+            return d
+        waiters = self._remoteWaiters[key] = [d]
+
+        def done(result):
+            del self._remoteWaiters[key]
+            if isinstance(result, Failure):
+                for waiter in waiters:
+                    waiter.errback(result)
+            else:
+                self._remoteResults[key] = result
+                for waiter in waiters:
+                    waiter.callback(result)
+
+        self.config().callRemote(method, *args).addBoth(done)
+        return d
+
     @defer.inlineCallbacks
     def pingMany(self, ipList):
         """
@@ -118,6 +158,7 @@ class ZenDisc(ZenModeler):
         @rtype: Twisted deferred
         """
         ips = []
+        pings = []
         for net in nets:
             if self.options.subnets and len(net.children()) > 0:
                 continue
@@ -128,17 +169,28 @@ class ZenDisc(ZenModeler):
                 )
                 continue
             self.log.info("Discover network '%s'", net.getNetworkName())
-            results = yield self.pingMany(net.fullIpList())
-            goodips, badips = _partitionPingResults(results)
-            self.log.debug(
-                "Found %d good IPs and %d bad IPs", len(goodips), len(badips)
-            )
-            yield self.config().callRemote(
-                "pingStatus", net, goodips, badips,
-                self.options.resetPtr, self.options.addInactive
-            )
-            ips += goodips
-            self.log.info("Discovered %s active ips", len(ips))
+            pings.append(
+                (net, self._pings.run(self.pingMany, net.fullIpList())))
+        # Networks are pinged in parallel but reported in order
+        try:
+            for net, ping in pings:
+                results = yield ping
+                goodips, badips = _partitionPingResults(results)
+                self.log.debug(
+                    "Found %d good IPs and %d bad IPs in '%s'",
+                    len(goodips), len(badips), net.getNetworkName()
+                )
+                yield self.config().callRemote(
+                    "pingStatus", net, goodips, badips,
+                    self.options.resetPtr, self.options.addInactive
+                )
+                ips += goodips
+                self.log.info("Discovered %s active ips", len(ips))
+        except Exception:
+            # The pings of the remaining networks are no longer wanted
+            for net, ping in pings:
+                ping.addErrback(lambda failure: None)
+            raise
         defer.returnValue(ips)
 
     @defer.inlineCallbacks
@@ -228,11 +280,22 @@ class ZenDisc(ZenModeler):
             devicepath = self.options.deviceclass
         if prodState is None:
             prodState = self.options.productionState
-        devices = []
-        for ip in ips:
-            device = yield self.discoverDevice(ip, devicepath, prodState)
-            if device is not None:
-                devices.append(device)
+        first = len(self.discovered)
+        # discoverDevice bounds the SNMP probes and device creations in
+        # flight; the results keep the order of the ips.
+        results = yield defer.DeferredList(
+            [self.discoverDevice(ip, devicepath, prodState) for ip in ips],
+            consumeErrors=True
+        )
+        devices = [dev for success, dev in results
+                   if success and dev is not None]
+        order = {}
+        for position, dev in enumerate(devices):
+            order.setdefault(dev.id, position)
+        self.discovered[first:] = sorted(
+            self.discovered[first:],
+            key=lambda devId: order.get(devId, len(devices))
+        )
         defer.returnValue(devices)
 
     @defer.inlineCallbacks
@@ -252,7 +315,7 @@ class ZenDisc(ZenModeler):
         @rtype: deferred: Twisted deferred
         """
         self.log.debug("Doing SNMP lookup on device %s", ip)
-        snmp_conf = yield self.config().callRemote(
+        snmp_conf = yield self.cachedRemote(
             'getDeviceClassSnmpConfig', devicePath)
 
         configs = []
@@ -286,12 +349,13 @@ class ZenDisc(ZenModeler):
             self.log.debug("Override acquired community strings")
             # Use a default set of SNMP community strings if the device
             # class has none configured.
-            communities = snmp_conf['zSnmpCommunities'] or DEFAULT_COMMUNITIES
+            communities = list(
+                snmp_conf['zSnmpCommunities'] or DEFAULT_COMMUNITIES)
 
             # If they exist, use this device's SNMP community strings instead
             # of the strings from the device class.
             if deviceSnmpCommunities:
-                communities = deviceSnmpCommunities
+                communities = list(deviceSnmpCommunities)
 
             # Reverse the communities so that ones earlier in the list have a
             # higher weight.
@@ -340,131 +404,12 @@ class ZenDisc(ZenModeler):
                 defer.returnValue(None)
 
         try:
-            kw = dict(
-                deviceName=ip,
-                discoverProto=None,
-                devicePath=devicepath,
-                performanceMonitor=self.options.monitor,
-                locationPath=self.options.location,
-                groupPaths=self.options.groups,
-                systemPaths=self.options.systems,
-                productionState=prodState
+            kw = yield self._probes.run(
+                self._probeDevice, ip, devicepath, prodState, deviceConfig
             )
-
-            # If zProperties are set via a job, get them and pass them in
-            if self.options.job:
-                job_props = yield self.config().callRemote(
-                    'getJobProperties', self.options.job
-                )
-                if job_props is not None:
-                    # grab zProperties from Job
-                    kw['zProperties'] = getattr(job_props, 'zProperties', {})
-                    # grab other Device properties from jobs
-                    # deviceProps = job_props.get('deviceProps', {})
-                    # kw.update(deviceProps)
-                    # @FIXME we are not getting deviceProps, check calling
-                    #  chain for clues. twisted upgrade heartburn perhaps?
-
-            # if we are using SNMP, lookup the device SNMP info and use the
-            # name defined there for deviceName
-            if not self.options.nosnmp:
-                self.log.debug("Scanning device with address %s", ip)
-                zProps = kw.get('zProperties', {})
-                deviceSnmpCommunities = zProps.get('zSnmpCommunities', None)
-                if not deviceSnmpCommunities and deviceConfig:
-                    deviceSnmpCommunities = getattr(
-                        deviceConfig, 'zSnmpCommunities', None)
-
-                snmp_config = yield self.findRemoteDeviceInfo(
-                    ip, devicepath, deviceSnmpCommunities
-                )
-                if snmp_config:
-                    if snmp_config.sysName:
-                        kw['deviceName'] = snmp_config.sysName
-                    if snmp_config.version:
-                        kw['zSnmpVer'] = snmp_config.version
-                    if snmp_config.port:
-                        kw['zSnmpPort'] = snmp_config.port
-                    if snmp_config.community:
-                        kw['zSnmpCommunity'] = snmp_config.community
-
-                # Since we did not find any snmp info and we are in
-                # strict discovery mode, do not create a device
-                elif self.options.zSnmpStrictDiscovery:
-                    self.log.info(
-                        "zSnmpStrictDiscovery is True. "
-                        "Not creating device for %s.", ip
-                    )
-                    defer.returnValue(None)
-
-            # RULES FOR DEVICE NAMING:
-            # 1. If zPreferSnmpNaming is true:
-            #        If snmp name is returned, use snmp name. Otherwise,
-            #        use the passed device name.  If no device name was passed,
-            #        do a dns lookup on the ip.
-            # 2. If zPreferSnmpNaming is false:
-            #        If we are discovering a single device and a name is
-            #        passed in instead of an IP, use the passed-in name.
-            #        Otherwise, do a dns lookup on the ip.
-            if self.options.zPreferSnmpNaming and not isip(kw['deviceName']):
-                # In this case, we want to keep kw['deviceName'] as-is,
-                # because it is what we got from snmp
-                pass
-            elif self.options.device and not isip(self.options.device):
-                kw['deviceName'] = self.options.device
-            else:
-                # An IP was passed in so we do a reverse lookup on it to get
-                # deviceName
-                try:
-                    kw["deviceName"] = yield asyncNameLookup(ip)
-                except Exception as ex:
-                    self.log.debug("Failed to lookup %s (%s)", ip, ex)
-
-            # If it's discovering a particular device,
-            # ignore zAutoDiscover limitations
-            forceDiscovery = bool(self.options.device)
-
-            # now create the device by calling zenhub
-            result = None
-            try:
-                result = yield self.config().callRemote(
-                    'createDevice', ipunwrap(ip), force=forceDiscovery, **kw
-                )
-            except Exception as ex:
-                raise ZentinelException(ex)
-
-            self.log.debug("Got result from remote_createDevice: %s", result)
-            dev, created = result
-
-            # if no device came back from createDevice we assume that it
-            # was told to not auto-discover the device.  This seems very
-            # dubious to me! -EAD
-            if not dev:
-                self.log.info("IP '%s' on no auto-discover, skipping", ip)
+            if kw is None:
                 defer.returnValue(None)
-
-            # A device came back and it already existed.
-            if not created and not dev.temp_device:
-                # if we shouldn't remodel skip the device by returning
-                # at the end of this block
-                if not self.options.remodel:
-                    self.log.info("Found IP '%s' on device '%s';"
-                                  " skipping discovery", ip, dev.id)
-                    if self.options.device:
-                        self.setExitCode(3)
-                    defer.returnValue(dev)
-                else:
-                    # we continue on to model the device.
-                    self.log.info("IP '%s' on device '%s' remodel",
-                                  ip, dev.id)
-            self.sendDiscoveredEvent(ip, dev)
-
-            # the device that we found/created or that should be remodeled
-            # is added to the list of devices to be modeled later
-            if not self.options.nosnmp:
-                self.discovered.append(dev.id)
-
-            yield self.config().callRemote('succeedDiscovery', dev.id)
+            dev = yield self._creates.run(self._createDiscoveredDevice, ip, kw)
             defer.returnValue(dev)
         except ZentinelException as e:
             self.log.exception(e)
@@ -484,6 +429,152 @@ class ZenDisc(ZenModeler):
         finally:
             self.log.info("Finished scanning device with address %s", ip)
 
+    @defer.inlineCallbacks
+    def _probeDevice(self, ip, devicepath, prodState, deviceConfig):
+        """
+        Work out how to create the device at the given IP address: its
+        name, from SNMP or DNS, and its SNMP settings.
+
+        @return: Twisted deferred of the createDevice keyword arguments,
+            or None if no device should be created
+        """
+        kw = dict(
+            deviceName=ip,
+            discoverProto=None,
+            devicePath=devicepath,
+            performanceMonitor=self.options.monitor,
+            locationPath=self.options.location,
+            groupPaths=self.options.groups,
+            systemPaths=self.options.systems,
+            productionState=prodState
+        )
+
+        # If zProperties are set via a job, get them and pass them in
+        if self.options.job:
+            job_props = yield self.cachedRemote(
+                'getJobProperties', self.options.job
+            )
+            if job_props is not None:
+                # grab zProperties from Job
+                kw['zProperties'] = getattr(job_props, 'zProperties', {})
+                # grab other Device properties from jobs
+                # deviceProps = job_props.get('deviceProps', {})
+                # kw.update(deviceProps)
+                # @FIXME we are not getting deviceProps, check calling
+                #  chain for clues. twisted upgrade heartburn perhaps?
+
+        # if we are using SNMP, lookup the device SNMP info and use the
+        # name defined there for deviceName
+        if not self.options.nosnmp:
+            self.log.debug("Scanning device with address %s", ip)
+            zProps = kw.get('zProperties', {})
+            deviceSnmpCommunities = zProps.get('zSnmpCommunities', None)
+            if not deviceSnmpCommunities and deviceConfig:
+                deviceSnmpCommunities = getattr(
+                    deviceConfig, 'zSnmpCommunities', None)
+
+            snmp_config = yield self.findRemoteDeviceInfo(
+                ip, devicepath, deviceSnmpCommunities
+            )
+            if snmp_config:
+                if snmp_config.sysName:
+                    kw['deviceName'] = snmp_config.sysName
+                if snmp_config.version:
+                    kw['zSnmpVer'] = snmp_config.version
+                if snmp_config.port:
+                    kw['zSnmpPort'] = snmp_config.port
+                if snmp_config.community:
+                    kw['zSnmpCommunity'] = snmp_config.community
+
+            # Since we did not find any snmp info and we are in
+            # strict discovery mode, do not create a device
+            elif self.options.zSnmpStrictDiscovery:
+                self.log.info(
+                    "zSnmpStrictDiscovery is True. "
+                    "Not creating device for %s.", ip
+                )
+                defer.returnValue(None)
+
+        # RULES FOR DEVICE NAMING:
+        # 1. If zPreferSnmpNaming is true:
+        #        If snmp name is returned, use snmp name. Otherwise,
+        #        use the passed device name.  If no device name was passed,
+        #        do a dns lookup on the ip.
+        # 2. If zPreferSnmpNaming is false:
+        #        If we are discovering a single device and a name is
+        #        passed in instead of an IP, use the passed-in name.
+        #        Otherwise, do a dns lookup on the ip.
+        if self.options.zPreferSnmpNaming and not isip(kw['deviceName']):
+            # In this case, we want to keep kw['deviceName'] as-is,
+            # because it is what we got from snmp
+            pass
+        elif self.options.device and not isip(self.options.device):
+            kw['deviceName'] = self.options.device
+        else:
+            # An IP was passed in so we do a reverse lookup on it to get
+            # deviceName
+            try:
+                kw["deviceName"] = yield asyncNameLookup(ip)
+            except Exception as ex:
+                self.log.debug("Failed to lookup %s (%s)", ip, ex)
+        defer.returnValue(kw)
+
+    @defer.inlineCallbacks
+    def _createDiscoveredDevice(self, ip, kw):
+        """
+        Create (or find) the device probed at the given IP address through
+        zenhub.
+
+        @return: Twisted deferred of the device, or None if zenhub didn't
+            create it
+        """
+        # If it's discovering a particular device,
+        # ignore zAutoDiscover limitations
+        forceDiscovery = bool(self.options.device)
+
+        # now create the device by calling zenhub
+        result = None
+        try:
+            result = yield self.config().callRemote(
+                'createDevice', ipunwrap(ip), force=forceDiscovery, **kw
+            )
+        except Exception as ex:
+            raise ZentinelException(ex)
+
+        self.log.debug("Got result from remote_createDevice: %s", result)
+        dev, created = result
+
+        # if no device came back from createDevice we assume that it
+        # was told to not auto-discover the device.  This seems very
+        # dubious to me! -EAD
+        if not dev:
+            self.log.info("IP '%s' on no auto-discover, skipping", ip)
+            defer.returnValue(None)
+
+        # A device came back and it already existed.
+        if not created and not dev.temp_device:
+            # if we shouldn't remodel skip the device by returning
+            # at the end of this block
+            if not self.options.remodel:
+                self.log.info("Found IP '%s' on device '%s';"
+                              " skipping discovery", ip, dev.id)
+                if self.options.device:
+                    self.setExitCode(3)
+                defer.returnValue(dev)
+            else:
+                # we continue on to model the device.
+                self.log.info("IP '%s' on device '%s' remodel",
+                              ip, dev.id)
+        self.sendDiscoveredEvent(ip, dev)
+
+        # the device that we found/created or that should be remodeled
+        # is added to the list of devices to be modeled later
+        if not self.options.nosnmp:
+            self.discovered.append(dev.id)
+
+        yield self.config().callRemote('succeedDiscovery', dev.id)
+        defer.returnValue(dev)
+
     @defer.inlineCallbacks
     def collectNet(self):
         """
@@ -527,13 +618,9 @@ class ZenDisc(ZenModeler):
                 )
         self.log.info("Working on devices: %s", devices)
 
-        foundDevices = []
-        for device in devices:
-            result = yield self.discoverDevice(
-                device, self.options.deviceclass, self.options.productionState
-            )
-            if result is not None:
-                foundDevices.append(result)
+        foundDevices = yield self.discoverDevices(
+            devices, self.options.deviceclass, self.options.productionState
+        )
         defer.returnValue(foundDevices)
 
     @defer.inlineCallbacks
@@ -685,6 +772,16 @@ class ZenDisc(ZenModeler):
         self.parser.add_option('--chunk', dest='chunkSize',
             default=10, type="int",
             help="Number of in-flight ping packets")
+        self.parser.add_option('--ping-parallel', dest='pingParallel',
+            default=4, type="int",
+            help="Number of networks to ping in parallel")
+        self.parser.add_option('--discover-parallel', dest='discoverParallel',
+            default=10, type="int",
+            help="Number of IPs to probe with SNMP and DNS in parallel")
+        self.parser.add_option('--create-parallel', dest='createParallel',
+            default=2, type="int",
+            help="Number of discovered devices to create in zenhub "
+                 "in parallel")
         self.parser.add_option('--snmp-missing', dest='snmpMissing',
             action="store_true", default=False,
             help="Send an event if SNMP is not found on the device")
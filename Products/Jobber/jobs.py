@@ -164,11 +164,14 @@ class Job(Task):
         raise NoSuchJobException(job_id)
 
     def _check_aborted(self, job_id):
+        store = getattr(self.app.backend, 'store', None)
         try:
             while True:
-                self.dmd._p_jar.sync()
+                if store is None:
+                    self.dmd._p_jar.sync()
                 try:
-                    status = self.app.backend.get_status(job_id)
+                    status = self.app.backend.get_status(job_id) \
+                        if store is None else store.getStatus(job_id)
                 except NoSuchJobException:
                     status = states.ABORTED
                 if status == states.ABORTED and \
@@ -11,6 +11,7 @@
 import os
 
 from datetime import datetime, timedelta
+from itertools import islice
 from uuid import uuid4
 
 import transaction
@@ -261,17 +262,27 @@ class JobManager(ZenModelRM):
         if not isinstance(user, basestring):
             user = user.getId()
 
-        # Add job metadata to the database
-        meta = JobRecord(
-                id=job_id,
+        properties = dict(dict(
                 user=user,
                 job_name=job.name,
                 job_type=job.getJobType(),
                 job_description=desc,
                 date_scheduled=datetime.utcnow(),
-            )
-        for prop, propval in properties.iteritems():
-            setattr(meta, prop, propval)
+            ), **properties)
+        store = self.getJobStore()
+        if store is not None:
+            # Like the dispatch, wait for the commit so that an aborted
+            # transaction leaves no job behind.
+            def hook(success):
+                if success:
+                    store.save(job_id, **properties)
+            transaction.get().addAfterCommitHook(hook)
+            if not store.archive:
+                log.info("Created job %s: %s", job, job_id)
+                return self._makeRecord(dict(properties, id=job_id))
+
+        # Add job metadata to the database
+        meta = JobRecord(id=job_id, **properties)
         self._setOb(job_id, meta)
         jobrecord = self._getOb(job_id)
         self.getCatalog().catalog_object(jobrecord)
@@ -281,12 +292,38 @@ class JobManager(ZenModelRM):
     def wait(self, job_id):
         return self.getJob(job_id).wait()
 
+    def getJobStore(self):
+        """
+        Return the L{JobStore} of the result backend, or None when job
+        state is kept in ZODB.
+        """
+        return getattr(current_app.backend, 'store', None)
+
+    def _makeRecord(self, properties):
+        # A JobRecord that isn't stored in ZODB
+        return JobRecord(**properties).__of__(self)
+
     def update(self, job_id, **kwargs):
         log.debug("Updating job %s with %s", job_id, kwargs)
+        store = self.getJobStore()
+        if store is not None:
+            store.update(job_id, **kwargs)
+            if store.archive:
+                self.archive(job_id, **kwargs)
+            return
         jobrecord = self.getJob(job_id)
         jobrecord.update(kwargs)
         self.getCatalog().catalog_object(jobrecord)
 
+    def archive(self, job_id, **kwargs):
+        """
+        Update the JobRecord of a job in ZODB, if there is one.
+        """
+        jobrecord = self._getOb(job_id, None)
+        if jobrecord is not None:
+            jobrecord.update(kwargs)
+            self.getCatalog().catalog_object(jobrecord)
+
     def getJob(self, jobid):
         """
         Return a L{JobRecord} object that matches the id specified.
@@ -299,6 +336,9 @@ class JobManager(ZenModelRM):
         """
         if not jobid:
             raise NoSuchJobException(jobid)
+        store = self.getJobStore()
+        if store is not None:
+            return self._makeRecord(store.get(jobid))
         try:
             return self._getOb(jobid)
         except AttributeError:
@@ -315,6 +355,11 @@ class JobManager(ZenModelRM):
             except (OSError, IOError):
                 # Did our best!
                 pass
+        store = self.getJobStore()
+        if store is not None:
+            store.delete(jobid)
+            if self._getOb(jobid, None) is None:
+                return
         self.getCatalog().uncatalog_object('/'.join(job.getPhysicalPath()))
         return self._delObject(jobid)
 
@@ -327,6 +372,13 @@ class JobManager(ZenModelRM):
                     return typ.__name__
             return typ
 
+        store = self.getJobStore()
+        if store is not None:
+            for properties in store.getByStatus(
+                    statuses, _normalizeJobType(jobtype)):
+                yield self._makeRecord(properties)
+            return
+
         # build additional query qualifiers based on named args
         query = {}
         if jobtype is not None:
@@ -381,6 +433,25 @@ class JobManager(ZenModelRM):
         """
         return self._getByStatus(states.ALL_STATES, type_)
 
+    def searchJobs(self, user=None, sort_on='scheduled', reverse=False,
+                   start=0, limit=None):
+        """
+        Return a (jobs, total) tuple of a page of JobRecords sorted by
+        sort_on, optionally only those created by user.
+        """
+        store = self.getJobStore()
+        if store is not None:
+            jobs, total = store.search(user, sort_on, reverse, start, limit)
+            return [self._makeRecord(p) for p in jobs], total
+        query = dict(sort_on=sort_on,
+                     sort_order='descending' if reverse else 'ascending')
+        if user is not None:
+            query['user'] = user
+        brains = self.getCatalog()(**query)
+        stop = None if limit is None else start + limit
+        return [b.getObject() for b in islice(brains, start, stop)], \
+            len(brains)
+
     security.declareProtected(ZEN_MANAGE_DMD, 'deleteUntil')
     def deleteUntil(self, untiltime):
         """
@@ -402,6 +473,10 @@ class JobManager(ZenModelRM):
         """
         Clear out all finished jobs.
         """
+        if self.getJobStore() is not None:
+            for job in list(self.getAllJobs()):
+                self.deleteJob(job.getId())
+            return
         for b in self.getCatalog()():
             self.deleteJob(b.getObject().getId())
 
@@ -74,6 +74,11 @@ BASE_ATTRIBUTES = ('id',
 
 
 class CollectorConfigService(HubService, ThresholdMixin):
+
+    # Maximum number of devices whose changes are pushed to the collectors
+    # in one call
+    pushBatchSize = 500
+
     def __init__(self, dmd, instance, deviceProxyAttributes=()):
         """
         Constructs a new CollectorConfig instance.
@@ -98,7 +103,8 @@ class CollectorConfigService(HubService, ThresholdMixin):
 
         # When about to notify daemons about device changes, wait for a little
         # bit to batch up operations.
-        self._procrastinator = Procrastinate(self._pushConfig)
+        self._procrastinator = Procrastinate(self._pushConfigs,
+                                             batchSize=self.pushBatchSize)
         self._reconfigProcrastinator = Procrastinate(self._pushReconfigure)
 
         self._notifier = component.getUtility(IBatchNotifier)
@@ -408,6 +414,53 @@ class CollectorConfigService(HubService, ThresholdMixin):
 
         return defer.DeferredList(deferreds)
 
+    def _pushConfigs(self, devices):
+        """
+        Push the configs and deletes of many devices with one
+        updateDeviceConfigs and one deleteDevices call per collector.
+        """
+        if self._sendDeviceProxy.im_func is not \
+                CollectorConfigService._sendDeviceProxy.im_func:
+            # Proxies are sent some other way; send them one by one
+            return defer.DeferredList([self._pushConfig(device)
+                                       for device in devices])
+        proxies = []
+        deletes = []
+        for device in devices:
+            deviceProxies = None
+            if self._perfIdFilter(device) and self._filterDevice(device):
+                deviceProxies = self._wrapFunction(self._createDeviceProxies,
+                                                   device)
+                if deviceProxies:
+                    self._wrapFunction(self._postCreateDeviceProxy,
+                                       deviceProxies)
+            if deviceProxies:
+                proxies.extend(deviceProxies)
+                continue
+            if hasattr(device, 'getPerformanceServer'):
+                # The invalidation is only sent to the previous and current
+                # collectors
+                prev_collector = device.dmd.Monitors.primaryAq() \
+                    .getPreviousCollectorForDevice(device.id)
+                if self.instance not in (
+                        prev_collector, device.getPerformanceServer().getId()):
+                    continue
+            deletes.append(device.id)
+
+        deferreds = []
+        for listener in self.listeners:
+            if deletes:
+                deferreds.append(listener.callRemote('deleteDevices',
+                                                     Zipper.dump(deletes)))
+            options = self.listenerOptions.get(listener, None)
+            configs = filter(self._getOptionsFilter(options), proxies)
+            if configs:
+                deferreds.append(listener.callRemote('updateDeviceConfigs',
+                                                     Zipper.dump(configs)))
+        self.log.debug("Pushed %d configs and %d deletes to %d collectors",
+                       len(proxies), len(deletes), len(self.listeners))
+        return defer.DeferredList(deferreds)
+
     def _sendDeviceProxy(self, listener, proxy):
         """
         TODO
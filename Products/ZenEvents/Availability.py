@@ -39,6 +39,10 @@ CLOSED_EVENT_STATUSES = set([STATUS_CLOSED, STATUS_CLEARED,
                              STATUS_DROPPED, STATUS_AGED])
 OPEN_EVENT_STATUSES = ALL_EVENT_STATUSES - CLOSED_EVENT_STATUSES
 
+# Event summary fields needed to compute downtime
+_DOWNTIME_FIELDS = ('uuid', 'status', 'first_seen_time', 'status_change_time',
+                    'occurrence.actor.element_identifier')
+
 def _severityGreaterThanOrEqual(sev):
     """function to return a list of severities >= the given severity;
        defines severity priority using arbitrary order, instead of
@@ -275,15 +279,18 @@ class Report(object):
         create_filter_args['first_seen'] = (0,endDate)
         create_filter_args['status'] = OPEN_EVENT_STATUSES
         event_filter = zep.createEventFilter(**create_filter_args)
-        open_events = zep.getEventSummariesGenerator(event_filter)
+        open_events = zep.getEventSummariesStream(event_filter,
+                                                  fields=_DOWNTIME_FIELDS)
 
         # 2. get closed events
         create_filter_args['status_change'] = (startDate+1,)
         create_filter_args['status'] = CLOSED_EVENT_STATUSES
         event_filter = zep.createEventFilter(**create_filter_args)
-        closed_events = zep.getEventSummariesGenerator(event_filter)
+        closed_events = zep.getEventSummariesStream(event_filter,
+                                                    fields=_DOWNTIME_FIELDS)
         # must also get events from archive
-        closed_events_from_archive = zep.getEventSummariesGenerator(event_filter, archive=True)
+        closed_events_from_archive = zep.getEventSummariesStream(
+            event_filter, archive=True, fields=_DOWNTIME_FIELDS)
 
         def eventDowntime(evt):
             first = evt['first_seen_time']
@@ -8,6 +8,8 @@
 ##############################################################################
 
 
+import time
+
 import Globals
 
 from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
@@ -20,15 +22,92 @@ log = logging.getLogger("zen.notificationdao")
 
 
 class NotificationDao(object):
-    def __init__(self, dmd):
+    # Seconds between syncs of the ZODB connection when looking up the
+    # notifications of signals
+    syncInterval = 1.0
+    # Seconds for which the active state of a notification is cached. Its
+    # maintenance windows are only checked once per interval.
+    activeCacheInterval = 10.0
+
+    def __init__(self, dmd, syncInterval=None, activeCacheInterval=None):
         self.dmd = dmd
         self.notification_manager = self.dmd.getDmdRoot(NotificationSubscriptionManager.root)
         self.guidManager = GUIDManager(dmd)
+        if syncInterval is not None:
+            self.syncInterval = syncInterval
+        if activeCacheInterval is not None:
+            self.activeCacheInterval = activeCacheInterval
+        self.resetCaches()
+
+    def resetCaches(self):
+        """
+        Forget the subscriber index and the cached active states.
+        """
+        self.syncCount = 0
+        self._lastSync = None
+        self._index = None
+        self._indexSerial = None
+        self._active = {}
+        self._activeBucket = None
 
     def getNotifications(self):
         self.dmd._p_jar.sync()
         return self.notification_manager.getChildNodes()
 
+    def sync(self):
+        """
+        Sync the ZODB connection unless it was synced less than syncInterval
+        seconds ago. The subscriber index is rebuilt when notifications were
+        added or removed since the last sync.
+
+        @return: whether the connection was synced
+        @rtype: boolean
+        """
+        now = time.time()
+        if self._lastSync is not None and \
+                now - self._lastSync < self.syncInterval:
+            return False
+        self.dmd._p_jar.sync()
+        self._lastSync = now
+        self.syncCount += 1
+        manager = self.notification_manager
+        manager._p_activate()
+        if manager._p_serial != self._indexSerial:
+            self._index = None
+            self._indexSerial = manager._p_serial
+        return True
+
+    def getSubscriberIndex(self):
+        """
+        Return a dictionary mapping subscriber uuids to the list of the
+        notifications with that uuid.
+        """
+        if self._index is None:
+            index = {}
+            for notification in self.notification_manager.getChildNodes():
+                guid = self.getNotificationGuid(notification)
+                index.setdefault(guid, []).append(notification)
+            self._index = index
+        return self._index
+
+    def getNotificationGuid(self, notification):
+        return IGlobalIdentifier(notification).getGUID()
+
+    def isActive(self, notification):
+        """
+        Return notification.isActive(), cached for the current interval of
+        activeCacheInterval seconds.
+        """
+        bucket = int(time.time() // self.activeCacheInterval)
+        if bucket != self._activeBucket:
+            self._active.clear()
+            self._activeBucket = bucket
+        try:
+            return self._active[notification.id]
+        except KeyError:
+            active = self._active[notification.id] = notification.isActive()
+            return active
+
     def getSignalNotifications(self, signal):
         """
         Given a signal, find which notifications match this signal. In order to
@@ -39,14 +118,13 @@ class NotificationDao(object):
         @param signal: The signal for which to get subscribers.
         @type signal: protobuf zep.Signal
         """
+        self.sync()
         active_matching_notifications = []
-        for notification in self.getNotifications():
-            if notification.isActive():
-                if self.notificationSubscribesToSignal(notification, signal):
-                    active_matching_notifications.append(notification)
-                    log.debug('Found matching notification: %s' % notification)
-                else:
-                    log.debug('Notification "%s" does not subscribe to this signal.' % notification)
+        subscribers = self.getSubscriberIndex().get(signal.subscriber_uuid, ())
+        for notification in subscribers:
+            if self.isActive(notification):
+                active_matching_notifications.append(notification)
+                log.debug('Found matching notification: %s' % notification)
             else:
                 log.debug('Notification "%s" is not active.' % notification)
 
@@ -63,5 +141,4 @@ class NotificationDao(object):
 
         @rtype boolean
         """
-        return signal.subscriber_uuid == IGlobalIdentifier(notification).getGUID()
-
+        return signal.subscriber_uuid == self.getNotificationGuid(notification)
@@ -119,13 +119,23 @@ class MockNotificationDao(NotificationDao):
     notifications = []
     def __init__(self):
         self.guidManager = MockGuidManager()
-        pass
+        self.notification_manager = self
+        self.resetCaches()
 
     def getNotifications(self):
         return self.notifications
 
-    def notificationSubscribesToSignal(self, notification, signal):
-        return signal.subscriber_uuid == notification.guid
+    def getChildNodes(self):
+        return self.notifications
+
+    def sync(self):
+        # The notifications are local, so rebuild the index for every signal
+        self._index = None
+        self.syncCount += 1
+        return True
+
+    def getNotificationGuid(self, notification):
+        return notification.guid
 
 class MockAction(TargetableAction):
     """
@@ -134,6 +144,10 @@ class MockAction(TargetableAction):
     """
     def __init__(self):
         self.result = []
+        self.setups = 0
+
+    def setupAction(self, dmd):
+        self.setups += 1
 
     def getInfo(self, notification):
         return repr(notification)
@@ -215,6 +229,42 @@ class ProcessSignalTaskTest(BaseTestCase):
 
         assert self.emailAction.result == []
 
+    def testActionSetupOncePerSync(self):
+        """
+        Test that actions are only set up again after the dao synced.
+        """
+        self.mockDao.notifications = [active_email_notification]
+        self.taskProcessor.processSignal(test_signal1)
+        self.mockDao.sync = lambda: False
+        self.taskProcessor.processSignal(test_signal1)
+        self.assertEqual(self.emailAction.setups, 1)
+        self.assertEqual(len(self.emailAction.result), 2)
+
+    def testSubscriberIndex(self):
+        """
+        Test that only the notifications subscribed to a signal are checked
+        for being active, and that their active state is cached.
+        """
+        checked = []
+        class CountingNotification(MockNotificationSubscription):
+            def isActive(self):
+                checked.append(self.id)
+                return True
+
+        notifications = []
+        for i in range(2000):
+            notification = CountingNotification('notification%d' % i)
+            notification.guid = str(uuid4())
+            notifications.append(notification)
+        notifications[1000].guid = subscriber_uuid
+        self.mockDao.notifications = notifications
+        self.mockDao.activeCacheInterval = 1e9
+
+        for i in range(3):
+            matches = self.mockDao.getSignalNotifications(test_signal1)
+            self.assertEqual(matches, [notifications[1000]])
+        self.assertEqual(checked, ['notification1000'])
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
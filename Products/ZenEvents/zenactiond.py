@@ -56,12 +56,26 @@ class ProcessSignalTask(object):
         self.schema = getUtility(IQueueSchema)
         self.queue = self.schema.getQueue("$Signals")
 
+        # action name -> syncCount of the dao when the action was set up
+        self._actionSetups = {}
+
     def getAction(self, action):
         try:
             return getUtility(IAction, action)
         except ComponentLookupError:
             raise ActionMissingException(action)
 
+    def setupAction(self, action, notification):
+        """
+        Let the action configure itself from the dmd, once per sync of the
+        notification dao.
+        """
+        syncCount = getattr(self.notificationDao, 'syncCount', None)
+        if syncCount is None or \
+                self._actionSetups.get(notification.action) != syncCount:
+            action.setupAction(notification.dmd)
+            self._actionSetups[notification.action] = syncCount
+
     def processMessage(self, message):
         """
         Handles a queue message, can call "acknowledge" on the Queue Consumer
@@ -114,7 +128,7 @@ class ProcessSignalTask(object):
             try:
                 target = signal.subscriber_uuid or '<none>'
                 action = self.getAction(notification.action)
-                action.setupAction(notification.dmd)
+                self.setupAction(action, notification)
                 if isinstance(action, TargetableAction):
                     target = ','.join(action.getTargets(notification, signal))
                 action.execute(notification, signal)
@@ -198,6 +212,15 @@ class ZenActionD(ZCmdBase):
         self.parser.add_option('--pagingworkerstimeout', dest="pagingWorkersTimeout", type="int", default=default_pagingworkers_timeout,
                                help='Timeout, in seconds, for paging workers (default: %d)' % \
                                        default_pagingworkers_timeout)
+        self.parser.add_option('--email-queue-size', dest="emailQueueSize", type="int", default=0,
+                               help='Send email from a queue of at most this many messages in'
+                                    ' background threads, reusing SMTP connections (default: 0, send'
+                                    ' each email while processing its signal)')
+        self.parser.add_option('--email-workers', dest="emailWorkers", type="int", default=2,
+                               help='Number of threads sending queued email (default: 2)')
+        self.parser.add_option('--email-digest-window', dest="emailDigestWindow", type="float", default=0,
+                               help='Seconds to collect queued email to the same recipients for'
+                                    ' and send it as one digest message (default: 0, no digests)')
         default_url = getDefaultZopeUrl()
         self.parser.add_option('--zopeurl', dest='zopeurl', default=default_url,
                                help="http path to the root of the zope server (default: %s)" % default_url)
@@ -260,6 +283,10 @@ class ZenActionD(ZCmdBase):
         self._workers.shutdown()
         if self._consumer:
             yield self._consumer.shutdown()
+        for name, action in getUtilitiesFor(IAction):
+            mailQueue = getattr(action, 'mailQueue', None)
+            if mailQueue is not None:
+                mailQueue.stop(timeout=30)
 
 
 if __name__ == '__main__':
@@ -51,6 +51,7 @@ from Products.ZenUtils.observable import ObservableMixin
 from pynetsnmp import netsnmp, twistedsnmp
 
 from Products.ZenUtils.captureReplay import CaptureReplay
+from Products.ZenUtils.MibIndex import MibIndex
 from Products.ZenEvents.EventServer import Stats
 from Products.ZenUtils.Utils import unused
 from Products.ZenEvents.TrapFilter import TrapFilter, TrapFilterError
@@ -160,6 +161,7 @@ class SnmpTrapPreferences(CaptureReplay):
         # Ensure that we always have an oidMap
         daemon = zope.component.getUtility(ICollector)
         daemon.oidMap = {}
+        daemon.mibIndex = MibIndex()
         # add our collector's custom statistics
         statService = zope.component.queryUtility(IStatisticsService)
         statService.addStatistic("events", "COUNTER")
@@ -203,7 +205,6 @@ class TrapTask(BaseTask, CaptureReplay):
         # For compatibility with captureReplay
         self.options = self._daemon.options
 
-        self.oidMap = self._daemon.oidMap
         self.stats = Stats()
 
         # Command-line argument sanity checking
@@ -363,25 +364,8 @@ class TrapTask(BaseTask, CaptureReplay):
             oid = '.'.join(map(str, oid))
 
         oid = oid.strip('.')
-        if exactMatch:
-            if oid in self.oidMap:
-                return self.oidMap[oid]
-            else:
-                return oid
-
-        oidlist = oid.split('.')
-        for i in range(len(oidlist), 0, -1):
-            name = self.oidMap.get('.'.join(oidlist[:i]), None)
-            if name is None:
-                continue
-
-            oid_trail = oidlist[i:]
-            if len(oid_trail) > 0 and not strip:
-                return "%s.%s" % (name, '.'.join(oid_trail))
-            else:
-                return name
-
-        return oid
+        return self._daemon.mibIndex.oid2name(oid, exactMatch, strip,
+                                              default=oid)
 
     def _pre_parse(self, session, transport, transport_data, transport_data_length):
         """Called before the net-snmp library parses the PDU. In the case
@@ -759,6 +743,7 @@ class MibConfigTask(ObservableMixin):
         self._daemon = zope.component.getUtility(ICollector)
 
         self._daemon.oidMap = self._preferences.oidMap
+        self._daemon.mibIndex = MibIndex(self._daemon.oidMap.iteritems())
 
     def doTask(self):
         return defer.succeed("Already updated OID -> name mappings...")
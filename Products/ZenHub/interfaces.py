@@ -111,6 +111,15 @@ class IInvalidationFilter(Interface):
         L{FILTER_CONTINUE}).
         """
 
+    # Optional:
+    # def classVerdict(cls):
+    #     """
+    #     Return the result include would give for every instance of cls
+    #     (L{FILTER_EXCLUDE}, L{FILTER_INCLUDE} or L{FILTER_CONTINUE}), or
+    #     None if include has to look at each instance.  Lets zenhub skip
+    #     the filter for classes it doesn't care about.
+    #     """
+
 class IInvalidationOid(Interface):
     """
     Allows an invalidation OID to be changed to a different OID or dropped
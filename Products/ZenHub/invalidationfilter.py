@@ -48,6 +48,11 @@ class IgnorableClassesFilter(object):
     def initialize(self, context):
         pass
 
+    def classVerdict(self, cls):
+        if issubclass(cls, self.CLASSES_TO_IGNORE):
+            return FILTER_EXCLUDE
+        return FILTER_CONTINUE
+
     def include(self, obj):
         if isinstance(obj, self.CLASSES_TO_IGNORE ):
             log.debug("IgnorableClassesFilter is ignoring %s ", obj)
@@ -106,6 +111,12 @@ class BaseOrganizerFilter(object):
         self.generateChecksum(organizer, m)
         return m.hexdigest()
 
+    def classVerdict(self, cls):
+        if not issubclass(cls, self._types):
+            return FILTER_CONTINUE
+        # The checksum of each organizer decides
+        return None
+
     def include(self, obj):
         # Move on if it's not one of our types
         if not isinstance(obj, self._types):
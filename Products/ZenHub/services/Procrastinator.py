@@ -21,8 +21,13 @@ class Procrastinate(object):
     _DO_LATER_DELAY = 5
     _DO_NOW_DELAY = 0.05
 
-    def __init__(self, cback):
+    def __init__(self, cback, batchSize=None):
+        """
+        @param cback: called with each device, or with a list of up to
+                      batchSize devices when batchSize is set
+        """
         self.cback = cback
+        self.batchSize = batchSize
         self.devices = set()
         self.timer = None
         self._stopping = False
@@ -48,8 +53,13 @@ class Procrastinate(object):
 
     def _doNow(self, *unused):
         if self.devices:
-            device = self.devices.pop()
-            self.cback(device)
+            if self.batchSize:
+                batch = [self.devices.pop() for i in
+                         xrange(min(self.batchSize, len(self.devices)))]
+                self.cback(batch)
+            else:
+                device = self.devices.pop()
+                self.cback(device)
             if self.devices:
                 reactor.callLater(Procrastinate._DO_NOW_DELAY, self._doNow)
             elif self._stopping:
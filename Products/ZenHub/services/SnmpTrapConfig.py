@@ -78,10 +78,8 @@ class SnmpTrapConfig(CollectorConfigService):
         proxy.name = "SNMP Trap Configuration"
         proxy.device = device.id
 
-        # Gather all OID -> Name mappings from /Mibs catalog
-        proxy.oidMap = dict(
-                       (b.oid, b.id) for b in self.dmd.Mibs.mibSearch() if b.oid
-                       )
+        # Gather all OID -> Name mappings from the shared /Mibs index
+        proxy.oidMap = dict(self.dmd.Mibs.getMibIndex().iteroids())
 
         return proxy
 
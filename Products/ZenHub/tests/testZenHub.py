@@ -17,6 +17,8 @@ from Products.ZenUtils.Driver import drive
 # Import from zenhub before importing twisted.internet.reactor
 from Products.ZenHub.zenhub import ZenHub
 from Products.ZenHub.PBDaemon import RemoteException, RemoteConflictError
+from Products.ZenHub.interfaces import \
+        FILTER_INCLUDE, FILTER_EXCLUDE, FILTER_CONTINUE
 
 from twisted.python.failure import Failure
 from twisted.internet import reactor
@@ -24,6 +26,7 @@ from twisted.cred import credentials
 from twisted.spread import pb
 import sys
 import os
+import collections
 
 from Products.ZenMessaging.queuemessaging.interfaces import IQueuePublisher
 from Products.ZenMessaging.queuemessaging.publisher import DummyQueuePublisher, EventPublisher
@@ -177,6 +180,70 @@ class TestZenHub(BaseTestCase):
         self.assertIn( "an error message", str(client.exception))
         self.assertIsNotNone( client.exception.traceback)
 
+class _ClassFilter(object):
+    """Excludes instances of one class without looking at them."""
+    def __init__(self, cls):
+        self.cls = cls
+        self.calls = 0
+
+    def classVerdict(self, cls):
+        return FILTER_EXCLUDE if issubclass(cls, self.cls) else FILTER_CONTINUE
+
+    def include(self, obj):
+        self.calls += 1
+        return FILTER_EXCLUDE if isinstance(obj, self.cls) else FILTER_CONTINUE
+
+
+class _InstanceFilter(object):
+    """Includes objects with an odd id."""
+    def __init__(self):
+        self.calls = 0
+
+    def include(self, obj):
+        self.calls += 1
+        return FILTER_INCLUDE if int(obj.id) % 2 else FILTER_CONTINUE
+
+
+class _Obj(object):
+    def __init__(self, id):
+        self.id = id
+
+class _IgnoredObj(_Obj):
+    pass
+
+
+class TestInvalidationFilters(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestInvalidationFilters, self).afterSetUp()
+        self.hub = ZenHub.__new__(ZenHub)
+        self.hub._classFilters = {}
+        self.hub._filterTimes = collections.Counter()
+
+    def testClassVerdicts(self):
+        ignore = _ClassFilter(_IgnoredObj)
+        odd = _InstanceFilter()
+        self.hub._invalidation_filters = [ignore, odd]
+        self.assertFalse(self.hub._include(_IgnoredObj('1')))
+        self.assertTrue(self.hub._include(_Obj('1')))
+        self.assertTrue(self.hub._include(_Obj('2')))
+        # the class filter decided from the class alone
+        self.assertEqual(0, ignore.calls)
+        self.assertEqual(2, odd.calls)
+        self.assertEqual(([], FILTER_EXCLUDE),
+                         self.hub._getClassFilters(_IgnoredObj))
+        self.assertIn('_InstanceFilter', self.hub._filterTimes)
+
+    def testFilterOrderIsKept(self):
+        ignore = _ClassFilter(_IgnoredObj)
+        odd = _InstanceFilter()
+        self.hub._invalidation_filters = [odd, ignore]
+        # the instance filter runs first and includes odd ids
+        self.assertTrue(self.hub._include(_IgnoredObj('1')))
+        self.assertFalse(self.hub._include(_IgnoredObj('2')))
+        self.assertEqual(0, ignore.calls)
+
+
 class Publisher(object):
     def __init__(self):
         self.queue = []
@@ -223,6 +290,7 @@ class TestInternalMetricWriter(BaseTestCase):
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestZenHub))
+    suite.addTest(unittest.makeSuite(TestInvalidationFilters))
     suite.addTest(unittest.makeSuite(TestMetricWriter))
     suite.addTest(unittest.makeSuite(TestInternalMetricWriter))
     return suite
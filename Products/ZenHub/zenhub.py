@@ -32,18 +32,18 @@ import os
 import subprocess
 import itertools
 from random import choice
-from zope.component import getAdapters, subscribers
+from zope.component import getAdapters, subscribers, getSiteManager
 
 from twisted.cred import portal, checkers, credentials
 from twisted.spread import pb, banana
 banana.SIZE_LIMIT = 1024 * 1024 * 10
 
-from twisted.internet import reactor, protocol, defer
+from twisted.internet import reactor, protocol, defer, task
 from twisted.web import server, xmlrpc
 from twisted.internet.error import ProcessExitedAlready
 from twisted.internet.defer import inlineCallbacks, returnValue
 from zope.event import notify
-from zope.interface import implements
+from zope.interface import implements, providedBy
 from zope.component import getUtility, getUtilitiesFor, adapts
 from ZODB.POSException import POSKeyError
 
@@ -421,6 +421,12 @@ class ZenHub(ZCmdBase):
         self.shutdown = False
         self.counters = collections.Counter()
         self._invalidations_paused = False
+        # seconds spent in each invalidation filter
+        self._filterTimes = collections.Counter()
+        self._invalidationRate = 0.0
+        # memoized filters and oid transform factories, keyed by class
+        self._classFilters = {}
+        self._oidTransformFactories = {}
 
         ZCmdBase.__init__(self)
         import Products.ZenHub
@@ -564,7 +570,7 @@ class ZenHub(ZCmdBase):
             self.log.warn("Unable to poll invalidations, will try again.")
         else:
             try:
-                self.doProcessQueue()
+                yield self.doProcessQueue()
             except Exception, ex:
                 self.log.exception("Unable to poll invalidations.")
         reactor.callLater(self.options.invalidation_poll_interval, self.processQueue)
@@ -577,9 +583,45 @@ class ZenHub(ZCmdBase):
         for fltr in sorted(filters, key=lambda f:getattr(f, 'weight', 100)):
             fltr.initialize(self.dmd)
             self._invalidation_filters.append(fltr)
+        self._classFilters = {}
         self.log.debug('Registered %s invalidation filters.' %
                        len(self._invalidation_filters))
 
+    def _getClassFilters(self, cls):
+        """
+        Return the filters that have to look at each instance of cls and
+        the verdict to use if none of them decides.  Filters that can decide
+        from the class alone (see IInvalidationFilter.classVerdict) are
+        only asked once per class.
+        """
+        try:
+            return self._classFilters[cls]
+        except KeyError:
+            pass
+        filters = []
+        verdict = FILTER_INCLUDE
+        for fltr in self._invalidation_filters:
+            classVerdict = getattr(fltr, 'classVerdict', None)
+            result = classVerdict(cls) if classVerdict is not None else None
+            if result == FILTER_CONTINUE:
+                continue
+            if result in (FILTER_INCLUDE, FILTER_EXCLUDE):
+                verdict = result
+                break
+            filters.append(fltr)
+        self._classFilters[cls] = filters, verdict
+        return filters, verdict
+
+    def _include(self, obj):
+        filters, verdict = self._getClassFilters(obj.__class__)
+        for fltr in filters:
+            start = time.time()
+            result = fltr.include(obj)
+            self._filterTimes[fltr.__class__.__name__] += time.time() - start
+            if result in (FILTER_INCLUDE, FILTER_EXCLUDE):
+                return result == FILTER_INCLUDE
+        return verdict == FILTER_INCLUDE
+
     def _filter_oids(self, oids):
         app = self.dmd.getPhysicalRoot()
         i = 0
@@ -598,29 +640,46 @@ class ZenHub(ZCmdBase):
                         # It's a delete. This should go through.
                         yield oid
                     else:
-                        included = True
-                        for fltr in self._invalidation_filters:
-                            result = fltr.include(obj)
-                            if result in (FILTER_INCLUDE, FILTER_EXCLUDE):
-                                included = (result == FILTER_INCLUDE)
-                                break
-                        if included:
+                        if self._include(obj):
                             oids = self._transformOid(oid, obj)
                             if oids:
                                 for oid in oids:
                                     yield oid
 
+    def _getOidTransformFactories(self, obj):
+        """
+        Return the IInvalidationOid subscription factories and the
+        old-style adapter factory (or None) for obj, memoized by the
+        interfaces obj provides.
+        """
+        spec = providedBy(obj)
+        try:
+            return self._oidTransformFactories[spec]
+        except KeyError:
+            pass
+        adapters = getSiteManager().adapters
+        adapterFactory = adapters.lookup((spec,), IInvalidationOid, '')
+        if adapterFactory is None and spec.isOrExtends(IInvalidationOid):
+            # The object is its own transform
+            adapterFactory = lambda obj: obj
+        factories = (
+            tuple(adapters.subscriptions((spec,), IInvalidationOid)),
+            adapterFactory)
+        self._oidTransformFactories[spec] = factories
+        return factories
+
     def _transformOid(self, oid, obj):
+        subscriptionFactories, adapterFactory = \
+            self._getOidTransformFactories(obj)
         # First, get any subscription adapters registered as transforms
-        adapters = subscribers((obj,), IInvalidationOid)
+        adapters = [factory(obj) for factory in subscriptionFactories]
         # Next check for an old-style (regular adapter) transform
-        try:
-            adapters = itertools.chain(adapters, (IInvalidationOid(obj),))
-        except TypeError:
-            # No old-style adapter is registered
-            pass
+        if adapterFactory is not None:
+            adapters.append(adapterFactory(obj))
         transformed = set()
         for adapter in adapters:
+            if adapter is None:
+                continue
             o = adapter.transformOid(oid)
             if isinstance(o, basestring):
                 transformed.add(o)
@@ -635,34 +694,62 @@ class ZenHub(ZCmdBase):
         transformed.discard(oid)
         return transformed or (oid,)
 
+    def _filterOidsCooperatively(self, oids, filtered):
+        """
+        Filter the oids in chunks, giving the reactor a chance to serve
+        collectors between chunks.  Meant to be run with task.coiterate.
+        """
+        chunkSize = max(1, self.options.invalidation_chunk_size)
+        for start in xrange(0, len(oids), chunkSize):
+            filtered.update(self._filter_oids(oids[start:start + chunkSize]))
+            yield
+
     def doProcessQueue(self):
         """
         Perform one cycle of update notifications.
 
-        @return: None
+        @return: Deferred that fires once the invalidations were handed
+                 to the invalidation processor
         """
         changes_dict = self.storage.poll_invalidations()
-        if changes_dict is not None:
+        if changes_dict is None:
+            return defer.succeed(None)
+
+        oids = list(changes_dict)
+        filtered = set()
+        start = time.time()
+
+        def process(unused):
+            elapsed = time.time() - start
+            self.counters['invalidationOids'] += len(oids)
+            if elapsed > 0:
+                self._invalidationRate = len(oids) / elapsed
+            self.log.debug('Filtered %s oids in %.2f seconds',
+                           len(oids), elapsed)
             processor = getUtility(IInvalidationProcessor)
-            d = processor.processQueue(tuple(set(self._filter_oids(changes_dict))))
-
-            def done(n):
-                if n == INVALIDATIONS_PAUSED:
-                    self.sendEvent({'summary': "Invalidation processing is "
-                                               "currently paused. To resume, set "
-                                               "'dmd.pauseHubNotifications = False'",
-                                    'severity': SEVERITY_CRITICAL,
+            return processor.processQueue(tuple(filtered))
+
+        def done(n):
+            if n == INVALIDATIONS_PAUSED:
+                self.sendEvent({'summary': "Invalidation processing is "
+                                           "currently paused. To resume, set "
+                                           "'dmd.pauseHubNotifications = False'",
+                                'severity': SEVERITY_CRITICAL,
+                                'eventkey': INVALIDATIONS_PAUSED})
+                self._invalidations_paused = True
+            else:
+                msg = 'Processed %s oids' % n
+                self.log.debug(msg)
+                if self._invalidations_paused:
+                    self.sendEvent({'summary': msg,
+                                    'severity': SEVERITY_CLEAR,
                                     'eventkey': INVALIDATIONS_PAUSED})
-                    self._invalidations_paused = True
-                else:
-                    msg = 'Processed %s oids' % n
-                    self.log.debug(msg)
-                    if self._invalidations_paused:
-                        self.sendEvent({'summary': msg,
-                                        'severity': SEVERITY_CLEAR,
-                                        'eventkey': INVALIDATIONS_PAUSED})
-                        self._invalidations_paused = False
-            d.addCallback(done)
+                    self._invalidations_paused = False
+
+        d = task.coiterate(self._filterOidsCooperatively(oids, filtered))
+        d.addCallback(process)
+        d.addCallback(done)
+        return d
 
     def sendEvent(self, **kw):
         """
@@ -983,6 +1070,9 @@ class ZenHub(ZCmdBase):
         r.gauge('workListLength', len(self.workList))
         for name, value in self.counters.items():
             r.counter(name, value)
+        r.gauge('invalidationOidsPerSecond', self._invalidationRate)
+        for name, seconds in self._filterTimes.items():
+            r.counter('invalidationFilterTime.%s' % name, int(seconds * 1000))
 
         # persist counters values
         self.saveCounters()
@@ -1064,6 +1154,10 @@ class ZenHub(ZCmdBase):
         self.parser.add_option('--invalidation-poll-interval', 
             type='int', default=30,
             help="Interval at which to poll invalidations (default: %default)")
+        self.parser.add_option('--invalidation-chunk-size',
+            dest='invalidation_chunk_size', type='int', default=100,
+            help="Number of invalidated oids filtered before yielding to "
+                 "the reactor (default: %default)")
         self.parser.add_option('--metrics-store-url', dest='metrics_store_url',
             type='string', default='http://localhost:8080/api/metrics/store',
             help='URL for posting internal metrics (default: %default)')
@@ -15,10 +15,16 @@ zenbatchload loads a list of devices read from a file.
 
 import sys
 import re
+import json
+import inspect
+import subprocess
+from itertools import izip
+from multiprocessing.pool import ThreadPool
 from traceback import format_exc
 import socket
 
 import Globals
+import transaction
 from ZODB.POSException import ConflictError
 from ZODB.transact import transact
 from zope.component import getUtility
@@ -29,6 +35,7 @@ from zExceptions import BadRequest
 
 from ZPublisher.Converters import type_converters
 from Products.ZenModel.interfaces import IDeviceLoader
+from Products.ZenModel.ZDeviceLoader import JobDeviceLoader
 from Products.ZenUtils.ZCmdBase import ZCmdBase
 from Products.ZenModel.Device import Device
 from Products.ZenRelations.ZenPropertyManager import iszprop
@@ -44,6 +51,26 @@ from Products.ZenUtils.IpUtil import isip
 
 from zenoss.protocols.protobufs.zep_pb2 import SEVERITY_INFO, SEVERITY_ERROR
 
+# Arguments of dmd.DeviceLoader.loadDevice that are passed on to the new
+# device as zProperties, and as device properties
+_LOADER_ZPROPERTIES = ('zSnmpCommunity', 'zSnmpPort', 'zSnmpVer')
+_LOADER_DEVICE_PROPERTIES = (
+    'tag', 'serialNumber', 'rackSlot', 'productionState', 'comments',
+    'hwManufacturer', 'hwProductName', 'osManufacturer', 'osProductName',
+    'locationPath', 'groupPaths', 'systemPaths', 'priority', 'title',
+)
+
+
+def _runModeler(command):
+    """
+    Run a zenmodeler command, returning its exit status and output.
+    """
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    return proc.returncode, output
+
+
 class BatchDeviceLoader(ZCmdBase):
     """
     Base class wrapping around dmd.DeviceLoader
@@ -154,6 +181,7 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
     def __init__(self, *args, **kwargs):
         ZCmdBase.__init__(self, *args, **kwargs)
         self.defaults = {}
+        self.report = {'loaded': [], 'rejected': [], 'modelErrors': []}
 
         self.collectorNames = self.dmd.Monitors.getPerformanceMonitorNames()
 
@@ -272,22 +300,45 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
                 self.log.warn( "The cproperty %s doesn't exist in %s" % (
                        cprop, device_specs.get('deviceName', device.id)))
 
-    def addAllLGSOrganizers(self, device_specs):
+    def getLGSPaths(self, device_specs):
+        """
+        Return the (lgsType, paths) of the locations, systems and groups a
+        device entry refers to.
+        """
+        lgsPaths = []
         location = device_specs.get('setLocation')
         if location:
-            self.addLGSOrganizer('Locations', (location,) )
+            lgsPaths.append(('Locations', (location,)))
 
         systems = device_specs.get('setSystems')
         if systems:
             if not isinstance(systems, list) and not isinstance(systems, tuple):
                 systems = (systems,)
-            self.addLGSOrganizer('Systems', systems)
+            lgsPaths.append(('Systems', systems))
 
         groups = device_specs.get('setGroups')
         if groups:
             if not isinstance(groups, list) and not isinstance(groups, tuple):
                 groups = (groups,)
-            self.addLGSOrganizer('Groups', groups)
+            lgsPaths.append(('Groups', groups))
+        return lgsPaths
+
+    def addAllLGSOrganizers(self, device_specs):
+        for lgsType, paths in self.getLGSPaths(device_specs):
+            self.addLGSOrganizer(lgsType, paths)
+
+    def addBatchLGSOrganizers(self, device_list):
+        """
+        Add the locations, groups and systems of all device entries at once,
+        rather than looking them up again for each device.
+        """
+        allPaths = {}
+        for device_specs in device_list:
+            for lgsType, paths in self.getLGSPaths(device_specs):
+                allPaths.setdefault(lgsType, set()).update(paths)
+        for lgsType, paths in sorted(allPaths.items()):
+            self.log.info("Adding %d %s", len(paths), lgsType)
+            self.addLGSOrganizer(lgsType, sorted(paths))
 
     def addLGSOrganizer(self, lgsType, paths=[]):
         """
@@ -350,7 +401,7 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
         internalVars = [
            'deviceName', 'devicePath', 'loader', 'loader_arg_keys',
         ]
-        @transact
+        # Callers commit (or not, with --nocommit): no transaction of its own
         def setNamedProp(org, name, description):
             setattr(org, name, description)
 
@@ -408,6 +459,103 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
             return result
         return None
 
+    def transactional(self, f):
+        """
+        Wrap f in a transaction, unless changes aren't to be committed.
+        """
+        return f if self.options.nocommit else transact(f)
+
+    def rejectDevice(self, report, device_specs, reason):
+        """
+        Record a device entry that could not be loaded.
+        """
+        report['rejected'].append(dict(
+            deviceName=device_specs.get('deviceName'),
+            devicePath=device_specs.get('devicePath'),
+            reason=reason,
+        ))
+
+    def loadDevice(self, device_specs, processed, report, created=None):
+        """
+        Create or find the device of an entry and apply its settings,
+        without committing.
+
+        @parameter device_specs: device creation dictionary
+        @type device_specs: dictionary
+        @parameter processed: status counts to update
+        @type processed: dictionary
+        @parameter report: loaded and rejected entries to update
+        @type report: dictionary
+        @parameter created: when loading as part of a batch, the list to
+            add the names of new devices to.  The locations, groups and
+            systems of a batch are added beforehand, errors are raised so
+            that the caller can roll the entry back, and the new device
+            events are left to be sent once the batch is committed.
+        @type created: list
+        @return: device or None
+        @rtype: DMD device object
+        """
+        loaderName = device_specs.get('loader')
+        if loaderName is not None:
+            try:
+                orgName = device_specs['devicePath']
+                organizer = self.dmd.getObjByPath('dmd' + orgName)
+                deviceLoader = getUtility(IDeviceLoader, loaderName, organizer)
+                devobj = self.runLoader(deviceLoader, device_specs)
+            except ConflictError:
+                raise
+            except ComponentLookupError:
+                self.log.critical("Unknown device loader '%s'", loaderName)
+                sys.exit(1)
+            except Exception:
+                if created is not None:
+                    raise
+                devName = device_specs.get('device_specs', 'Unkown Device')
+                msg = "Ignoring device loader issue for %s" % devName
+                self.reportException(msg, devName, specs=str(device_specs))
+                processed['errors'] += 1
+                self.rejectDevice(report, device_specs, "Device loader error")
+                return
+        else:
+            deviceLoader = None
+            devobj = None
+            if self.validDeviceSpec(processed, device_specs):
+                if created is None:
+                    devobj = self.getDevice(device_specs)
+                else:
+                    devobj = self.getBatchDevice(device_specs, created)
+                if devobj is None:
+                    self.rejectDevice(report, device_specs,
+                                      "Unable to create the device")
+            else:
+                self.rejectDevice(report, device_specs,
+                                  "No device name or unresolvable name")
+
+        if devobj is None:
+            if deviceLoader is not None:
+                processed['processed'] += 1
+                report['loaded'].append(dict(
+                    deviceName=device_specs.get('deviceName'),
+                    devicePath=device_specs.get('devicePath'),
+                    loader=loaderName,
+                ))
+        else:
+            if created is None:
+                self.addAllLGSOrganizers(device_specs)
+            self.applyZProps(devobj, device_specs)
+            self.applyCustProps(devobj, device_specs)
+            self.applyOtherProps(devobj, device_specs)
+
+            if not self.options.nocommit and isinstance(devobj, Device):
+                notify(IndexingEvent(devobj))
+            report['loaded'].append(dict(
+                deviceName=device_specs.get('deviceName'),
+                devicePath=device_specs.get('devicePath'),
+                id=devobj.id,
+            ))
+
+        return devobj
+
     def processDevices(self, device_list):
         """
         Read the input and process the devices
@@ -421,9 +569,10 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
         @return: status of device loading
         @rtype: dictionary
         """
+        if getattr(self.options, 'batchsize', 0) > 0:
+            return self.processDeviceBatches(device_list)
 
-        def transactional(f):
-            return f if self.options.nocommit else transact(f)
+        transactional = self.transactional
 
         processed = {'processed':0, 'errors':0, 'no_IP':0}
 
@@ -431,44 +580,24 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
         def _process(device_specs):
             # Get the latest bits
             self.dmd.zport._p_jar.sync()
+            return self.loadDevice(device_specs, processed, self.report)
 
-            loaderName = device_specs.get('loader')
-            if loaderName is not None:
-                try:
-                    orgName = device_specs['devicePath']
-                    organizer = self.dmd.getObjByPath('dmd' + orgName)
-                    deviceLoader = getUtility(IDeviceLoader, loaderName, organizer)
-                    devobj = self.runLoader(deviceLoader, device_specs)
-                except ConflictError:
-                    raise
-                except ComponentLookupError:
-                    self.log.critical("Unknown device loader '%s'", loaderName)
-                    sys.exit(1)
-                except Exception:
-                    devName = device_specs.get('device_specs', 'Unkown Device')
-                    msg = "Ignoring device loader issue for %s" % devName
-                    self.reportException(msg, devName, specs=str(device_specs))
-                    processed['errors'] += 1
-                    return
-            else:
-                deviceLoader = None
-                devobj = None
-                if self.validDeviceSpec(processed, device_specs):
-                    devobj = self.getDevice(device_specs)
+        for device_specs in device_list:
+            devobj = _process(device_specs)
 
-            if devobj is None:
-                if deviceLoader is not None:
-                    processed['processed'] += 1
-            else:
-                self.addAllLGSOrganizers(device_specs)
-                self.applyZProps(devobj, device_specs)
-                self.applyCustProps(devobj, device_specs)
-                self.applyOtherProps(devobj, device_specs)
+            # We need to commit in order to model, so don't bother
+            # trying to model unless we can do both
+            if devobj and not self.options.nocommit and not self.options.nomodel:
+                self.modelDevice(device_specs, devobj, processed)
 
-                if not self.options.nocommit and isinstance(devobj, Device):
-                    notify(IndexingEvent(devobj))
+        processed['total'] = len(device_list)
+        return processed
 
-            return devobj
+    def modelDevice(self, device_specs, devobj, processed):
+        """
+        Discover the SNMP community of a device if needed, and model it.
+        """
+        transactional = self.transactional
 
         @transactional
         def _snmp_community(device_specs, devobj):
@@ -487,20 +616,166 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
                 msg = "Modeling error for %s" % devobj.id
                 self.reportException(msg, devobj.id, exception=str(ex))
                 processed['errors'] += 1
+                self.report['modelErrors'].append(
+                    dict(id=devobj.id, reason=str(ex)))
             processed['processed'] += 1
 
-        for device_specs in device_list:
-            devobj = _process(device_specs)
+        _snmp_community(device_specs, devobj)
+        _model(devobj)
 
-            # We need to commit in order to model, so don't bother
-            # trying to model unless we can do both
-            if devobj and not self.options.nocommit and not self.options.nomodel:
-                _snmp_community(device_specs, devobj)
-                _model(devobj)
+    def processDeviceBatches(self, device_list):
+        """
+        Bulk version of processDevices: all locations, groups and systems
+        are added first, devices are then loaded --batchsize at a time in
+        one transaction per batch, and modeled once they are all loaded.
+
+        @parameter device_list: list of device entries
+        @type device_list: list of dictionaries
+        @return: status of device loading
+        @rtype: dictionary
+        """
+        processed = {'processed':0, 'errors':0, 'no_IP':0}
+        self.transactional(self.addBatchLGSOrganizers)(device_list)
+
+        loaded = []
+        batchsize = self.options.batchsize
+        for start in xrange(0, len(device_list), batchsize):
+            batch = device_list[start:start + batchsize]
+            loaded.extend(self.loadBatch(batch, processed))
+            self.log.info("Loaded %d of %d devices",
+                          start + len(batch), len(device_list))
+
+        if loaded and not self.options.nocommit and not self.options.nomodel:
+            if self.options.modelWorkers > 0:
+                self.modelDevicesInParallel(loaded, processed)
+            else:
+                for device_specs, devId in loaded:
+                    devobj = self.dmd.Devices.findDeviceByIdExact(devId)
+                    if devobj is not None:
+                        self.modelDevice(device_specs, devobj, processed)
 
         processed['total'] = len(device_list)
         return processed
 
+    def loadBatch(self, batch, processed):
+        """
+        Load a batch of device entries in a single transaction.  On a
+        conflict the whole batch is retried, up to --retries times.  An
+        entry failing on its own is rolled back and rejected without
+        failing the rest of its batch.
+
+        @return: (device_specs, device id) of the devices loaded
+        @rtype: list of tuples
+        """
+        attempts = max(self.options.retries, 0) + 1
+        for attempt in xrange(1, attempts + 1):
+            counts = dict.fromkeys(processed, 0)
+            report = {'loaded': [], 'rejected': []}
+            loaded = []
+            created = []
+            try:
+                if not self.options.nocommit:
+                    self.dmd.zport._p_jar.sync()
+                for device_specs in batch:
+                    savepoint = transaction.savepoint()
+                    createdBefore = len(created)
+                    try:
+                        devobj = self.loadDevice(device_specs, counts, report,
+                                                 created)
+                    except ConflictError:
+                        raise
+                    except Exception, ex:
+                        savepoint.rollback()
+                        del created[createdBefore:]
+                        msg = "Unable to load %s -- skipping" % \
+                              device_specs.get('deviceName')
+                        self.reportException(msg,
+                                             device_specs.get('deviceName', ''))
+                        counts['errors'] += 1
+                        self.rejectDevice(report, device_specs, str(ex))
+                        continue
+                    if isinstance(devobj, Device):
+                        loaded.append((device_specs, devobj.id))
+                if self.options.nocommit:
+                    transaction.abort()
+                else:
+                    transaction.commit()
+            except ConflictError:
+                transaction.abort()
+                if attempt < attempts:
+                    self.log.warn("Conflict loading a batch of %d devices,"
+                                  " retrying (%d of %d)", len(batch),
+                                  attempt, attempts - 1)
+                    continue
+                self.log.error("Conflict loading a batch of %d devices,"
+                               " giving up on it", len(batch))
+                processed['errors'] += len(batch)
+                for device_specs in batch:
+                    self.rejectDevice(self.report, device_specs,
+                                      "Conflict error")
+                return []
+            for key, count in counts.items():
+                processed[key] += count
+            for key, entries in report.items():
+                self.report[key].extend(entries)
+            # Only now that the batch is committed, or it would be sent
+            # again by a retry
+            for name in created:
+                self.notifyNewDeviceCreated(name)
+            return loaded
+
+    def modelDevicesInParallel(self, loaded, processed):
+        """
+        Discover the SNMP community of the loaded devices as needed, then
+        model them with up to --model_workers zenmodeler processes at a time.
+
+        @parameter loaded: (device_specs, device id) of the loaded devices
+        @type loaded: list of tuples
+        """
+        @transact
+        def getCommands(chunk):
+            chunkCommands = []
+            for device_specs, devId in chunk:
+                devobj = self.dmd.Devices.findDeviceByIdExact(devId)
+                if devobj is None:
+                    continue
+                # Discover the SNMP community if it isn't explicitly set.
+                if 'zSnmpCommunity' not in device_specs:
+                    devobj.manage_snmpCommunity()
+                perfConf = devobj.getPerformanceServer()
+                if perfConf is None:
+                    self.log.error("Unable to get collector info for %s",
+                                   devId)
+                    continue
+                chunkCommands.append((devId, perfConf._getZenModelerCommand(
+                    devobj.id, perfConf.id)))
+            return chunkCommands
+
+        commands = []
+        batchsize = self.options.batchsize
+        for start in xrange(0, len(loaded), batchsize):
+            commands.extend(getCommands(loaded[start:start + batchsize]))
+
+        self.log.info("Modeling %d devices with %d workers", len(commands),
+                      self.options.modelWorkers)
+        pool = ThreadPool(self.options.modelWorkers)
+        try:
+            results = pool.imap(_runModeler,
+                                [command for devId, command in commands])
+            for (devId, command), (status, output) in izip(commands, results):
+                if self.options.showModelOutput:
+                    self.log.info("Modeled %s:\n%s", devId, output)
+                if status:
+                    msg = "Modeling error for %s" % devId
+                    self.log.error("%s: zenmodeler exited with %s", msg, status)
+                    processed['errors'] += 1
+                    self.report['modelErrors'].append(dict(
+                        id=devId, reason="zenmodeler exited with %s" % status))
+                processed['processed'] += 1
+        finally:
+            pool.close()
+            pool.join()
+
     def validDeviceSpec(self, processed, device_specs):
         if 'deviceName' not in device_specs:
             return False
@@ -607,6 +882,48 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
 
         return devobj
 
+    def getBatchDevice(self, device_specs, created):
+        """
+        Find or create the device of an entry loaded as part of a batch.
+        Unlike getDevice it goes to the loader of dmd.DeviceLoader.loadDevice
+        directly, since loadDevice aborts the transaction on errors, which
+        would throw away the rest of the batch as well.
+
+        @parameter device_specs: device creation dictionary
+        @type device_specs: dictionary
+        @parameter created: list to add the name of a new device to
+        @type created: list
+        @return: device
+        @rtype: DMD device object
+        """
+        name = device_specs['deviceName']
+        devobj = self.dmd.Devices.findDevice(name)
+        if devobj is not None:
+            self.log.info("Found existing device %s" % name)
+            return devobj
+
+        # The defaults of dmd.DeviceLoader.loadDevice, overridden by the entry
+        argspec = inspect.getargspec(self.loader)
+        specs = dict(zip(argspec.args[-len(argspec.defaults):],
+                         argspec.defaults))
+        for key in self.loader_args:
+            if key in device_specs:
+                specs[key] = device_specs[key]
+
+        self.log.info("Creating initial device %s (customized properties are set after creation)" % name)
+        zProperties = dict((key, specs[key]) for key in _LOADER_ZPROPERTIES)
+        deviceProperties = dict((key, specs[key])
+                                for key in _LOADER_DEVICE_PROPERTIES)
+        loader = JobDeviceLoader(self.dmd.DeviceLoader)
+        # Do NOT model at this time
+        devobj = loader.load_device(name, specs['devicePath'], 'none',
+                                    specs['performanceMonitor'],
+                                    specs['manageIp'],
+                                    zProperties=zProperties,
+                                    deviceProperties=deviceProperties)
+        created.append(name)
+        return devobj
+
     def buildOptions(self):
         """
         Add our command-line options to the basics
@@ -641,6 +958,26 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
         self.parser.add_option('--reject_file', dest="reject_file",
             help="If specified, use as the name of a file to store unparseable lines")
 
+        self.parser.add_option('--batchsize', dest="batchsize",
+            default=0, type="int",
+            help="Load devices in batches of this many per commit, adding"
+                 " all locations, groups and systems up front and modeling"
+                 " once all devices are loaded. 0 loads and models one"
+                 " device at a time.")
+
+        self.parser.add_option('--retries', dest="retries",
+            default=3, type="int",
+            help="Number of times to retry a batch after a conflict error")
+
+        self.parser.add_option('--model_workers', dest="modelWorkers",
+            default=0, type="int",
+            help="With --batchsize, model the loaded devices with this many"
+                 " zenmodeler processes in parallel")
+
+        self.parser.add_option('--report_file', dest="report_file",
+            help="If specified, write a JSON report of the loaded, rejected"
+                 " and unparseable entries to this file")
+
         self.parser.add_option('--must_be_resolvable',
             dest="must_be_resolvable", default=False,
             action="store_true",
@@ -763,6 +1100,19 @@ windows_device_3 setTitle="Windows AD Server 1", setHWTag="service-tag-ABCDEF",
             self.log.debug("Unable to write rejects to '%' because: %s",
                            name, ex)
 
+    def writeReport(self, name, processed, unparseable):
+        """
+        Write the status counts and the loaded, rejected and unparseable
+        entries to a JSON file.
+        """
+        report = dict(self.report, summary=processed, unparseable=unparseable)
+        try:
+            with open(name, 'w') as fd:
+                json.dump(report, fd, indent=2, sort_keys=True)
+        except IOError as ex:
+            self.log.error("Unable to write the report to '%s' because: %s",
+                           name, ex)
+
 
 if __name__=='__main__':
     batchLoader = BatchDeviceLoader()
@@ -789,4 +1139,7 @@ if __name__=='__main__':
     results = batchLoader.processDevices(device_list)
     results['unparseable'] = len(unparseable)
     batchLoader.reportResults(results)
+    if batchLoader.options.report_file is not None:
+        batchLoader.writeReport(batchLoader.options.report_file, results,
+                                unparseable)
     sys.exit(0)
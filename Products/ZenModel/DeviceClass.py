@@ -590,8 +590,9 @@ class DeviceClass(DeviceOrganizer, ZenPackable, TemplateContainer):
         """
         Return the actual RRDTemplate instances.
         """
+        if not context or context is self:
+            return self.getResolvedRRDTemplates()
         templates = {}
-        if not context: context = self
         mychain = aq_chain(context)
         mychain.reverse()
         for obj in mychain:
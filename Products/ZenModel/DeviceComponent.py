@@ -26,6 +26,7 @@ from Lockable import Lockable
 from EventView import EventView
 from Products.ZenUtils.Utils import getAllConfmonObjects
 from Products.Zuul.catalog.interfaces import IPathReporter
+from Products.Zuul.componentindex import componentsChanged
 
 
 class DeviceComponent(Lockable):
@@ -96,6 +97,24 @@ class DeviceComponent(Lockable):
         return self.collectors
 
 
+    def index_object(self, idxs=None):
+        """
+        Index in the device's component catalog and have component listings
+        of the device rebuilt.
+        """
+        super(DeviceComponent, self).index_object(idxs)
+        componentsChanged(getattr(self, self.default_catalog, None))
+
+
+    def unindex_object(self):
+        """
+        Unindex from the device's component catalog and have component
+        listings of the device rebuilt.
+        """
+        super(DeviceComponent, self).unindex_object()
+        componentsChanged(getattr(self, self.default_catalog, None))
+
+
     def getInstDescription(self):
         """
         Return some text that describes this component.  Default is name.
@@ -13,10 +13,12 @@ Base class for device organizers
 """
 
 from itertools import ifilter
+import transaction
 from zope.event import notify
 from zope.interface import implements
 from ZODB.transact import transact
 from AccessControl import ClassSecurityInfo
+from Acquisition import aq_base
 from Globals import InitializeClass
 
 from Organizer import Organizer
@@ -32,6 +34,8 @@ from Products.ZenRelations.RelSchema import ToManyCont, ToOne
 from Products.ZenWidgets.interfaces import IMessageSender
 
 from ZenossSecurity import ZEN_VIEW, ZEN_MANAGE_DMD, ZEN_COMMON, ZEN_CHANGE_DEVICE_PRODSTATE
+from ZenossSecurity import ZEN_ZPROPERTIES_EDIT
+from Products.ZenMessaging.audit import audit
 from Products.ZenUtils.Utils import unused, getObjectsFromCatalog
 from Products.ZenUtils.guid.interfaces import IGloballyIdentifiable
 from Products.ZenWidgets import messaging
@@ -40,6 +44,26 @@ from Products.Jobber.zenmodel import DeviceSetLocalRolesJob
 import logging
 LOG = logging.getLogger('ZenModel.DeviceOrganizer')
 
+_MARKER = object()
+
+# Device catalog indexes _bulkUpdateDevices may update
+_DEVICE_CATALOG_INDEXES = ('getProdState',)
+
+# Global catalog counterparts of device catalog indexes
+_GLOBAL_CATALOG_INDEXES = {'getProdState': 'productionState'}
+
+
+def _overridesSetProdState(device):
+    """
+    Whether the class of device has its own setProdState, which setting
+    the state in bulk would bypass.
+    """
+    from Products.ZenModel.Device import Device
+    method = getattr(aq_base(device).__class__, 'setProdState', None)
+    return getattr(method, 'im_func', None) is not \
+        Device.__dict__['setProdState']
+
+
 class DeviceOrganizer(Organizer, DeviceManagerBase, Commandable, ZenMenuable,
                         MaintenanceWindowable, AdministrativeRoleable):
     """
@@ -285,6 +309,123 @@ class DeviceOrganizer(Organizer, DeviceManagerBase, Commandable, ZenMenuable,
             return self.callZenScreen(self.REQUEST)
 
 
+    def _bulkUpdateDevices(self, devices, change, idxs=(), batchSize=None,
+                           inTransaction=False):
+        """
+        Call change(device) for each device and reindex the ones it returns
+        True for.  Reindexing is deferred until the end of each batch and
+        is limited to idxs, which name indexes of both the device catalog
+        and the global catalog.
+
+        @return: ids of the changed devices
+        @rtype: list
+        """
+        if devices is None:
+            devices = self.getSubDevices()
+        devices = list(devices)
+        deviceIdxs = [i for i in idxs if i in _DEVICE_CATALOG_INDEXES]
+        globalIdxs = tuple(_GLOBAL_CATALOG_INDEXES.get(i, i) for i in idxs)
+        changed = []
+
+        def _update(batch):
+            updated = [dev for dev in batch if change(dev)]
+            if idxs:
+                for dev in updated:
+                    dev = dev.primaryAq()
+                    if deviceIdxs:
+                        dev.index_object(idxs=deviceIdxs, noips=True)
+                    notify(IndexingEvent(dev, globalIdxs, True))
+            changed.extend(dev.id for dev in updated)
+
+        if inTransaction:
+            processFunc = transact(_update)
+            transaction.commit()
+        else:
+            processFunc = _update
+        batchSize = batchSize or len(devices) or 1
+        for i in xrange(0, len(devices), batchSize):
+            processFunc(devices[i:i + batchSize])
+        return changed
+
+    security.declareProtected(ZEN_CHANGE_DEVICE_PRODSTATE, 'setProdStateBulk')
+    def setProdStateBulk(self, state, devices=None, maintWindowChange=False,
+                         batchSize=None, inTransaction=False,
+                         auditCategory=None, auditObject=None, **auditData):
+        """
+        Set the production state of many devices at once, all devices in
+        this organizer by default.  Devices already in the state are left
+        alone, the others are reindexed in batches and a single audit
+        record lists them all.  Devices whose class overrides setProdState
+        have it called instead, and are reindexed by it.
+
+        @parameter state: new production state
+        @type state: int
+        @parameter devices: devices to change
+        @parameter maintWindowChange: are we setting state from inside a MW?
+        @type maintWindowChange: boolean
+        @parameter batchSize: number of devices reindexed together
+        @type batchSize: int
+        @parameter inTransaction: commit each batch in its own transaction
+        @type inTransaction: boolean
+        @parameter auditCategory: audit category, None for no audit record
+        @parameter auditObject: audited object, this organizer by default
+        @return: ids of the changed devices
+        @rtype: list
+        """
+        state = int(state)
+        overridden = []
+
+        def setState(device):
+            if device.productionState == state and (
+                    maintWindowChange or device.preMWProductionState == state):
+                return False
+            if _overridesSetProdState(device):
+                device.setProdState(state, maintWindowChange)
+                overridden.append(device.id)
+                return False
+            device.productionState = state
+            if not maintWindowChange:
+                device.preMWProductionState = state
+            return True
+
+        changed = self._bulkUpdateDevices(devices, setState,
+                                          ('getProdState',), batchSize,
+                                          inTransaction)
+        changed.extend(overridden)
+        if changed and auditCategory:
+            audit(auditCategory, auditObject or self,
+                  productionState=self.convertProdState(state),
+                  devices=' '.join(changed), deviceCount=str(len(changed)),
+                  **auditData)
+        return changed
+
+    security.declareProtected(ZEN_ZPROPERTIES_EDIT, 'setZenPropertyBulk')
+    def setZenPropertyBulk(self, propname, propvalue, devices=None,
+                           batchSize=None, inTransaction=False,
+                           auditCategory=None, auditObject=None):
+        """
+        Set a zProperty locally on many devices at once, all devices in this
+        organizer by default, with a single audit record.
+
+        @return: ids of the changed devices
+        @rtype: list
+        """
+        def setProperty(device):
+            if getattr(aq_base(device), propname, _MARKER) == propvalue:
+                return False
+            device.setZenProperty(propname, propvalue)
+            return True
+
+        changed = self._bulkUpdateDevices(devices, setProperty, (),
+                                          batchSize, inTransaction)
+        if changed and auditCategory:
+            audit(auditCategory, auditObject or self,
+                  data_={propname: propvalue},
+                  maskFields_=(propname,) if
+                      self.zenPropIsPassword(propname) else (),
+                  devices=' '.join(changed), deviceCount=str(len(changed)))
+        return changed
+
     security.declareProtected(ZEN_CHANGE_DEVICE_PRODSTATE, 'setProdState')
     def setProdState(self, state, deviceNames=None,
                         isOrganizer=False, REQUEST=None):
@@ -21,6 +21,7 @@ import logging
 log = logging.getLogger('zen')
 
 from ipaddr import IPAddress, IPNetwork
+from BTrees.OOBTree import OOBTree
 
 from Globals import DTMLFile
 from Globals import InitializeClass
@@ -56,6 +57,7 @@ def manage_addIpNetwork(context, id, netmask=24, REQUEST = None, version=4):
         net.dmdRootName = id
         net.buildZProperties()
         net.createCatalog()
+        net.buildNetworkIndex()
         #manage_addZDeviceDiscoverer(context)
     if REQUEST is not None:
         REQUEST['RESPONSE'].redirect(context.absolute_url_path()+'/manage_main')
@@ -68,6 +70,68 @@ addIpNetwork = DTMLFile('dtml/addIpNetwork',globals())
 # into class A->B->C network tree
 defaultNetworkTree = (32,)
 
+
+class NetworkIndex(object):
+    """
+    Longest prefix match index of the networks below a network root.
+        OOBTree
+            Key:    prefix length
+            Value:  OOBTree
+                        Key:    network number
+                        Value:  tuple of the ids from the root to the network
+    """
+    def __init__(self):
+        self.prefixes = OOBTree()
+
+    def add(self, number, prefixlen, path):
+        nets = self.prefixes.get(prefixlen)
+        if nets is None:
+            nets = self.prefixes[prefixlen] = OOBTree()
+        nets[number] = path
+
+    def remove(self, number, prefixlen, path):
+        """
+        Remove a network, unless another one with the same number and
+        prefix length was indexed in its place.
+        """
+        nets = self.prefixes.get(prefixlen)
+        if nets is not None and nets.get(number) == path:
+            del nets[number]
+            if not nets:
+                del self.prefixes[prefixlen]
+
+    def get(self, number, prefixlen):
+        nets = self.prefixes.get(prefixlen)
+        if nets is not None:
+            return nets.get(number)
+
+    def prefixLengths(self):
+        return list(self.prefixes.keys())
+
+    def matches(self, number, maxlen):
+        """
+        Generate (path, prefix length) of the networks containing the
+        address number, longest prefix first.
+        """
+        for prefixlen in reversed(self.prefixLengths()):
+            shift = maxlen - prefixlen
+            path = self.prefixes[prefixlen].get(number >> shift << shift)
+            if path is not None:
+                yield path, prefixlen
+
+    def within(self, start, end):
+        """
+        Generate (path, prefix length) of the networks whose number is in
+        the range start to end, end excluded.
+        """
+        for prefixlen, nets in self.prefixes.items():
+            for path in nets.values(start, end, excludemax=True):
+                yield path, prefixlen
+
+    def __len__(self):
+        return sum(len(nets) for nets in self.prefixes.values())
+
+
 class IpNetwork(DeviceOrganizer):
     """IpNetwork object"""
 
@@ -238,12 +302,22 @@ class IpNetwork(DeviceOrganizer):
         Look for children of the netobj at this level and move them to the
         right spot.
         """
-        moveList = []
-        for subnetOrIp in netobjParent.children():
-            if subnetOrIp == netobj:
-                continue
-            if netobj.hasIp(subnetOrIp.id):
-                moveList.append(subnetOrIp.id)
+        index, root = netobj._getNetworkIndex()
+        if index is not None:
+            # The networks inside netobj that are directly below the parent
+            net = IPNetwork(ipunwrap(netobj.id))
+            start = long(int(net.network))
+            end = start + 2 ** (net.max_prefixlen - netobj.netmask)
+            parentPath = netobjParent._networkIndexPath(root)
+            moveList = [path[-1] for path, prefixlen in index.within(start, end)
+                        if path[:-1] == parentPath and path[-1] != netobj.id]
+        else:
+            moveList = []
+            for subnetOrIp in netobjParent.children():
+                if subnetOrIp == netobj:
+                    continue
+                if netobj.hasIp(subnetOrIp.id):
+                    moveList.append(subnetOrIp.id)
         if moveList:
             netobjPath = netobj.getOrganizerName()[1:]
             netobjParent.moveOrganizer(netobjPath, moveList)
@@ -256,6 +330,25 @@ class IpNetwork(DeviceOrganizer):
         if netip.find("/") >= 0:
             netip, netmask = netip.split("/", 1)
             netmask = int(netmask)
+        index, root = self._getNetworkIndex()
+        if index is not None:
+            try:
+                number = numbip(netip)
+            except IpAddressError:
+                number = None
+            if number is not None:
+                base = self._networkIndexPath(root)
+                prefixes = [netmask] if netmask else index.prefixLengths()
+                for prefixlen in prefixes:
+                    path = index.get(number, prefixlen)
+                    if path is not None and path[:len(base)] == base:
+                        net = root._resolveNetworkPath(path, prefixlen)
+                        if net is not None:
+                            return net
+                        # The index is out of date, look at every network
+                        break
+                else:
+                    return None
         for subnet in [self] + self.getSubNetworks():
             if netmask == 0 and subnet.id == netip:
                 return subnet
@@ -285,6 +378,21 @@ class IpNetwork(DeviceOrganizer):
                 except KeyError:
                     pass
 
+        # Otherwise look for the longest matching prefix below this network.
+        index, root = self._getNetworkIndex()
+        if index is not None:
+            base = self._networkIndexPath(root)
+            maxlen = 128 if ':' in ip else 32
+            for netPath, prefixlen in index.matches(numbip(ip), maxlen):
+                if len(netPath) > len(base) and netPath[:len(base)] == base:
+                    net = root._resolveNetworkPath(netPath, prefixlen)
+                    if net is not None:
+                        return net
+                    # The index is out of date, walk the tree instead
+                    break
+            else:
+                return None
+
         # Otherwise we have to traverse the entire network hierarchy.
         for net in self.children():
             if net.hasIp(ip):
@@ -524,6 +632,67 @@ class IpNetwork(DeviceOrganizer):
                 ip.index_object()
 
 
+    def _getNetworkIndex(self):
+        """
+        Return the NetworkIndex of this network's tree, or None if the tree
+        has none, and the network root.
+        """
+        root = self.getNetworkRoot()
+        return getattr(aq_base(root), '_networkIndex', None), root
+
+
+    def _networkIndexPath(self, root):
+        """The ids from the network root down to this network."""
+        return self.getPrimaryPath()[len(root.getPrimaryPath()):]
+
+
+    def _resolveNetworkPath(self, path, netmask):
+        """
+        Return the network at path below this one, or None if there is no
+        such network with that netmask.
+        """
+        net = self
+        try:
+            for id in path:
+                net = net._getOb(id)
+        except (AttributeError, KeyError):
+            return None
+        if not isinstance(aq_base(net), IpNetwork) or net.netmask != netmask:
+            return None
+        return net
+
+
+    def updateNetworkIndex(self, remove=False):
+        """
+        Add this network to the NetworkIndex of its tree, or remove it.
+        """
+        if self.id.endswith("Networks"):
+            return
+        index, root = self._getNetworkIndex()
+        if index is None:
+            return
+        number = numbip(ipunwrap(self.id))
+        path = self._networkIndexPath(root)
+        if remove:
+            index.remove(number, self.netmask, path)
+        else:
+            index.add(number, self.netmask, path)
+
+
+    security.declareProtected(ZEN_MANAGE_DMD, 'buildNetworkIndex')
+    def buildNetworkIndex(self):
+        """
+        Build the NetworkIndex of the networks below this network root.
+        """
+        index = NetworkIndex()
+        rootPath = self.getPrimaryPath()
+        for net in self.getSubNetworks():
+            index.add(numbip(ipunwrap(net.id)), net.netmask,
+                      net.getPrimaryPath()[len(rootPath):])
+        self._networkIndex = index
+        return index
+
+
     security.declareProtected(ZEN_ADD, 'createCatalog')
     def createCatalog(self):
         """make the catalog for device searching"""
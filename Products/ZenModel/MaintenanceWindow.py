@@ -35,6 +35,8 @@ from Products.ZenWidgets import messaging
 from Products.ZenMessaging.audit import audit
 
 import transaction
+from Acquisition import aq_base
+from BTrees.OOBTree import OOTreeSet
 from ZODB.transact import transact
 
 
@@ -70,6 +72,9 @@ def addMonth(secs, dayOfMonthHint=0):
 
 RETURN_TO_ORIG_PROD_STATE = -99
 
+# Attribute of the dmd holding the paths of the active maintenance windows
+ACTIVE_WINDOWS_ATTR = '_activeMaintenanceWindowPaths'
+
 class MaintenanceWindow(ZenModelRM):
 
     implements(IIndexed)
@@ -458,26 +463,29 @@ class MaintenanceWindow(ZenModelRM):
         Return a dictionary of devices and their minimum production state from
         all maintenance windows.
 
-        Note: This method should be moved to the zenjobs command in order to
-              improve performance.
+        Only the windows in the active window index are looked at, rather
+        than every window in the catalog.  Their devices are fetched each
+        time, so devices that joined a window's target since it began are
+        taken into account.
 
+        @parameter devices: devices to get the minimum production states
+                            of, defaults to the devices of this window
+        @type devices: list
         @return: dictionary of device_id:production_state
         @rtype: dictionary
         """
-        # Get all maintenance windows + action rules from all device classes,
-        # devices, Systems, Locations, and Groups.
-        # Yes, it's O(m * n)
+        if devices is None:
+            devices = self.fetchDevices()
+        deviceIds = set(device.id for device in devices)
+        active = self._activeWindowIndex()
         minDevProdStates = {}
-        cat = getattr(self, self.default_catalog)
-        for entry in cat():
-            try:
-                mw = entry.getObject()
-            except Exception:
-                continue
-
-            if not mw.isActive():
-                # Note: if the mw has just ended, the self.end() method
-                #       has already made the mw inactive before this point
+        for path in list(active):
+            mw = self.unrestrictedTraverse(path, None)
+            # Note: if the mw has just ended, the self.end() method
+            #       has already made the mw inactive before this point
+            if not isinstance(mw, MaintenanceWindow) or not mw.isActive():
+                # Ended or deleted since
+                active.remove(path)
                 continue
 
             log.debug("Updating min MW Prod state using state %s from window %s",
@@ -490,6 +498,8 @@ class MaintenanceWindow(ZenModelRM):
                 mwDevices = mw.fetchDevices()
 
             for device in mwDevices:
+                if device.id not in deviceIds:
+                    continue
                 state = minDevProdStates.get(device.id, None)
                 if state is None or state > mw.startProductionState:
                     minDevProdStates[device.id] = mw.startProductionState
@@ -499,6 +509,44 @@ class MaintenanceWindow(ZenModelRM):
         return minDevProdStates
 
 
+    def _activeWindowIndex(self):
+        """
+        Return the index of active maintenance windows, an OOTreeSet of the
+        paths of the windows that are active.  It is built from the catalog
+        the first time it is needed.
+        """
+        dmd = self.getDmd()
+        index = getattr(aq_base(dmd), ACTIVE_WINDOWS_ATTR, None)
+        if index is None:
+            index = OOTreeSet()
+            cat = getattr(self, self.default_catalog)
+            for entry in cat():
+                try:
+                    mw = entry.getObject()
+                except Exception:
+                    continue
+                if mw.isActive():
+                    index.insert(mw.getPrimaryId())
+            setattr(dmd, ACTIVE_WINDOWS_ATTR, index)
+        return index
+
+
+    def _updateActiveWindowIndex(self, remove=False):
+        """
+        Add this window to, or remove it from, the active window index
+        depending on whether it is active.  With remove, the window is
+        removed in any case, as when it is about to be moved or deleted.
+        """
+        if self.getDmd() is None:
+            return
+        index = self._activeWindowIndex()
+        path = self.getPrimaryId()
+        if self.isActive() and not remove:
+            index.insert(path)
+        elif path in index:
+            index.remove(path)
+
+
     def fetchDevices(self):
         """
         Get the list of devices from our maintenance window.
@@ -544,9 +592,11 @@ class MaintenanceWindow(ZenModelRM):
         #       following takes into account our window state too.
         #       Conversely, self.end() ends the window before calling this code.
         devices = self.fetchDevices()
+        self._updateActiveWindowIndex()
         minDevProdStates = self.fetchDeviceMinProdStates( devices )
 
         def _setProdState(devices_batch):
+            devicesByState = {}
             for device in devices_batch:
                 if ending:
                     # Note: If no maintenance windows apply to a device, then the
@@ -571,18 +621,22 @@ class MaintenanceWindow(ZenModelRM):
                         continue
 
                 self._p_changed = 1
-                # Changes the current state for a device, but *not*
-                # the preMWProductionState
-                oldProductionState = self.dmd.convertProdState(device.productionState)
-                newProductionState = self.dmd.convertProdState(minProdState)
-                log.info("MW %s changes %s's production state from %s to %s",
-                         self.displayName(), device.id, oldProductionState,
-                         newProductionState)
-                audit('System.Device.Edit', device, starting=str(not ending),
-                    maintenanceWindow=self.displayName(),
-                    productionState=newProductionState,
-                    oldData_={'productionState':oldProductionState})
-                device.setProdState(minProdState, maintWindowChange=True)
+                log.debug("MW %s changes %s's production state from %s to %s",
+                          self.displayName(), device.id,
+                          device.productionState, minProdState)
+                devicesByState.setdefault(minProdState, []).append(device)
+
+            # Changes the current state of the devices, but *not* their
+            # preMWProductionState, with one audit record per state
+            for minProdState, devices in devicesByState.iteritems():
+                changed = self.dmd.Devices.setProdStateBulk(
+                    minProdState, devices, maintWindowChange=True,
+                    auditCategory='System.Device.Edit', auditObject=self,
+                    starting=str(not ending),
+                    maintenanceWindow=self.displayName())
+                log.info("MW %s changed the production state of %d devices"
+                         " to %s", self.displayName(), len(changed),
+                         self.dmd.convertProdState(minProdState))
 
         if inTransaction:
             processFunc = transact(_setProdState)
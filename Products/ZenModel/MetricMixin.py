@@ -15,7 +15,8 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 log = logging.getLogger("zen.MetricMixin")
 
-from Acquisition import aq_chain
+from Acquisition import aq_base, aq_chain, aq_inner, aq_parent
+from Products.ZenModel.TemplateContainer import TemplateContainer
 from Products.ZenUtils import Map
 from Products.ZenWidgets import messaging
 from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
@@ -155,6 +156,16 @@ class MetricMixin(object):
             return self._getOb(name)
         except AttributeError:
             pass
+        # The nearest template container (usually the device class) keeps
+        # a cached map of the templates visible from it.
+        obj = self
+        while obj is not None:
+            base = aq_base(obj)
+            if isinstance(base, TemplateContainer):
+                return obj.getResolvedRRDTemplate(name)
+            if getattr(base, 'rrdTemplates', None) is not None:
+                break
+            obj = aq_parent(aq_inner(obj))
         for obj in aq_chain(self):
             try:
                 return obj.rrdTemplates._getOb(name)
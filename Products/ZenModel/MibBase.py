@@ -11,6 +11,7 @@
 from zope.interface import implements
 
 from Products.ZenModel.interfaces import IIndexed
+from Products.ZenModel.MibOrganizer import invalidateMibIndex
 from ZenModelRM import ZenModelRM
 from ZenPackable import ZenPackable
 
@@ -42,6 +43,16 @@ class MibBase(ZenModelRM, ZenPackable):
             if key in atts: setattr(self, key, val)
 
 
+    def index_object(self, idxs=None):
+        super(MibBase, self).index_object(idxs)
+        invalidateMibIndex(self)
+
+
+    def unindex_object(self):
+        super(MibBase, self).unindex_object()
+        invalidateMibIndex(self)
+
+
     def getFullName(self):
         """Return full value name in form MODULE::attribute.
         """
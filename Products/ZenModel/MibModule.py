@@ -111,11 +111,22 @@ class MibModule(ZenModelRM, ZenPackable):
             return self.callZenScreen(REQUEST)
 
 
+    def _oidExists(self, oid):
+        """
+        Is there a MIB node or notification with this oid already?  The
+        catalog is queried directly rather than through the MIB index,
+        which is rebuilt after every node added while loading a MIB.
+        """
+        from MibOrganizer import _oid2name
+        return bool(_oid2name(self.getDmdRoot("Mibs").mibSearch, oid,
+                              exactMatch=True))
+
+
     def createMibNode(self, id, **kwargs):
         """Create a MibNotification 
         """
         from MibNode import MibNode
-        if self.oid2name(kwargs['oid'], exactMatch=True, strip=False):
+        if self._oidExists(kwargs['oid']):
             return None
         node = MibNode(id, **kwargs) 
         self.nodes._setObject(node.id, node)
@@ -161,7 +172,7 @@ class MibModule(ZenModelRM, ZenPackable):
         """Create a MibNotification 
         """
         from MibNotification import MibNotification
-        if self.oid2name(kwargs['oid'], exactMatch=True, strip=False):
+        if self._oidExists(kwargs['oid']):
             return None
         node = MibNotification(id, **kwargs) 
         self.notifications._setObject(node.id, node)
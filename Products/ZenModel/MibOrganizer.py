@@ -16,6 +16,8 @@ from Globals import DTMLFile
 from Globals import InitializeClass
 from AccessControl import ClassSecurityInfo
 from AccessControl import Permissions
+from Acquisition import aq_base
+from BTrees.Length import Length
 from Products.Jobber.jobs import SubprocessJob
 from Products.ZenModel.ZenossSecurity import *
 
@@ -23,6 +25,7 @@ from Products.ZenRelations.RelSchema import *
 from Products.ZenUtils.Search import makeCaseInsensitiveKeywordIndex
 from Products.ZenWidgets import messaging
 from Products.ZenUtils.Utils import atomicWrite, binPath, zenPath
+from Products.ZenUtils.MibIndex import MibIndex
 from Organizer import Organizer
 from MibModule import MibModule
 from ZenPackable import ZenPackable
@@ -65,6 +68,60 @@ def _oid2name(mibSearch, oid, exactMatch=True, strip=False):
     return ""
 
 
+# Name of the persistent counter on /Mibs that changes whenever the
+# mibSearch catalog changes.
+GENERATION_ATTR = '_mibIndexGeneration'
+
+# Process wide MIB indexes by generation.  Two are kept so that
+# connections that are one sync apart don't rebuild over and over.
+_mibIndexes = {}
+_MAX_INDEXES = 2
+
+
+def _buildMibIndex(mibs, generation):
+    return MibIndex(((b.oid, b.id) for b in mibs.mibSearch() if b.oid),
+                    generation)
+
+
+def getMibIndex(mibs):
+    """
+    Return the name <-> OID index of the /Mibs catalog.  The index is
+    built once per process and shared until MIBs are loaded or deleted.
+    While the current transaction has uncommitted MIB changes a private
+    index is built for it instead.
+    """
+    counter = getattr(aq_base(mibs), GENERATION_ATTR, None)
+    if counter is None:
+        generation = 0
+    else:
+        generation = counter()
+        if counter._p_changed or counter._p_jar is None:
+            index = getattr(counter, '_v_mibIndex', None)
+            if index is None or index.generation != generation:
+                index = _buildMibIndex(mibs, generation)
+                counter._v_mibIndex = index
+            return index
+    index = _mibIndexes.get(generation)
+    if index is None:
+        index = _buildMibIndex(mibs, generation)
+        if len(_mibIndexes) >= _MAX_INDEXES:
+            _mibIndexes.clear()
+        _mibIndexes[generation] = index
+    return index
+
+
+def invalidateMibIndex(context):
+    """
+    Mark the MIB indexes of every process as stale.
+    """
+    mibs = context.getDmdRoot(MibOrganizer.dmdRootName)
+    counter = getattr(aq_base(mibs), GENERATION_ATTR, None)
+    if counter is None:
+        counter = Length()
+        setattr(aq_base(mibs), GENERATION_ATTR, counter)
+    counter.change(1)
+
+
 class MibOrganizer(Organizer, ZenPackable):
     meta_type = "MibOrganizer"
     dmdRootName = "Mibs"
@@ -113,17 +170,20 @@ class MibOrganizer(Organizer, ZenPackable):
         """
         Return a name for an oid.
         """
-        return _oid2name(self.getDmdRoot("Mibs").mibSearch, oid,
-            exactMatch, strip)
+        return getMibIndex(self.getDmdRoot("Mibs")).oid2name(
+            oid, exactMatch, strip)
 
     def name2oid(self, name):
         """
         Return an oid based on a name in the form MIB::name.
         """
-        brains = self.getDmdRoot("Mibs").mibSearch({'id': name})
-        if len(brains) > 0:
-            return brains[0].oid
-        return ''
+        return getMibIndex(self.getDmdRoot("Mibs")).getOid(name) or ''
+
+    def getMibIndex(self):
+        """
+        Return the shared name <-> OID index of all MIBs.
+        """
+        return getMibIndex(self.getDmdRoot("Mibs"))
 
     def countClasses(self):
         """Count all mibs with in a MibOrganizer.
@@ -1,4 +1,3 @@
-
 ##############################################################################
 # 
 # Copyright (C) Zenoss, Inc. 2008, all rights reserved.
@@ -9,8 +8,62 @@
 ##############################################################################
 
 
+from Acquisition import aq_base, aq_chain, aq_inner, aq_parent
+from BTrees.Length import Length
+
 from Products.ZenRelations.RelSchema import *
 
+# Name of the persistent counter, kept on the top-most TemplateContainer
+# (e.g. /Devices), that is bumped whenever template resolution may change.
+GENERATION_ATTR = '_templateGeneration'
+
+# Counters for the template resolution cache, see templateCacheStats
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def templateCacheStats():
+    """
+    Return the hit, miss and invalidation counters of the template
+    resolution cache of this process.
+    """
+    return dict(_stats)
+
+
+def _rootContainer(context):
+    """
+    Return the top-most TemplateContainer in the acquisition chain.
+    """
+    root = None
+    for obj in aq_chain(context):
+        if isinstance(aq_base(obj), TemplateContainer):
+            root = obj
+    return root
+
+
+def _generation(root):
+    counter = getattr(aq_base(root), GENERATION_ATTR, None)
+    if counter is None:
+        return 0
+    return counter()
+
+
+def invalidateTemplateCache(context):
+    """
+    Invalidate the resolved templates of every TemplateContainer that
+    shares a root with context.  The counter is persistent so that other
+    processes see the change after their next sync.
+    """
+    root = _rootContainer(context)
+    if root is None:
+        return
+    counter = getattr(aq_base(root), GENERATION_ATTR, None)
+    if counter is None:
+        counter = Length()
+        setattr(aq_base(root), GENERATION_ATTR, counter)
+    counter.change(1)
+    _stats['invalidations'] += 1
+
+
 class TemplateContainer(object):
     """
     This mixin is so that different classes can sit on the other
@@ -26,3 +79,53 @@ class TemplateContainer(object):
         ('rrdTemplates', 
             ToManyCont(ToOne, 'Products.ZenModel.RRDTemplate', 'deviceClass')),
     )
+
+    def _getResolvedTemplateLevels(self):
+        """
+        Return a dict of template id to the number of aq_parent steps
+        between this container and the container of the nearest template
+        with that id.
+
+        Only the levels are cached (in a volatile attribute) so that no
+        acquisition wrapper outlives the request that built it.  The cache
+        is dropped whenever the generation counter changes.
+        """
+        cached = getattr(self, '_v_resolvedTemplateLevels', None)
+        if cached is not None:
+            root, generation, levels = cached
+            if _generation(root) == generation:
+                _stats['hits'] += 1
+                return levels
+        _stats['misses'] += 1
+        levels = {}
+        root = None
+        for level, obj in enumerate(aq_chain(aq_inner(self), 1)):
+            base = aq_base(obj)
+            if not isinstance(base, TemplateContainer):
+                continue
+            root = base
+            for templateId in obj.rrdTemplates.objectIds():
+                levels.setdefault(templateId, level)
+        self._v_resolvedTemplateLevels = (root, _generation(root), levels)
+        return levels
+
+    def getResolvedRRDTemplate(self, name):
+        """
+        Return the template called name that is visible from this
+        container (the nearest one wins) or None.
+        """
+        level = self._getResolvedTemplateLevels().get(name)
+        if level is None:
+            return None
+        obj = self
+        for i in xrange(level):
+            obj = aq_parent(aq_inner(obj))
+        return obj.rrdTemplates._getOb(name, None)
+
+    def getResolvedRRDTemplates(self):
+        """
+        Return every template visible from this container, the nearest
+        template winning when ids collide.
+        """
+        return filter(None, map(self.getResolvedRRDTemplate,
+                                self._getResolvedTemplateLevels()))
@@ -49,6 +49,7 @@ from Products.ZenUtils import Utils
 from Products.ZenUtils.IpUtil import getHostByName, isip
 from Products.ZenUtils.guid.guid import GUIDManager
 from Products.ZenUtils.ProcessQueue import ProcessQueue
+from Products.ZenUtils.MailQueue import MailQueue, MailQueueFull
 from Products.ZenUtils.ZenTales import talEval, InvalidTalesException
 from zenoss.protocols.protobufs.zep_pb2 import (
     SEVERITY_CLEAR, SEVERITY_INFO, SEVERITY_DEBUG,
@@ -346,10 +347,21 @@ class EmailAction(IActionBase, TargetableAction):
     actionContentInfo = IEmailActionContentInfo
 
     shouldExecuteInBatch = True
+    mailQueue = None
 
     def __init__(self):
         super(EmailAction, self).__init__()
 
+    def configure(self, options):
+        super(EmailAction, self).configure(options)
+        queueSize = options.get('emailQueueSize', 0)
+        if queueSize > 0:
+            self.mailQueue = MailQueue(
+                maxSize=queueSize,
+                workers=options.get('emailWorkers', 2),
+                digestWindow=options.get('emailDigestWindow', 0))
+            self.mailQueue.start()
+
     def getDefaultData(self, dmd):
         return dict(host=dmd.smtpHost,
                     port=dmd.smtpPort,
@@ -448,6 +460,18 @@ class EmailAction(IActionBase, TargetableAction):
         email_message['To'] = ','.join(targets)
         email_message['Date'] = formatdate(None, True)
 
+        if self.mailQueue is not None:
+            try:
+                self.mailQueue.send(email_message, host, port, useTls,
+                                    user, password)
+            except MailQueueFull:
+                raise ActionExecutionException(
+                    "Notification '%s' FAILED to queue emails to %s: the"
+                    " mail queue is full" % (notification.id, targets))
+            log.debug("Notification '%s' queued emails to: %s",
+                      notification.id, targets)
+            return
+
         result, errorMsg = sendEmail(
             email_message,
             host, port,
@@ -0,0 +1,49 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__='''
+Add the metadata columns the device grid sorts and filters on to the global
+catalog, so that a page of devices doesn't wake up every device.
+'''
+
+import Migrate
+from Products.ZCatalog.Catalog import CatalogError
+from Products.Zuul.catalog.global_catalog import DEVICE_GRID_COLUMNS
+
+
+class AddDeviceGridColumns(Migrate.Step):
+
+    version = Migrate.Version(5, 2, 0)
+
+    def cutover(self, dmd):
+        catalog = dmd.zport.global_catalog
+        added = False
+        for column in DEVICE_GRID_COLUMNS:
+            try:
+                catalog._catalog.addColumn(column)
+                added = True
+            except CatalogError:
+                # Column exists
+                pass
+        if not added:
+            return
+        print "Updating the catalog metadata of devices..."
+        for i, brain in enumerate(catalog.unrestrictedSearchResults(
+                objectImplements='Products.ZenModel.Device.Device')):
+            try:
+                device = brain.getObject()
+            except Exception:
+                continue
+            catalog.catalog_object(device, idxs=(), update_metadata=True)
+            if i % 1000 == 999:
+                self.log_progress("%d devices" % (i + 1))
+
+
+AddDeviceGridColumns()
@@ -0,0 +1,34 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__='''
+Build the longest prefix match index of the IPv4 and IPv6 network trees.
+'''
+
+import Migrate
+from Acquisition import aq_base
+
+
+class AddNetworkIndex(Migrate.Step):
+
+    version = Migrate.Version(5, 2, 0)
+
+    def cutover(self, dmd):
+        for name in ('Networks', 'IPv6Networks'):
+            root = getattr(aq_base(dmd), name, None)
+            if root is None or \
+                    getattr(aq_base(root), '_networkIndex', None) is not None:
+                continue
+            print "Indexing the networks of /%s..." % name
+            index = dmd.getDmdRoot(name).buildNetworkIndex()
+            print "Indexed %d networks" % len(index)
+
+
+AddNetworkIndex()
@@ -9,9 +9,15 @@
 
 from zope.component import adapter
 from zope.container.interfaces import IObjectAddedEvent, IObjectRemovedEvent
+from zope.container.interfaces import IObjectMovedEvent
 from OFS.interfaces import IObjectWillBeMovedEvent, IObjectWillBeAddedEvent
 
+from Products.ZenModel.DeviceClass import DeviceClass
 from Products.ZenModel.IpInterface import IpInterface, beforeDeleteIpInterface
+from Products.ZenModel.IpNetwork import IpNetwork
+from Products.ZenModel.MaintenanceWindow import MaintenanceWindow
+from Products.ZenModel.RRDTemplate import RRDTemplate
+from Products.ZenModel.TemplateContainer import invalidateTemplateCache
 
 def unindexBeforeDelete(ob, event):
     """
@@ -55,3 +61,61 @@ def onInterfaceAdded(ob, event):
         if device:
             device.getMacAddressCache().add(ob.macaddress)
 
+
+@adapter(RRDTemplate, IObjectMovedEvent)
+def onTemplateMoved(ob, event):
+    """
+    Templates were added, removed or renamed; the resolved templates of
+    the device classes are stale.
+    """
+    for parent in (event.oldParent, event.newParent):
+        if parent is not None:
+            invalidateTemplateCache(parent)
+
+
+@adapter(DeviceClass, IObjectMovedEvent)
+def onDeviceClassMoved(ob, event):
+    """
+    A device class (and so the templates it can see) moved.  Pasted
+    classes may carry resolved templates computed at their old location.
+    """
+    for parent in (event.oldParent, event.newParent):
+        if parent is not None:
+            invalidateTemplateCache(parent)
+
+
+@adapter(IpNetwork, IObjectWillBeMovedEvent)
+def onNetworkRemoved(ob, event):
+    """
+    Remove networks being moved or deleted from their tree's NetworkIndex.
+    """
+    if not IObjectWillBeAddedEvent.providedBy(event):
+        ob.updateNetworkIndex(remove=True)
+
+
+@adapter(IpNetwork, IObjectMovedEvent)
+def onNetworkAdded(ob, event):
+    """
+    Index networks added or moved in their tree's NetworkIndex.
+    """
+    if not IObjectRemovedEvent.providedBy(event):
+        ob.updateNetworkIndex()
+
+
+@adapter(MaintenanceWindow, IObjectWillBeMovedEvent)
+def onMaintenanceWindowRemoved(ob, event):
+    """
+    Remove windows being moved or deleted, with the device or organizer
+    they belong to, from the active window index.
+    """
+    if not IObjectWillBeAddedEvent.providedBy(event):
+        ob._updateActiveWindowIndex(remove=True)
+
+
+@adapter(MaintenanceWindow, IObjectMovedEvent)
+def onMaintenanceWindowAdded(ob, event):
+    """
+    Index active windows added or moved under their new path.
+    """
+    if not IObjectRemovedEvent.providedBy(event):
+        ob._updateActiveWindowIndex()
@@ -15,10 +15,24 @@ if __name__ == '__main__':
 from Products.ZenModel.ZenossSecurity import *
 from Products.CMFCore.utils import getToolByName
 
+from Products.ZenModel.Device import Device
 from ZenModelBaseTest import ZenModelBaseTest
 
 idsort = lambda a,b: cmp(a.id, b.id)
 
+
+class OwnStateDevice(Device):
+    """
+    A device class with its own setProdState, as ZenPacks may have.
+    """
+    calls = []
+
+    def setProdState(self, state, maintWindowChange=False, REQUEST=None):
+        self.calls.append((self.id, state, maintWindowChange))
+        return super(OwnStateDevice, self).setProdState(
+            state, maintWindowChange, REQUEST)
+
+
 class TestDeviceOrganizers(ZenModelBaseTest):
 
     def assertSameObs(self, *args):
@@ -103,6 +117,46 @@ class TestDeviceOrganizers(ZenModelBaseTest):
         self.assertSameObs(self.dmd.Systems.aa.bb.getSubDevices(),[self.bc, self.ab])
         self.assertSameObs(self.dmd.Systems.aa.cc.getSubDevices(),[self.bc, self.ba])
 
+    def testSetProdStateBulk(self):
+        changed = self.dmd.Devices.aa.setProdStateBulk(500, batchSize=1)
+        self.assertEqual(sorted(changed), ['ab', 'ac'])
+        for dev in (self.ab, self.ac):
+            self.assertEqual(dev.productionState, 500)
+            self.assertEqual(dev.preMWProductionState, 500)
+        self.assertEqual(self.ba.productionState, 1000)
+        stateName = self.dmd.convertProdState(500)
+        self.assertEqual(
+            sorted(b.id for b in self.catalog(getProdState=stateName)),
+            ['ab', 'ac'])
+        self.assertEqual(self.dmd.Devices.aa.setProdStateBulk(500), [])
+
+        changed = self.dmd.Devices.setProdStateBulk(
+            300, [self.ab, self.ba], maintWindowChange=True)
+        self.assertEqual(sorted(changed), ['ab', 'ba'])
+        self.assertEqual(self.ab.productionState, 300)
+        self.assertEqual(self.ab.preMWProductionState, 500)
+
+    def testSetProdStateBulkOverride(self):
+        calls = OwnStateDevice.calls = []
+        own = OwnStateDevice('own')
+        self.dmd.Devices.aa.devices._setObject(own.id, own)
+        own = self.dmd.Devices.aa.devices._getOb('own')
+        changed = self.dmd.Devices.aa.setProdStateBulk(500)
+        self.assertEqual(sorted(changed), ['ab', 'ac', 'own'])
+        self.assertEqual(calls, [('own', 500, False)])
+        self.assertEqual(own.productionState, 500)
+        self.assertEqual(self.ab.productionState, 500)
+
+    def testSetZenPropertyBulk(self):
+        changed = self.dmd.Devices.bb.setZenPropertyBulk(
+            'zSnmpCommunity', 'bulk')
+        self.assertEqual(sorted(changed), ['ba', 'bc'])
+        self.assertEqual(self.ba.zSnmpCommunity, 'bulk')
+        self.assertFalse(self.ab.hasProperty('zSnmpCommunity'))
+        self.assertEqual(
+            self.dmd.Devices.bb.setZenPropertyBulk('zSnmpCommunity', 'bulk'),
+            [])
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
@@ -9,6 +9,7 @@
 
 
 import os, sys
+import logging
 if __name__ == '__main__':
     execfile(os.path.join(sys.path[0], 'framework.py'))
 
@@ -17,6 +18,8 @@ from Products.ZenModel.Exceptions import *
 from ZenModelBaseTest import ZenModelBaseTest
 from Products.ZenUtils.IpUtil import IP_DELIM
 
+log = logging.getLogger('zen.testIpNetwork')
+
 class TestIpNetwork(ZenModelBaseTest):
 
 
@@ -231,6 +234,76 @@ class TestIpNetwork(ZenModelBaseTest):
         subnet24 = dmdNet.createNet("10.10.10.0", 24)
         assertZPropertiesExist(subnet24)
 
+    def testNetworkIndex(self):
+        """
+        The network index follows networks being created, rebalanced, moved
+        and deleted, and finds the same networks as walking the tree.
+        """
+        dmdNet = self.dmd.Networks
+        dmdNet.zDefaultNetworkTree = ['8', '16', '24', '32']
+        subnet24 = dmdNet.createNet("10.10.10.0", 24)
+        other24 = dmdNet.createNet("10.10.20.0", 24)
+        subnet16 = dmdNet.createNet("10.10.0.0", 16)
+        index = dmdNet._networkIndex
+        self.assertEqual(4, len(index))
+        self.assertEqual(subnet24.getPrimaryPath()[4:],
+                         index.get(subnet24.primarySortKey(), 24))
+
+        def lookups():
+            return [(dmdNet.getNet(ip), dmdNet.findNet(*net))
+                    for ip, net in (("10.10.10.5", ("10.10.10.0", 24)),
+                                    ("10.10.20.5", ("10.10.20.0", 0)),
+                                    ("10.10.30.5", ("10.10.0.0", 16)),
+                                    ("11.0.0.1", ("11.0.0.0", 8)))]
+        indexed = lookups()
+        self.assertEqual((subnet24, subnet24), indexed[0])
+        self.assertEqual((other24, other24), indexed[1])
+        self.assertEqual(subnet16, indexed[2][0])
+        self.assertEqual((None, None), indexed[3])
+        self.assertEqual(None, subnet24.getNet("10.10.20.5"))
+
+        del dmdNet._networkIndex
+        self.assertEqual(indexed, lookups())
+        index = dmdNet.buildNetworkIndex()
+        self.assertEqual(indexed, lookups())
+
+        subnet8 = dmdNet.findNet("10.0.0.0", 8)
+        subnet8.moveOrganizer("/Networks", ["10.10.0.0"])
+        self.assertEqual(("10.10.0.0", "10.10.10.0"),
+                         index.get(subnet24.primarySortKey(), 24))
+        moved = dmdNet.getNet("10.10.10.5")
+        self.assertEqual(("10.10.0.0", "10.10.10.0"),
+                         moved.getPrimaryPath()[4:])
+        dmdNet.manage_deleteOrganizers(["/10.10.0.0"])
+        self.assertEqual(1, len(index))
+        self.assertEqual(subnet8, dmdNet.getNet("10.10.10.5"))
+
+    def ftestBulkCreation(self):
+        """
+        Times creating IPs in 1000 /24 networks, with and without the
+        network index.
+        """
+        import time
+        timings, networks = {}, {}
+        for label in ('index', 'tree walk'):
+            dmdNet = self.dmd.Networks
+            for net in dmdNet.children():
+                dmdNet._delObject(net.id)
+            if label == 'tree walk':
+                del dmdNet._networkIndex
+            start = time.time()
+            for i in xrange(4000):
+                net = i % 1000
+                dmdNet.createIp("10.%d.%d.%d" % (net % 4, net / 4,
+                                                 i / 1000 + 1), 24)
+            timings[label] = time.time() - start
+            networks[label] = len(dmdNet.getSubNetworks())
+            log.info("%s: %.3fs for 4000 IPs in %d networks",
+                     label, timings[label], networks[label])
+            self.assertEqual(4000, dmdNet.countIpAddresses())
+        self.assertEqual(networks['index'], networks['tree walk'])
+        self.assert_(timings['index'] < timings['tree walk'])
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
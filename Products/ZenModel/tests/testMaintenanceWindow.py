@@ -8,14 +8,18 @@
 ##############################################################################
 
 
+import logging
 from time import mktime, time
 
 from ZenModelBaseTest import ZenModelBaseTest
-from Products.ZenModel.MaintenanceWindow import MaintenanceWindow, DAY_SECONDS
+from Products.ZenModel.MaintenanceWindow import MaintenanceWindow, DAY_SECONDS, \
+     ACTIVE_WINDOWS_ATTR
 # Note: The new messaging code inteferes with FakeRequest operations,
 #      as the adapter machinery doesn't load
 #from Products.ZenUtils.FakeRequest import FakeRequest
 
+log = logging.getLogger('zen.testMaintenanceWindow')
+
 
 # Note: These defaults can be overridden by the user, but we only need an
 #       example set to test.
@@ -389,6 +393,115 @@ class TestMaintenanceWindows(ZenModelBaseTest):
         self.assert_(mws.dev.productionState == dev_orig_state)
 
 
+    def testActiveWindowIndex(self):
+        """
+        Windows are added to the active window index when they begin and
+        removed when they end.
+        """
+        windowDefs = [
+           [0, 3, state_Pre_Production],
+           [1, 5, state_Test],
+        ]
+        mws = self.setupWindows(windowDefs)
+        paths = [mw.getPrimaryId() for mw in mws.mwObjs[:2]]
+
+        mws.mwObjs[0].begin(now=mws.time_tn[0])
+        mws.mwObjs[1].begin(now=mws.time_tn[1])
+        index = getattr(self.dmd, ACTIVE_WINDOWS_ATTR)
+        self.assertEqual(sorted(index), sorted(paths))
+
+        mws.mwObjs[0].end()
+        self.assertEqual(list(index), paths[1:])
+        self.assertEqual(mws.dev.productionState,
+                         mws.mwObjs[1].startProductionState)
+
+        # A deleted window is dropped once it is found to be gone
+        mws.grp.maintenanceWindows._delObject(mws.mwIds[1])
+        mws.mwObjs[0].fetchDeviceMinProdStates([mws.dev])
+        self.assertEqual(list(index), [])
+
+
+    def testDeviceJoiningActiveWindow(self):
+        """
+        A device added to the group of an active window stays in that
+        window's state when another window of the device ends.
+        """
+        mws = self.setupWindows([[0, 3, state_Pre_Production]])
+        lateGroup = self.dmd.Groups.createOrganizer('unittestLateGroup')
+        lateGroup.manage_addMaintenanceWindow('lateWindow')
+        lateWindow = lateGroup.maintenanceWindows._getOb('lateWindow')
+        lateWindow.manage_editMaintenanceWindow(
+            startDate=mws.startDate, startHours=str(mws.tn[0]),
+            durationHours='5', startProductionState=state_Maintenance,
+            REQUEST=None)
+        lateWindow.begin(now=mws.time_tn[0])
+        mws.mwObjs[0].begin(now=mws.time_tn[0])
+        self.assertEqual(mws.dev.productionState, state_Pre_Production)
+
+        mws.dev.setGroups([mws.grp.getOrganizerName(),
+                           lateGroup.getOrganizerName()])
+        mws.mwObjs[0].end()
+        self.assertEqual(mws.dev.productionState, state_Maintenance)
+
+
+    def testRenamedDeviceWindowStaysActive(self):
+        """
+        The window of a renamed device stays in the active window index,
+        under its new path, and keeps applying its state.
+        """
+        mws = self.setupWindows([[0, 3, state_Pre_Production]])
+        mws.dev.manage_addMaintenanceWindow('devWindow')
+        devWindow = mws.dev.maintenanceWindows._getOb('devWindow')
+        devWindow.manage_editMaintenanceWindow(
+            startDate=mws.startDate, startHours=str(mws.tn[0]),
+            durationHours='5', startProductionState=state_Maintenance,
+            REQUEST=None)
+        devWindow.begin(now=mws.time_tn[0])
+        mws.mwObjs[0].begin(now=mws.time_tn[0])
+
+        mws.dev.renameDevice('unittestRenamed')
+        dev = self.dmd.Devices.findDeviceByIdExact('unittestRenamed')
+        devWindow = dev.maintenanceWindows._getOb('devWindow')
+        index = getattr(self.dmd, ACTIVE_WINDOWS_ATTR)
+        self.assertEqual(sorted(index), sorted([devWindow.getPrimaryId(),
+                                                mws.mwObjs[0].getPrimaryId()]))
+        mws.mwObjs[0].end()
+        self.assertEqual(dev.productionState, state_Maintenance)
+
+
+    def ftestManyWindowsStateChangeLoad(self):
+        """
+        Time a window change with 3000 other active windows, at the
+        maintenance state, on overlapping groups.
+        """
+        mws = self.setupWindows([[0, 3, state_Pre_Production]])
+        for i in range(100):
+            dev = self.dmd.Devices.createInstance("mwdev%d" % i)
+            dev.setGroups(mws.grp.id)
+        groups = [self.dmd.Groups.createOrganizer("mwgroup%d" % i)
+                  for i in range(30)]
+        mws.dev.setGroups([grp.getOrganizerName()
+                           for grp in [mws.grp] + groups])
+        for i in range(3000):
+            grp = groups[i % 30]
+            mwid = "mwload%d" % i
+            grp.manage_addMaintenanceWindow(mwid)
+            mw = grp.maintenanceWindows._getOb(mwid)
+            mw.started = mws.time_tn[0]
+            mw._updateActiveWindowIndex()
+
+        now = time()
+        mws.mwObjs[0].begin(now=mws.time_tn[0])
+        log.info("First window start with 3000 active windows: %f seconds",
+                 time() - now)
+        self.assertEqual(mws.dev.productionState, state_Maintenance)
+        now = time()
+        mws.mwObjs[0].end()
+        log.info("Next window end with 3000 active windows: %f seconds",
+                 time() - now)
+        self.assertEqual(mws.dev.productionState, state_Maintenance)
+
+
     def ftestWindowStateChangeLoad(self):
         """
         The simple algorithm in use is O(n * m^2) for n devices and m windows,
@@ -136,6 +136,25 @@ class TestMibOrganizer(ZenModelBaseTest):
         self.assert_(mibOrg.oid2name('2') == 'notification')
 
 
+    def testMibIndexInvalidation(self):
+        mibOrg = self.dmd.Mibs
+        mod = mibOrg.createMibModule('mod')
+        mod.createMibNode(id='node', moduleName='mod', nodetype='MibNode',
+                          oid='1.3.6.1.9', status='ok')
+        self.assertEqual('1.3.6.1.9', mibOrg.name2oid('node'))
+        self.assertEqual('node.1', mibOrg.oid2name('1.3.6.1.9.1',
+                                                   exactMatch=False))
+        index = mibOrg.getMibIndex()
+        self.assert_(index is mibOrg.getMibIndex())
+
+        mod.createMibNode(id='other', moduleName='mod', nodetype='MibNode',
+                          oid='1.3.6.1.10', status='ok')
+        self.assertEqual('other', mibOrg.oid2name('1.3.6.1.10'))
+        mod.deleteMibNodes(['node'])
+        self.assertEqual('', mibOrg.name2oid('node'))
+        self.assertEqual('', mibOrg.oid2name('1.3.6.1.9.1', exactMatch=False))
+
+
     def testOrganizer(self):
         mibOrg = self.dmd.Mibs
         subOrg = mibOrg.createOrganizer('/sub')
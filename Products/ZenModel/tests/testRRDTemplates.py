@@ -13,7 +13,9 @@ if __name__ == '__main__':
     framework = None                    # quiet pyflakes
     execfile(os.path.join(sys.path[0], 'framework.py'))
 
+from Acquisition import aq_base, aq_chain
 from ZenModelBaseTest import ZenModelBaseTest
+from Products.ZenModel.TemplateContainer import TemplateContainer
 
 class TestRRDTemplates(ZenModelBaseTest):
 
@@ -68,6 +70,61 @@ class TestRRDTemplates(ZenModelBaseTest):
         self.assert_('test2' not in lintemps)
         self.assert_('test3' in lintemps)
 
+    def testResolvedTemplates(self):
+        from Products.ZenModel.TemplateContainer import templateCacheStats
+        devices = self.dmd.Devices
+        server = self.dmd.Devices.createOrganizer('/Server')
+        linux = self.dmd.Devices.createOrganizer('/Server/Linux')
+        devices.manage_addRRDTemplate('test1')
+        server.manage_addRRDTemplate('test1')
+        devices.manage_addRRDTemplate('test2')
+        dev = linux.createInstance('testdev')
+
+        template = dev.getRRDTemplateByName('test1')
+        self.assertEqual(server.rrdTemplates.test1, template)
+        self.assertEqual(devices.rrdTemplates.test2,
+                         dev.getRRDTemplateByName('test2'))
+        self.assert_(dev.getRRDTemplateByName('test3') is None)
+        self.assertEqual(self.uncachedTemplates(linux),
+                         sorted(t.getPrimaryId() for t in linux.getRRDTemplates()))
+
+        # lookups are served from the cache until a template changes
+        hits = templateCacheStats()['hits']
+        dev.getRRDTemplateByName('test1')
+        self.assertEqual(hits + 1, templateCacheStats()['hits'])
+
+        linux.manage_addRRDTemplate('test3')
+        self.assertEqual(linux.rrdTemplates.test3,
+                         dev.getRRDTemplateByName('test3'))
+        server.rrdTemplates._delObject('test1')
+        self.assertEqual(devices.rrdTemplates.test1,
+                         dev.getRRDTemplateByName('test1'))
+
+        # binding a template and moving one
+        linux.bindTemplates(['test2', 'test3'])
+        self.assertEqual(['test2', 'test3'],
+                         [t.id for t in dev.getRRDTemplates()])
+        template = devices.rrdTemplates._getOb('test2')
+        devices.rrdTemplates._delObject('test2')
+        linux.rrdTemplates._setObject('test2', aq_base(template))
+        self.assertEqual(linux.rrdTemplates.test2,
+                         dev.getRRDTemplateByName('test2'))
+        for organizer in (devices, server, linux):
+            self.assertEqual(self.uncachedTemplates(organizer),
+                             sorted(t.getPrimaryId()
+                                    for t in organizer.getRRDTemplates()))
+
+    def uncachedTemplates(self, organizer):
+        """
+        The paths of the templates visible from organizer, the nearest
+        winning, found without the template cache.
+        """
+        templates = {}
+        for obj in reversed(aq_chain(organizer)):
+            if isinstance(aq_base(obj), TemplateContainer):
+                templates.update((t.id, t) for t in obj.rrdTemplates())
+        return sorted(t.getPrimaryId() for t in templates.values())
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
@@ -55,6 +55,60 @@ class Testzenbatchloader(BaseTestCase):
         dev = self.zloader.dmd.Devices.findDevice('device1')
         self.assert_(dev.cDateTest == olympics)
 
+    def testBatches(self):
+        """
+        Load devices in batches, with their locations added beforehand
+        """
+        self.zloader.options.batchsize = 2
+        self.zloader.options.retries = 1
+        self.zloader.options.modelWorkers = 0
+        configs = ["batch1 setLocation='/Batch/Here'",
+                   "batch2 setLocation='/Batch/There'",
+                   "batch3 setLocation='/Batch/Here'"]
+        device_list, unparseable = self.zloader.parseDevices(configs)
+        self.zloader.processDevices(device_list)
+
+        for name in ('batch1', 'batch2', 'batch3'):
+            self.assert_(self.zloader.dmd.Devices.findDevice(name))
+        dev = self.zloader.dmd.Devices.findDevice('batch3')
+        self.assertEqual(dev.location().getOrganizerName(), '/Batch/Here')
+        loaded = self.zloader.report['loaded']
+        self.assertEqual([entry['deviceName'] for entry in loaded],
+                         ['batch1', 'batch2', 'batch3'])
+        self.assertEqual(self.zloader.report['rejected'], [])
+
+    def testBatchWithFailingEntry(self):
+        """
+        An entry failing in the middle of a batch is rolled back on its own
+        """
+        self.zloader.options.batchsize = 3
+        self.zloader.options.retries = 1
+        self.zloader.options.modelWorkers = 0
+        applyZProps = self.zloader.applyZProps
+        def failingApplyZProps(devobj, device_specs):
+            if devobj.id == 'broken2':
+                raise ValueError("bad zProperty")
+            applyZProps(devobj, device_specs)
+        self.zloader.applyZProps = failingApplyZProps
+        notified = []
+        self.zloader.notifyNewDeviceCreated = notified.append
+        configs = ["fine1", "broken2", "fine3"]
+        device_list, unparseable = self.zloader.parseDevices(configs)
+        processed = self.zloader.processDevices(device_list)
+
+        devices = self.zloader.dmd.Devices
+        self.assert_(devices.findDeviceByIdExact('fine1'))
+        self.assert_(devices.findDeviceByIdExact('fine3'))
+        self.failIf(devices.findDeviceByIdExact('broken2'))
+        self.assertEqual(processed['errors'], 1)
+        loaded = self.zloader.report['loaded']
+        self.assertEqual([entry['deviceName'] for entry in loaded],
+                         ['fine1', 'fine3'])
+        rejected = self.zloader.report['rejected']
+        self.assertEqual([entry['deviceName'] for entry in rejected],
+                         ['broken2'])
+        self.assertEqual(notified, ['fine1', 'fine3'])
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
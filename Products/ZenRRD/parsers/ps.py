@@ -30,6 +30,107 @@ from Products.ZenModel.OSProcessState import determineProcessState
 # (device, cmdAndArgs)
 Globals.MostRecentMonitoredTimePids = getattr(Globals, "MostRecentMonitoredTimePids", {})
 
+# Matchers are keyed by their regexes so that the compiled regexes are kept
+# between collection cycles.
+_matchers = {}
+_MAX_MATCHERS = 10000
+
+def getMatcher(cmd):
+    """
+    Return an OSProcessDataMatcher for the process datasource cmd.
+    """
+    key = (cmd.includeRegex, cmd.excludeRegex, cmd.replaceRegex,
+           cmd.replacement, cmd.primaryUrlPath, cmd.generatedId)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        if len(_matchers) >= _MAX_MATCHERS:
+            _matchers.clear()
+        matcher = _matchers[key] = OSProcessDataMatcher(
+            includeRegex   = cmd.includeRegex,
+            excludeRegex   = cmd.excludeRegex,
+            replaceRegex   = cmd.replaceRegex,
+            replacement    = cmd.replacement,
+            primaryUrlPath = cmd.primaryUrlPath,
+            generatedId    = cmd.generatedId)
+    return matcher
+
+
+class ProcessTable(object):
+    """
+    The processes listed in the output of one ps command.
+
+    The output is parsed once, the first time a datasource claims its
+    processes.  The datasources given to the table are then matched in a
+    single pass over the processes: each process belongs to the first
+    datasource, in the order given, that matches it, so no process is
+    counted by more than one OSProcess.
+    """
+
+    def __init__(self, output, cmds=()):
+        """
+        @param output: ps command output, including the header line
+        @param cmds: process datasources, in sequence order
+        """
+        self._output = output
+        self._cmds = list(cmds)
+        self._rows = None
+        self._matched = None
+        self.claimedPids = set()
+
+    def _parse(self, parser):
+        """
+        Parse the output into a list of (pid, rss, cpu, cmdAndArgs) tuples.
+        """
+        # without relying on "ps" command output
+        data = unicode(self._output, errors="replace")
+        lines = data.splitlines()[1:]
+        self._rows = filter(None, map(parser._extractProcessMetrics, lines))
+
+    def _match(self, cmds):
+        """
+        Assign the unclaimed processes to the first of cmds that matches
+        them.  Processes with the same command line get the same verdict,
+        so each distinct command line is matched only once.
+        """
+        matchers = [(cmd, getMatcher(cmd)) for cmd in cmds]
+        matched = dict((id(cmd), []) for cmd in cmds)
+        owners = {}
+        for row in self._rows:
+            pid, cmdAndArgs = row[0], row[3]
+            if pid in self.claimedPids:
+                continue
+            try:
+                owner = owners[cmdAndArgs]
+            except KeyError:
+                owner = None
+                for cmd, matcher in matchers:
+                    if matcher.matches(cmdAndArgs):
+                        owner = id(cmd)
+                        break
+                owners[cmdAndArgs] = owner
+            if owner is not None:
+                matched[owner].append(row)
+                self.claimedPids.add(pid)
+        return matched
+
+    def claim(self, cmd, parser):
+        """
+        Return the (pid, rss, cpu, cmdAndArgs) tuples of the processes
+        that belong to cmd.  A datasource that was not given to the table
+        only gets processes that no other datasource has claimed.
+
+        @param parser: ps parser used to parse the output lines
+        """
+        if self._rows is None:
+            self._parse(parser)
+        if self._matched is None:
+            self._matched = self._match(self._cmds)
+        if id(cmd) not in self._matched:
+            self._cmds.append(cmd)
+            self._matched.update(self._match([cmd]))
+        return self._matched[id(cmd)]
+
+
 def parseCpuTime(cputime):
     """
     Parse the cputime field of a process (output from the ps command).
@@ -123,31 +224,12 @@ class ps(CommandParser):
         return combinedPids, combinedRss, combinedCpu
 
     def processResults(self, cmd, results):
-        matcher = OSProcessDataMatcher(
-            includeRegex   = cmd.includeRegex,
-            excludeRegex   = cmd.excludeRegex,
-            replaceRegex   = cmd.replaceRegex,
-            replacement    = cmd.replacement,
-            primaryUrlPath = cmd.primaryUrlPath,
-            generatedId    = cmd.generatedId)
-
-        def matches(processMetrics):
-            pid, rss, cpu, cmdAndArgs = processMetrics
-            return matcher.matches(cmdAndArgs)
-	
-	data = unicode(cmd.result.output, errors="replace")  # without relying on "ps" command output
-	lines = data.splitlines()[1:]
-        metrics = map(self._extractProcessMetrics, lines)
-        matchingMetrics = filter(matches, metrics)
-        
-        # We can not take into account processes that have already been
-        # matched by other process class
-        if hasattr(cmd, 'already_matched_cmdAndArgs'):
-            if cmd.already_matched_cmdAndArgs:
-                matchingMetrics = [ m for m in matchingMetrics if m[3] not in cmd.already_matched_cmdAndArgs ]
-                cmd.already_matched_cmdAndArgs.extend([ m[3] for m in matchingMetrics ])
-            else:
-                cmd.already_matched_cmdAndArgs = [ m[3] for m in matchingMetrics ]
+        # zencommand shares one table between all of the OSProcess
+        # datasources run off the same ps output
+        table = getattr(cmd, 'processTable', None)
+        if table is None:
+            table = ProcessTable(cmd.result.output, [cmd])
+        matchingMetrics = table.claim(cmd, self)
 
         pids, rss, cpu = self._combineProcessMetrics(matchingMetrics)
 
@@ -8,6 +8,8 @@
 ##############################################################################
 
 import logging
+import os
+import re
 
 from twisted.internet import reactor, defer
 from twisted.internet.error import ProcessExitedAlready
@@ -336,3 +338,122 @@ class SshRunner(object):
 
         return self
 
+
+class CommandResult(object):
+    """
+    The result of one command run as part of a batch.  It provides the
+    same attributes as the runners so that it can be handed to
+    Cmd.processCompleted.
+    """
+
+    def __init__(self, output, exitCode, stderr):
+        self.output = output
+        self.exitCode = exitCode
+        self.stderr = stderr
+
+
+BATCH_SHELL = "/bin/sh"
+
+# A batch times out after its commands' timeouts, but at most after this
+# many of them
+MAX_BATCH_TIMEOUTS = 3
+
+
+def shellQuote(text):
+    """
+    Quote text so that a POSIX shell passes it on as a single argument.
+    """
+    return "'%s'" % text.replace("'", "'\\''")
+
+
+def buildBatchScript(commands, token):
+    """
+    Return a command line that runs all of commands in one shell, one after
+    the other.  Each command's stdout, stderr and exit code are framed with
+    marker lines containing token so that parseBatchOutput can split them
+    apart again.
+
+    @param commands: command lines to run
+    @param token: string that doesn't appear in the output of the commands
+    """
+    lines = ['_zb_err=`mktemp 2>/dev/null || echo /tmp/.zenbatch.$$`']
+    for index, command in enumerate(commands):
+        lines.extend([
+            "printf '\\n%s:%d:out\\n'" % (token, index),
+            '(\n%s\n) 2>"$_zb_err" </dev/null' % command,
+            '_zb_rc=$?',
+            "printf '\\n%s:%d:err\\n'" % (token, index),
+            'cat "$_zb_err"',
+            "printf '\\n%s:%d:rc:%%d\\n' $_zb_rc" % (token, index),
+        ])
+    lines.append('rm -f "$_zb_err"')
+    return "%s -c %s" % (BATCH_SHELL, shellQuote('\n'.join(lines)))
+
+
+def parseBatchOutput(output, token, count):
+    """
+    Split the output of a script built by buildBatchScript into the
+    results of its commands.
+
+    @return: list of count CommandResult objects, in command order, with
+             None for the commands whose results are missing
+    """
+    marker = re.compile(r'\n%s:(\d+):(out|err|rc)(?::(-?\d+))?\n'
+                        % re.escape(token))
+    sections = {}
+    pieces = marker.split(output)
+    for i in xrange(1, len(pieces), 4):
+        index, field, code, content = pieces[i:i + 4]
+        index = int(index)
+        if field == 'rc':
+            content = int(code)
+        sections.setdefault(index, {})[field] = content
+
+    results = [None] * count
+    for index, fields in sections.iteritems():
+        if index < count and len(fields) == 3:
+            results[index] = CommandResult(fields['out'], fields['rc'],
+                                           fields['err'])
+    return results
+
+
+class SshBatchRunner(SshRunner):
+    """
+    Runs several commands through a single channel of an SSH connection.
+    """
+
+    def sendBatch(self, commands):
+        """
+        Run the commands of the Cmd objects in commands in one remote shell.
+
+        @return: deferred list of CommandResult objects, in command order,
+                 with None for the commands whose results are missing
+        """
+        self.command = commands
+        token = 'ZENBATCH-%s' % os.urandom(8).encode('hex')
+        script = buildBatchScript([c.command for c in commands], token)
+        self._script = script
+        d = self.command_defer = self.connection.addCommand(script)
+        self._timer = reactor.callLater(
+            self._sshOptions.commandTimeout *
+            min(len(commands), MAX_BATCH_TIMEOUTS), self.timeout)
+        d.addBoth(self.processEnded)
+        d.addCallback(
+            lambda result: parseBatchOutput(result.output, token, len(commands)))
+        return d
+
+    def timeout(self, timedOut=True):
+        """
+        Close the channel of the batch, which may still be running on the
+        device, and fail it.
+        """
+        if self.command_defer.called:
+            return
+        sshconn = getattr(self.connection, 'connection', None)
+        for channel in getattr(sshconn, 'channels', {}).values():
+            if getattr(channel, 'command', None) == self._script:
+                log.debug("Closing the channel of a timed out batch on %s",
+                          self.deviceId)
+                channel.loseConnection()
+        self.command_defer.errback(TimeoutError(self.command))
+
@@ -0,0 +1,98 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import subprocess
+from unittest import TestCase
+
+from twisted.internet import defer, task
+
+from Products.ZenRRD import runner
+from Products.ZenRRD.runner import buildBatchScript, parseBatchOutput
+from Products.ZenUtils.Utils import DictAsObj
+
+TOKEN = 'ZENBATCH-0123456789abcdef'
+
+
+def runLocally(commandLine):
+    """
+    Stand in for the remote login shell of an SSH exec channel.
+    """
+    process = subprocess.Popen(commandLine, shell=True,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, stderr = process.communicate()
+    return output
+
+
+class BatchRunnerTest(TestCase):
+
+    def testRoundTrip(self):
+        commands = [
+            "echo hello",
+            "printf 'no newline'",
+            "echo oops >&2; exit 3",
+            "echo 'it''s quoted' | tr a-z A-Z",
+            "true",
+        ]
+        output = runLocally(buildBatchScript(commands, TOKEN))
+        results = parseBatchOutput(output, TOKEN, len(commands))
+        self.assertEqual(
+            [(r.output, r.exitCode, r.stderr) for r in results],
+            [("hello\n", 0, ""),
+             ("no newline", 0, ""),
+             ("", 3, "oops\n"),
+             ("ITS QUOTED\n", 0, ""),
+             ("", 0, "")])
+
+    def testTruncatedOutput(self):
+        commands = ["echo one", "echo two"]
+        output = runLocally(buildBatchScript(commands, TOKEN))
+        output = output[:output.index("two")]
+        results = parseBatchOutput(output, TOKEN, len(commands))
+        self.assertEqual(results[0].output, "one\n")
+        self.assertEqual(results[1], None)
+
+    def testTimeout(self):
+        class Channel(object):
+            closed = False
+            def loseConnection(self):
+                self.closed = True
+        channel = Channel()
+
+        class Connection(object):
+            def addCommand(self, command):
+                channel.command = command
+                self.connection = DictAsObj(channels={1: channel})
+                return defer.Deferred()
+
+        batchRunner = runner.SshBatchRunner.__new__(runner.SshBatchRunner)
+        batchRunner.deviceId = 'device'
+        batchRunner.connection = Connection()
+        batchRunner._sshOptions = DictAsObj(commandTimeout=10)
+        clock = task.Clock()
+        reactor, runner.reactor = runner.reactor, clock
+        try:
+            commands = [DictAsObj(command='sleep 60')] * 10
+            failures = []
+            batchRunner.sendBatch(commands).addErrback(failures.append)
+        finally:
+            runner.reactor = reactor
+        # The timeout doesn't grow with the number of commands
+        clock.advance(10 * runner.MAX_BATCH_TIMEOUTS - 1)
+        self.assertEqual(failures, [])
+        clock.advance(1)
+        self.assertTrue(failures[0].check(runner.TimeoutError))
+        self.assertTrue(channel.closed)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(BatchRunnerTest))
+    return suite
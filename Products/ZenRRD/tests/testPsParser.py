@@ -14,7 +14,7 @@ from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenRRD.tests.BaseParsersTestCase import Object
 from Products.ZenRRD.CommandParser import ParsedResults
 
-from Products.ZenRRD.parsers.ps import ps
+from Products.ZenRRD.parsers.ps import ps, ProcessTable
 
 class TestParsers(BaseTestCase):
     def testPs1(self):
@@ -477,6 +477,60 @@ class TestParsers(BaseTestCase):
             if summary.find('Process up') < 0: # and they were still running with the same PIDs
                 raise AssertionError("unexpected event")
 
+    def testPsSequence(self):
+        """
+        A process is only counted by the first process set, in sequence
+        order, that matches it.
+        """
+        deviceConfig = Object()
+        deviceConfig.device = 'localhost'
+        output = """  PID   RSS     TIME COMMAND
+100 1 00:00:01 /usr/bin/java -jar zenjobs.jar
+101 1 00:00:01 /usr/bin/java -jar zenjobs.jar
+102 1 00:00:01 /usr/bin/java -jar other.jar
+103 1 00:00:01 /usr/sbin/sshd
+"""
+        cmds = []
+        for name, regex in (("zenjobs", "zenjobs"), ("java", "java")):
+            cmd = Object()
+            cmd.deviceConfig = deviceConfig
+            cmd.command = 'command'
+            cmd.includeRegex = regex
+            cmd.excludeRegex = None
+            cmd.replaceRegex = ".*"
+            cmd.replacement = name
+            cmd.primaryUrlPath = "url"
+            cmd.displayName = name
+            cmd.severity = 1
+            cmd.generatedId = "url_" + md5(name).hexdigest().strip()
+            p1 = Object()
+            p1.id = 'count'
+            p1.data = dict(id=cmd.generatedId,
+                           alertOnRestart=True,
+                           failSeverity=3)
+            cmd.points = [p1]
+            cmd.result = Object()
+            cmd.result.output = output
+            cmds.append(cmd)
+
+        table = ProcessTable(output, cmds)
+        parser = ps()
+        counts = []
+        for cmd in cmds:
+            cmd.processTable = table
+            results = ParsedResults()
+            parser.processResults(cmd, results)
+            counts.extend(value for dp, value in results.values)
+        self.assertEqual(counts, [2, 1])
+        self.assertEqual(table.claimedPids, set([100, 101, 102]))
+
+        # Without the shared table each process set matches on its own
+        javaCmd = cmds[1]
+        del javaCmd.processTable
+        results = ParsedResults()
+        parser.processResults(javaCmd, results)
+        self.assertEqual([value for dp, value in results.values], [3])
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
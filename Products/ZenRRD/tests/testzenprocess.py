@@ -16,9 +16,12 @@ from md5 import md5
 log = logging.getLogger('zen.testzenprocess')
 
 import re
+from twisted.internet import defer
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenRRD.zenprocess import ZenProcessTask
 from Products.ZenRRD.zenprocess import mapResultsToDicts
+from Products.ZenRRD.zenprocess import INDEXTABLE, NAMETABLE, PATHTABLE, \
+    ARGSTABLE
 from Products.ZenUtils.Utils import zenPath
 from Products.ZenHub.services.ProcessConfig import ProcessProxy
 
@@ -46,6 +49,38 @@ class TaskConfig(object):
         if procDefs is not None:
             self.processes = procDefs
 
+class SnmpAgent(object):
+    """
+    Stands in for the SNMP proxy of a device's HOST-RESOURCES-MIB process
+    table, counting the requests made.
+    """
+    def __init__(self):
+        self.processes = {}
+        self.requests = 0
+
+    def _values(self):
+        values = {}
+        for pid, (name, path, args) in self.processes.iteritems():
+            values['%s.%d' % (INDEXTABLE, pid)] = pid
+            values['%s.%d' % (NAMETABLE, pid)] = name
+            values['%s.%d' % (PATHTABLE, pid)] = path
+            values['%s.%d' % (ARGSTABLE, pid)] = args
+        return values
+
+    def getTable(self, oids, **kw):
+        self.requests += 1
+        values = self._values()
+        return defer.succeed(dict(
+            (table, dict((oid, value) for oid, value in values.iteritems()
+                         if oid.rsplit('.', 1)[0] == table))
+            for table in oids))
+
+    def get(self, oids, timeout, tries):
+        self.requests += 1
+        values = self._values()
+        return defer.succeed(dict((oid, values[oid]) for oid in oids
+                                  if oid in values))
+
 class ProcessResults(object):
     PROCESSES = 'PROCESSES'
     AFTERBYCONFIG = 'AFTERBYCONFIG'
@@ -875,6 +910,52 @@ class TestZenprocess(BaseTestCase):
         
         self.assertEqual(result, expected)
 
+    def testIncrementalScan(self):
+        task = self.makeTask({})
+        options = task._preferences.options = Options()
+        options.showrawtables = False
+        options.showprocs = False
+        options.captureFilePrefix = ''
+        options.fullscancycles = 3
+        task._maxOidsPerRequest = 40
+        agent = task.snmpProxy = SnmpAgent()
+        for pid in range(1, 101):
+            agent.processes[pid] = ('app', '/bin/app', str(pid))
+
+        def scan():
+            agent.requests = 0
+            results = []
+            task._getProcesses().addCallback(results.append)
+            return dict(results[0])
+
+        procs = scan()
+        self.assertEqual(len(procs), 100)
+        self.assertEqual(agent.requests, 1)
+
+        # pid 1 exited, pid 101 started
+        del agent.processes[1]
+        agent.processes[101] = ('new', '/bin/new', 'args')
+        procs = scan()
+        self.assertEqual(sorted(procs), range(2, 102))
+        self.assertEqual(procs[101], '/bin/new args')
+        self.assertEqual(agent.requests, 2)
+
+        # a monitored pid was reused by another process
+        task._deviceStats._pidToProcess = {2: None}
+        agent.processes[2] = ('other', '/bin/other', '')
+        procs = scan()
+        self.assertEqual(procs[2], '/bin/other')
+        self.assertEqual(agent.requests, 3)
+        self.assertEqual(task._deviceStats.cyclesSinceFullScan, 0)
+
+        # the third cycle after a full walk walks the table again
+        scan()
+        scan()
+        self.assertEqual(task._deviceStats.cyclesSinceFullScan, 2)
+        scan()
+        self.assertEqual(agent.requests, 1)
+        self.assertEqual(task._deviceStats.cyclesSinceFullScan, 0)
+
     
 
 
@@ -34,6 +34,7 @@ from Products.ZenUtils.Utils import unused, getExitMessage
 from Products.DataCollector.SshClient import SshClient
 from Products.ZenEvents.ZenEventClasses import Clear, Cmd_Fail
 from Products.ZenRRD.CommandParser import ParsedResults
+from Products.ZenRRD.parsers.ps import ProcessTable
 from Products.ZenRRD import runner
 
 from Products.ZenCollector.daemon import CollectorDaemon
@@ -117,6 +118,15 @@ class SshPerformanceCollectionPreferences(object):
                           help="Display the entire command and command-line arguments, " \
                                " including any passwords.")
 
+        parser.add_option('--batchcommands',
+                          dest='batchcommands',
+                          action="store_true",
+                          default=False,
+                          help="Run all of a device's SSH commands for a cycle" \
+                               " in one remote shell instead of opening a" \
+                               " channel per command. The remote shell must" \
+                               " be POSIX compatible.")
+
     def postStartup(self):
         pass
 
@@ -368,6 +378,8 @@ class SshPerformanceCollectionTask(BaseTask):
                                                   COLLECTOR_NAME)
         self._maxbackoffseconds = preferences.options.maxbackoffminutes * 60
         self._showfullcommand = preferences.options.showfullcommand
+        self._batchCommands = self._useSsh and \
+                              preferences.options.batchcommands
 
         self._executor = TwistedExecutor(taskConfig.zSshConcurrentSessions)
 
@@ -431,6 +443,48 @@ class SshPerformanceCollectionTask(BaseTask):
         d.addBoth(datasource.processCompleted)
         return d
 
+    @defer.inlineCallbacks
+    def _addBatch(self, datasources):
+        """
+        Run the commands of all of the datasources through a single SSH
+        channel.  Datasources whose results can't be recovered from the
+        batch output are run again through their own channels, unless the
+        batch timed out: the device is then reported down instead.
+
+        @return: list of deferreds, one per datasource
+        """
+        if self._showfullcommand:
+            for datasource in datasources:
+                log.info("Datasource %s command: %s", datasource.name,
+                         datasource.command)
+
+        batchRunner = runner.SshBatchRunner(self._device, MySshClient)
+        batchRunner.connection = self._connector.connection
+        lastStart = time.time()
+        try:
+            commandResults = yield batchRunner.sendBatch(datasources)
+        except TimeoutError:
+            # Each command would hang on the device as well
+            raise Exception("Batched commands timed out")
+        except Exception as ex:
+            log.warn("Batched commands failed on %s, running them"
+                     " separately: %s", self._devId, ex)
+            commandResults = [None] * len(datasources)
+
+        deferredCmds = []
+        for datasource, commandResult in zip(datasources, commandResults):
+            if commandResult is None:
+                d = self._executor.submit(self._addDatasource, datasource)
+            else:
+                datasource.lastStart = lastStart
+                d = defer.succeed(datasource.processCompleted(commandResult))
+            deferredCmds.append(d)
+        missing = commandResults.count(None)
+        if missing and missing < len(datasources):
+            log.debug("%d of %d batched commands on %s were run separately",
+                      missing, len(datasources), self._devId)
+        defer.returnValue(deferredCmds)
+
     @defer.inlineCallbacks
     def _fetchPerf(self, ignored=None):
         """
@@ -446,17 +500,21 @@ class SshPerformanceCollectionTask(BaseTask):
         cacheableDS = {}
 
         # Bundle up the list of tasks
-        deferredCmds = []
+        uniqueDS = []
         for datasource in self._datasources:
             datasource.deviceConfig = self._device
             if datasource.command in cacheableDS:
                 cacheableDS[datasource.command].append(datasource)
             else:
                 cacheableDS[datasource.command] = []
-                task = self._executor.submit(self._addDatasource, datasource)
-                deferredCmds.append(task)
+                uniqueDS.append(datasource)
 
         # Run the tasks
+        if self._batchCommands and len(uniqueDS) > 1:
+            deferredCmds = yield self._addBatch(uniqueDS)
+        else:
+            deferredCmds = [self._executor.submit(self._addDatasource, ds)
+                            for ds in uniqueDS]
         resultList = yield defer.DeferredList(deferredCmds, consumeErrors=True)
         parsedResults = self._parseResults(resultList, cacheableDS)
         self._storeResults(parsedResults)
@@ -471,16 +529,18 @@ class SshPerformanceCollectionTask(BaseTask):
         # Sort process_datasources by sequence
         process_datasources.sort(key=lambda x: x.sequence)
 
-        already_matched = []
+        # The ps output is parsed once and matched against all of the
+        # datasources in a single pass
+        processTable = ProcessTable(collection_result.output,
+                                    process_datasources)
 
         # Now we process datasources in sequence order
         for datasource in process_datasources:
             results = ParsedResults()
             datasource.result = copy(collection_result)
-            datasource.already_matched_cmdAndArgs = already_matched
+            datasource.processTable = processTable
             self._processDatasourceResults(datasource, results)
-            already_matched = datasource.already_matched_cmdAndArgs[:]
-            del datasource.already_matched_cmdAndArgs
+            del datasource.processTable
             process_parseable_results.append( (datasource, results) )
 
         return process_parseable_results
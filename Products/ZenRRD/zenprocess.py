@@ -61,6 +61,7 @@ log = logging.getLogger("zen.zenprocess")
 # HOST-RESOURCES-MIB OIDs used
 HOSTROOT = '.1.3.6.1.2.1.25'
 RUNROOT = HOSTROOT + '.4'
+INDEXTABLE = RUNROOT + '.2.1.1'
 NAMETABLE = RUNROOT + '.2.1.2'
 PATHTABLE = RUNROOT + '.2.1.4'
 ARGSTABLE = RUNROOT + '.2.1.5'
@@ -126,6 +127,14 @@ class ZenProcessPreferences(object):
                           default='',
                           help="Directory and filename to use as a template"
                                " to store SNMP results from device.")
+        parser.add_option('--fullscancycles', dest='fullscancycles',
+                          default=1,
+                          type='int',
+                          help="Walk the whole process table only every"
+                               " this many cycles. In between only the pids"
+                               " are walked and the names of new processes"
+                               " fetched (default %default: always walk the"
+                               " whole table).")
 
     def postStartup(self):
         pass
@@ -138,6 +147,10 @@ class DeviceStats:
         self._pidToProcess = {}
         # map ProcessProxy id to ProcessStats object
         self._processes = {}
+        # map pid number to (hrSWRunName, name with args) of the processes
+        # found by the last scan, for incremental scans
+        self.processTable = None
+        self.cyclesSinceFullScan = 0
         for id, process in deviceProxy.processes.iteritems():
             self._processes[id] = ProcessStats(process)
 
@@ -394,15 +407,13 @@ class ZenProcessTask(ObservableMixin):
         log.debug("Scanning for processes from %s [%s]", self._devId, self._manageIp)
 
         self.state = ZenProcessTask.STATE_SCANNING_PROCS
-        tables = [NAMETABLE, PATHTABLE, ARGSTABLE]
         try:
-            tableResult = yield self._getTables(tables)
+            processes = yield self._getProcesses()
             summary = 'Process table up for device %s' % self._devId
             self._clearSnmpError("%s - timeout cleared" % summary, 'table_scan_timeout')
             if self.snmpConnInfo.zSnmpVer == 'v3':
                 self._clearSnmpError("%s - v3 error cleared" % summary, 'table_scan_v3_error')
-            
-            processes = self._parseProcessNames(tableResult)
+
             self._clearSnmpError(summary, 'resource_mib')
             self._deviceStats.update(self._device)
             processStatuses = self._determineProcessStatus(processes)
@@ -508,6 +519,99 @@ class ZenProcessTask(ObservableMixin):
                                          severity=Event.Clear)
             log.debug("(%s) %s" % (self._devId, message))
 
+    @defer.inlineCallbacks
+    def _getProcesses(self):
+        """
+        Get the list of processes running on the device, either by walking
+        the process table or, between full walks, incrementally from the
+        processes found by the previous scan.
+
+        @return: list of (pid, name_with_args) tuples
+        @rtype: Twisted deferred
+        """
+        stats = self._deviceStats
+        fullScanCycles = getattr(self._preferences.options,
+                                 'fullscancycles', 1)
+        if stats.processTable is not None and \
+                stats.cyclesSinceFullScan + 1 < fullScanCycles:
+            procs = yield self._scanProcessesIncrementally()
+            if procs is not None:
+                stats.cyclesSinceFullScan += 1
+                defer.returnValue(procs)
+            log.debug("Process table of %s changed unexpectedly, walking"
+                      " the whole table", self._devId)
+
+        tableResult = yield self._getTables([NAMETABLE, PATHTABLE, ARGSTABLE])
+        procs = self._parseProcessNames(tableResult)
+        if fullScanCycles > 1:
+            names = _extractTable(tableResult[NAMETABLE])
+            stats.processTable = dict(
+                (pid, (names.get(pid), name_with_args))
+                for pid, name_with_args in procs)
+            stats.cyclesSinceFullScan = 0
+        else:
+            stats.processTable = None
+        defer.returnValue(procs)
+
+    @defer.inlineCallbacks
+    def _scanProcessesIncrementally(self):
+        """
+        Walk only the hrSWRunIndex column, fetch the names of the processes
+        that weren't running at the last scan, and check that the monitored
+        pids still belong to the same processes.
+
+        @return: list of (pid, name_with_args) tuples, or None when the
+                 process table has to be walked
+        @rtype: Twisted deferred
+        """
+        stats = self._deviceStats
+        table = stats.processTable
+        indexResult = yield self._getTables([INDEXTABLE])
+        index = indexResult.get(INDEXTABLE)
+        if not index:
+            defer.returnValue(None)
+        pids = set(int(oid.rsplit('.', 1)[-1]) for oid in index)
+
+        # A reused pid can't be seen in the index, so check the names of the
+        # pids that matter.
+        checkPids = [pid for pid in stats.pids if pid in pids and pid in table]
+        newPids = [pid for pid in pids if pid not in table]
+        oids = [NAMETABLE + '.%d' % pid for pid in checkPids]
+        for pid in newPids:
+            oids.extend(oid + '.%d' % pid
+                        for oid in (NAMETABLE, PATHTABLE, ARGSTABLE))
+        results = {}
+        for oidChunk in chunk(oids, max(self._maxOidsPerRequest, 1)):
+            result = yield self._get(oidChunk)
+            results.update(result)
+
+        for pid in checkPids:
+            name = results.get(NAMETABLE + '.%d' % pid)
+            if not isinstance(name, basestring) or \
+                    name.strip() != table[pid][0]:
+                defer.returnValue(None)
+
+        # A new pid without a name exited before it could be read
+        newResults = {NAMETABLE: {}, PATHTABLE: {}, ARGSTABLE: {}}
+        newPids = set(newPids)
+        for oid, value in results.iteritems():
+            tableOid, pid = oid.rsplit('.', 1)
+            if tableOid in newResults and int(pid) in newPids and \
+                    isinstance(value, basestring):
+                newResults[tableOid][oid] = value
+        newNames = _extractTable(newResults[NAMETABLE])
+        newTable = dict((pid, table[pid]) for pid in pids if pid in table)
+        for pid, name_with_args in mapResultsToDicts(False, newResults):
+            newTable[pid] = (newNames[pid], name_with_args)
+        stats.processTable = newTable
+
+        procs = [(pid, value[1]) for pid, value in newTable.iteritems()]
+        log.debug("Incremental process scan of %s: %d processes, %d new",
+                  self._devId, len(procs), len(newNames))
+        if self._preferences.options.showprocs:
+            self._showProcessList(procs)
+        defer.returnValue(procs)
+
     def _parseProcessNames(self, results):
         """
         Parse the process tables and reconstruct the list of processes
@@ -859,6 +963,14 @@ def mapResultsToDicts(showrawtables, results):
 
     return procs
 
+def _extractTable(column):
+    """
+    Map the pids in the oids of an SNMP table column to their stripped
+    values.
+    """
+    return dict((int(oid.rsplit('.', 1)[-1]), value.strip())
+                for oid, value in column.iteritems())
+
 def reverseDict(d):
     """
     Return a dictionary with keys and values swapped:
@@ -20,6 +20,8 @@ Developers Guide.
 import Globals
 import sys
 import os
+import json
+import time
 import transaction
 import zope.component
 from zope.event import notify
@@ -37,10 +39,17 @@ from Products.ZenUtils.Utils import getObjByPath, getObjByPath2
 
 from Products.ZenModel.interfaces import IZenDocProvider
 from Products.ZenRelations.Exceptions import *
+from Products.ZenRelations.LinkIndex import LinkIndex
 from Products.Zuul.catalog.events import IndexingEvent
 
 _STRING_PROPERTY_TYPES = ( 'string', 'text', 'password' )
 
+CHECKPOINT_FILE = 'checkpoint.json'
+LINK_INDEX_FILE = 'links'
+
+# Seconds between progress reports of the objects and links loaded
+REPORT_INTERVAL = 60
+
 
 
 class ImportRM(ZCmdBase, ContentHandler):
@@ -78,6 +87,10 @@ for a ZenPack.
     """
     rootpath = ''
     skipobj = 0
+    position = 0
+    resumePosition = 0
+    linkIndex = None
+    checkpointDir = None
 
     def __init__(self, noopts=0, app=None, keeproot=False):
         """
@@ -128,6 +141,7 @@ for a ZenPack.
         """
         ignoredElements = [ 'objects' ]
         attrs = self.cleanattrs(attrs)
+        self.position += 1
         if self.skipobj > 0:
             self.skipobj += 1
             return
@@ -136,7 +150,10 @@ for a ZenPack.
              name, self.context().id, self._locator.getLineNumber() ))
 
         if name == 'object':
-            if attrs.get('class') == 'Device':
+            # Objects before the checkpoint of a resumed import were
+            # committed already, so they are expected to exist
+            replaying = self.replaying()
+            if attrs.get('class') == 'Device' and not replaying:
                 devId = attrs['id'].split('/')[-1]
                 dev = self.dmd.Devices.findDeviceByIdOrIp(devId)
                 if dev:
@@ -144,7 +161,7 @@ for a ZenPack.
                                     (devId, self._locator.getLineNumber())
                     raise Exception(msg)
 
-            if attrs.get('class') == 'IpAddress':
+            if attrs.get('class') == 'IpAddress' and not replaying:
                 ipAddress = attrs['id']
                 dev = self.dmd.Devices.findDeviceByIdOrIp(ipAddress)
                 if dev:
@@ -200,13 +217,19 @@ for a ZenPack.
         @type name: string
         """
         ignoredElements = [ 'toone', 'link' ]
+        self.position += 1
         if self.skipobj > 0:
             self.skipobj -= 1
             return
 
         noIncrementalCommit = self.options.noCommit or self.options.chunk_size==0
 
-        if name in ('object', 'tomany', 'tomanycont'):
+        if name in ('object', 'tomany', 'tomanycont') and self.replaying():
+            obj = self.objstack.pop()
+            if self.rootpath == obj.getPrimaryId():
+                self.rootpath = ''
+
+        elif name in ('object', 'tomany', 'tomanycont'):
             obj = self.objstack.pop()
             notify(IndexingEvent(obj))
             if hasattr(aq_base(obj), 'index_object'):
@@ -218,6 +241,8 @@ for a ZenPack.
 
             # Not committing, or no objects to commit.
             if noIncrementalCommit or not self.uncommittedObjects:
+                if self.linksDue():
+                    self.resolveLinks()
                 return
 
             # Commit only after "chunk_size" objects need committed.
@@ -225,6 +250,8 @@ for a ZenPack.
                 self.log.debug("Committing a batch of %s objects" %
                                self.options.chunk_size)
                 self.commit()
+            elif self.linksDue():
+                self.resolveLinks()
 
         elif name == 'objects': # ie end of the file
             self.log.info('End loading objects')
@@ -237,10 +264,13 @@ for a ZenPack.
             else:
                 self.log.info('Would have created %d objects in the ZODB database'
                            % self.objectnumber)
+            self.reportProgress()
+            self.clearCheckpoint()
 
         elif name == 'property':
-            self.setProperty(self.context(), self.curattrs,
-                             self.charvalue)
+            if not self.replaying():
+                self.setProperty(self.context(), self.curattrs,
+                                 self.charvalue)
             # We've closed off a tag, so now we need to re-initialize
             # the area that stores the contents of elements
             self.charvalue = ''
@@ -318,6 +348,7 @@ for a ZenPack.
             obj = self.context()._getOb(obj.id)
             self.objectnumber += 1
             self.uncommittedObjects += 1
+            self.createdIds.add(obj.getPrimaryId())
             self.log.debug('Added object %s to database'
                             % obj.getPrimaryId())
         else:
@@ -401,7 +432,7 @@ for a ZenPack.
 
     def addLink(self, rel, objid):
         """
-        Build list of links to form after all objects have been created
+        Build list of links to form with the next batch of links
         make sure that we don't add other side of a bidirectional relation
 
         @param rel: relationship object
@@ -409,23 +440,214 @@ for a ZenPack.
         @param objid: objid
         @type objid: string
         """
-        self.links.append((rel.getPrimaryId(), objid))
+        if self.replaying():
+            # Linked up or kept in the link index before the checkpoint
+            return
+        self.links.append((rel.getPrimaryId(), objid, self.position))
+
+    def replaying(self):
+        """
+        Is the element being parsed one that was committed before the
+        checkpoint that a resumed import started from?
+        """
+        return self.position <= self.resumePosition
+
+    def linksDue(self):
+        """
+        Have enough links been read or objects been created since the last
+        batch to link them up now?
+        """
+        batchSize = getattr(self.options, 'link_batch_size', 1000)
+        return len(self.links) + len(self.createdIds) >= batchSize
+
+    def physicalPath(self, objid):
+        """
+        The physical path of the object at path objid, which is relative to
+        the import context unless it starts with a slash.
+        """
+        path = objid.rstrip('/')
+        if not path.startswith('/'):
+            path = '/'.join(self.app.getPhysicalPath() + (path,))
+        return path
+
+    def linkObject(self, relid, objid, final=False):
+        """
+        Add the object at path objid to the relationship at path relid.
+
+        @param final: log a failure if the object does not exist, since no
+                      later batch can create it
+        @return: False if the object does not exist (yet)
+        @rtype: boolean
+        """
+        try:
+            obj = getObjByPath(self.app, objid)
+        except (KeyError, AttributeError, NotFound):
+            obj = None
+        if obj is not None and \
+                '/'.join(obj.getPhysicalPath()) != self.physicalPath(objid):
+            # Acquired from a parent, the object itself does not exist
+            obj = None
+        if obj is None and not final:
+            return False
+        try:
+            self.log.debug('Linking relation %s to object %s', relid, objid)
+            if obj is None:
+                raise NotFound(objid)
+            rel = getObjByPath(self.app, relid)
+            if not rel.hasobject(obj):
+                rel.addRelation(obj)
+            self.linkCount += 1
+        except Exception:
+            self.log.critical('Failed linking relation %s to object %s' % (
+                              relid, objid))
+            self.failedLinks += 1
+        return True
+
+    def resolveLinks(self):
+        """
+        Link up the links read since the last batch whose object exists,
+        and those in the link index that wait for an object created since.
+        Links to objects that don't exist yet are spilled to the link index.
+        """
+        links, self.links = self.links, []
+        created, self.createdIds = self.createdIds, set()
+        for relid, objid, position in links:
+            if not self.linkObject(relid, objid):
+                if self.linkIndex is None:
+                    self.linkIndex = self.openLinkIndex()
+                self.linkIndex.add(objid, relid, position)
+        if self.linkIndex is None:
+            return
+        for objid in created:
+            entries = self.linkIndex.get(objid)
+            if not entries:
+                continue
+            for relid, position in entries:
+                self.linkObject(relid, objid, final=True)
+            self.resolvedTargets.append(objid)
+        if not self.checkpointDir:
+            # Nothing to resume from, so no need to keep them until commit
+            self.forgetResolvedLinks()
+
+    def forgetResolvedLinks(self):
+        """
+        Drop the links that were linked up from the link index.
+        """
+        for objid in self.resolvedTargets:
+            self.linkIndex.remove(objid)
+        self.resolvedTargets = []
 
     def processLinks(self):
         """
         Walk through all the links that we saved and link them up
         """
-        for (relid, objid) in self.links:
-            try:
-                self.log.debug('Linking relation %s to object %s',
-                               relid, objid)
-                rel = getObjByPath(self.app, relid)
-                obj = getObjByPath(self.app, objid)
-                if not rel.hasobject(obj):
-                    rel.addRelation(obj)
-            except:
-                self.log.critical('Failed linking relation %s to object %s' % (
-                                  relid, objid))
+        self.resolveLinks()
+        if self.linkIndex is None:
+            return
+        for objid in self.linkIndex.targets():
+            for relid, position in self.linkIndex.get(objid):
+                self.linkObject(relid, objid, final=True)
+            self.resolvedTargets.append(objid)
+        if not self.checkpointDir:
+            self.forgetResolvedLinks()
+
+    def openLinkIndex(self):
+        """
+        The index of the links waiting for their object, kept with the
+        checkpoint if there is one.
+        """
+        if not self.checkpointDir:
+            return LinkIndex()
+        return LinkIndex(os.path.join(self.checkpointDir, LINK_INDEX_FILE))
+
+    def closeLinkIndex(self):
+        if self.linkIndex is not None:
+            self.linkIndex.close()
+            self.linkIndex = None
+
+    def loadCheckpoint(self):
+        """
+        Pick up an interrupted import of the same input file where its last
+        committed chunk left off.
+        """
+        path = os.path.join(self.checkpointDir, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            self.log.info('No checkpoint in %s, starting from the beginning',
+                          self.checkpointDir)
+            return
+        if self.inputId() is None:
+            raise Exception('Only the import of a file can be resumed')
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('input') != self.inputId():
+            raise Exception('The checkpoint in %s is for input %s, not %s' % (
+                            self.checkpointDir, checkpoint.get('input'),
+                            self.inputId()))
+        self.resumePosition = checkpoint['position']
+        self.objectnumber = checkpoint['objects']
+        self.linkCount = checkpoint['links']
+        self.linkIndex = self.openLinkIndex()
+        self.linkIndex.truncate(self.resumePosition)
+        self.log.info('Resuming after %d objects and %d links loaded, '
+                      '%d links pending', self.objectnumber, self.linkCount,
+                      len(self.linkIndex))
+
+    def saveCheckpoint(self):
+        """
+        Record how far the import got with the chunk just committed.
+        """
+        if self.linkIndex is not None:
+            self.forgetResolvedLinks()
+            self.linkIndex.sync()
+        checkpoint = {
+            'input': self.inputId(),
+            'position': self.position,
+            'objects': self.objectnumber,
+            'links': self.linkCount,
+        }
+        path = os.path.join(self.checkpointDir, CHECKPOINT_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.rename(path + '.tmp', path)
+
+    def clearCheckpoint(self):
+        """
+        Remove the checkpoint of an import that ran to completion.
+        """
+        if not self.checkpointDir:
+            return
+        self.closeLinkIndex()
+        LinkIndex.destroy(os.path.join(self.checkpointDir, LINK_INDEX_FILE))
+        path = os.path.join(self.checkpointDir, CHECKPOINT_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def inputId(self):
+        """
+        The name and size of the input file, which a checkpoint is for.
+        """
+        name = getattr(self.infile, 'name', None)
+        if not name or not os.path.isfile(name):
+            return None
+        return [os.path.abspath(name), os.path.getsize(name)]
+
+    def reportProgress(self, interval=0):
+        """
+        Log the number of objects and links loaded and their rates, at most
+        once every interval seconds.
+        """
+        now = time.time()
+        if now - self.lastReport < interval:
+            return
+        self.lastReport = now
+        elapsed = max(now - self.startTime, 0.001)
+        objects = self.objectnumber - self.startCounts[0]
+        links = self.linkCount - self.startCounts[1]
+        pending = len(self.linkIndex) if self.linkIndex is not None else 0
+        self.log.info('%d objects (%.1f/sec) and %d links (%.1f/sec) loaded, '
+                      '%d links pending, %d failed', objects,
+                      objects / elapsed, links, links / elapsed, pending,
+                      self.failedLinks)
 
     def buildOptions(self):
         """
@@ -444,6 +666,24 @@ for a ZenPack.
                                type='int',
                                default=100
                                )
+        self.parser.add_option('--linkbatchsize', dest='link_batch_size',
+                               help='Number of links or objects read after '
+                               'which the links whose objects exist are '
+                               'linked up.',
+                               type='int',
+                               default=1000
+                               )
+        self.parser.add_option('--checkpointdir', dest='checkpointDir',
+                               help='Directory in which to keep the progress '
+                               'and pending links of the import, so that an '
+                               'interrupted import can be resumed.'
+                               )
+        self.parser.add_option('--resume', dest='resume',
+                               action='store_true', default=False,
+                               help='Resume an interrupted import of the same '
+                               'input file from the checkpoint in '
+                               '--checkpointdir.'
+                               )
         self.parser.add_option(
             '-n',
             '--noCommit',
@@ -471,8 +711,14 @@ for a ZenPack.
         """
         self.objstack = [self.app]
         self.links = []
+        self.createdIds = set()
+        self.resolvedTargets = []
         self.objectnumber = 0
         self.uncommittedObjects = 0
+        self.linkCount = 0
+        self.failedLinks = 0
+        self.position = 0
+        self.resumePosition = 0
         self.charvalue = ''
         if xmlfile and isinstance(xmlfile, basestring):
             self.infile = open(xmlfile)
@@ -482,6 +728,19 @@ for a ZenPack.
             self.infile = open(self.options.infile)
         else:
             self.infile = sys.stdin
+        self.checkpointDir = getattr(self.options, 'checkpointDir', None)
+        if self.checkpointDir:
+            if not os.path.isdir(self.checkpointDir):
+                os.makedirs(self.checkpointDir)
+            if getattr(self.options, 'resume', False):
+                self.loadCheckpoint()
+            else:
+                self.clearCheckpoint()
+        elif getattr(self.options, 'resume', False):
+            self.log.warn('No --checkpointdir to resume from, '
+                          'starting from the beginning')
+        self.startTime = self.lastReport = time.time()
+        self.startCounts = (self.objectnumber, self.linkCount)
         parser = make_parser()
         parser.setContentHandler(self)
         try:
@@ -492,6 +751,7 @@ for a ZenPack.
                    ex.getMessage())
         finally:
             self.infile.close()
+            self.closeLinkIndex()
 
     def loadDatabase(self):
         """
@@ -504,11 +764,15 @@ for a ZenPack.
         """
         Wrapper around the Zope database commit()
         """
+        self.resolveLinks()
         trans = transaction.get()
         trans.note('Import from file %s using %s'
                     % (self.options.infile, self.__class__.__name__))
         trans.commit()
         self.uncommittedObjects = 0
+        if self.checkpointDir:
+            self.saveCheckpoint()
+        self.reportProgress(REPORT_INTERVAL)
         if hasattr(self, 'connection'):
             # It's safe to call syncdb()
             self.syncdb()
@@ -523,6 +787,9 @@ class SpoofedOptions(object):
         self.noCommit = True
         self.noindex = True
         self.dataroot = '/zport/dmd'
+        self.link_batch_size = 1000
+        self.checkpointDir = None
+        self.resume = False
 
 
 class NoLoginImportRM(ImportRM):
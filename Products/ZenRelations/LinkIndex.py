@@ -0,0 +1,109 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """LinkIndex
+
+Relationship links read by ImportRM whose target object does not exist
+yet, kept on disk and keyed by the path of that target so that they can be
+linked up as soon as it is created rather than held in memory until the
+whole document is parsed.
+"""
+
+import os
+import glob
+import shelve
+import shutil
+import tempfile
+
+
+class LinkIndex(object):
+    """
+    Pending links, as lists of (relationship path, position) keyed by the
+    path of the object they link to.  The position is that of the link in
+    the imported document, so that links read after the last checkpoint of
+    an interrupted import can be dropped when it is resumed.
+    """
+
+    def __init__(self, path=None):
+        """
+        @param path: file name of the index, a temporary one that is removed
+                     on close if None
+        """
+        self._tempdir = None
+        if path is None:
+            self._tempdir = tempfile.mkdtemp(prefix='zenimport')
+            path = os.path.join(self._tempdir, 'links')
+        self.path = path
+        self._shelf = shelve.open(path, protocol=2)
+        self._count = sum(len(entries) for entries in self._shelf.itervalues())
+
+    def __len__(self):
+        return self._count
+
+    def add(self, target, relid, position=0):
+        """
+        Note that the relationship relid links to target once it exists.
+        """
+        entries = self._shelf.get(target, [])
+        entries.append((relid, position))
+        self._shelf[target] = entries
+        self._count += 1
+
+    def get(self, target):
+        """
+        The (relationship path, position) tuples waiting for target.
+        """
+        return self._shelf.get(target, [])
+
+    def remove(self, target):
+        """
+        Forget the links to target, once they have been linked up.
+        """
+        entries = self._shelf.get(target)
+        if entries is not None:
+            del self._shelf[target]
+            self._count -= len(entries)
+
+    def targets(self):
+        """
+        Paths of all objects that links are waiting for.
+        """
+        return self._shelf.keys()
+
+    def truncate(self, position):
+        """
+        Drop the links read after position.
+        """
+        for target in self._shelf.keys():
+            entries = self._shelf[target]
+            kept = [e for e in entries if e[1] <= position]
+            if len(kept) == len(entries):
+                continue
+            if kept:
+                self._shelf[target] = kept
+            else:
+                del self._shelf[target]
+            self._count -= len(entries) - len(kept)
+
+    def sync(self):
+        self._shelf.sync()
+
+    def close(self):
+        self._shelf.close()
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    @staticmethod
+    def destroy(path):
+        """
+        Remove the files of the index kept at path.
+        """
+        for name in glob.glob(path + '*'):
+            os.remove(name)
@@ -10,6 +10,9 @@
 
 import re
 import logging
+import threading
+
+import transaction
 
 from OFS.PropertyManager import PropertyManager
 from zExceptions import BadRequest
@@ -217,6 +220,36 @@ class PropertyDescriptor(object):
         """
         return getattr(self.transformer, method)(value)
 
+class _Resolutions(threading.local):
+    """
+    Where zProperties were found in this thread's current transaction,
+    keyed on the acquisition chain and the property id.  Other processes'
+    changes only become visible at transaction boundaries, so entries are
+    dropped with the transaction and whenever a property is added,
+    updated or deleted.
+    """
+    transaction = None
+    entries = None
+
+_resolutions = _Resolutions()
+
+# Number of cached resolutions above which they are all dropped
+MAX_RESOLUTIONS = 100000
+
+def _getResolutions():
+    txn = transaction.get()
+    if _resolutions.transaction is not txn or \
+            len(_resolutions.entries) >= MAX_RESOLUTIONS:
+        _resolutions.transaction = txn
+        _resolutions.entries = {}
+    return _resolutions.entries
+
+def invalidatePropertyResolutions():
+    """
+    Forget where zProperties were found in the current transaction.
+    """
+    _resolutions.entries = {}
+
 class ZenPropertyDoesNotExist(ValueError):
     pass
 
@@ -301,6 +334,7 @@ class ZenPropertyManager(object, PropertyManager):
         self._wrapperCheck(value)
         if not self.valid_property_id(id):
             raise BadRequest, 'Id %s is invalid or duplicate' % id
+        invalidatePropertyResolutions()
 
         def setprops(**pschema):
             self._properties=self._properties+(pschema,)
@@ -351,6 +385,7 @@ class ZenPropertyManager(object, PropertyManager):
         the ValueError returned from the field2* converters in the class
         Converters.py
         """
+        invalidatePropertyResolutions()
         try:
             super(ZenPropertyManager, self)._updateProperty(id, value)
         except ValueError:
@@ -360,6 +395,10 @@ class ZenPropertyManager(object, PropertyManager):
             args = (id, value, proptype)
             log.error(msg % args)
 
+    def _delProperty(self, id):
+        invalidatePropertyResolutions()
+        super(ZenPropertyManager, self)._delProperty(id)
+
 
     _onlystars = re.compile("^\*+$").search
     security.declareProtected(ZEN_ZPROPERTIES_EDIT, 'manage_editProperties')
@@ -507,6 +546,7 @@ class ZenPropertyManager(object, PropertyManager):
         Delete device tree properties from the this DeviceClass object.
         """
         if propname:
+            invalidatePropertyResolutions()
             try:
                 self._delProperty(propname)
             except AttributeError:
@@ -558,15 +598,28 @@ class ZenPropertyManager(object, PropertyManager):
     def _findParentWithProperty(self, id):
         """
         Returns self or the first acquisition parent that has a property with
-        the id.  Returns None if no parent had the id.
-        """
-        for ob in aq_chain(self):
-            if isinstance(ob, ZenPropertyManager) and ob.hasProperty(id):
-                parentWithProperty = ob
-                break
-        else:
-            parentWithProperty = None
-        return parentWithProperty
+        the id.  Returns None if no parent had the id.  Where the property was
+        found is remembered for the rest of the transaction, or until a
+        property is changed.
+        """
+        managers = [ob for ob in aq_chain(self)
+                    if isinstance(ob, ZenPropertyManager)]
+        # objects that were never stored can't be told apart, don't cache
+        oids = tuple(getattr(aq_base(ob), '_p_oid', None) for ob in managers)
+        key = (oids, id)
+        resolutions = _getResolutions()
+        position = resolutions.get(key, zenmarker)
+        if position is zenmarker:
+            for position, ob in enumerate(managers):
+                if ob.hasProperty(id):
+                    break
+            else:
+                position = None
+            if None not in oids:
+                resolutions[key] = position
+        if position is None:
+            return None
+        return managers[position]
 
     def hasProperty(self, id, useAcquisition=False):
         """
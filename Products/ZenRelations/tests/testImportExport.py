@@ -113,6 +113,29 @@ class ImportTest(ZenRelationsBaseTest):
         self.assertEqual(1, len(self.app.loc.devices()))
         self.assert_('dev', self.app.loc.devices()[0].id)
 
+    def testImportLinkBeforeObject(self):
+        "test importing a to-one relationship to an object loaded later"
+        im = NoLoginImportRM(self.app)
+        im.options.link_batch_size = 1
+        xml = "<objects>" + objwithtoone + objnoprops + "</objects>"
+        im.loadObjectFromXML(StringIO.StringIO(xml))
+        self.assertEqual('loc', self.app.dev.location().id)
+        self.assertEqual(1, len(self.app.loc.devices()))
+        self.assertEqual(1, im.linkCount)
+        self.assert_(im.linkIndex is None)
+
+    def testImportLinkToAcquiredObject(self):
+        "test not linking to an object only found by acquisition"
+        self.build(self.app, Location, "loc")
+        im = NoLoginImportRM(self.app)
+        xml = "<objects>" + objwithtoone.replace("objid='loc'",
+                                                 "objid='dev/loc'") + \
+              "</objects>"
+        im.loadObjectFromXML(StringIO.StringIO(xml))
+        self.assertEqual(None, self.app.dev.location())
+        self.assertEqual(0, im.linkCount)
+        self.assertEqual(1, im.failedLinks)
+
     def testImportToManyCont(self):
         "test importing rm with properties"
         self.failIf(hasattr(self.app, 'loc'))
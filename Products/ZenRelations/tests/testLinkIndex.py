@@ -0,0 +1,70 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from Products.ZenRelations.LinkIndex import LinkIndex
+
+
+class TestLinkIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'links')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_links_are_kept_by_target(self):
+        index = LinkIndex(self.path)
+        index.add('/zport/dmd/loc', '/zport/dmd/dev1/location', 3)
+        index.add('/zport/dmd/loc', '/zport/dmd/dev2/location', 8)
+        index.add('/zport/dmd/rack', '/zport/dmd/dev1/rack', 4)
+        self.assertEquals(len(index), 3)
+        self.assertEquals(index.get('/zport/dmd/loc'),
+                          [('/zport/dmd/dev1/location', 3),
+                           ('/zport/dmd/dev2/location', 8)])
+        self.assertEquals(index.get('/zport/dmd/other'), [])
+        index.remove('/zport/dmd/loc')
+        self.assertEquals(index.targets(), ['/zport/dmd/rack'])
+        self.assertEquals(len(index), 1)
+        index.close()
+
+    def test_reopened_index_drops_links_after_checkpoint(self):
+        index = LinkIndex(self.path)
+        index.add('/zport/dmd/loc', '/zport/dmd/dev1/location', 3)
+        index.add('/zport/dmd/loc', '/zport/dmd/dev2/location', 8)
+        index.add('/zport/dmd/rack', '/zport/dmd/dev2/rack', 9)
+        index.close()
+        index = LinkIndex(self.path)
+        self.assertEquals(len(index), 3)
+        index.truncate(5)
+        self.assertEquals(len(index), 1)
+        self.assertEquals(index.targets(), ['/zport/dmd/loc'])
+        index.close()
+        LinkIndex.destroy(self.path)
+        self.assertEquals(os.listdir(self.tempdir), [])
+
+    def test_temporary_index_is_removed(self):
+        index = LinkIndex()
+        index.add('/zport/dmd/loc', '/zport/dmd/dev1/location')
+        tempdir = os.path.dirname(index.path)
+        index.close()
+        self.failIf(os.path.exists(tempdir))
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(TestLinkIndex),))
+
+
+if __name__=="__main__":
+    unittest.main(defaultTest='test_suite')
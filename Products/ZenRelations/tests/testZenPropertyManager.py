@@ -12,7 +12,8 @@ import os, sys
 if __name__ == '__main__':
   execfile(os.path.join(sys.path[0], 'framework.py'))
 
-from Acquisition import aq_base
+import transaction
+from Acquisition import aq_base, aq_chain
 
 from Products.ZenRelations.tests.TestSchema import Organizer
 
@@ -21,6 +22,7 @@ from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenRelations.ZenPropertyManager import PropertyDescriptor
 from Products.ZenRelations.ZenPropertyManager import ZenPropertyManager
 from Products.ZenRelations.ZenPropertyManager import IdentityTransformer
+from Products.ZenRelations.ZenPropertyManager import _resolutions
 from Products.ZenRelations.RelationshipManager import RelationshipManager
 from Products.ZenUtils.ZenTales import talesEval
 from Products.ZenWidgets import messaging
@@ -172,6 +174,58 @@ class ZenPropertyManagerTest(ZenRelationsBaseTest):
         subnode._updateProperty('ptest', 'b')
         self.assert_(subnode.ptest == 'b')
 
+    def assertResolvesLikeUncached(self, *obs):
+        for ob in obs:
+            for id in self.orgroot.zenPropertyIds() + ['ptest']:
+                expected = None
+                for parent in aq_chain(ob):
+                    if isinstance(parent, ZenPropertyManager) and \
+                            parent.hasProperty(id):
+                        expected = aq_base(parent)
+                        break
+                for i in range(2):
+                    found = ob._findParentWithProperty(id)
+                    self.assert_(aq_base(found) is expected if expected
+                                 else found is None)
+
+    def testResolutionCache(self):
+        """Cached zProperty resolution matches walking the aq_chain"""
+        a = self.create(self.orgroot, Organizer, "A")
+        b = self.create(a, Organizer, "B")
+        c = self.create(self.orgroot, Organizer, "C")
+        # resolutions are only cached for stored objects
+        transaction.savepoint(True)
+        self.assertResolvesLikeUncached(a, b, c)
+        self.assert_(_resolutions.entries)
+
+        # overrides
+        a.setZenProperty("zString", "a")
+        self.assertEqual(b.getProperty("zString"), "a")
+        a.setZenProperty("zString", "a2")
+        self.assertEqual(b.getZ("zString"), "a2")
+        b._setProperty("ptest", 2, type="int")
+        self.assertEqual(b.getPropertyType("ptest"), "int")
+        self.assertEqual(c.getProperty("ptest"), None)
+        self.assertResolvesLikeUncached(a, b, c)
+        a.deleteZenProperty("zString")
+        self.assertEqual(b.getProperty("zString"), "")
+        self.assertEqual(b.zenPropertyPath("zString"), "/")
+        self.assertResolvesLikeUncached(a, b, c)
+
+        # moves
+        a.setZenProperty("zInt", 1)
+        self.assertEqual(b.getProperty("zInt"), 1)
+        ob = aq_base(b)
+        a._delObject("B")
+        c._setObject("B", ob)
+        b = c._getOb("B")
+        self.assertEqual(b.getProperty("zInt"), -1)
+        c.setZenProperty("zInt", 3)
+        self.assertEqual(b.getProperty("zInt"), 3)
+        self.assertEqual(b.zenPropertyPath("zInt"), "/C")
+        self.assertResolvesLikeUncached(a, b, c)
+
+
 class Transformer(object):
 
     def transformForSet(self, input):
@@ -18,11 +18,22 @@ meant to be run from an rpt file.
 import Globals
 import logging
 import transaction
+from Acquisition import aq_base
+from Products.ZenModel.MetricMixin import MetricMixin
 from Products.ZenModel.RRDDataPoint import getDataPointsByAliases
 from Products.ZenReports import Utils, Utilization
-from Products.ZenUtils.ZenTales import talesEval, InvalidTalesException
+from DateTime import DateTime
+from Products.PageTemplates.Expressions import getEngine
+from Products.ZenUtils.ZenTales import talesEval, talesCompile
+from Products.Zuul.interfaces.info import IInfo
+from Products.Zuul import getFacade
 log = logging.getLogger("zen.reports")
 
+# Number of report rows whose metric values are fetched together.  The
+# transaction is aborted after each batch to free the ZODB cache, so no more
+# than this many rows of objects are kept referenced in between.
+ROW_BATCH_SIZE = 100
+
 
 class Column(object):
     """
@@ -66,6 +77,15 @@ class Column(object):
         # at one time.
         return getattr(self._columnHandler, 'aliasName', None)
 
+    def compile(self, trusted=False):
+        """
+        Let the column handler prepare itself for a report run (if it
+        knows how to).
+        """
+        compile = getattr(self._columnHandler, 'compile', None)
+        if compile is not None:
+            compile(trusted)
+
 
 def _fetchValueWithAlias(entity, datapoint, alias, summary):
     """
@@ -77,6 +97,24 @@ def _fetchValueWithAlias(entity, datapoint, alias, summary):
     return entity.getRRDValue(datapoint.id, **summary)
 
 
+# Classes by whether they override getRRDValue or getRRDValues
+_getRRDValueOverrides = {}
+
+
+def _overridesGetRRDValue(cls):
+    """
+    Whether cls has its own getRRDValue or getRRDValues, whose values the
+    bulk metric query would bypass.
+    """
+    overrides = _getRRDValueOverrides.get(cls)
+    if overrides is None:
+        overrides = _getRRDValueOverrides[cls] = any(
+            getattr(getattr(cls, name, None), 'im_func', None)
+            is not MetricMixin.__dict__[name]
+            for name in ('getRRDValue', 'getRRDValues'))
+    return overrides
+
+
 class RRDColumnHandler(object):
     """
     A handler that return RRD data for the value given the row context.
@@ -97,6 +135,17 @@ class RRDColumnHandler(object):
         @param extra: extra context passed to the columnHandler that will
             generate the column value
         """
+        # The values were prefetched in bulk by AliasPlugin.run; they are
+        # keyed by (aliasName, pair index) and only present for the pairs
+        # whose template is bound to the row's device or component.
+        rrdValues = extra.get('rrdValues')
+        if rrdValues is not None:
+            for index in xrange(len(extra['aliasDatapointPairs'] or ())):
+                value = rrdValues.get((self.aliasName, index))
+                if value is not None:
+                    return value
+            return None
+
         # The summary dict has the request key/values
         summary = extra['summary']
 
@@ -136,25 +185,87 @@ class PythonColumnHandler(object):
     The row context includes the device object ('device') and, if available,
     the component object ('component').  It also includes report information
     such as the start date ('start') and end date ('end') of the report.
+
+    The expression is compiled once, on the first row (or when the plugin
+    calls compile), and every row is evaluated against the same engine
+    context.  Trusted expressions skip TALES altogether and are evaluated as
+    plain python code objects.
     """
 
     def __init__(self, talesExpression, extraContext={}):
         """
         @param talesExpression: A python expression that can use the context
         """
+        self._expression = talesExpression
         self._talesExpression = 'python:%s' % talesExpression
         self._extraContext = extraContext
+        self._compiled = None
+        self._code = None
+        self._engineContext = None
 
-    def __call__(self, device, component=None, extra=None, value=None):
+    def compile(self, trusted=False):
+        """
+        Compile the expression for this report run.
+
+        @param trusted: evaluate the expression as plain python instead of
+                        a (restricted) TALES python expression.  Only use
+                        this for reports shipped with Zenoss.
+        """
+        if trusted:
+            self._code = compile(self._expression, '<report column>', 'eval')
+            self._compiled = None
+        else:
+            self._compiled = talesCompile(self._talesExpression)
+            self._code = None
+        self._engineContext = None
+        self._now = DateTime()
+        # Adapting the row context to IInfo is expensive, only do it for
+        # expressions that may use it.
+        self._needsInfo = 'info' in self._expression
+
+    def _rowContext(self, device, component, extra, value):
         kw = dict(device=device, component=component, value=value)
         kw.update(self._extraContext)
         if extra is not None:
             kw.update(extra)
+        return kw
+
+    def _evalTrusted(self, device, kw):
+        names = dict(context=device, here=device, nothing=None, now=self._now)
+        names.update(kw)
+        return eval(self._code, {}, names)
+
+    def _evalTales(self, device, kw):
+        if self._engineContext is None:
+            self._engineContext = getEngine().getContext(
+                {'nothing': None, 'now': self._now})
+        rowVars = self._engineContext.vars
+        rowVars['context'] = rowVars['here'] = device
+        rowVars.update(kw)
+        if self._needsInfo:
+            try:
+                rowVars['info'] = IInfo(device)
+            except TypeError:
+                rowVars.pop('info', None)
+        res = self._compiled(self._engineContext)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def __call__(self, device, component=None, extra=None, value=None):
+        if self._code is None and self._compiled is None:
+            self.compile()
+        kw = self._rowContext(device, component, extra, value)
         value = None
         try:
-            value = talesEval(self._talesExpression, device, kw)
-        except InvalidTalesException, e:
-            log.info(e)
+            if self._code is not None:
+                value = self._evalTrusted(device, kw)
+            else:
+                value = self._evalTales(device, kw)
+        except Exception, e:
+            log.info("Error when processing expression %s on context %s : "
+                     "Exception Class %s Message: %s",
+                     self._talesExpression, device, type(e), e)
         return value
 
 
@@ -164,6 +275,11 @@ class AliasPlugin(object):
     choose datapoints
     """
 
+    # Set to True by the reports shipped with Zenoss so that their python
+    # column expressions are evaluated as plain python code objects
+    # instead of going through TALES.
+    trustedExpressions = False
+
     def _getComponents(self, device, componentPath):
         componentPath = 'here/%s' % componentPath
         try:
@@ -210,7 +326,8 @@ class AliasPlugin(object):
         return None
 
     def _createRecord(self, device, component=None,
-            columnDatapointsMap={}, summary={}, templateArgs=None):
+            columnDatapointsMap={}, summary={}, templateArgs=None,
+            rrdValues=None, compositeColumns=None):
         """
         Creates a record for the given row context
         (that is, the device and/or component)
@@ -224,6 +341,10 @@ class AliasPlugin(object):
         @param summary: a dict of report parameters like start date,
                         end date, and rrd summary function
         @param templateArgs the template tags from the ui
+        @param rrdValues: optional dict of prefetched metric values for
+                          this row (see _prefetchRRDValues)
+        @param compositeColumns: the (compiled) composite columns, defaults
+                                 to getCompositeColumns()
 
         @rtype L{Utils.Record}
         """
@@ -240,6 +361,8 @@ class AliasPlugin(object):
                 summary=summary,
                 templateArgs=templateArgs
             )
+            if rrdValues is not None:
+                extra['rrdValues'] = rrdValues
             value = localGetValue(device, component, extra)
             columnValueMap[columnName] = value
 
@@ -247,7 +370,9 @@ class AliasPlugin(object):
         # not pass datapoints.
         extra = dict(summary=summary)
         extra.update(columnValueMap)
-        for column in self.getCompositeColumns():
+        if compositeColumns is None:
+            compositeColumns = self.getCompositeColumns()
+        for column in compositeColumns:
             columnName = column.getColumnName()
             value = localGetValue(device, component, extra)
             columnValueMap[columnName] = value
@@ -289,9 +414,122 @@ class AliasPlugin(object):
 
         return columnDatapointsMap
 
+    def _fetchRRDValues(self, dmd, fetches, summary):
+        """
+        Fetch the values of (entity, datapoint, extraRpn) tuples from the
+        metric service with as few queries as possible.  The values of
+        entities whose class overrides getRRDValue or getRRDValues are
+        fetched with getRRDValue instead.
+
+        @return: list of values in the same order as fetches
+        """
+        values = [None] * len(fetches)
+        bulk, serial = [], []
+        for position, fetch in enumerate(fetches):
+            if _overridesGetRRDValue(aq_base(fetch[0]).__class__):
+                serial.append(position)
+            else:
+                bulk.append(position)
+        if bulk:
+            facade = getFacade('metric', dmd)
+            bulkValues = facade.getBulkValues(
+                [fetches[position] for position in bulk],
+                start=summary['start'], end=summary['end'], cf=summary['cf'])
+            for position, value in zip(bulk, bulkValues):
+                values[position] = value
+        if serial:
+            serialValues = self._fetchRRDValuesSerially(
+                dmd, [fetches[position] for position in serial], summary)
+            for position, value in zip(serial, serialValues):
+                values[position] = value
+        return values
+
+    def _fetchRRDValuesSerially(self, dmd, fetches, summary):
+        """
+        Fetch the values one at a time with getRRDValue.  Slow, but honors
+        any getRRDValue override on the entities.
+        """
+        values = []
+        for entity, datapoint, extraRpn in fetches:
+            kw = dict(summary)
+            if extraRpn:
+                kw['extraRpn'] = extraRpn
+            values.append(entity.getRRDValue(datapoint.id, **kw))
+        return values
+
+    def _prefetchRRDValues(self, dmd, rows, columnDatapointsMap, summary):
+        """
+        Collect the alias/datapoint pairs that are bound to each row and
+        fetch all of their values at once.
+
+        @param rows: list of (device, component) tuples
+        @return: list (one per row) of dicts mapping (aliasName, pair index)
+                 to the value of that pair for the row
+        """
+        rrdColumns = []
+        for column, aliasDatapointPairs in columnDatapointsMap.iteritems():
+            aliasName = column.getAliasName()
+            if aliasName is None or not aliasDatapointPairs:
+                continue
+            pairs = [(index, alias, datapoint,
+                      datapoint.datasource().rrdTemplate())
+                     for index, (alias, datapoint)
+                     in enumerate(aliasDatapointPairs)]
+            rrdColumns.append((aliasName, pairs))
+        if not rrdColumns:
+            return [{} for row in rows]
+
+        fetches = []
+        rowValues = []
+        for device, component in rows:
+            perfObject = component or device
+            cells = {}
+            deviceTemplates = perfObject.getRRDTemplates()
+            for aliasName, pairs in rrdColumns:
+                for index, alias, datapoint, template in pairs:
+                    # Only fetch the value if the template is bound
+                    # to this device or component
+                    if template not in deviceTemplates:
+                        continue
+                    extraRpn = None
+                    if alias:
+                        try:
+                            extraRpn = alias.evaluate(perfObject)
+                        except (TypeError, NameError):
+                            log.debug("Unable to evaluate alias %s for %s",
+                                      alias.id, perfObject.getPrimaryId())
+                            continue
+                    cells[(aliasName, index)] = len(fetches)
+                    fetches.append((perfObject, datapoint, extraRpn))
+            rowValues.append(cells)
+
+        values = self._fetchRRDValues(dmd, fetches, summary)
+        for cells in rowValues:
+            for key, position in cells.iteritems():
+                cells[key] = values[position]
+        return rowValues
+
+    def _createRecords(self, dmd, rows, columnDatapointsMap, summary,
+                       templateArgs, compositeColumns):
+        rowValues = self._prefetchRRDValues(
+            dmd, rows, columnDatapointsMap, summary)
+        return [self._createRecord(device, component, columnDatapointsMap,
+                                   summary, templateArgs, rrdValues,
+                                   compositeColumns)
+                for (device, component), rrdValues in zip(rows, rowValues)]
+
+    def _compileColumns(self, columns):
+        """
+        Compile the column expressions once for the whole report run.
+        """
+        for column in columns:
+            column.compile(self.trustedExpressions)
+
     def run(self, dmd, args, templateArgs=None):
         """
-        Generate the report using the columns and aliases
+        Generate the report using the columns and aliases.  Rows are
+        gathered in batches of up to ROW_BATCH_SIZE so that the metric
+        values of a whole batch can be fetched with a few bulk queries.
 
         @param dmd the dmd context to access the context objects
         @param args the report args from the ui
@@ -306,6 +544,8 @@ class AliasPlugin(object):
         # Create a dict of column to the datapoint/alias pairs
         # that return a value for the column
         columnDatapointsMap = self._mapColumnsToDatapoints(dmd)
+        compositeColumns = self.getCompositeColumns()
+        self._compileColumns(columnDatapointsMap.keys() + compositeColumns)
 
         # Don't run against all devices, which kills large systems
         if not args.get('generate') or args.get('deviceClass', '/') == '/':
@@ -315,20 +555,31 @@ class AliasPlugin(object):
         # values from the filter widget
         componentPath = self.getComponentPath()
         report = []
+        rows = []
+
+        def flush():
+            # Create the records of the batch before the abort so that the
+            # rows don't keep its objects in the cache
+            if rows:
+                report.extend(self._createRecords(
+                    dmd, rows, columnDatapointsMap, summary, templateArgs,
+                    compositeColumns))
+                del rows[:]
+            transaction.abort()
+
         for device in Utilization.filteredDevices(dmd, args):
             i += 1
-            if i % 100 == 0: transaction.abort()
+            if i % ROW_BATCH_SIZE == 0: flush()
             if componentPath is None:
-                record = self._createRecord(
-                    device, None, columnDatapointsMap, summary, templateArgs)
-                report.append(record)
+                rows.append((device, None))
             else:
                 components = self._getComponents(device, componentPath)
                 for component in components:
                     i+=1
-                    if i % 100 == 0: transaction.abort()
-                    record = self._createRecord(
-                        device, component, columnDatapointsMap, summary,
-                        templateArgs)
-                    report.append(record)
+                    if i % ROW_BATCH_SIZE == 0: flush()
+                    rows.append((device, component))
+        if rows:
+            report.extend(self._createRecords(
+                dmd, rows, columnDatapointsMap, summary, templateArgs,
+                compositeColumns))
         return report
@@ -18,6 +18,8 @@ class cpu( AliasPlugin ):
     The cpu usage report
     """
 
+    trustedExpressions = True
+
     def getColumns(self):
         ##      alias/dp id : column name
         return [ Column( 'deviceName',
@@ -15,6 +15,8 @@ from Products.ZenReports.AliasPlugin import AliasPlugin, Column, \
 class filesystems( AliasPlugin ):
     "The file systems report"
 
+    trustedExpressions = True
+
     def getColumns(self):
         ##      alias/dp id : column name
         return [ Column( 'deviceName', PythonColumnHandler( 'device.titleOrId()' ) ),
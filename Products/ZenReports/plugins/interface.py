@@ -18,6 +18,8 @@ from Products.ZenReports.AliasPlugin import \
 class interface(AliasPlugin):
     "The interface usage report"
 
+    trustedExpressions = True
+
     def getComponentPath(self):
         return 'os/interfaces'
 
@@ -33,6 +33,8 @@ def _getPercentUtilization( availableReal, totalReal, usedPercent ):
 class memory( AliasPlugin ):
     "The memory usage report"
 
+    trustedExpressions = True
+
     def getColumns(self):
         return [
                 Column('deviceName', PythonColumnHandler( 'device.titleOrId()' )),
@@ -58,8 +58,13 @@ class threshold(object):
             'last_seen' : (startDate,),
             }
         event_filter = zep.createEventFilter(**create_filter_args)
-        events = zep.getEventSummariesGenerator(event_filter)
-        events_from_archive = zep.getEventSummariesGenerator(event_filter, archive=True)
+        fields = ('status', 'first_seen_time', 'status_change_time',
+                  'occurrence.actor.element_identifier',
+                  'occurrence.actor.element_sub_identifier',
+                  'occurrence.event_class')
+        events = zep.getEventSummariesStream(event_filter, fields=fields)
+        events_from_archive = zep.getEventSummariesStream(
+            event_filter, archive=True, fields=fields)
 
         sum = defaultdict(int)
         counts = defaultdict(int)
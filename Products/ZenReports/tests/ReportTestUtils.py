@@ -9,6 +9,7 @@
 
 
 from Products.ZenModel.MetricMixin import MetricMixin
+from Products.ZenReports.AliasPlugin import AliasPlugin
 from Products.ZenModel.Device import manage_createDevice
 
 def attributeAsRRDValue( rrdView, id, **args ):
@@ -21,11 +22,16 @@ class replaceGetRRDValue:
     def __call__(self, fn):
         def wrappedFunction(*args):
             oldMethod = MetricMixin.getRRDValue
+            oldFetch = AliasPlugin.__dict__['_fetchRRDValues']
             MetricMixin.getRRDValue = self._newMethod
+            # bypass the bulk metric query so getRRDValue is used per cell
+            AliasPlugin._fetchRRDValues = \
+                AliasPlugin.__dict__['_fetchRRDValuesSerially']
             try:
                 return fn(*args)
             finally:
                 MetricMixin.getRRDValue = oldMethod
+                AliasPlugin._fetchRRDValues = oldFetch
         return wrappedFunction
 
 def createTestDevice( dmd, deviceId, propertyMap={}, deviceClass='/Devices/Server' ):
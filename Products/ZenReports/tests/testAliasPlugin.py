@@ -11,6 +11,8 @@
 from datetime import datetime
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenModel.Device import manage_createDevice
+from Products.ZenModel.MetricMixin import MetricMixin
+from Products.Zuul.facades.metricfacade import MetricFacade
 from Products.ZenModel.tests.RRDTestUtils import *
 from Products.ZenReports.AliasPlugin import *
 from Products.ZenReports.tests.ReportTestUtils import *
@@ -212,6 +214,107 @@ class TestAliasPlugin(BaseTestCase):
         self.assert_( 'testCol6' not in record6.values.keys() )
 
 
+    def testBulkFetch(self):
+        template=createTemplate(self.dmd, 'TestTemplate4')
+        addAlias( template, 'ds1', 'dp1', 'testAlias7' )
+        addAlias( template, 'ds1', 'dp2', 'testAlias8' )
+        devices=[]
+        for n in range(3):
+            dev=createTestDevice( self.dmd, 'TestDevice%d' % (10 + n), dict(
+                                    zDeviceTemplates=[template.id] ) )
+            dev.dp1=n
+            dev.dp2=n * 10
+            devices.append(dev)
+        unbound=createTestDevice( self.dmd, 'TestDevice13' )
+
+        fetchCalls=[]
+        class _BulkPlugin(_TestPlugin):
+            def _fetchRRDValues(self, dmd, fetches, summary):
+                fetchCalls.append(fetches)
+                return [getattr(entity, dp.id)
+                        for entity, dp, extraRpn in fetches]
+
+        test4 = _BulkPlugin(
+                            [
+                             Column('testCol1', RRDColumnHandler( 'testAlias7' ) ),
+                             Column('testCol2', RRDColumnHandler( 'testAlias8' ) )
+                            ]
+                            )
+        records=test4.run( self.dmd, {'deviceClass':'/Devices/Server', 'generate':True} )
+
+        # every bound cell is fetched with a single bulk call
+        self.assertEquals( 1, len( fetchCalls ) )
+        self.assertEquals( 2 * len( devices ), len( fetchCalls[0] ) )
+        recordMap=dict( zip( map( getDeviceIdFromRecord, records ), records ) )
+        for n, dev in enumerate(devices):
+            record=recordMap[dev.id]
+            self.assertEquals( n, record.values['testCol1'] )
+            self.assertEquals( n * 10, record.values['testCol2'] )
+        record=recordMap[unbound.id]
+        self.assertEquals( None, record.values['testCol1'] )
+        self.assertEquals( None, record.values['testCol2'] )
+
+    def testOverriddenGetRRDValue(self):
+        dev=createTestDevice( self.dmd, 'TestDevice14' )
+        class _Entity(MetricMixin):
+            def getRRDValue(self, dsname, **kw):
+                return (dsname, kw.get('extraRpn'))
+        class _DataPoint(object):
+            id = 'dp1'
+        bulkCalls=[]
+        def getBulkValues(facade, queries, **kw):
+            bulkCalls.append(queries)
+            return ['bulk'] * len(queries)
+        oldBulk = MetricFacade.getBulkValues
+        MetricFacade.getBulkValues = getBulkValues
+        try:
+            summary = dict(start=None, end=None, cf='AVERAGE')
+            entity = _Entity()
+            values = _TestPlugin()._fetchRRDValues( self.dmd, [
+                (dev, _DataPoint(), None), (entity, _DataPoint(), '8,*'),
+                (dev, _DataPoint(), '2,/')], summary )
+        finally:
+            MetricFacade.getBulkValues = oldBulk
+        # the entity with its own getRRDValue is not fetched in bulk
+        self.assertEquals( ['bulk', ('dp1', '8,*'), 'bulk'], values )
+        self.assertEquals( 1, len( bulkCalls ) )
+        self.assertEquals( [dev, dev], [q[0] for q in bulkCalls[0]] )
+
+    def testTrustedExpressions(self):
+        rackSlot=42
+        createTestDevice( self.dmd, 'TestDevice20', dict( rackSlot=rackSlot ) )
+        createTestDevice( self.dmd, 'TestDevice21', dict( rackSlot=rackSlot ) )
+        def columns():
+            return [
+                    Column('testCol1', PythonColumnHandler('device.id') ),
+                    Column('testCol2', PythonColumnHandler('device.rackSlot') ),
+                    Column('testCol3', PythonColumnHandler('device.noSuchMethod()') )
+                   ]
+        def compositeColumns():
+            return [ Column('testCol4', PythonColumnHandler('testCol2 * 2') ) ]
+
+        results = []
+        for trusted in (False, True):
+            plugin = _TestPlugin( columns(), compositeColumns() )
+            plugin.trustedExpressions = trusted
+            records = plugin.run( self.dmd, {'deviceClass':'/Devices/Server', 'generate':True} )
+            results.append( sorted( (r.values['testCol1'], r.values['testCol2'],
+                                     r.values['testCol3'], r.values['testCol4'])
+                                    for r in records ) )
+        self.assertEquals( results[0], results[1] )
+        self.assertEquals( [('TestDevice20', rackSlot, None, rackSlot * 2),
+                            ('TestDevice21', rackSlot, None, rackSlot * 2)],
+                           results[0] )
+
+    def testHandlerCompiledOnce(self):
+        dev=createTestDevice( self.dmd, 'TestDevice22' )
+        handler = PythonColumnHandler('component or device.id')
+        handler.compile()
+        compiled = handler._compiled
+        self.assertEquals( dev.id, handler( dev ) )
+        self.assertEquals( 'x', handler( dev, 'x' ) )
+        self.assert_( compiled is handler._compiled )
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
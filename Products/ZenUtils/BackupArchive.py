@@ -0,0 +1,450 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """BackupArchive
+
+Writing and checking zenbackup archives part by part.  A backup is made of
+independent parts (the events database, the ZODB, config files, ...) that
+each stage their files in a directory of their own.  BackupEngine runs the
+parts concurrently and streams each one into the gzipped archive as soon as
+it is done, checksumming its files on the way in.  The archive ends with a
+manifest of the files of each part and their checksums, which
+verifyArchive uses to check an archive without restoring it.
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import hashlib
+import logging
+import tarfile
+import threading
+import Queue
+from cStringIO import StringIO
+
+from ZenBackupBase import BACKUP_DIR
+
+log = logging.getLogger("zen.BackupArchive")
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_FORMAT = 1
+JOURNAL_FILE = 'journal.json'
+
+_BLOCKSIZE = 1024 * 1024
+
+
+class _HashingReader(object):
+    """
+    A file that checksums what is read from it.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha.update(data)
+        self.size += len(data)
+        return data
+
+
+def fileChecksum(fileobj):
+    """
+    The (sha256, size) of what is left to read in fileobj.
+    """
+    reader = _HashingReader(fileobj)
+    while reader.read(_BLOCKSIZE):
+        pass
+    return reader.sha.hexdigest(), reader.size
+
+
+def _walk(top):
+    """
+    The (path, path relative to top) of the directories and files under
+    top, parents first.
+    """
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames.sort()
+        for name in sorted(dirnames) + sorted(filenames):
+            path = os.path.join(dirpath, name)
+            yield path, os.path.relpath(path, top)
+
+
+class BackupPart(object):
+    """
+    A part of a backup.
+
+    @param run: called with the directory to stage the files of the part in
+    @param mainThread: run in the main thread rather than concurrently,
+                       for parts that open their own ZODB connection
+    """
+
+    def __init__(self, name, run, mainThread=False, description=None):
+        self.name = name
+        self.run = run
+        self.mainThread = mainThread
+        self.description = description or name
+
+    def __repr__(self):
+        return '<BackupPart %s>' % self.name
+
+
+class BackupArchive(object):
+    """
+    A gzipped tar of a zenbackup directory, written one part at a time and
+    ending with a manifest of the files of every part.
+    """
+
+    def __init__(self, name=None, fileobj=None):
+        self.tar = tarfile.open(name=name, fileobj=fileobj, mode='w|gz')
+        self.manifest = {'format': MANIFEST_FORMAT,
+                         'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                         'host': socket.getfqdn(),
+                         'parts': {}}
+        info = tarfile.TarInfo(BACKUP_DIR)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0750
+        info.mtime = time.time()
+        self.tar.addfile(info)
+
+    def addPart(self, name, partDir, seconds=0.0):
+        """
+        Stream the files staged in partDir into the archive.
+
+        @return: dictionary of file path to its sha256 and size
+        """
+        files = {}
+        for path, relpath in _walk(partDir):
+            info = self.tar.gettarinfo(path, '/'.join((BACKUP_DIR, relpath)))
+            if not info.isreg():
+                self.tar.addfile(info)
+                continue
+            with open(path, 'rb') as f:
+                reader = _HashingReader(f)
+                self.tar.addfile(info, reader)
+            files[relpath] = {'sha256': reader.sha.hexdigest(),
+                              'size': reader.size}
+        self.manifest['parts'][name] = {'status': 'ok',
+                                        'seconds': round(seconds, 1),
+                                        'files': files}
+        return files
+
+    def failPart(self, name, error):
+        self.manifest['parts'][name] = {'status': 'failed',
+                                        'error': str(error),
+                                        'files': {}}
+
+    def close(self):
+        """
+        Add the manifest and close the archive.
+        """
+        data = json.dumps(self.manifest, indent=2, sort_keys=True)
+        info = tarfile.TarInfo('/'.join((BACKUP_DIR, MANIFEST_FILE)))
+        info.size = len(data)
+        info.mode = 0640
+        info.mtime = time.time()
+        self.tar.addfile(info, StringIO(data))
+        self.tar.close()
+
+
+class BackupJournal(object):
+    """
+    The parts of a backup staged so far, so that an interrupted backup can
+    be resumed without running them again.
+    """
+
+    def __init__(self, stagingRoot):
+        self.path = os.path.join(stagingRoot, JOURNAL_FILE)
+        self._lock = threading.Lock()
+        self.parts = {}
+
+    def load(self):
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.parts = json.load(f).get('parts', {})
+        return self.parts
+
+    def clear(self):
+        with self._lock:
+            self.parts = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def complete(self, name, partDir, seconds):
+        sizes = dict((relpath, os.path.getsize(path))
+                     for path, relpath in _walk(partDir)
+                     if os.path.isfile(path))
+        with self._lock:
+            self.parts[name] = {'seconds': seconds, 'sizes': sizes}
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'parts': self.parts}, f)
+            os.rename(tmp, self.path)
+
+    def isComplete(self, name, partDir):
+        """
+        Whether part name was staged in partDir and is still intact.
+        """
+        entry = self.parts.get(name)
+        if entry is None or not os.path.isdir(partDir):
+            return False
+        sizes = dict((relpath, os.path.getsize(path))
+                     for path, relpath in _walk(partDir)
+                     if os.path.isfile(path))
+        return sizes == entry.get('sizes')
+
+
+class BackupEngine(object):
+    """
+    Runs the parts of a backup concurrently, staging each one in a
+    directory of its own under stagingRoot, and adds each part to the
+    archive as soon as it is staged.
+    """
+
+    def __init__(self, archive, stagingRoot, parallel=3, journal=None,
+                 keepStaged=False):
+        """
+        @param parallel: number of parts run at the same time
+        @param journal: a BackupJournal to record staged parts in and
+                        resume from
+        @param keepStaged: keep staged parts until the backup is done
+                           rather than removing them once archived
+        """
+        self.archive = archive
+        self.stagingRoot = stagingRoot
+        self.parallel = max(1, parallel)
+        self.journal = journal
+        self.keepStaged = keepStaged
+        self.resumed = []
+
+    def partDir(self, name):
+        return os.path.join(self.stagingRoot, 'parts', name)
+
+    def _stage(self, part):
+        """
+        Run part, returning (part, seconds, error).
+        """
+        partDir = self.partDir(part.name)
+        if os.path.isdir(partDir):
+            shutil.rmtree(partDir)
+        os.makedirs(partDir, 0750)
+        log.info("Backing up %s.", part.description)
+        start = time.time()
+        try:
+            part.run(partDir)
+        except Exception as e:
+            log.debug("Backup of %s failed", part.description, exc_info=True)
+            return part, time.time() - start, e
+        seconds = time.time() - start
+        if self.journal is not None:
+            self.journal.complete(part.name, partDir, seconds)
+        return part, seconds, None
+
+    def _work(self, todo, done):
+        while True:
+            try:
+                part = todo.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                done.put(self._stage(part))
+            except Exception as e:
+                done.put((part, 0.0, e))
+
+    def run(self, parts):
+        """
+        Back up parts into the archive.
+
+        @return: dictionary of the names of the failed parts to their error
+        """
+        done = Queue.Queue()
+        todo = Queue.Queue()
+        local = []
+        for part in parts:
+            entry = self.journal.parts.get(part.name) \
+                if self.journal is not None else None
+            if entry is not None and \
+                    self.journal.isComplete(part.name, self.partDir(part.name)):
+                log.info("Resuming with the staged backup of %s.",
+                         part.description)
+                self.resumed.append(part.name)
+                done.put((part, entry.get('seconds', 0.0), None))
+            elif part.mainThread:
+                local.append(part)
+            else:
+                todo.put(part)
+        workers = [threading.Thread(target=self._work, args=(todo, done),
+                                    name='backup-%d' % i)
+                   for i in range(min(self.parallel, todo.qsize()))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for part in local:
+            done.put(self._stage(part))
+        errors = {}
+        for i in range(len(parts)):
+            part, seconds, error = done.get()
+            partDir = self.partDir(part.name)
+            if error is not None:
+                log.error("Backup of %s failed: %s", part.description, error)
+                self.archive.failPart(part.name, error)
+                errors[part.name] = error
+            else:
+                files = self.archive.addPart(part.name, partDir, seconds)
+                log.info("Backup of %s completed in %.1fs (%d files,"
+                         " %d bytes).", part.description, seconds,
+                         len(files), sum(f['size'] for f in files.values()))
+            if not self.keepStaged:
+                shutil.rmtree(partDir, ignore_errors=True)
+        for worker in workers:
+            worker.join()
+        return errors
+
+
+def compareManifest(manifest, checksums, parts=None):
+    """
+    Problems found comparing the (sha256, size) checksums of the files of a
+    backup with its manifest.
+
+    @param parts: names of the parts to compare, all of them by default
+    """
+    problems = []
+    for name, part in sorted(manifest.get('parts', {}).items()):
+        if parts is not None and name not in parts:
+            continue
+        if part.get('status') != 'ok':
+            problems.append("Part %s failed during the backup: %s" %
+                            (name, part.get('error')))
+            continue
+        for relpath, expected in sorted(part.get('files', {}).items()):
+            actual = checksums.get(relpath)
+            if actual is None:
+                problems.append("%s (%s) is missing" % (relpath, name))
+            elif actual != (expected['sha256'], expected['size']):
+                problems.append("%s (%s) is corrupt: checksum or size"
+                                " mismatch" % (relpath, name))
+    return problems
+
+
+def _relativeName(name):
+    """
+    The path of an archive member relative to the backup directory.
+    """
+    if name.startswith('./'):
+        name = name[2:]
+    parts = name.split('/', 1)
+    if len(parts) == 2 and parts[0] == BACKUP_DIR:
+        return parts[1]
+    return None
+
+
+def readArchive(visit, name=None, fileobj=None):
+    """
+    Stream through a backup archive, calling visit with the path relative
+    to the backup directory, the TarInfo and a file object of each of its
+    regular files.
+
+    @return: the manifest, or None for archives made without one
+    """
+    manifest = None
+    tar = tarfile.open(name=name, fileobj=fileobj, mode='r|gz')
+    try:
+        for member in tar:
+            relpath = _relativeName(member.name)
+            if relpath is None or not member.isreg():
+                continue
+            f = tar.extractfile(member)
+            if relpath == MANIFEST_FILE:
+                manifest = json.load(f)
+            else:
+                visit(relpath, member, f)
+    finally:
+        tar.close()
+    return manifest
+
+
+def extractArchive(destDir, select=None, name=None, fileobj=None):
+    """
+    Extract the files of a backup archive that select accepts, or all of
+    them, into the backup directory under destDir, checksumming them on
+    the way.
+
+    @param select: called with the relative path of each file
+    @return: (manifest, checksums of the extracted files)
+    """
+    backupDir = os.path.join(destDir, BACKUP_DIR)
+    checksums = {}
+
+    def visit(relpath, member, f):
+        if '..' in relpath.split('/'):
+            log.warning("Not extracting %s from the backup", member.name)
+            return
+        if select is not None and not select(relpath):
+            return
+        path = os.path.join(backupDir, relpath)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent, 0750)
+        reader = _HashingReader(f)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(reader, out, _BLOCKSIZE)
+        os.chmod(path, member.mode & 0777)
+        checksums[relpath] = (reader.sha.hexdigest(), reader.size)
+
+    manifest = readArchive(visit, name=name, fileobj=fileobj)
+    return manifest, checksums
+
+
+def verifyArchive(name=None, fileobj=None):
+    """
+    Read a backup archive through, checksumming its files and comparing
+    them with its manifest.
+
+    @return: (manifest, checksums, problems); manifest is None for archives
+             made before manifests were added, of which only the
+             readability is checked
+    """
+    checksums = {}
+
+    def visit(relpath, member, f):
+        checksums[relpath] = fileChecksum(f)
+
+    try:
+        manifest = readArchive(visit, name=name, fileobj=fileobj)
+    except Exception as e:
+        return None, checksums, ["The archive is unreadable: %s" % e]
+    if manifest is None:
+        return None, checksums, []
+    return manifest, checksums, compareManifest(manifest, checksums)
+
+
+def verifyDirectory(backupDir):
+    """
+    Check the files of an unpacked backup against its manifest.
+
+    @return: (manifest, checksums, problems), as verifyArchive
+    """
+    path = os.path.join(backupDir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None, {}, []
+    with open(path) as f:
+        manifest = json.load(f)
+    checksums = {}
+    for part in manifest.get('parts', {}).values():
+        for relpath in part.get('files', {}):
+            path = os.path.join(backupDir, relpath)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    checksums[relpath] = fileChecksum(f)
+    return manifest, checksums, compareManifest(manifest, checksums)
@@ -0,0 +1,315 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """MailQueue
+
+Deliver email in background threads so that a slow mail relay doesn't
+block the caller.  SMTP connections are kept open and reused per
+(host, port, TLS, user), and messages for the same recipients can be
+merged into digests.
+"""
+
+import logging
+import smtplib
+import socket
+import threading
+import time
+import Queue
+from collections import deque
+
+from email.MIMEMessage import MIMEMessage
+from email.MIMEMultipart import MIMEMultipart
+from email.MIMEText import MIMEText
+from email.Utils import formatdate
+
+from Products.ZenUtils.Utils import DEFAULT_SOCKET_TIMEOUT
+
+log = logging.getLogger("zen.mailqueue")
+
+_STOP = object()
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class SmtpConnectionPool(object):
+    """
+    Idle SMTP connections, keyed by (host, port, useTls, user).
+    """
+
+    def __init__(self, idleTimeout=60, maxIdle=4):
+        """
+        @param idleTimeout: seconds after which an idle connection is closed
+        @param maxIdle: maximum number of idle connections kept per key
+        """
+        self.idleTimeout = idleTimeout
+        self.maxIdle = maxIdle
+        self.connections = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, password):
+        """
+        Return a (server, reused) tuple, reused telling whether the
+        connection was taken from the pool.
+        """
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                server, since = idle.pop()
+                if now - since < self.idleTimeout:
+                    return server, True
+                self._close(server)
+        return self._connect(key, password), False
+
+    def release(self, key, server):
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.maxIdle:
+                idle.append((server, time.time()))
+                return
+        self._close(server)
+
+    def discard(self, server):
+        self._close(server)
+
+    def closeAll(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.itervalues():
+            for server, since in connections:
+                self._close(server)
+
+    def _connect(self, key, password):
+        host, port, useTls, user = key
+        server = smtplib.SMTP(host, port, timeout=DEFAULT_SOCKET_TIMEOUT)
+        if useTls:
+            server.ehlo()
+            server.starttls()
+            server.ehlo()
+        if user:
+            server.login(user, password)
+        self.connections += 1
+        return server
+
+    def _close(self, server):
+        # Some servers using TLS throw an EOF error on quit
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+
+class MailQueue(object):
+    """
+    A bounded queue of outgoing email delivered by worker threads.
+
+    With a digest window, messages to the same recipients sent within the
+    window are delivered as one message that has the original messages
+    attached.  The messages held in digests count toward maxSize until
+    their digest is queued.
+    """
+
+    def __init__(self, maxSize=1000, workers=2, digestWindow=0, pool=None,
+                 statsInterval=300):
+        """
+        @param maxSize: maximum number of messages waiting for delivery
+        @param workers: number of delivery threads
+        @param digestWindow: seconds to collect messages to the same
+                             recipients for, 0 to send them one by one
+        @param statsInterval: seconds between logging delivery statistics
+        """
+        self.maxSize = maxSize
+        self.workers = workers
+        self.digestWindow = digestWindow
+        self.pool = pool or SmtpConnectionPool()
+        self.statsInterval = statsInterval
+        self._queue = Queue.Queue(maxSize)
+        self._threads = []
+        self._digests = {}
+        self._digested = 0
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self._totalLatency = 0.0
+        self._lastStats = time.time()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run,
+                                      name="MailQueue-%d" % i)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Deliver the pending digests and the queued messages, then stop the
+        worker threads.
+        """
+        with self._lock:
+            digests, self._digests = self._digests, {}
+            self._digested = 0
+        for key, digest in digests.iteritems():
+            digest['timer'].cancel()
+            self._put(self._makeDigest(digest), digest['server'],
+                      digest['queued'], block=True)
+        for thread in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.pool.closeAll()
+
+    @property
+    def depth(self):
+        """
+        Number of messages waiting for delivery, including digested ones.
+        """
+        return self._queue.qsize() + self._digested
+
+    def stats(self):
+        """
+        Return a dictionary of delivery statistics; latencies are in
+        seconds from queuing to delivery.
+        """
+        delivered = self.sent + self.failed
+        return dict(depth=self.depth,
+                    sent=self.sent,
+                    failed=self.failed,
+                    connections=self.pool.connections,
+                    lastLatency=self.lastLatency,
+                    maxLatency=self.maxLatency,
+                    avgLatency=self._totalLatency / delivered
+                               if delivered else 0.0)
+
+    def send(self, message, host, port=25, useTls=False, user='',
+             password=''):
+        """
+        Queue message for delivery.
+
+        @raise MailQueueFull: when maxSize messages are already waiting,
+                              queued or in digests
+        """
+        server = ((host, port, bool(useTls), user or ''), password)
+        queued = time.time()
+        if self.digestWindow > 0:
+            recipients = tuple(sorted(
+                x.strip() for x in message['To'].split(',')))
+            key = (server[0], message['From'], recipients)
+            with self._lock:
+                if self._queue.qsize() + self._digested >= self.maxSize:
+                    raise MailQueueFull()
+                self._digested += 1
+                digest = self._digests.get(key)
+                if digest is not None:
+                    digest['messages'].append(message)
+                    return
+                timer = threading.Timer(self.digestWindow,
+                                        self._flushDigest, (key,))
+                timer.setDaemon(True)
+                self._digests[key] = dict(messages=[message], server=server,
+                                          queued=queued, timer=timer)
+            timer.start()
+            return
+        self._put(message, server, queued)
+
+    def _put(self, message, server, queued, block=False):
+        try:
+            self._queue.put((message, server, queued), block)
+        except Queue.Full:
+            raise MailQueueFull()
+
+    def _flushDigest(self, key):
+        with self._lock:
+            digest = self._digests.pop(key, None)
+            if digest is None:
+                return
+            self._digested -= len(digest['messages'])
+        try:
+            self._put(self._makeDigest(digest), digest['server'],
+                      digest['queued'])
+        except MailQueueFull:
+            self.failed += len(digest['messages'])
+            log.error("Mail queue is full, dropped a digest of %d messages"
+                      " to %s", len(digest['messages']), key[2])
+
+    def _makeDigest(self, digest):
+        messages = digest['messages']
+        if len(messages) == 1:
+            return messages[0]
+        first = messages[0]
+        message = MIMEMultipart('mixed')
+        message.attach(MIMEText("%d notifications:\n\n%s\n" % (
+            len(messages), "\n".join(m['Subject'] for m in messages))))
+        for each in messages:
+            message.attach(MIMEMessage(each))
+        message['Subject'] = "[%d notifications] %s" % (len(messages),
+                                                         first['Subject'])
+        message['From'] = first['From']
+        message['To'] = first['To']
+        message['Date'] = formatdate(None, True)
+        return message
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            message, server, queued = item
+            try:
+                self._deliver(message, *server)
+            except Exception as ex:
+                self.failed += 1
+                log.error("Failed to send email '%s' to %s: %s",
+                          message['Subject'], message['To'], ex)
+            else:
+                self.sent += 1
+            latency = time.time() - queued
+            self.lastLatency = latency
+            self.maxLatency = max(self.maxLatency, latency)
+            self._totalLatency += latency
+            self._logStats()
+
+    def _deliver(self, message, key, password):
+        fromaddr = message['From']
+        toaddr = [x.strip() for x in message['To'].split(',')]
+        text = message.as_string()
+        while True:
+            server, reused = self.pool.acquire(key, password)
+            try:
+                server.sendmail(fromaddr, toaddr, text)
+            except (smtplib.SMTPServerDisconnected, socket.error):
+                self.pool.discard(server)
+                # The relay may have closed an idle connection
+                if not reused:
+                    raise
+            except Exception:
+                self.pool.discard(server)
+                raise
+            else:
+                self.pool.release(key, server)
+                return
+
+    def _logStats(self):
+        now = time.time()
+        if now - self._lastStats >= self.statsInterval:
+            self._lastStats = now
+            log.info("Mail queue: %(depth)d waiting, %(sent)d sent,"
+                     " %(failed)d failed, %(connections)d connections,"
+                     " latency avg %(avgLatency).2fs max %(maxLatency).2fs",
+                     self.stats())
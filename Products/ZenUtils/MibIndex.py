@@ -0,0 +1,121 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """MibIndex
+
+A bidirectional MIB name <-> OID index.  OIDs are kept in a trie keyed by
+OID component so that the longest known prefix of an OID is found with one
+walk instead of one lookup per candidate prefix.  It has no ZODB
+dependencies so that it can be used both in zenhub and in the collectors.
+"""
+
+_NAME = 0
+_CHILDREN = 1
+
+
+class MibIndex(object):
+    """
+    Maps OIDs to names and names to OIDs.  When the same OID is added more
+    than once the last one added wins, as it did in the oidMap of zentrap.
+    When the same name is added more than once the first one wins, as it
+    did for name lookups in the mibSearch catalog.  Names are matched case
+    insensitively like the mibSearch catalog does.
+    """
+
+    def __init__(self, pairs=(), generation=None):
+        """
+        @param pairs: iterable of (oid, name) tuples
+        @param generation: opaque value identifying the MIB data the index
+                           was built from
+        """
+        self.generation = generation
+        self._names = {}
+        self._oids = {}
+        self._root = [None, {}]
+        for oid, name in pairs:
+            self.add(oid, name)
+
+    def __len__(self):
+        return len(self._oids)
+
+    def add(self, oid, name):
+        """
+        Add an oid and its name to the index.
+        """
+        oid = oid.strip('.')
+        if not oid or not name:
+            return
+        self._names.setdefault(name.lower(), oid)
+        self._oids[oid] = name
+        node = self._root
+        for part in oid.split('.'):
+            children = node[_CHILDREN]
+            child = children.get(part)
+            if child is None:
+                child = children[part] = [None, {}]
+            node = child
+        node[_NAME] = name
+
+    def iteroids(self):
+        """
+        Iterate over (oid, name) tuples.
+        """
+        return self._oids.iteritems()
+
+    def getOid(self, name):
+        """
+        Return the oid of name or None.
+        """
+        return self._names.get(name.lower())
+
+    def getName(self, oid):
+        """
+        Return the name of the exact oid or None.
+        """
+        return self._oids.get(oid.strip('.'))
+
+    def longestMatch(self, oid):
+        """
+        Return a (name, remainder) tuple for the longest known prefix of
+        oid, remainder being the list of trailing OID components that are
+        not part of the prefix.  Return (None, None) if no prefix is known.
+        """
+        parts = oid.strip('.').split('.')
+        node = self._root
+        name, matched = None, 0
+        for depth, part in enumerate(parts):
+            node = node[_CHILDREN].get(part)
+            if node is None:
+                break
+            if node[_NAME] is not None:
+                name, matched = node[_NAME], depth + 1
+        if name is None:
+            return None, None
+        return name, parts[matched:]
+
+    def oid2name(self, oid, exactMatch=True, strip=False, default=""):
+        """
+        Return a name for an oid.
+
+        @param exactMatch: find the full OID or don't match
+        @param strip: when not matching exactly, return only the name of
+                      the matched prefix instead of name plus the numeric
+                      remainder
+        @param default: returned when nothing matches
+        """
+        if exactMatch:
+            name = self.getName(oid)
+            return default if name is None else name
+        name, remainder = self.longestMatch(oid)
+        if name is None:
+            return default
+        if remainder and not strip:
+            return "%s.%s" % (name, '.'.join(remainder))
+        return name
@@ -25,12 +25,15 @@ import subprocess
 import tarfile
 import re
 import gzip
+import shutil
 from itertools import imap
 
 import Globals
 from ZCmdBase import ZCmdBase
 from Products.ZenUtils.Utils import zenPath, binPath, readable_time, unused
 from ZenBackupBase import *
+from BackupArchive import BackupArchive, BackupEngine, BackupJournal
+from BackupArchive import BackupPart
 from zope.interface import implements
 from Products.Zuul.interfaces import IPreBackupEvent, IPostBackupEvent
 from zope.event import notify
@@ -108,7 +111,7 @@ class ZenBackup(ZenBackupBase):
             return False
         return output.startswith('Elapsed time:')
 
-    def saveSettings(self):
+    def saveSettings(self, stagingDir=None):
         '''
         Save the database credentials to a file for use during restore.
         '''
@@ -129,7 +132,7 @@ class ZenBackup(ZenBackupBase):
         config.set(CONFIG_SECTION, 'zepdbuser', self.options.zepdbuser)
         config.set(CONFIG_SECTION, 'zepdbpass', self.options.zepdbpass)
 
-        creds_file = os.path.join(self.tempDir, CONFIG_FILE)
+        creds_file = os.path.join(stagingDir or self.tempDir, CONFIG_FILE)
         self.log.debug("Writing MySQL credentials to %s", creds_file)
         f = open(creds_file, 'w')
         try:
@@ -227,6 +230,26 @@ class ZenBackup(ZenBackupBase):
                                action='store_true',
                                help='include only data relevant to collector'
                                     ' in the backup.')
+        self.parser.add_option('--parallel',
+                               dest="parallel",
+                               default=3,
+                               type='int',
+                               help='Number of backup parts (databases, config'
+                                    ' files, performance data, ...) to run'
+                                    ' at the same time.')
+        self.parser.add_option('--staging-dir',
+                               dest="stagingDir",
+                               default=None,
+                               help='Directory to stage backup parts in.'
+                                    ' Staged parts are kept there until the'
+                                    ' backup is complete so that an'
+                                    ' interrupted backup can be resumed.')
+        self.parser.add_option('--resume',
+                               dest="resume",
+                               default=False,
+                               action='store_true',
+                               help='Resume an interrupted backup, reusing'
+                                    ' the parts staged in --staging-dir.')
 
         self.parser.remove_option('-v')
         self.parser.add_option('-v', '--logseverity',
@@ -235,7 +258,8 @@ class ZenBackup(ZenBackupBase):
                         type='int',
                         help='Logging severity threshold')
 
-    def backupMySqlDb(self, host, port, db, user, passwdType, sqlFile, socket=None, tables=None):
+    def backupMySqlDb(self, host, port, db, user, passwdType, sqlFile, socket=None, tables=None,
+                      stagingDir=None):
         command = ['mysqldump', '-u%s' %user, '--single-transaction', '--routines']
         credential = self.getPassArg(passwdType)
         database = [db]
@@ -249,7 +273,7 @@ class ZenBackup(ZenBackupBase):
         if socket:
             command.append('--socket=%s' % socket)
 
-        with gzip.open(os.path.join(self.tempDir, sqlFile),'wb') as gf:
+        with gzip.open(os.path.join(stagingDir or self.tempDir, sqlFile),'wb') as gf:
             # If tables are specified, backup db schema and data from selected tables.
             if tables is not None:
                 self.log.debug(' '.join(command + ['*' * 8] + ['--no-data'] + database))
@@ -285,19 +309,11 @@ class ZenBackup(ZenBackupBase):
         with open(os.devnull, 'w') as devnull:
             return not subprocess.call([zeneventserver_cmd, 'status'], stdout=devnull, stderr=devnull)
 
-    def backupZEP(self):
+    def backupZEP(self, stagingDir=None):
         '''
         Backup ZEP
         '''
         partBeginTime = time.time()
-        
-        # Setup defaults for db info
-        if self.options.fetchArgs:
-            self.log.info('Getting ZEP dbname, user, password, port from configuration files.')
-            self.readZEPSettings()
-
-        if self.options.saveSettings:
-            self.saveSettings()
 
         if self.options.noEventsDb:
             self.log.info('Doing a partial backup of the events database.')
@@ -308,34 +324,49 @@ class ZenBackup(ZenBackupBase):
 
         self.backupMySqlDb(self.options.zepdbhost, self.options.zepdbport,
                            self.options.zepdbname, self.options.zepdbuser,
-                           'zepdbpass', 'zep.sql.gz', tables=tables)
+                           'zepdbpass', 'zep.sql.gz', tables=tables,
+                           stagingDir=stagingDir)
 
         partEndTime = time.time()
         subtotalTime = readable_time(partEndTime - partBeginTime)
         self.log.info("Backup of events database completed in %s.", subtotalTime)
 
-        if not self.options.noEventsDb:
-            zeneventserver_dir = zenPath('var', 'zeneventserver')
-            if self.options.noZepIndexes:
-                self.log.info('Not backing up event indexes.')
-            elif self._zepRunning():
-                self.log.info('Not backing up event indexes - it is currently running.')
-            elif os.path.isdir(zeneventserver_dir):
-                self.log.info('Backing up event indexes.')
-                zepTar = tarfile.open(os.path.join(self.tempDir, 'zep.tar'), 'w')
-                zepTar.add(zeneventserver_dir, 'zeneventserver')
-                zepTar.close()
-                self.log.info('Backing up event indexes completed.')
-
-    def backupZenPacks(self):
+    def backupZEPIndexes(self, stagingDir=None):
+        '''
+        Backup the ZEP indexes, unless zeneventserver is running.
+        '''
+        zeneventserver_dir = zenPath('var', 'zeneventserver')
+        if self._zepRunning():
+            self.log.info('Not backing up event indexes - it is currently running.')
+        elif os.path.isdir(zeneventserver_dir):
+            self.log.info('Backing up event indexes.')
+            zepTar = tarfile.open(os.path.join(stagingDir or self.tempDir, 'zep.tar'), 'w')
+            zepTar.add(zeneventserver_dir, 'zeneventserver')
+            zepTar.close()
+            self.log.info('Backing up event indexes completed.')
+
+    def backupEtcFiles(self, stagingDir=None):
+        '''
+        Backup the config files
+        '''
+        # Copy /etc to backup dir (except for sockets)
+        self.log.info('Backing up config files.')
+        etcTar = tarfile.open(os.path.join(stagingDir or self.tempDir, 'etc.tar'), 'w')
+        etcTar.dereference = True
+        etcTar.add(zenPath('etc'), 'etc')
+        etcTar.close()
+        self.log.info("Backup of config files completed.")
+
+    def backupZenPacks(self, stagingDir=None):
         """
         Backup the zenpacks dir
         """
+        stagingDir = stagingDir or self.tempDir
         #can only copy zenpacks backups if ZEO is backed up
         if not self.options.noZopeDb and os.path.isdir(zenPath('ZenPacks')):
             # Copy /ZenPacks to backup dir
             self.log.info('Backing up ZenPacks.')
-            etcTar = tarfile.open(os.path.join(self.tempDir, 'ZenPacks.tar'), 'w')
+            etcTar = tarfile.open(os.path.join(stagingDir, 'ZenPacks.tar'), 'w')
             etcTar.dereference = True
             etcTar.add(zenPath('ZenPacks'), 'ZenPacks')
             etcTar.close()
@@ -343,29 +374,30 @@ class ZenBackup(ZenBackupBase):
             # add /bin dir if backing up zenpacks
             # Copy /bin to backup dir 
             self.log.info('Backing up bin dir.')
-            etcTar = tarfile.open(os.path.join(self.tempDir, 'bin.tar'), 'w')
+            etcTar = tarfile.open(os.path.join(stagingDir, 'bin.tar'), 'w')
             etcTar.dereference = True
             etcTar.add(zenPath('bin'), 'bin')
             etcTar.close()
             self.log.info("Backup of bin completed.")
     
-    def backupZenPackContents(self):
+    def backupZenPackContents(self, stagingDir=None):
         dmd = ZCmdBase(noopts=True).dmd
         self.log.info("Backing up ZenPack contents.")
         for pack in dmd.ZenPackManager.packs():
-            pack.backup(self.tempDir, self.log)
+            pack.backup(stagingDir or self.tempDir, self.log)
         self.log.info("Backup of ZenPack contents complete.")
     
-    def startBackupZODB(self):
+    def startBackupZODB(self, stagingDir=None):
         """
         Backup the Zope database.
         """
+        stagingDir = stagingDir or self.tempDir
         self.log.info('Initiating ZODB backup...')
         zodb_handler = ZenDB(useDefault='zodb')
-        self._zodb_backup_file_handler = open(os.path.join(self.tempDir, 'zodb.sql.gz'), 'wb')
+        self._zodb_backup_file_handler = open(os.path.join(stagingDir, 'zodb.sql.gz'), 'wb')
         (self._zodb_mysqldump_process, self._zodb_backup_gzip_process) = zodb_handler.asynchronousDump(self._zodb_backup_file_handler)
         
-        self._zodb_session_backup_file_handler = open(os.path.join(self.tempDir, 'zodb_session.sql.gz'), 'wb')
+        self._zodb_session_backup_file_handler = open(os.path.join(stagingDir, 'zodb_session.sql.gz'), 'wb')
         (self._zodb_session_mysqldump_process, self._zodb_session_backup_gzip_process) = zodb_handler.asynchronousDump(self._zodb_session_backup_file_handler, no_data=True)
     
     def waitForZODBBackup(self):
@@ -386,8 +418,19 @@ class ZenBackup(ZenBackupBase):
         partEndTime = time.time()
         subtotalTime = readable_time(partEndTime - partBeginTime)
         self.log.info("Waited %s seconds for the ZODB backup to finish.", subtotalTime)
-    
-    def backupPerfData(self):
+
+        if self._zodb_mysqldump_process.returncode or \
+                self._zodb_backup_gzip_process.returncode:
+            raise ZenBackupException("ZODB backup failed.", True)
+
+    def backupZODB(self, stagingDir=None):
+        """
+        Backup the Zope database and wait for the backup to finish.
+        """
+        self.startBackupZODB(stagingDir)
+        self.waitForZODBBackup()
+
+    def backupPerfData(self, stagingDir=None):
         """
         Back up the RRD files storing performance data.
         """
@@ -399,7 +442,7 @@ class ZenBackup(ZenBackupBase):
         partBeginTime = time.time()
 
         self.log.info('Backing up performance data (RRDs).')
-        tarFile = os.path.join(self.tempDir, 'perf.tar')
+        tarFile = os.path.join(stagingDir or self.tempDir, 'perf.tar')
         #will change dir to ZENHOME so that tar dir structure is relative
         cmd = ['tar', 'chfC', tarFile, zenPath(), 'perf']
         (output, warnings, returncode) = self.runCommand(cmd)
@@ -412,32 +455,87 @@ class ZenBackup(ZenBackupBase):
                       subtotalTime )
 
 
-    def packageStagingBackups(self):
+    def openArchive(self):
         """
-        Gather all of the other data into one nice, neat file for easy
-        tracking. Returns the filename created.
+        Open the archive parts are streamed into. Returns the archive and
+        the name of the backup file.
         """
-        self.log.info('Packaging backup file.')
+        if self.options.stdout:
+            return BackupArchive(fileobj=sys.stdout), 'stdout'
         if self.options.file:
             outfile = self.options.file
         else:
             outfile = self.getDefaultBackupFile()
-        tempHead, tempTail = os.path.split(self.tempDir)
-        tarFile = outfile
-        if self.options.stdout:
-            tarFile = '-'
-        cmd = ['tar', 'czfC', tarFile, tempHead, tempTail]
-        (output, warnings, returncode) = self.runCommand(cmd)
-        if returncode:
-            raise ZenBackupException("Backup packaging failed.", True)
-        self.log.info('Backup written to %s' % outfile)
-        return outfile
+        # Written under a temporary name so that an interrupted backup
+        # doesn't leave a truncated file behind
+        return BackupArchive(name=outfile + '.partial'), outfile
+
+
+    def getBackupParts(self):
+        """
+        The parts of the backup to make, according to the options.
+
+        @rtype: list of BackupPart
+        """
+        parts = []
+        # Do a full backup of zep if noEventsDb is false, otherwise only back
+        # up a small subset of tables to capture the event triggers.
+        if not self.options.noEventsDb or not self.options.noZopeDb:
+            if self.options.saveSettings:
+                parts.append(BackupPart('settings', self.saveSettings,
+                                        description='database settings'))
+            parts.append(BackupPart('zep', self.backupZEP,
+                                    description='events database'))
+            if not self.options.noEventsDb:
+                if self.options.noZepIndexes:
+                    self.log.info('Not backing up event indexes.')
+                else:
+                    parts.append(BackupPart('zepindexes',
+                                            self.backupZEPIndexes,
+                                            description='event indexes'))
+        else:
+            self.log.info('Skipping backup of the events database.')
+
+        parts.append(BackupPart('etc', self.backupEtcFiles,
+                                description='config files'))
+
+        if self.options.noZopeDb:
+            self.log.info('Skipping backup of ZODB.')
+        else:
+            parts.append(BackupPart('zodb', self.backupZODB,
+                                    description='ZODB'))
+
+        if self.options.noZenPacks:
+            self.log.info('Skipping backup of ZenPack data.')
+        else:
+            parts.append(BackupPart('zenpacks', self.backupZenPacks,
+                                    description='ZenPacks'))
+            # Opens its own ZODB connection
+            parts.append(BackupPart('zenpackcontents',
+                                    self.backupZenPackContents,
+                                    mainThread=True,
+                                    description='ZenPack contents'))
+
+        if self.options.noPerfData:
+            self.log.info('Skipping backup of performance data.')
+        else:
+            parts.append(BackupPart('perf', self.backupPerfData,
+                                    description='performance data'))
+        return parts
 
 
     def cleanupTempDir(self):
         """
         Remove temporary files in staging directory.
         """
+        if self.options.stagingDir:
+            # Only remove what the backup staged, not the directory itself
+            self.log.info('Cleaning up staged parts in %s' % self.rootTempDir)
+            for name in ('parts', BACKUP_DIR):
+                shutil.rmtree(os.path.join(self.rootTempDir, name),
+                              ignore_errors=True)
+            BackupJournal(self.rootTempDir).clear()
+            return
         self.log.info('Cleaning up staging directory %s' % self.rootTempDir)
         cmd = ['rm', '-r', self.rootTempDir]
         (output, warnings, returncode) = self.runCommand(cmd)
@@ -448,87 +546,94 @@ class ZenBackup(ZenBackupBase):
     def makeBackup(self):
         '''
         Create a backup of the data and configuration for a Zenoss install.
+
+        The parts of the backup run concurrently, each staged in a directory
+        of its own and streamed into the backup file as soon as it is done.
+        The backup file ends with a manifest of the checksums of its files.
         '''
         hasCriticalErrors = False
         messages = []
         backupBeginTime = time.time()
 
         # Create temp backup dir
-        self.rootTempDir = self.getTempDir()
+        journal = None
+        if self.options.stagingDir:
+            self.rootTempDir = self.options.stagingDir
+            if not os.path.isdir(self.rootTempDir):
+                os.makedirs(self.rootTempDir, 0750)
+            journal = BackupJournal(self.rootTempDir)
+            if self.options.resume:
+                journal.load()
+            else:
+                journal.clear()
+        elif self.options.resume:
+            self.log.critical('--resume needs the --staging-dir of the'
+                              ' backup to resume.')
+            return -1
+        else:
+            self.rootTempDir = self.getTempDir()
         self.tempDir = os.path.join(self.rootTempDir, BACKUP_DIR)
         self.log.debug("Use %s as a staging directory for the backup", self.tempDir)
-        os.mkdir(self.tempDir, 0750)
+        if not os.path.isdir(self.tempDir):
+            os.mkdir(self.tempDir, 0750)
 
         if self.options.collector:
             self.options.noEventsDb = True
             self.options.noZopeDb = True
             self.options.noZepIndexes = True
             self.options.noZenPacks = True
-        
-        # Do a full backup of zep if noEventsDb is false, otherwise only back
-        # up a small subset of tables to capture the event triggers.
-        if not self.options.noEventsDb or not self.options.noZopeDb:
-            try:
-                self.backupZEP()
-            except ZenBackupException as e:
-                hasCriticalErrors = hasCriticalErrors or e.isCritical()
-                messages.append(str(e))
-        else:
-            self.log.info('Skipping backup of the events database.')
-        
-        # Copy /etc to backup dir (except for sockets)
-        self.log.info('Backing up config files.')
-        etcTar = tarfile.open(os.path.join(self.tempDir, 'etc.tar'), 'w')
-        etcTar.dereference = True
-        etcTar.add(zenPath('etc'), 'etc')
-        etcTar.close()
-        self.log.info("Backup of config files completed.")
-        
-        if self.options.noZopeDb:
-            self.log.info('Skipping backup of ZODB.')
-        else:
-            notify(PreBackupEvent(self))
-            self.startBackupZODB()
 
-        if self.options.noZenPacks:
-            self.log.info('Skipping backup of ZenPack data.')
-        else:
-            partBeginTime = time.time()
-            self.backupZenPacks()
-            self.backupZenPackContents()
-            partEndTime = time.time()
-            subtotalTime = readable_time(partEndTime - partBeginTime)
-            self.log.info("Backup of ZenPacks completed in %s.", subtotalTime)
-        
+        parts = self.getBackupParts()
+        names = [part.name for part in parts]
+        if 'zep' in names and self.options.fetchArgs:
+            # Setup defaults for db info
+            self.log.info('Getting ZEP dbname, user, password, port from configuration files.')
+            self.readZEPSettings()
+
+        archive, outfile = self.openArchive()
+        engine = BackupEngine(archive, self.rootTempDir,
+                              parallel=self.options.parallel,
+                              journal=journal,
+                              keepStaged=journal is not None)
+        if 'zodb' in names:
+            notify(PreBackupEvent(self))
+        errors = engine.run(parts)
         notify(PostBackupEvent(self))
-        if not self.options.noZopeDb:
-            self.waitForZODBBackup()
+        for e in errors.values():
+            # Unexpected errors are critical
+            if isinstance(e, ZenBackupException):
+                hasCriticalErrors = hasCriticalErrors or e.isCritical()
+            else:
+                hasCriticalErrors = True
+            messages.append(str(e))
 
-        if self.options.noPerfData:
-            self.log.info('Skipping backup of performance data.')
+        # Anything else staged in the backup directory, by ZenPacks
+        # handling the backup events for instance
+        if os.listdir(self.tempDir):
+            archive.addPart('other', self.tempDir)
+
+        archive.close()
+        if not self.options.stdout:
+            os.rename(outfile + '.partial', outfile)
+        self.log.info('Backup written to %s' % outfile)
+
+        if hasCriticalErrors and journal is not None:
+            self.log.info('Staged parts are kept in %s, run again with'
+                          ' --resume to retry the failed parts.',
+                          self.rootTempDir)
         else:
             try:
-                self.backupPerfData()
+                self.cleanupTempDir()
             except ZenBackupException as e:
-                hasCriticalErrors = hasCriticalErrors or e.isCritical()
-                messages.append(str(e))
+                    hasCriticalErrors = hasCriticalErrors or e.isCritical()
+                    messages.append(str(e))
 
-        # tar, gzip and send to outfile
-        try:
-            outfile = self.packageStagingBackups()
-        except ZenBackupException as e:
-                hasCriticalErrors = hasCriticalErrors or e.isCritical()
-                messages.append(str(e))
-
-        try:
-            self.cleanupTempDir()
-        except ZenBackupException as e:
-                hasCriticalErrors = hasCriticalErrors or e.isCritical()
-                messages.append(str(e))
-        
         if not hasCriticalErrors:
             backupEndTime = time.time()
             totalBackupTime = readable_time(backupEndTime - backupBeginTime)
+            if engine.resumed:
+                self.log.info('Resumed with the staged %s.',
+                              ', '.join(engine.resumed))
             if len(messages) == 0:
                 self.log.info('Backup completed successfully in %s.', totalBackupTime)
             else:
@@ -17,6 +17,11 @@ Restores a zenoss backup created by zenbackup.
 import logging
 import sys
 import os
+import json
+import time
+import Queue
+import shutil
+import threading
 import subprocess
 import tarfile
 import ConfigParser
@@ -26,18 +31,82 @@ from ZCmdBase import ZCmdBase
 from Products.ZenUtils.Utils import zenPath, binPath, requiresDaemonShutdown
 
 from ZenBackupBase import *
+from BackupArchive import verifyArchive, verifyDirectory, readArchive
+from BackupArchive import extractArchive, compareManifest, MANIFEST_FILE
+
+# Components a backup is restored by, in restore order
+RESTORE_COMPONENTS = ('zodb', 'etc', 'zenpacks', 'zenpackcontents', 'perf',
+                      'zep')
+
+# Components that are restored after others. ZEP reads its database
+# settings from the restored global.conf.
+RESTORE_DEPENDENCIES = {'zenpackcontents': ('zodb', 'etc', 'zenpacks'),
+                        'zep': ('etc',)}
+
+# The component restoring each part of a backup, None for what every
+# restore needs
+BACKUP_PART_COMPONENTS = {'settings': None,
+                          'zep': 'zep',
+                          'zepindexes': 'zep',
+                          'etc': 'etc',
+                          'zodb': 'zodb',
+                          'zenpacks': 'zenpacks',
+                          'zenpackcontents': 'zenpackcontents',
+                          'other': 'zenpackcontents',
+                          'perf': 'perf'}
+
+_FILE_COMPONENTS = {CONFIG_FILE: None,
+                    'zep.sql': 'zep',
+                    'zep.sql.gz': 'zep',
+                    'zep.tar': 'zep',
+                    'etc.tar': 'etc',
+                    'zodb.sql': 'zodb',
+                    'zodb.sql.gz': 'zodb',
+                    'zodb_session.sql': 'zodb',
+                    'zodb_session.sql.gz': 'zodb',
+                    'ZenPacks.tar': 'zenpacks',
+                    'bin.tar': 'zenpacks',
+                    'perf.tar': 'perf'}
+
+_INNER_TARS = ('etc.tar', 'ZenPacks.tar', 'perf.tar', 'zep.tar')
+
+
+def componentOfFile(relpath):
+    """
+    The component restoring a file of a backup. Files other than the
+    known ones are left there by ZenPacks.
+    """
+    if relpath in _FILE_COMPONENTS:
+        return _FILE_COMPONENTS[relpath]
+    if relpath.startswith('repozo/'):
+        return 'zodb'
+    return 'zenpackcontents'
+
+
+class RestoreStep(object):
+    """
+    The restore of a component, after the components in deps.
+    """
+
+    def __init__(self, name, run, deps=(), mainThread=False):
+        self.name = name
+        self.run = run
+        self.deps = deps
+        self.mainThread = mainThread
 
 
 class ZenRestore(ZenBackupBase):
 
-    def __init__(self):
-        ZenBackupBase.__init__(self)
+    def __init__(self, noopts=0):
+        ZenBackupBase.__init__(self, noopts)
         self.log = logging.getLogger("zenrestore")
         logging.basicConfig()
         if self.options.verbose:
             self.log.setLevel(10)
         else:
             self.log.setLevel(40)
+        # Whether the backup file holds a ZODB backup, extracted or not
+        self.archiveHasZODB = False
 
     def buildOptions(self):
         """basic options setup sub classes can add more options here"""
@@ -79,6 +148,31 @@ class ZenRestore(ZenBackupBase):
                                help=('Experimental: Restore any ZenPacks in ' 
                                      'the backup. Some ZenPacks may not work '
                                      'properly. Reinstall ZenPacks if possible'))
+        self.parser.add_option('--only',
+                               dest='only',
+                               default=None,
+                               help='Restore only these comma separated'
+                                    ' components: %s.' %
+                                    ', '.join(RESTORE_COMPONENTS))
+        self.parser.add_option('--dry-run',
+                               dest='dryRun',
+                               default=False,
+                               action='store_true',
+                               help='Show what the restore would overwrite'
+                                    ' without restoring anything.')
+        self.parser.add_option('--parallel',
+                               dest='parallel',
+                               default=3,
+                               type='int',
+                               help='Number of independent components to'
+                                    ' restore at the same time.')
+        self.parser.add_option('--verify-only',
+                               dest='verifyOnly',
+                               default=False,
+                               action='store_true',
+                               help='Check the integrity of the backup'
+                                    ' against the checksums of its manifest'
+                                    ' without restoring anything.')
 
     def getSettings(self):
         ''' Retrieve some options from settings file
@@ -326,6 +420,343 @@ class ZenRestore(ZenBackupBase):
                         os.path.join(self.tempDir, 'perf.tar'))
         if os.system(cmd): return -1
 
+    def verifyBackup(self):
+        """
+        Check the files of a backup against the checksums of its manifest,
+        without restoring anything.
+        """
+        # The report is what --verify-only is run for
+        self.options.verbose = True
+        if self.options.file:
+            if not os.path.isfile(self.options.file):
+                sys.stderr.write('The specified backup file does not exist: %s\n' %
+                      self.options.file)
+                return -1
+            self.msg('Verifying backup file %s' % self.options.file)
+            manifest, checksums, problems = verifyArchive(name=self.options.file)
+        else:
+            if not os.path.isdir(self.options.dir):
+                sys.stderr.write('The specified backup directory does not exist:'
+                                ' %s\n' % self.options.dir)
+                return -1
+            self.msg('Verifying backup directory %s' % self.options.dir)
+            manifest, checksums, problems = verifyDirectory(self.options.dir)
+
+        for problem in problems:
+            sys.stderr.write('%s\n' % problem)
+        if problems:
+            sys.stderr.write('Backup verification failed.\n')
+            return -1
+        if manifest is None:
+            if self.options.file:
+                self.msg('The backup file is readable, but was made without'
+                         ' a manifest: its checksums cannot be verified.')
+            else:
+                self.msg('The backup directory has no manifest: its'
+                         ' checksums cannot be verified.')
+            return 0
+        parts = manifest.get('parts', {})
+        self.msg('Backup verified: %d files in %d parts (%s) match their'
+                 ' checksums.' % (len(checksums), len(parts),
+                                  ', '.join(sorted(parts))))
+        return 0
+
+    def getSelectedComponents(self):
+        """
+        The components to restore, from --only and the --no-* options.
+        """
+        if self.options.only:
+            only = set(c.strip() for c in self.options.only.split(',')
+                       if c.strip())
+            unknown = only.difference(RESTORE_COMPONENTS)
+            if unknown:
+                raise ValueError('Unknown components %s, choose from %s' % (
+                                 ', '.join(sorted(unknown)),
+                                 ', '.join(RESTORE_COMPONENTS)))
+            selected = only
+        else:
+            selected = set(RESTORE_COMPONENTS)
+            if not self.options.zenpacks:
+                selected.discard('zenpacks')
+        if self.options.noZODB:
+            selected.discard('zodb')
+        if self.options.noEventsDb:
+            selected.discard('zep')
+        if self.options.noPerfdata:
+            selected.discard('perf')
+        return selected
+
+    def unpackBackup(self, rootTempDir, selected):
+        """
+        Extract the files of the selected components from the backup file,
+        checking them against its manifest. Returns the manifest.
+        """
+        def select(relpath):
+            component = componentOfFile(relpath)
+            if relpath in ('zodb.sql', 'zodb.sql.gz') or \
+                    relpath.startswith('repozo/'):
+                self.archiveHasZODB = True
+            return component is None or component in selected
+
+        manifest, checksums = extractArchive(rootTempDir, select,
+                                             name=self.options.file)
+        if manifest is not None:
+            # Parts that failed during the backup are reported by doRestore
+            needed = selected.union([None])
+            parts = [name for name, part in manifest.get('parts', {}).items()
+                     if part.get('status') == 'ok' and
+                     BACKUP_PART_COMPONENTS.get(name) in needed]
+            problems = compareManifest(manifest, checksums, parts)
+            if problems:
+                raise ValueError('; '.join(problems))
+        return manifest
+
+    def inspectBackup(self, selected):
+        """
+        Read what a restore of the selected components would restore,
+        extracting only the settings of a backup file.
+
+        @return: (manifest, dictionary of the files of the backup to their
+                 size, dictionary of the tar files of the backup to the
+                 names of their members)
+        """
+        files = {}
+        members = {}
+
+        def visit(relpath, member, f):
+            files[relpath] = member.size
+            if relpath == CONFIG_FILE:
+                with open(os.path.join(self.tempDir, CONFIG_FILE), 'w') as out:
+                    out.write(f.read())
+            elif relpath in _INNER_TARS and \
+                    componentOfFile(relpath) in selected:
+                tar = tarfile.open(fileobj=f, mode='r|')
+                members[relpath] = [m.name for m in tar if not m.isdir()]
+                tar.close()
+
+        if self.options.file:
+            os.mkdir(self.tempDir, 0750)
+            manifest = readArchive(visit, name=self.options.file)
+        else:
+            manifest = None
+            for dirpath, dirnames, filenames in os.walk(self.tempDir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    relpath = os.path.relpath(path, self.tempDir)
+                    if relpath == MANIFEST_FILE:
+                        with open(path) as f:
+                            manifest = json.load(f)
+                    elif relpath != CONFIG_FILE:
+                        info = tarfile.TarInfo(relpath)
+                        info.size = os.path.getsize(path)
+                        with open(path, 'rb') as f:
+                            visit(relpath, info, f)
+        return manifest, files, members
+
+    def reportDryRun(self, selected, manifest, files, members):
+        """
+        Report what a restore of the selected components would overwrite.
+        """
+        # The report is what --dry-run is run for
+        self.options.verbose = True
+
+        def count(path):
+            return sum(len(filenames) for _, _, filenames in os.walk(path))
+
+        self.msg('Dry run, nothing is restored.')
+        if manifest is not None:
+            self.msg('Backup made on %s at %s.' % (manifest.get('host'),
+                                                   manifest.get('created')))
+            for name, part in sorted(manifest.get('parts', {}).items()):
+                if part.get('status') != 'ok':
+                    self.msg('The backup of %s failed: %s' % (
+                             name, part.get('error')))
+        has = lambda *names: any(n in files for n in names)
+        for component in RESTORE_COMPONENTS:
+            if component not in selected:
+                self.msg('%s: not selected' % component)
+            elif component == 'zodb':
+                if has('zodb.sql', 'zodb.sql.gz') or \
+                        any(f.startswith('repozo/') for f in files):
+                    self.msg('zodb: would replace the %s and %s_session MySQL'
+                             ' databases on %s' % (self.options.zodb_db,
+                             self.options.zodb_db, self.options.zodb_host))
+                else:
+                    self.msg('zodb: not in the backup')
+            elif component == 'etc':
+                names = members.get('etc.tar')
+                if names is None:
+                    self.msg('etc: not in the backup')
+                else:
+                    existing = [n for n in names
+                                if os.path.exists(zenPath(n))]
+                    self.msg('etc: would overwrite %d of the %d files it'
+                             ' restores in %s' % (len(existing), len(names),
+                                                  zenPath('etc')))
+            elif component == 'zenpacks':
+                names = members.get('ZenPacks.tar')
+                if names is None:
+                    self.msg('zenpacks: not in the backup')
+                else:
+                    self.msg('zenpacks: would remove %s (%d files) and restore'
+                             ' %d files, keeping existing files in %s' % (
+                             zenPath('ZenPacks'), count(zenPath('ZenPacks')),
+                             len(names), zenPath('bin')))
+            elif component == 'zenpackcontents':
+                self.msg('zenpackcontents: installed ZenPacks would restore'
+                         ' their own data from the backup')
+            elif component == 'perf':
+                names = members.get('perf.tar')
+                if names is None:
+                    self.msg('perf: not in the backup')
+                else:
+                    self.msg('perf: would remove %s (%d files) and restore'
+                             ' %d files' % (zenPath('perf'),
+                             count(zenPath('perf')), len(names)))
+            elif component == 'zep':
+                if not has('zep.sql', 'zep.sql.gz'):
+                    self.msg('zep: not in the backup')
+                    continue
+                if self.options.fetchArgs:
+                    self.readZEPSettings()
+                indexDir = zenPath('var', 'zeneventserver', 'index')
+                if 'zep.tar' in members:
+                    indexes = 'restoring %d index files' % len(members['zep.tar'])
+                else:
+                    indexes = 'to be rebuilt from the database'
+                self.msg('zep: would replace the %s MySQL database on %s and'
+                         ' remove %s (%d files), %s' % (
+                         self.options.zepdbname, self.options.zepdbhost,
+                         indexDir, count(indexDir), indexes))
+        return 0
+
+    def planRestore(self, selected):
+        """
+        The restore steps of the selected components found in the backup.
+        A step only waits for the steps it depends on that are planned.
+        """
+        steps = []
+
+        def add(name, run, mainThread=False):
+            steps.append(RestoreStep(name, run, mainThread=mainThread))
+
+        if 'zodb' in selected:
+            if self.hasZODBBackup():
+                add('zodb', self.restoreZODB)
+            else:
+                self.msg('Archive does not contain a ZODB backup')
+        if 'etc' in selected:
+            if os.path.isfile(os.path.join(self.tempDir, 'etc.tar')):
+                add('etc', self.restoreEtcFiles)
+            else:
+                self.msg('Backup contains no config files.')
+        if 'zenpacks' in selected:
+            if os.path.isfile(os.path.join(self.tempDir, 'ZenPacks.tar')):
+                add('zenpacks', self.restoreZenPacks)
+            else:
+                self.msg('Backup contains no ZenPacks.')
+        if 'zenpackcontents' in selected:
+            # Allow each installed ZenPack to restore state from the backup,
+            # in the main thread since it opens its own ZODB connection
+            add('zenpackcontents', self.restoreZenPackContents,
+                mainThread=True)
+        if 'perf' in selected:
+            if os.path.isfile(os.path.join(self.tempDir, 'perf.tar')):
+                add('perf', self.restorePerfData)
+            else:
+                self.msg('Backup contains no perf data.')
+        if 'zep' in selected:
+            add('zep', self.restoreZEP)
+        else:
+            self.msg('Skipping the events database.')
+        planned = set(step.name for step in steps)
+        for step in steps:
+            step.deps = [d for d in RESTORE_DEPENDENCIES.get(step.name, ())
+                         if d in planned]
+        return steps
+
+    def runRestorePlan(self, steps):
+        """
+        Run the restore steps, up to --parallel of those that don't depend
+        on each other at the same time.
+
+        @return: names of the steps that failed or were skipped because a
+                 step they depend on failed
+        """
+        done = dict((step.name, threading.Event()) for step in steps)
+        failed = set()
+        lock = threading.Lock()
+        progress = [0]
+
+        def run(step):
+            for dep in step.deps:
+                done[dep].wait()
+            with lock:
+                progress[0] += 1
+                position = progress[0]
+                skip = failed.intersection(step.deps)
+            if skip:
+                self.msg('[%d/%d] Not restoring %s, restoring %s failed.' % (
+                         position, len(steps), step.name,
+                         ', '.join(sorted(skip))))
+                failed.add(step.name)
+                done[step.name].set()
+                return
+            self.msg('[%d/%d] Restoring %s.' % (position, len(steps),
+                                                step.name))
+            start = time.time()
+            try:
+                result = step.run()
+            except Exception as e:
+                self.log.exception("Restoring %s failed", step.name)
+                result = -1
+            seconds = time.time() - start
+            if result == -1:
+                failed.add(step.name)
+                self.msg('[%d/%d] Restoring %s failed after %.1fs.' % (
+                         position, len(steps), step.name, seconds))
+            else:
+                self.msg('[%d/%d] Restored %s in %.1fs.' % (
+                         position, len(steps), step.name, seconds))
+            done[step.name].set()
+
+        def runOrFail(step):
+            try:
+                run(step)
+            except Exception:
+                self.log.exception("Restoring %s failed", step.name)
+                with lock:
+                    failed.add(step.name)
+                done[step.name].set()
+
+        # Steps are in restore order, so the steps a worker waits for are
+        # already running or done
+        todo = Queue.Queue()
+        for step in steps:
+            if not step.mainThread:
+                todo.put(step)
+
+        def work():
+            while True:
+                try:
+                    step = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                runOrFail(step)
+
+        workers = [threading.Thread(target=work, name='restore-%d' % i)
+                   for i in range(min(max(1, self.options.parallel),
+                                      todo.qsize()))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for step in steps:
+            if step.mainThread:
+                runOrFail(step)
+        for worker in workers:
+            worker.join()
+        return failed
+
     def doRestore(self):
         """
         Restore from a previous backup
@@ -337,20 +768,37 @@ class ZenRestore(ZenBackupBase):
         elif not self.options.file and not self.options.dir:
             sys.stderr.write('You must specify either --file or --dir.\n')
             sys.exit(-1)
+
+        if self.options.verifyOnly:
+            return self.verifyBackup()
+
+        try:
+            selected = self.getSelectedComponents()
+        except ValueError as e:
+            sys.stderr.write('%s\n' % e)
+            sys.exit(-1)
         
         # Maybe check to see if zeo is up and tell user to quit zenoss first
         rootTempDir = ''
+        manifest = None
         if self.options.file:
             if not os.path.isfile(self.options.file):
                 sys.stderr.write('The specified backup file does not exist: %s\n' %
                       self.options.file)
                 sys.exit(-1)
-            # Create temp dir and untar backup into it
-            self.msg('Unpacking backup file')
             rootTempDir = self.getTempDir()
-            cmd = 'tar xzfC %s %s' % (self.options.file, rootTempDir)
-            if os.system(cmd): return -1
             self.tempDir = os.path.join(rootTempDir, BACKUP_DIR)
+            if not self.options.dryRun:
+                # Create temp dir and untar the selected parts into it
+                self.msg('Unpacking backup file')
+                try:
+                    manifest = self.unpackBackup(rootTempDir, selected)
+                except Exception as e:
+                    sys.stderr.write('Unpacking the backup failed: %s\n' % e)
+                    shutil.rmtree(rootTempDir, ignore_errors=True)
+                    return -1
+                if not os.path.isdir(self.tempDir):
+                    os.mkdir(self.tempDir, 0750)
         else:
             self.msg('Using %s as source of restore' % self.options.dir)
             if not os.path.isdir(self.options.dir):
@@ -359,10 +807,20 @@ class ZenRestore(ZenBackupBase):
                 sys.exit(-1)
             self.tempDir = self.options.dir
 
+        if self.options.dryRun:
+            manifest, files, members = self.inspectBackup(selected)
+            self.getSettings()
+            try:
+                return self.reportDryRun(selected, manifest, files, members)
+            finally:
+                if rootTempDir:
+                    shutil.rmtree(rootTempDir, ignore_errors=True)
+
         # Maybe use values from backup file as defaults for self.options.
         self.getSettings()
 
-        if self.options.zenpacks and not self.hasZODBBackup():
+        if 'zenpacks' in selected and not (self.hasZODBBackup() or
+                                           self.archiveHasZODB):
             sys.stderr.write('Archive does not contain ZODB backup; cannot'
                              'restore ZenPacks')
             sys.exit(-1)
@@ -376,39 +834,14 @@ class ZenRestore(ZenBackupBase):
             sys.stderr.write("Please stop all Zenoss daemons and run"
                             "zenrestore again\n")
             sys.exit(-1)
-            
-        # ZODB
-        if self.hasZODBBackup():
-            self.restoreZODB()
-        else:
-            self.msg('Archive does not contain a ZODB backup')
 
-        # Configuration
-        self.restoreEtcFiles()
+        if manifest is not None:
+            for name, part in sorted(manifest.get('parts', {}).items()):
+                if part.get('status') != 'ok':
+                    self.msg('The backup of %s failed, it is not restored: %s'
+                             % (name, part.get('error')))
 
-        # ZenPacks
-        if self.options.zenpacks:
-            tempPacks = os.path.join(self.tempDir, 'ZenPacks.tar')
-            if os.path.isfile(tempPacks):
-                self.restoreZenPacks()
-            else:
-                self.msg('Backup contains no ZenPacks.')
-
-        # Allow each installed ZenPack to restore state from the backup
-        self.restoreZenPackContents()
-
-        # Performance Data
-        tempPerf = os.path.join(self.tempDir, 'perf.tar')
-        if os.path.isfile(tempPerf):
-            self.restorePerfData()
-        else:
-            self.msg('Backup contains no perf data.')
-
-        # Events
-        if self.options.noEventsDb:
-            self.msg('Skipping the events database.')
-        else:
-            self.restoreZEP()
+        failed = self.runRestorePlan(self.planRestore(selected))
 
         # clean up
         if self.options.file:
@@ -416,6 +849,9 @@ class ZenRestore(ZenBackupBase):
             cmd = 'rm -r %s' % rootTempDir
             if os.system(cmd): return -1
 
+        if failed:
+            self.msg('Restore of %s failed.' % ', '.join(sorted(failed)))
+            return -1
         self.msg('Restore complete.')
         # TODO: Audit from command-line without zenpacks loaded.
         # audit('Shell.Backup.Restore', file=self.options.file,
@@ -25,7 +25,7 @@ from celery import current_app, states, chain
 from celery.utils.log import get_task_logger
 
 from .loader import ZenossLoader
-from .backend import ZODBBackend
+from .backend import ZODBBackend, SqliteBackend
 
 # The Task must be imported AFTER ZenossLoader and ZODBBackend are imported,
 # otherwise these names will not be available when Task is imported.
@@ -26,7 +26,9 @@ import AccessControl.User
 
 from Products.Jobber.exceptions import NoSuchJobException
 from Products.ZenRelations.ZenPropertyManager import setDescriptors
-from Products.ZenUtils.celeryintegration import states
+from Products.ZenUtils.celeryintegration import states, constants
+from Products.ZenUtils.celeryintegration.jobstore import JobStore
+from Products.ZenUtils.Utils import zenPath
 from Products.ZenUtils.ZodbFactory import IZodbFactoryLookup
 from AccessControl.SecurityManagement import newSecurityManager
 from AccessControl.SecurityManagement import noSecurityManager
@@ -265,3 +267,73 @@ class ZODBBackend(BaseDictBackend):
     def process_cleanup(self):
         self._db = None
         self.reset()
+
+
+class SqliteBackend(ZODBBackend):
+    """
+    Result backend for Celery that keeps job state in a L{JobStore}
+    rather than in ZODB.  JobRecords are only written to ZODB, as an
+    archive, when JOBSTORE_ARCHIVE is set.
+    """
+    _store = None
+
+    @property
+    def store(self):
+        with self._db_lock:
+            if self._store is None:
+                conf = self.app.conf
+                self._store = JobStore(
+                    conf.get(constants.JOBSTORE_PATH) or
+                        zenPath('var', 'zenjobs.sqlite'),
+                    archive=bool(conf.get(constants.JOBSTORE_ARCHIVE)),
+                    batchSize=conf.get(constants.JOBSTORE_BATCH_SIZE) or 50,
+                    flushInterval=conf.get(
+                        constants.JOBSTORE_FLUSH_INTERVAL) or 1.0)
+            return self._store
+
+    def update(self, task_id, **properties):
+        """
+        Store properties of a job, and on its archived JobRecord.
+        """
+        self.store.update(task_id, **properties)
+        if not self.store.archive:
+            return
+
+        def _archive():
+            try:
+                transact(self.jobmgr.archive)(task_id, **properties)
+            except Exception:
+                log.debug("Unable to archive properties of job %s\n%s",
+                          task_id, traceback.format_exc())
+            finally:
+                self.reset()
+
+        t = threading.Thread(target=_archive)
+        t.start()
+        t.join()
+
+    def _get_task_meta_for(self, task_id):
+        meta = dict(result=None, traceback=None)
+        meta.update(self.store.get(task_id))
+        return meta
+
+    def wait_for(self, task_id, timeout=None, propagate=True, interval=0.5):
+        """
+        Wait for the job to be finished and return its result.
+        """
+        status = self.store.waitFor(task_id, states.READY_STATES, timeout,
+                                    interval)
+        if status is None:
+            raise TimeoutError("The operation timed out.")
+        result = self.get_result(task_id)
+        if status in states.PROPAGATE_STATES and propagate:
+            raise result
+        return result
+
+    def _forget(self, task_id):
+        self.store.delete(task_id)
+
+    def process_cleanup(self):
+        if self._store is not None:
+            self._store.flush()
+        super(SqliteBackend, self).process_cleanup()
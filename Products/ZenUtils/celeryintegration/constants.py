@@ -22,3 +22,7 @@ LOG_FORMAT = 'CELERYD_LOG_FORMAT'
 TASK_LOG_FORMAT = 'CELERYD_TASK_LOG_FORMAT'
 STDOUT_LOG_LEVEL = 'CELERY_REDIRECT_STDOUTS_LEVEL'
 ACK_LATE = "CELERY_ACKS_LATE"
+JOBSTORE_PATH = 'ZENOSS_JOBSTORE_PATH'
+JOBSTORE_ARCHIVE = 'ZENOSS_JOBSTORE_ARCHIVE'
+JOBSTORE_BATCH_SIZE = 'ZENOSS_JOBSTORE_BATCH_SIZE'
+JOBSTORE_FLUSH_INTERVAL = 'ZENOSS_JOBSTORE_FLUSH_INTERVAL'
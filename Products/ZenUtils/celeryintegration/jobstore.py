@@ -0,0 +1,327 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """JobStore
+
+Job state kept in a local sqlite database instead of ZODB.  Status, type
+and user are indexed columns so that status queries don't have to load
+every job; the remaining job properties are stored as a pickle.  Property
+updates are buffered and written in batches, and waiting for a job is
+woken up by writes from the same process and by a cheap change counter
+check for writes from other processes.
+
+The database is opened in write-ahead log mode, whose readers and writers
+share memory mapped from a file next to it.  It must be on a local
+filesystem shared by the processes using it, not on a network filesystem.
+"""
+
+import atexit
+import cPickle as pickle
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from Products.Jobber.exceptions import NoSuchJobException
+from Products.ZenUtils.celeryintegration import states
+
+log = logging.getLogger("zen.celeryintegration.jobstore")
+
+# Properties that are also stored in their own column, mapped to the column
+_COLUMNS = {
+    'status': 'status',
+    'job_type': 'type',
+    'user': 'user',
+    'job_description': 'description',
+    'date_scheduled': 'scheduled',
+    'date_started': 'started',
+    'date_done': 'finished',
+}
+
+# Columns jobs can be sorted on
+SORT_COLUMNS = frozenset(_COLUMNS.values())
+
+# PRAGMA data_version was added in sqlite 3.8.8, waiting for a job polls its
+# status with older versions
+_HAS_DATA_VERSION = sqlite3.sqlite_version_info >= (3, 8, 8)
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        type TEXT,
+        user TEXT,
+        description TEXT,
+        scheduled TEXT,
+        started TEXT,
+        finished TEXT,
+        properties BLOB NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, type)",
+    "CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user)",
+)
+
+
+def _columnValue(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _dumps(properties):
+    try:
+        return pickle.dumps(properties, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError):
+        # Results and tracebacks are not always picklable; keep their text
+        properties = dict(
+            (k, v if k not in ('result', 'traceback') else repr(v))
+            for k, v in properties.iteritems())
+        return pickle.dumps(properties, pickle.HIGHEST_PROTOCOL)
+
+
+class JobStore(object):
+    """
+    Job state keyed by job id.  Jobs are returned as dictionaries of their
+    properties.
+    """
+
+    def __init__(self, path, archive=False, batchSize=50, flushInterval=1.0):
+        """
+        @param path: sqlite database file, shared by all processes on a
+                     local filesystem
+        @param archive: also keep JobRecords in ZODB
+        @param batchSize: number of buffered job updates that triggers a
+                          write
+        @param flushInterval: seconds buffered job updates are kept at most
+        """
+        self.path = path
+        self.archive = archive
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.writes = 0
+        self._local = threading.local()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._changed = threading.Condition()
+        self._changes = 0
+        with self._connection() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+        atexit.register(self.flush)
+
+    def _connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.text_factory = str
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = conn
+        return conn
+
+    def _dataVersion(self):
+        """
+        A number that changes when other connections write the database,
+        or None when sqlite is too old to tell.
+        """
+        if not _HAS_DATA_VERSION:
+            return None
+        return self._connection().execute(
+            "PRAGMA data_version").fetchone()[0]
+
+    def _notify(self):
+        with self._changed:
+            self._changes += 1
+            self._changed.notifyAll()
+
+    def save(self, job_id, **properties):
+        """
+        Add a job, replacing a job with the same id.
+        """
+        properties['id'] = job_id
+        properties.setdefault('status', states.PENDING)
+        with self._lock:
+            self._pending.pop(job_id, None)
+        columns = dict((column, _columnValue(properties.get(prop)))
+                       for prop, column in _COLUMNS.iteritems())
+        names = sorted(columns)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, properties, %s) "
+                "VALUES (?, ?, %s)" % (", ".join(names),
+                                       ", ".join("?" * len(names))),
+                [job_id, sqlite3.Binary(_dumps(properties))] +
+                [columns[name] for name in names])
+        self.writes += 1
+        self._notify()
+
+    def update(self, job_id, **properties):
+        """
+        Buffer new property values for a job.  Updates that finish a job
+        are written right away so that waiters see them without delay.
+        """
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(properties)
+            flush = (len(self._pending) >= self.batchSize or
+                     properties.get('status') in states.READY_STATES)
+            if not flush and self._timer is None:
+                self._timer = threading.Timer(self.flushInterval, self.flush)
+                self._timer.setDaemon(True)
+                self._timer.start()
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered job updates in one transaction.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        with self._connection() as conn:
+            for job_id, properties in pending.iteritems():
+                row = conn.execute(
+                    "SELECT properties FROM jobs WHERE id = ?",
+                    (job_id,)).fetchone()
+                if row is None:
+                    log.warn("Job not updated.  Unable to save properties "
+                             "%s to job %s", properties, job_id)
+                    continue
+                stored = pickle.loads(str(row[0]))
+                stored.update(properties)
+                columns = [(column, _columnValue(properties[prop]))
+                           for prop, column in _COLUMNS.iteritems()
+                           if prop in properties]
+                conn.execute(
+                    "UPDATE jobs SET properties = ?%s WHERE id = ?" % "".join(
+                        ", %s = ?" % column for column, value in columns),
+                    [sqlite3.Binary(_dumps(stored))] +
+                    [value for column, value in columns] + [job_id])
+        self.writes += 1
+        self._notify()
+
+    def get(self, job_id):
+        """
+        Return the properties of a job.
+
+        @raise NoSuchJobException: if there is no such job
+        """
+        self.flush()
+        row = self._connection().execute(
+            "SELECT properties FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise NoSuchJobException(job_id)
+        return pickle.loads(str(row[0]))
+
+    def getStatus(self, job_id):
+        """
+        Return the status of a job, reading only the status column.
+
+        @raise NoSuchJobException: if there is no such job
+        """
+        with self._lock:
+            status = self._pending.get(job_id, {}).get('status')
+        if status is not None:
+            return status
+        row = self._connection().execute(
+            "SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise NoSuchJobException(job_id)
+        return row[0]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._pending.pop(job_id, None)
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self._notify()
+
+    def _select(self, where, args, sort_on=None, reverse=False, start=0,
+                limit=None):
+        sql = "SELECT properties FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if sort_on is not None:
+            if sort_on not in SORT_COLUMNS:
+                raise ValueError("Can't sort jobs on %s" % sort_on)
+            sql += " ORDER BY %s %s" % (sort_on, "DESC" if reverse else "ASC")
+        if limit is not None or start:
+            sql += " LIMIT ? OFFSET ?"
+            args = list(args) + [-1 if limit is None else limit, start]
+        self.flush()
+        for row in self._connection().execute(sql, args).fetchall():
+            yield pickle.loads(str(row[0]))
+
+    def getByStatus(self, statuses, jobtype=None):
+        """
+        Return the jobs in one of statuses, optionally of one job type.
+        """
+        statuses = list(statuses)
+        where = ["status IN (%s)" % ", ".join("?" * len(statuses))]
+        if jobtype is not None:
+            where.append("type = ?")
+            statuses.append(jobtype)
+        return self._select(where, statuses)
+
+    def search(self, user=None, sort_on='scheduled', reverse=False, start=0,
+               limit=None):
+        """
+        Return a (jobs, total) tuple of a page of jobs, optionally only
+        those of one user.
+        """
+        where, args = [], []
+        if user is not None:
+            where.append("user = ?")
+            args.append(user)
+        self.flush()
+        total = self._connection().execute(
+            "SELECT COUNT(*) FROM jobs" +
+            (" WHERE " + " AND ".join(where) if where else ""),
+            args).fetchone()[0]
+        jobs = list(self._select(where, args, sort_on, reverse, start, limit))
+        return jobs, total
+
+    def waitFor(self, job_id, statuses, timeout=None, interval=0.5):
+        """
+        Block until a job's status is one of statuses and return it, or
+        return None when timeout seconds passed first.  Writes made through
+        this store wake the waiter immediately; writes of other processes
+        are noticed within interval seconds by checking sqlite's change
+        counter, the job itself is only read again when it changed.  With
+        sqlite older than 3.8.8 the job is read every interval instead.
+
+        @raise NoSuchJobException: if there is no such job
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        version = None
+        while True:
+            with self._changed:
+                changes = self._changes
+            current = self._dataVersion()
+            if current is None or current != version:
+                version = current
+                status = self.getStatus(job_id)
+                if status in statuses:
+                    return status
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return None
+            with self._changed:
+                if self._changes == changes:
+                    self._changed.wait(wait)
+                if self._changes != changes:
+                    # Written by this process, read the job again
+                    version = None
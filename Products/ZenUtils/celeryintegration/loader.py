@@ -18,7 +18,8 @@ from . import constants
 class ZenossLoader(BaseLoader):
 
     override_backends = {
-        'zodb': 'Products.ZenUtils.celeryintegration.ZODBBackend'
+        'zodb': 'Products.ZenUtils.celeryintegration.ZODBBackend',
+        'sqlite': 'Products.ZenUtils.celeryintegration.SqliteBackend',
     }
 
     def on_worker_process_init(self):
@@ -67,7 +68,14 @@ class ZenossLoader(BaseLoader):
             # RESULT STORE #
             ################
 
-            constants.RESULT_BACKEND: 'zodb',
+            # 'zodb' or 'sqlite'; the sqlite job store must be on a path
+            # that Zope and zenjobs share, on a local filesystem rather
+            # than NFS since its write-ahead log uses shared memory.
+            constants.RESULT_BACKEND: globalCfg.get(
+                'zenjobs-result-backend', 'zodb'),
+            constants.JOBSTORE_PATH: globalCfg.get('zenjobs-store-path'),
+            constants.JOBSTORE_ARCHIVE: str(globalCfg.get(
+                'zenjobs-store-archive', '')).lower() in ('1', 'true', 'yes'),
 
             ###########
             # WORKERS #
@@ -0,0 +1,108 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase
+
+from Products.Jobber.exceptions import NoSuchJobException
+from Products.ZenUtils.celeryintegration import states
+from Products.ZenUtils.celeryintegration import jobstore
+from Products.ZenUtils.celeryintegration.jobstore import JobStore
+
+
+class JobStoreTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'jobs.sqlite')
+        self.store = JobStore(self.path, batchSize=10, flushInterval=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testSaveAndGet(self):
+        now = datetime.utcnow()
+        self.store.save('a', user='admin', job_type='Shell Command',
+                        date_scheduled=now)
+        job = self.store.get('a')
+        self.assertEqual(job['id'], 'a')
+        self.assertEqual(job['status'], states.PENDING)
+        self.assertEqual(job['date_scheduled'], now)
+        self.assertRaises(NoSuchJobException, self.store.get, 'b')
+        self.store.delete('a')
+        self.assertRaises(NoSuchJobException, self.store.getStatus, 'a')
+
+    def testStatusQueries(self):
+        for i, status in enumerate((states.PENDING, states.STARTED,
+                                    states.SUCCESS)):
+            self.store.save(str(i), status=status, job_type='type%d' % (i % 2))
+        unfinished = self.store.getByStatus(states.UNREADY_STATES)
+        self.assertEqual(sorted(j['id'] for j in unfinished), ['0', '1'])
+        running = self.store.getByStatus((states.STARTED,), 'type1')
+        self.assertEqual([j['id'] for j in running], ['1'])
+        jobs, total = self.store.search(sort_on='status', reverse=True,
+                                        limit=2)
+        self.assertEqual(total, 3)
+        self.assertEqual([j['status'] for j in jobs],
+                         [states.SUCCESS, states.STARTED])
+
+    def testBatchedUpdates(self):
+        for i in range(5):
+            self.store.save(str(i))
+        writes = self.store.writes
+        for i in range(5):
+            self.store.update(str(i), status=states.STARTED, logfile='x')
+        self.assertEqual(self.store.writes, writes)
+        # Read your own writes
+        self.assertEqual(self.store.getStatus('3'), states.STARTED)
+        other = JobStore(self.path)
+        self.assertEqual(other.getStatus('3'), states.PENDING)
+        self.store.flush()
+        self.assertEqual(self.store.writes, writes + 1)
+        self.assertEqual(other.get('3')['logfile'], 'x')
+        # Finishing a job is written right away
+        self.store.update('4', status=states.SUCCESS, result=4)
+        self.assertEqual(other.get('4')['result'], 4)
+
+    def testWaitFor(self):
+        self.store.save('a')
+        self.assertEqual(
+            self.store.waitFor('a', states.READY_STATES, timeout=0.1), None)
+        other = JobStore(self.path)
+
+        def finish():
+            time.sleep(0.2)
+            other.update('a', status=states.SUCCESS)
+
+        threading.Thread(target=finish).start()
+        start = time.time()
+        status = self.store.waitFor('a', states.READY_STATES, timeout=5,
+                                    interval=0.05)
+        self.assertEqual(status, states.SUCCESS)
+        self.assertTrue(time.time() - start < 2)
+
+    def testWaitForWithoutDataVersion(self):
+        hasDataVersion = jobstore._HAS_DATA_VERSION
+        jobstore._HAS_DATA_VERSION = False
+        try:
+            self.testWaitFor()
+        finally:
+            jobstore._HAS_DATA_VERSION = hasDataVersion
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(JobStoreTest))
+    return suite
@@ -0,0 +1,128 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import asyncore
+import email
+import smtpd
+import threading
+import time
+from email.MIMEText import MIMEText
+from unittest import TestCase
+
+from Products.ZenUtils.MailQueue import MailQueue, MailQueueFull
+
+
+class StandInSmtpServer(smtpd.SMTPServer):
+    """
+    Local SMTP server that keeps the messages it receives.
+    """
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+        self._thread = threading.Thread(
+            target=asyncore.loop, kwargs=dict(timeout=0.05))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.messages.append((rcpttos, email.message_from_string(data)))
+
+    def stop(self):
+        asyncore.close_all()
+        self._thread.join(1)
+
+
+def makeMessage(subject, to='ops@example.com'):
+    message = MIMEText("body of %s" % subject)
+    message['Subject'] = subject
+    message['From'] = 'zenoss@example.com'
+    message['To'] = to
+    return message
+
+
+class MailQueueTest(TestCase):
+
+    def setUp(self):
+        self.server = StandInSmtpServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def waitFor(self, count):
+        deadline = time.time() + 5
+        while len(self.server.messages) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def testPooledDelivery(self):
+        queue = MailQueue(workers=1)
+        queue.start()
+        for i in range(5):
+            queue.send(makeMessage('message %d' % i), '127.0.0.1',
+                       self.server.port)
+        queue.stop(timeout=5)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+        stats = queue.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['depth'], 0)
+
+    def testDigest(self):
+        queue = MailQueue(workers=1, digestWindow=0.2)
+        queue.start()
+        for i in range(3):
+            queue.send(makeMessage('message %d' % i), '127.0.0.1',
+                       self.server.port)
+        queue.send(makeMessage('other', to='dba@example.com'), '127.0.0.1',
+                   self.server.port)
+        self.assertEqual(queue.depth, 4)
+        self.waitFor(2)
+        queue.stop(timeout=5)
+        subjects = sorted(m['Subject'] for r, m in self.server.messages)
+        self.assertEqual(subjects, ['[3 notifications] message 0', 'other'])
+
+    def testQueueFull(self):
+        queue = MailQueue(maxSize=1)
+        queue.send(makeMessage('first'), '127.0.0.1', self.server.port)
+        self.assertRaises(MailQueueFull, queue.send, makeMessage('second'),
+                          '127.0.0.1', self.server.port)
+        queue.start()
+        queue.stop(timeout=5)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def testDigestQueueFull(self):
+        queue = MailQueue(maxSize=3, digestWindow=10)
+        queue.send(makeMessage('first'), '127.0.0.1', self.server.port)
+        queue.send(makeMessage('second'), '127.0.0.1', self.server.port)
+        queue.send(makeMessage('other', to='dba@example.com'), '127.0.0.1',
+                   self.server.port)
+        # both digested messages and open digests count toward maxSize
+        for to in ('ops@example.com', 'noc@example.com'):
+            self.assertRaises(MailQueueFull, queue.send,
+                              makeMessage('fourth', to=to), '127.0.0.1',
+                              self.server.port)
+        self.assertEqual(queue.depth, 3)
+        queue.start()
+        queue.stop(timeout=5)
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(queue.depth, 0)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(MailQueueTest))
+    return suite
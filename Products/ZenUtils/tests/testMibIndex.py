@@ -0,0 +1,65 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import unittest
+from Products.ZenUtils.MibIndex import MibIndex
+
+
+class MibIndexTest(unittest.TestCase):
+    """Tests MibIndex lookups"""
+
+    def setUp(self):
+        self.index = MibIndex([
+            ('1.3.6.1.2.1.2.2.1.10', 'ifInOctets'),
+            ('.1.3.6.1.2.1.31.1.1.1.6', 'ifHCInOctets'),
+            ('1.3.6.1.2.1.31.1.1.1.6', 'duplicate'),
+            ('1.3.6.1.4.1.4743.1.2.2.66', 'expedIfBssAAAVlanAtts'),
+        ])
+
+    def testName2Oid(self):
+        self.assertEqual('1.3.6.1.2.1.31.1.1.1.6',
+                         self.index.getOid('ifHCInOctets'))
+        self.assertEqual('1.3.6.1.2.1.31.1.1.1.6',
+                         self.index.getOid('IFHCINOCTETS'))
+        self.assertEqual(None, self.index.getOid('nothing'))
+
+    def testLastAddedOidWins(self):
+        self.assertEqual(3, len(self.index))
+        self.assertEqual('duplicate',
+                         self.index.getName('1.3.6.1.2.1.31.1.1.1.6'))
+        self.assertEqual('duplicate.0', self.index.oid2name(
+            '1.3.6.1.2.1.31.1.1.1.6.0', exactMatch=False))
+
+    def testExactMatch(self):
+        oid = '.1.3.6.1.4.1.4743.1.2.2.66'
+        self.assertEqual('expedIfBssAAAVlanAtts', self.index.oid2name(oid))
+        self.assertEqual('', self.index.oid2name(oid + '.0'))
+        self.assertEqual(oid, self.index.oid2name(oid + '.0', default=oid))
+
+    def testLongestMatch(self):
+        oid = '.1.3.6.1.4.1.4743.1.2.2.66'
+        self.assertEqual('expedIfBssAAAVlanAtts',
+                         self.index.oid2name(oid, exactMatch=False))
+        self.assertEqual('expedIfBssAAAVlanAtts.0.1',
+                         self.index.oid2name(oid + '.0.1', exactMatch=False))
+        self.assertEqual('expedIfBssAAAVlanAtts',
+                         self.index.oid2name(oid + '.0.1', exactMatch=False,
+                                             strip=True))
+        self.assertEqual(('ifInOctets', ['7']),
+                         self.index.longestMatch('1.3.6.1.2.1.2.2.1.10.7'))
+        self.assertEqual((None, None), self.index.longestMatch('1.3.6.1.2'))
+        self.assertEqual('', self.index.oid2name('1.3.6.1.2',
+                                                 exactMatch=False))
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(MibIndexTest),))
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
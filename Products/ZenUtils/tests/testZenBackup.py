@@ -8,9 +8,22 @@
 ##############################################################################
 
 
+import os
+import shutil
+import tarfile
+import tempfile
 import unittest
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenUtils.ZenBackup import strip_definer
+from Products.ZenUtils.BackupArchive import BackupArchive, BackupEngine
+from Products.ZenUtils.BackupArchive import BackupJournal, BackupPart
+from Products.ZenUtils.BackupArchive import verifyArchive, compareManifest
+from Products.ZenUtils.BackupArchive import extractArchive
+from Products.ZenUtils.ZenBackupBase import BACKUP_DIR, CONFIG_FILE
+from Products.ZenUtils.ZenBackupBase import CONFIG_SECTION
+from Products.ZenUtils.ZenRestore import ZenRestore, componentOfFile
+from Products.ZenUtils.ZenRestore import RESTORE_COMPONENTS
+from Products.ZenUtils.ZenRestore import RESTORE_DEPENDENCIES
 
 class TestDefiner(BaseTestCase):
     """Test the DEFINER stripping."""
@@ -41,8 +54,273 @@ END */;;"""
         actual = "\n".join(strip_definer(line) for line in input_text.splitlines())
         self.assertEqual(actual, expected)
 
+class TestBackupEngine(BaseTestCase):
+    """Test backing up parts into an archive with a manifest."""
+
+    def afterSetUp(self):
+        super(TestBackupEngine, self).afterSetUp()
+        self.dir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.dir, 'backup.tgz')
+        self.staging = os.path.join(self.dir, 'staging')
+        self.runs = []
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        super(TestBackupEngine, self).beforeTearDown()
+
+    def part(self, name, content, fail=False):
+        def run(stagingDir):
+            self.runs.append(name)
+            if fail:
+                raise IOError("%s is unavailable" % name)
+            with open(os.path.join(stagingDir, name + '.dat'), 'w') as f:
+                f.write(content)
+        return BackupPart(name, run)
+
+    def backup(self, parts, journal=None):
+        archive = BackupArchive(name=self.outfile)
+        engine = BackupEngine(archive, self.staging, parallel=2,
+                              journal=journal, keepStaged=bool(journal))
+        errors = engine.run(parts)
+        archive.close()
+        return errors
+
+    def testArchiveIsVerified(self):
+        errors = self.backup([self.part('etc', 'config' * 100),
+                              self.part('zodb', 'data' * 1000),
+                              self.part('perf', '', fail=True)])
+        self.assertEqual(errors.keys(), ['perf'])
+        manifest, checksums, problems = verifyArchive(name=self.outfile)
+        self.assertEqual(sorted(checksums), ['etc.dat', 'zodb.dat'])
+        self.assertEqual(manifest['parts']['zodb']['files']['zodb.dat']['size'],
+                         4000)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue('perf' in problems[0])
+        # staged parts were removed once archived
+        self.assertFalse(os.listdir(os.path.join(self.staging, 'parts')))
+
+        checksums['etc.dat'] = ('0' * 64, 600)
+        del checksums['zodb.dat']
+        self.assertEqual(len(compareManifest(manifest, checksums)), 3)
+
+    def testTruncatedArchive(self):
+        self.backup([self.part('zodb', os.urandom(100000))])
+        with open(self.outfile, 'r+b') as f:
+            f.truncate(50000)
+        manifest, checksums, problems = verifyArchive(name=self.outfile)
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith('The archive is unreadable'))
+
+    def testResume(self):
+        journal = BackupJournal(self.staging)
+        os.makedirs(self.staging)
+        self.backup([self.part('etc', 'config'),
+                     self.part('zodb', 'data', fail=True)], journal)
+        self.assertEqual(sorted(self.runs), ['etc', 'zodb'])
+        del self.runs[:]
+        journal = BackupJournal(self.staging)
+        journal.load()
+        self.assertEqual(self.backup([self.part('etc', 'config'),
+                                      self.part('zodb', 'data')], journal),
+                         {})
+        self.assertEqual(self.runs, ['zodb'])
+        manifest, checksums, problems = verifyArchive(name=self.outfile)
+        self.assertEqual(problems, [])
+        self.assertEqual(sorted(checksums), ['etc.dat', 'zodb.dat'])
+
+    def testSelectiveExtraction(self):
+        self.backup([self.part('zodb', 'data'), self.part('perf', 'rrd')])
+        self.assertEqual(componentOfFile('zodb.sql.gz'), 'zodb')
+        self.assertEqual(componentOfFile('perf.tar'), 'perf')
+        self.assertEqual(componentOfFile('backup.settings'), None)
+        manifest, checksums = extractArchive(
+            self.staging, lambda relpath: relpath.startswith('zodb'),
+            name=self.outfile)
+        self.assertEqual(checksums.keys(), ['zodb.dat'])
+        self.assertEqual(compareManifest(manifest, checksums, ['zodb']), [])
+        self.assertEqual(len(compareManifest(manifest, checksums)), 1)
+        self.assertEqual(os.listdir(os.path.join(self.staging, 'zenbackup')),
+                         ['zodb.dat'])
+
+
+class TestZenRestore(BaseTestCase):
+    """Test restoring selected components of a backup."""
+
+    def afterSetUp(self):
+        super(TestZenRestore, self).afterSetUp()
+        self.dir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.dir, 'backup.tgz')
+        self.restore = ZenRestore(noopts=1)
+        self.messages = []
+        self.restore.msg = self.messages.append
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        super(TestZenRestore, self).beforeTearDown()
+
+    def setOptions(self, *args):
+        self.restore.inputArgs = list(args)
+        self.restore.options, self.restore.args = \
+            self.restore.parser.parse_args(args=list(args))
+
+    def backup(self, files, tars={}):
+        """
+        Back up a part of each (part name, file name), holding that file,
+        a tar of the given member names for the files in tars.
+        """
+        def part(name, filename):
+            def run(stagingDir):
+                path = os.path.join(stagingDir, filename)
+                if filename in tars:
+                    tar = tarfile.open(path, 'w')
+                    for member in tars[filename]:
+                        tar.addfile(tarfile.TarInfo(member))
+                    tar.close()
+                else:
+                    with open(path, 'w') as f:
+                        f.write('[%s]\n' % CONFIG_SECTION)
+            return BackupPart(name, run)
+        archive = BackupArchive(name=self.outfile)
+        BackupEngine(archive, os.path.join(self.dir, 'staging')).run(
+            [part(name, filename) for name, filename in files])
+        archive.close()
+
+    def restorePlan(self, failing=(), raising=(),
+                    files=('zodb.sql.gz', 'etc.tar', 'ZenPacks.tar',
+                           'perf.tar')):
+        """
+        Plan and run a restore of every component from a backup directory
+        holding files, failing the given components and raising an error
+        in the restore of those in raising.
+
+        @return: (the failed components, the components in the order their
+                 restore started)
+        """
+        self.restore.tempDir = os.path.join(self.dir, BACKUP_DIR)
+        os.mkdir(self.restore.tempDir)
+        for filename in files:
+            open(os.path.join(self.restore.tempDir, filename), 'w').close()
+        started = []
+
+        def restorer(name):
+            def run():
+                started.append(name)
+                if name in raising:
+                    raise KeyError(name)
+                if name in failing:
+                    return -1
+            return run
+        for name, method in (('zodb', 'restoreZODB'),
+                             ('etc', 'restoreEtcFiles'),
+                             ('zenpacks', 'restoreZenPacks'),
+                             ('zenpackcontents', 'restoreZenPackContents'),
+                             ('perf', 'restorePerfData'),
+                             ('zep', 'restoreZEP')):
+            setattr(self.restore, method, restorer(name))
+        self.setOptions('--dir', self.restore.tempDir, '--zenpacks')
+        steps = self.restore.planRestore(
+            self.restore.getSelectedComponents())
+        return self.restore.runRestorePlan(steps), started
+
+    def testSelectedComponents(self):
+        self.setOptions()
+        self.assertEqual(self.restore.getSelectedComponents(),
+                         set(['zodb', 'etc', 'zenpackcontents', 'perf',
+                              'zep']))
+        self.setOptions('--zenpacks', '--no-eventsdb', '--no-perfdata')
+        self.assertEqual(self.restore.getSelectedComponents(),
+                         set(['zodb', 'etc', 'zenpacks', 'zenpackcontents']))
+        self.setOptions('--only', 'zodb, zenpacks,perf', '--no-zodb',
+                        '--no-perfdata')
+        self.assertEqual(self.restore.getSelectedComponents(),
+                         set(['zenpacks']))
+        self.setOptions('--only', 'zodb,events')
+        self.assertRaises(ValueError, self.restore.getSelectedComponents)
+
+    def testUnpackOnlyZenPacks(self):
+        self.backup([('settings', CONFIG_FILE),
+                     ('zodb', 'zodb.sql.gz'),
+                     ('zenpacks', 'ZenPacks.tar')])
+        self.setOptions('--file', self.outfile, '--only', 'zenpacks')
+        selected = self.restore.getSelectedComponents()
+        rootTempDir = os.path.join(self.dir, 'restore')
+        self.restore.tempDir = os.path.join(rootTempDir, BACKUP_DIR)
+        self.restore.unpackBackup(rootTempDir, selected)
+        self.assertEqual(sorted(os.listdir(self.restore.tempDir)),
+                         ['ZenPacks.tar', CONFIG_FILE])
+        # The ZODB backup the ZenPacks need is in the file, unextracted
+        self.assertFalse(self.restore.hasZODBBackup())
+        self.assertTrue(self.restore.archiveHasZODB)
+
+    def testRestorePlanOrder(self):
+        failed, started = self.restorePlan()
+        self.assertEqual(failed, set())
+        self.assertEqual(sorted(started), sorted(RESTORE_COMPONENTS))
+        for name, deps in RESTORE_DEPENDENCIES.items():
+            for dep in deps:
+                self.assertTrue(started.index(dep) < started.index(name))
+
+    def testFailedDependency(self):
+        failed, started = self.restorePlan(failing=('zodb',))
+        self.assertEqual(failed, set(['zodb', 'zenpackcontents']))
+        self.assertFalse('zenpackcontents' in started)
+        self.assertTrue('zep' in started)
+        self.assertTrue('Not restoring zenpackcontents, restoring zodb'
+                        ' failed.' in ' '.join(self.messages))
+
+    def testMissingDependencies(self):
+        # A backup made with --no-zodb, without config files
+        failed, started = self.restorePlan(files=('ZenPacks.tar',
+                                                  'perf.tar'))
+        self.assertEqual(failed, set())
+        self.assertEqual(sorted(started),
+                         ['perf', 'zenpackcontents', 'zenpacks', 'zep'])
+        self.assertTrue(started.index('zenpacks') <
+                        started.index('zenpackcontents'))
+
+    def testRaisingStepFails(self):
+        failed, started = self.restorePlan(raising=('etc',))
+        self.assertEqual(failed, set(['etc', 'zenpackcontents', 'zep']))
+        self.assertFalse('zep' in started)
+
+    def testFailedEtcSkipsZEP(self):
+        failed, started = self.restorePlan(failing=('etc',))
+        self.assertEqual(failed, set(['etc', 'zenpackcontents', 'zep']))
+        self.assertEqual(sorted(started), ['etc', 'perf', 'zenpacks',
+                                           'zodb'])
+
+    def testDryRun(self):
+        self.backup([('settings', CONFIG_FILE),
+                     ('zodb', 'zodb.sql.gz'),
+                     ('perf', 'perf.tar')],
+                    tars={'perf.tar': ['perf/a.rrd', 'perf/b.rrd']})
+        self.setOptions('--file', self.outfile, '--dry-run',
+                        '--no-eventsdb')
+        self.assertEqual(self.restore.doRestore(), 0)
+        self.assertEqual(self.messages[0], 'Dry run, nothing is restored.')
+        report = dict(m.split(': ', 1) for m in self.messages[2:])
+        self.assertEqual(sorted(report), sorted(RESTORE_COMPONENTS))
+        self.assertTrue(report['zodb'].startswith('would replace the'))
+        self.assertEqual(report['etc'], 'not in the backup')
+        self.assertEqual(report['zenpacks'], 'not selected')
+        self.assertTrue(report['perf'].endswith('and restore 2 files'))
+        self.assertEqual(report['zep'], 'not selected')
+        # Nothing but the settings was extracted, and that was cleaned up
+        self.assertFalse(os.path.exists(self.restore.tempDir))
+
+    def testVerifyOnly(self):
+        self.backup([('settings', CONFIG_FILE), ('zodb', 'zodb.sql.gz')])
+        self.setOptions('--file', self.outfile, '--verify-only')
+        self.assertEqual(self.restore.doRestore(), 0)
+        self.assertEqual(self.messages[-1],
+                         'Backup verified: 2 files in 2 parts (settings,'
+                         ' zodb) match their checksums.')
+
+
 def test_suite():
-    return unittest.TestSuite((unittest.makeSuite(TestDefiner),))
+    return unittest.TestSuite((unittest.makeSuite(TestDefiner),
+                               unittest.makeSuite(TestBackupEngine),
+                               unittest.makeSuite(TestZenRestore)))
 
 if __name__ == '__main__':
     unittest.main(defaultTest='test_suite')
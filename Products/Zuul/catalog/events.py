@@ -44,8 +44,12 @@ def onIndexingEvent(ob, event):
     # Ignore things dmd or above
     if len(path)<=3 or path[2]!='dmd':
         return
-    catalog.catalog_object(evob, idxs=idxs,
-                           update_metadata=event.update_metadata)
+    if idxs:
+        catalog.catalog_object(evob, idxs=idxs,
+                               update_metadata=event.update_metadata)
+    else:
+        # Reindexing everything: skip what didn't change
+        catalog.catalog_changes(evob, update_metadata=event.update_metadata)
 
 
 @adapter(IGloballyIndexed, IObjectWillBeMovedEvent)
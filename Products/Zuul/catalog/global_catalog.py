@@ -8,6 +8,9 @@
 ##############################################################################
 
 
+import time
+import inspect
+import logging
 from itertools import ifilterfalse, chain
 
 import zExceptions
@@ -20,6 +23,8 @@ from zope.component import adapts
 from Acquisition import aq_base
 from AccessControl import getSecurityManager
 from ZODB.POSException import ConflictError
+from persistent import Persistent
+from BTrees.IOBTree import IOBTree
 from Products.ZCatalog.ZCatalog import ZCatalog
 from Products.ZenModel.IpNetwork import IpNetwork
 from Products.ZenModel.IpInterface import IpInterface
@@ -36,15 +41,31 @@ from Products.ZenModel.Device import Device
 from Products.ZenModel.FileSystem import FileSystem
 from Products.ZenModel.Software import Software
 from Products.ZenModel.OperatingSystem import OperatingSystem
+from Products.ZenRelations.ToOneRelationship import ToOneRelationship
+from Products.ZenRelations.ToManyRelationshipBase import \
+    ToManyRelationshipBase
 from Products.Zuul.utils import getZProperties, allowedRolesAndUsers
 from interfaces import IGloballyIndexed, IPathReporter, IIndexableWrapper
 
+log = logging.getLogger("zen.GlobalCatalog")
+
 _MARKER = object()
 _CACHE = defaultdict(dict)
 _CACHE_RESULTS = []
 
+# Fingerprint of inputs that changed in the current transaction
+_CHANGED = object()
+# Key of the metadata in the fingerprints of an object
+_METADATA = '@metadata'
+
 globalCatalogId = 'global_catalog'
 
+# Metadata columns of the device attributes that grids sort and filter on,
+# see Products.Zuul.tree.registerInfoColumn
+DEVICE_GRID_COLUMNS = ('collector', 'priority', 'snmpSysName', 'serialNumber',
+                       'tagNumber', 'hwManufacturer', 'hwModel',
+                       'osManufacturer', 'osModel')
+
 
 def _allowedRoles(user):
     roles = list(user.getRoles())
@@ -88,10 +109,162 @@ def memoized_in_context(f, wrapper, *args, **kwargs):
     return f(wrapper, *args, **kwargs)
 
 
+def _resolveInput(context, name):
+    """
+    The values an input name resolves to from context.  Names are dotted
+    attribute paths from the context, '' being the context itself.  A '*'
+    step expands a to-many relationship or a sequence into its members,
+    to-one relationships resolve to the object they point to and methods
+    are called.
+    """
+    values = [context]
+    for step in filter(None, name.split('.')):
+        resolved = []
+        for value in values:
+            if value is None:
+                continue
+            if step == '*':
+                if isinstance(value, ToManyRelationshipBase):
+                    resolved.extend(value.objectValuesGen())
+                else:
+                    resolved.extend(value)
+                continue
+            value = getattr(value, step, None)
+            if isinstance(value, ToOneRelationship) or inspect.ismethod(value):
+                value = value()
+            resolved.append(value)
+        values = resolved
+    return values
+
+
+def _fingerprint(value):
+    """
+    A hashable stand-in for an input value.  Persistent objects are
+    represented by their oid and serial, which change whenever they are
+    written, or by _CHANGED if they were changed in this transaction.
+    """
+    if isinstance(value, ToManyRelationshipBase):
+        value = list(value.objectValuesGen())
+    if isinstance(value, Persistent):
+        value = aq_base(value)
+        if value._p_jar is None or value._p_oid is None:
+            return _CHANGED
+        value._p_activate()
+        if value._p_changed:
+            return _CHANGED
+        return value._p_oid, value._p_serial
+    if isinstance(value, dict):
+        value = sorted(value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        parts = tuple(_fingerprint(v) for v in value)
+        return _CHANGED if _CHANGED in parts else parts
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def inputFingerprints(context, indexInputs, names, columns):
+    """
+    Hash the inputs of the indexes in names and of the metadata columns of
+    context.  Indexes without declared inputs, and the metadata if any of
+    its columns has none, get None: they must always be recomputed.
+
+    @param indexInputs: dictionary of index or column name to the names of
+                        its inputs, as understood by L{_resolveInput}
+    @return: dictionary of index name, or _METADATA, to hash or None
+    """
+    cache = {}
+
+    def groupHash(inputs):
+        parts = []
+        for name in inputs:
+            part = cache.get(name, _MARKER)
+            if part is _MARKER:
+                try:
+                    part = _fingerprint(_resolveInput(context, name))
+                except ConflictError:
+                    raise
+                except Exception:
+                    part = _CHANGED
+                cache[name] = part
+            if part is _CHANGED:
+                return None
+            parts.append((name, part))
+        return hash(tuple(parts))
+
+    fingerprints = {}
+    for name in names:
+        inputs = indexInputs.get(name)
+        fingerprints[name] = groupHash(inputs) if inputs is not None else None
+    metadataInputs = set()
+    for column in columns:
+        inputs = indexInputs.get(column)
+        if inputs is None:
+            metadataInputs = None
+            break
+        metadataInputs.update(inputs)
+    fingerprints[_METADATA] = groupHash(sorted(metadataInputs)) \
+        if metadataInputs is not None else None
+    return fingerprints
+
+
+class IndexingStats(object):
+    """
+    Counts of the indexes and metadata recomputed and skipped by
+    incremental cataloging, logged every statsInterval seconds.
+    """
+
+    def __init__(self, statsInterval=300):
+        self.statsInterval = statsInterval
+        self.reset()
+
+    def reset(self):
+        self.objects = 0
+        self.fullObjects = 0
+        self.unchangedObjects = 0
+        self.indexesRecomputed = 0
+        self.indexesSkipped = 0
+        self.metadataWritten = 0
+        self.metadataSkipped = 0
+        self._lastStats = time.time()
+
+    def stats(self):
+        indexes = self.indexesRecomputed + self.indexesSkipped
+        return dict(objects=self.objects,
+                    fullObjects=self.fullObjects,
+                    unchangedObjects=self.unchangedObjects,
+                    indexesRecomputed=self.indexesRecomputed,
+                    indexesSkipped=self.indexesSkipped,
+                    metadataWritten=self.metadataWritten,
+                    metadataSkipped=self.metadataSkipped,
+                    skipRate=float(self.indexesSkipped) / indexes
+                             if indexes else 0.0)
+
+    def logStats(self):
+        now = time.time()
+        if now - self._lastStats >= self.statsInterval:
+            self._lastStats = now
+            log.info("Incremental indexing: %(objects)d objects"
+                     " (%(fullObjects)d fully cataloged, %(unchangedObjects)d"
+                     " unchanged), %(indexesRecomputed)d indexes recomputed,"
+                     " %(indexesSkipped)d skipped (skip rate %(skipRate).2f),"
+                     " metadata written %(metadataWritten)d and skipped"
+                     " %(metadataSkipped)d times", self.stats())
+
+
+indexingStats = IndexingStats()
+
+
 class IndexableWrapper(object):
     implements(IIndexableWrapper)
     adapts(IGloballyIndexed)
 
+    # Index and metadata column names to the inputs they are computed from,
+    # see inputFingerprints.  Indexes not listed are always recomputed.
+    indexInputs = {}
+
     def __init__(self, context):
         self._context = context
 
@@ -247,6 +420,51 @@ class IndexableWrapper(object):
         Mac Address. Devices and Interfaces
         """
 
+    def collector(self):
+        """
+        Collector. Only for Devices, a metadata column.
+        """
+
+    def priority(self):
+        """
+        Priority. Only for Devices, a metadata column.
+        """
+
+    def snmpSysName(self):
+        """
+        SNMP system name. Only for Devices, a metadata column.
+        """
+
+    def serialNumber(self):
+        """
+        Hardware serial number. Only for Devices, a metadata column.
+        """
+
+    def tagNumber(self):
+        """
+        Hardware tag number. Only for Devices, a metadata column.
+        """
+
+    def hwManufacturer(self):
+        """
+        Hardware manufacturer name. Only for Devices, a metadata column.
+        """
+
+    def hwModel(self):
+        """
+        Hardware model name. Only for Devices, a metadata column.
+        """
+
+    def osManufacturer(self):
+        """
+        OS manufacturer name. Only for Devices, a metadata column.
+        """
+
+    def osModel(self):
+        """
+        OS model name. Only for Devices, a metadata column.
+        """
+
 
 class SearchableMixin(object):
 
@@ -290,9 +508,80 @@ class ComponentWrapper(SearchableMixin,IndexableWrapper):
 class DeviceWrapper(SearchableMixin,IndexableWrapper):
     adapts(Device)
 
+    indexInputs = {
+        'id': ('id',),
+        'uid': ('id',),
+        'uuid': ('_guid',),
+        'name': ('id', 'title'),
+        'meta_type': (),
+        'objectImplements': (),
+        'ipAddress': ('manageIp',),
+        'productionState': ('productionState',),
+        'monitored': (),
+        'collectors': (),
+        'productKeys': (),
+        'macAddresses': ('macaddresses',),
+        'searchKeywords': (
+            'id', 'title', 'manageIp', 'productionState', 'priority',
+            'zProdStateThreshold', 'snmpSysName', 'snmpLocation',
+            'hw.serialNumber', 'hw.tag',
+            'hw.productClass', 'hw.productClass.manufacturer',
+            'os.productClass', 'os.productClass.manufacturer',
+            'getPerformanceServerName', 'getLocationName',
+            'getSystemNames', 'getDeviceGroupNames',
+            'os.interfaces.*.ipaddresses.*', 'os.interfaces.*._ipAddresses'),
+        # zProperties are attributes of the device itself
+        'zProperties': ('',),
+        'searchIcon': ('zIcon',),
+        'searchExcerpt': ('id', 'title', 'manageIp'),
+        'collector': ('getPerformanceServerName',),
+        'priority': ('priority',),
+        'snmpSysName': ('snmpSysName',),
+        'serialNumber': ('hw.serialNumber',),
+        'tagNumber': ('hw.tag',),
+        'hwManufacturer': ('hw.productClass.manufacturer',),
+        'hwModel': ('hw.productClass',),
+        'osManufacturer': ('os.productClass.manufacturer',),
+        'osModel': ('os.productClass',),
+    }
+
     def macAddresses(self):
         return self._context.getMacAddresses()
 
+    def collector(self):
+        return self._context.getPerformanceServerName()
+
+    def priority(self):
+        return self._context.priority
+
+    def snmpSysName(self):
+        return self._context.snmpSysName
+
+    def serialNumber(self):
+        return self._context.hw.serialNumber
+
+    def tagNumber(self):
+        return self._context.hw.tag
+
+    def _productClassName(self, hardwareOrOS, manufacturer=False):
+        productClass = hardwareOrOS.productClass()
+        if productClass is not None and manufacturer:
+            productClass = productClass.manufacturer()
+        if productClass is not None:
+            return productClass.titleOrId()
+
+    def hwManufacturer(self):
+        return self._productClassName(self._context.hw, manufacturer=True)
+
+    def hwModel(self):
+        return self._productClassName(self._context.hw)
+
+    def osManufacturer(self):
+        return self._productClassName(self._context.os, manufacturer=True)
+
+    def osModel(self):
+        return self._productClassName(self._context.os)
+
     def productionState(self):
         return str(self._context.productionState)
 
@@ -413,7 +702,102 @@ class GlobalCatalog(ZCatalog):
 
             ZCatalog.catalog_object(self, ob, uid, **kwargs)
 
+    def catalog_changes(self, obj, update_metadata=True):
+        """
+        Catalog obj, recomputing only the indexes and metadata whose inputs
+        changed since it was last cataloged this way.  Objects whose wrapper
+        declares no indexInputs, or that are not cataloged yet, are
+        cataloged in full.
+        """
+        if isinstance(obj, self._get_forbidden_classes()):
+            return
+        ob = IIndexableWrapper(obj)
+        uid = "/".join(obj.getPhysicalPath())
+        inputs = getattr(ob, 'indexInputs', None)
+        stats = indexingStats
+        stats.objects += 1
+        if not inputs:
+            stats.fullObjects += 1
+            ZCatalog.catalog_object(self, ob, uid,
+                                    update_metadata=update_metadata)
+            stats.logStats()
+            return
+        cat = self._catalog
+        names = cat.indexes.keys()
+        current = inputFingerprints(obj, inputs, names, cat.names)
+        rid = cat.uids.get(uid)
+        previous = self._getInputFingerprints(rid, uid)
+        if previous is None:
+            stats.fullObjects += 1
+            ZCatalog.catalog_object(self, ob, uid,
+                                    update_metadata=update_metadata)
+            if rid is not None and not update_metadata:
+                current[_METADATA] = None
+        else:
+            changed = [name for name in names
+                       if current[name] is None or
+                       current[name] != previous.get(name)]
+            metadata = update_metadata and (
+                current[_METADATA] is None or
+                current[_METADATA] != previous.get(_METADATA))
+            stats.indexesRecomputed += len(changed)
+            stats.indexesSkipped += len(names) - len(changed)
+            if metadata:
+                stats.metadataWritten += 1
+            elif update_metadata:
+                stats.metadataSkipped += 1
+            if not changed and not metadata:
+                stats.unchangedObjects += 1
+                stats.logStats()
+                return
+            if not changed:
+                # An empty idxs means all of them to ZCatalog, so rewrite
+                # the metadata along with an index without inputs
+                changed = [name for name in names
+                           if inputs.get(name) == ()][:1] or None
+            ZCatalog.catalog_object(self, ob, uid, idxs=changed,
+                                    update_metadata=metadata)
+            if not metadata:
+                # Keep the fingerprint the metadata was written with
+                current[_METADATA] = previous.get(_METADATA)
+        self._setInputFingerprints(cat.uids.get(uid), uid, current)
+        stats.logStats()
+
+    def _getInputFingerprints(self, rid, uid):
+        """
+        The fingerprints rid was last cataloged with, or None.
+        """
+        fingerprints = getattr(aq_base(self), '_inputFingerprints', None)
+        if rid is None or fingerprints is None:
+            return None
+        entry = fingerprints.get(rid)
+        if entry is None or entry[0] != uid:
+            return None
+        return dict(entry[1])
+
+    def _setInputFingerprints(self, rid, uid, current):
+        if rid is None:
+            return
+        fingerprints = getattr(aq_base(self), '_inputFingerprints', None)
+        if fingerprints is None:
+            fingerprints = self._inputFingerprints = IOBTree()
+        entry = (uid, tuple(sorted(current.items())))
+        if fingerprints.get(rid) != entry:
+            fingerprints[rid] = entry
+
+    def getIndexingStats(self):
+        """
+        Counts of the indexes and metadata incremental cataloging
+        recomputed and skipped in this process.
+        """
+        return indexingStats.stats()
+
     def uncatalog_object(self, path):
+        fingerprints = getattr(aq_base(self), '_inputFingerprints', None)
+        if fingerprints is not None:
+            rid = self._catalog.uids.get(path)
+            if rid is not None and rid in fingerprints:
+                del fingerprints[rid]
         try:
             # If path points to an object, we can ignore the uncataloguing if
             # it's a forbidden class (because it was never indexed in the first
@@ -489,6 +873,8 @@ def initializeGlobalCatalog(catalog):
     catalog.addColumn('zProperties')
     catalog.addColumn('searchIcon')
     catalog.addColumn('searchExcerpt')
+    for column in DEVICE_GRID_COLUMNS:
+        catalog.addColumn(column)
 
 
 class GlobalCatalogFactory(object):
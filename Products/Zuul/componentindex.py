@@ -0,0 +1,174 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """ComponentIndex
+
+Sort orders of the components of a device, built from the metadata of its
+componentSearch catalog so that the component grid can sort and page
+without waking up the components it doesn't show.  Indexes are kept per
+process and rebuilt once the components of their device are indexed or
+unindexed again.
+"""
+
+import re
+import time
+import logging
+from Acquisition import aq_base
+from BTrees.Length import Length
+
+log = logging.getLogger("zen.ComponentIndex")
+
+# Number of device indexes kept per process
+MAX_INDEXES = 200
+
+_indexes = {}
+
+# Positions of the sort keys in the rows of an index
+_POSITIONS = {'name': 0, 'meta_type': 1, 'monitored': 2}
+
+
+def _sortKey(value):
+    """
+    Pad numeric values with 0's so that sort is both alphabetically and
+    numerically correct: eth1/12 sorts on eth0000000001/0000000012.
+    """
+    if not isinstance(value, basestring):
+        return value
+    return re.sub("[\d]+", lambda x: str.zfill(x.group(0), 10), value)
+
+
+def componentsChanged(catalog):
+    """
+    Note that components were indexed in or unindexed from a
+    componentSearch catalog, so that its component indexes are rebuilt.
+    """
+    if catalog is None:
+        return
+    counter = getattr(aq_base(catalog), '_componentsVersion', None)
+    if counter is None:
+        counter = catalog._componentsVersion = Length()
+    counter.change(1)
+
+
+def _version(catalog):
+    """
+    The committed version of a catalog's components, or None if this
+    transaction changed them.
+    """
+    if catalog._p_jar is None:
+        return None
+    counter = getattr(aq_base(catalog), '_componentsVersion', None)
+    if counter is None:
+        return catalog._p_oid, None, 0
+    value = counter()
+    if counter._p_jar is None or counter._p_changed:
+        return None
+    return catalog._p_oid, counter._p_serial, value
+
+
+def getComponentIndex(catalog):
+    """
+    The ComponentIndex of a componentSearch catalog.
+    """
+    path = catalog.getPhysicalPath()
+    version = _version(catalog)
+    index = _indexes.get(path)
+    if index is None or version is None or index.version != version:
+        index = ComponentIndex(catalog, version)
+        if version is not None:
+            if len(_indexes) >= MAX_INDEXES:
+                _indexes.pop(next(iter(_indexes)), None)
+            _indexes[path] = index
+    return index
+
+
+class ComponentIndex(object):
+    """
+    Components of one componentSearch catalog, as rows of (name, meta_type,
+    monitored, uuid) keyed by catalog record id, with their sort orders.
+    """
+
+    sortKeys = ('name', 'meta_type', 'monitored', 'status')
+
+    def __init__(self, catalog, version, statusTtl=10):
+        """
+        @param statusTtl: seconds the order by status is kept, since it
+                          depends on events rather than the catalog
+        """
+        self.version = version
+        self.statusTtl = statusTtl
+        self._orders = {}
+        self._statusOrder = None
+        cat = catalog._catalog
+        positions = [cat.schema.get(column) for column in
+                     ('titleOrId', 'meta_type', 'getUUID')]
+        monitored = cat.indexes.get('monitored')
+        start = time.time()
+        self.rows = {}
+        for rid, record in cat.data.iteritems():
+            name, metaType, uuid = [record[p] if p is not None else None
+                                    for p in positions]
+            isMonitored = monitored.getEntryForObject(rid, None) \
+                if monitored is not None else None
+            self.rows[rid] = (name, metaType, isMonitored, uuid)
+        log.debug("Indexed %d components of %s in %.3fs", len(self.rows),
+                  '/'.join(catalog.getPhysicalPath()), time.time() - start)
+
+    def order(self, key, getStatuses=None):
+        """
+        Record ids of all components sorted on key.
+
+        @param getStatuses: for the status key, called with the rows and
+                            returning a dictionary of record id to status
+        """
+        if key == 'status':
+            return self._getStatusOrder(getStatuses)
+        order = self._orders.get(key)
+        if order is None:
+            position = _POSITIONS[key]
+            rows = self.rows
+            order = sorted(rows, key=lambda rid: _sortKey(rows[rid][position]))
+            self._orders[key] = order
+        return order
+
+    def _getStatusOrder(self, getStatuses):
+        now = time.time()
+        if self._statusOrder is not None and self._statusOrder[0] > now:
+            return self._statusOrder[1]
+        statuses = getStatuses(self.rows)
+        order = sorted(self.rows, key=lambda rid: _sortKey(statuses.get(rid)))
+        self._statusOrder = (now + self.statusTtl, order)
+        return order
+
+    def select(self, brains, key, reverse=False, start=0, limit=None,
+               getStatuses=None):
+        """
+        Sort catalog results on key and return a (total, page) tuple, page
+        being the brains from start up to limit.  Only the brains are
+        looked at, no component is woken up.
+        """
+        byRid = dict((brain.getRID(), brain) for brain in brains)
+        order = self.order(key, getStatuses)
+        if reverse:
+            order = reversed(order)
+        start = max(start, 0)
+        stop = None if limit is None else start + limit
+        page = []
+        position = 0
+        for rid in order:
+            brain = byRid.get(rid)
+            if brain is None:
+                continue
+            if position >= start:
+                page.append(brain)
+            position += 1
+            if stop is not None and position >= stop:
+                break
+        return len(byRid), page
@@ -26,6 +26,7 @@ from Products.Zuul.interfaces import IDeviceFacade, ICatalogTool, IInfo, ITempla
 from Products.Jobber.facade import FacadeMethodJob
 from Products.Jobber.jobs import SubprocessJob
 from Products.Zuul.tree import SearchResults
+from Products.Zuul.componentindex import ComponentIndex, getComponentIndex
 from Products.DataCollector.Plugins import CoreImporter, PackImporter, loadPlugins
 from Products.ZenModel.DeviceOrganizer import DeviceOrganizer
 from Products.ZenModel.ComponentGroup import ComponentGroup
@@ -34,6 +35,7 @@ from Products.ZenModel.System import System
 from Products.ZenModel.Location import Location
 from Products.ZenModel.DeviceClass import DeviceClass
 from Products.ZenModel.Device import Device
+from Products.ZenModel.DeviceComponent import DeviceComponent
 from Products.ZenMessaging.ChangeEvents.events import ObjectAddedToOrganizerEvent, \
     ObjectRemovedFromOrganizerEvent
 from Products.Zuul import getFacade
@@ -44,14 +46,48 @@ from Products.Zuul.catalog.events import IndexingEvent
 from Products.ZenUtils.IpUtil import isip, getHostByName
 from Products.ZenUtils.Utils import getObjectsFromCatalog
 from Products.ZenEvents.Event import Event
+from zenoss.protocols.protobufs.zep_pb2 import (
+    SEVERITY_CRITICAL, SEVERITY_ERROR, SEVERITY_WARNING, STATUS_NEW,
+    STATUS_ACKNOWLEDGED
+)
 from Products.ZenUtils.Utils import binPath, zenPath
 from Acquisition import aq_base
 from Products.Zuul.infos.metricserver import MultiContextMetricServiceGraphDefinition
+from Products.Zuul.infos import InfoBase
+from Products.Zuul.infos.component import ComponentInfo
 
 
 iszprop = re.compile("z[A-Z]").match
 log = logging.getLogger('zen.DeviceFacade')
 
+# The info properties whose values a ComponentIndex sorts on
+_INDEXED_PROPERTIES = {
+    'name': InfoBase.name,
+    'meta_type': InfoBase.meta_type,
+    'monitored': ComponentInfo.monitored,
+    'status': ComponentInfo.status,
+}
+
+# Component methods behind the indexed properties, which the index reads
+# the way DeviceComponent implements them
+_INDEXED_MODEL_METHODS = {
+    'monitored': ('monitored',),
+    'status': ('getStatus', 'monitored', 'isMonitored'),
+}
+
+# Whether the infos of a meta_type use the property for a sort key
+_indexedInfoAttributes = {}
+
+
+def _inheritsFromDeviceComponent(klass, name):
+    """
+    Whether klass has the method of DeviceComponent called name, or neither
+    of them has one.
+    """
+    ours = getattr(DeviceComponent, name, None)
+    theirs = getattr(klass, name, None)
+    return getattr(theirs, 'im_func', theirs) is getattr(ours, 'im_func', ours)
+
 
 class DeviceCollectorChangeEvent(object):
     implements(IDeviceCollectorChangeEvent)
@@ -172,6 +208,22 @@ class DeviceFacade(TreeFacade):
             obj.device()._createComponentSearchPathIndex()
         brains = cat.evalAdvancedQuery(query)
 
+        index = None
+        if name is None and sort in ComponentIndex.sortKeys:
+            index = getComponentIndex(cat)
+            if not self._indexSortsLikeInfos(cat, index, sort):
+                index = None
+        if index is not None:
+            # sort and page on catalog metadata, only the components of the
+            # page are woken up
+            device = obj.device()
+            total, page = index.select(
+                brains, sort, reverse, start, limit,
+                lambda rows: self._getComponentStatuses(device, rows))
+            pagedResult = map(IInfo, map(unbrain, page))
+            self.bulkLoadMetricData(pagedResult)
+            return SearchResults(iter(pagedResult), total, str(total), False)
+
         # unbrain the results
         comps=map(IInfo, map(unbrain, brains))
 
@@ -212,6 +264,70 @@ class DeviceFacade(TreeFacade):
 
         return SearchResults(iter(pagedResult), total, hash_, False)
 
+    def _indexSortsLikeInfos(self, cat, index, sort):
+        """
+        Returns whether the info of every kind of component in the index
+        reads sort the way the index does, that is neither its info class
+        nor its component class override the attribute or the methods it is
+        computed from, like IpInterface.getStatus does.  One component of
+        each meta_type is woken up the first time it is seen.
+        """
+        samples = {}
+        for rid, row in index.rows.iteritems():
+            if (row[1], sort) not in _indexedInfoAttributes:
+                samples.setdefault(row[1], rid)
+        for metaType, rid in samples.iteritems():
+            obj = cat._catalog[rid].getObject()
+            info = IInfo(obj)
+            klass = type(aq_base(obj))
+            _indexedInfoAttributes[(metaType, sort)] = \
+                getattr(type(info), sort, None) is _INDEXED_PROPERTIES[sort] \
+                and all(_inheritsFromDeviceComponent(klass, name)
+                        for name in _INDEXED_MODEL_METHODS.get(sort, ()))
+        return all(_indexedInfoAttributes[(row[1], sort)]
+                   for row in index.rows.itervalues())
+
+    def _getComponentStatuses(self, device, rows):
+        """
+        Returns the status ComponentInfo.status would show for each row of
+        a ComponentIndex, counting the status events of all the components
+        of the device with a single ZEP query.
+
+        @type  rows: dictionary
+        @param rows: Record ids to (name, meta_type, monitored, uuid) rows
+        @rtype:   dictionary
+        @return:  Record ids to status strings
+        """
+        counts = {}
+        deviceMonitored = device.monitorDevice()
+        metaTypes = set(row[1] for row in rows.itervalues() if row[2])
+        if deviceMonitored and metaTypes:
+            zep = getFacade('zep', self._dmd)
+            eventFilter = zep.createEventFilter(
+                tags=[device.getUUID()],
+                severity=[SEVERITY_WARNING, SEVERITY_ERROR, SEVERITY_CRITICAL],
+                status=[STATUS_NEW, STATUS_ACKNOWLEDGED],
+                event_class=['/Status/%s' % t for t in metaTypes])
+            summaries = zep.getEventSummariesStream(
+                eventFilter, fields=['occurrence.actor.element_sub_uuid',
+                                     'occurrence.event_class'])
+            for summary in summaries:
+                occurrence = summary['occurrence'][0]
+                key = (occurrence.get('actor', {}).get('element_sub_uuid'),
+                       occurrence.get('event_class'))
+                counts[key] = counts.get(key, 0) + 1
+        statuses = {}
+        for rid, (name, metaType, monitored, uuid) in rows.iteritems():
+            if deviceMonitored and monitored:
+                statusCode = counts.get((uuid, '/Status/%s' % metaType), 0)
+            else:
+                statusCode = -1
+            value = self._dmd.convertStatus(statusCode)
+            if not isinstance(value, str):
+                value = "Down" if value > 0 else "Up"
+            statuses[rid] = value
+        return statuses
+
     def getComponents(self, uid=None, types=(), meta_type=(), start=0,
                       limit=None, sort='name', dir='ASC', name=None, keys=()):
         return self._componentSearch(uid, types, meta_type, start, limit,
@@ -482,10 +598,10 @@ class DeviceFacade(TreeFacade):
     def _setProductionState(self, uids, state):
         if isinstance(uids, basestring):
             uids = (uids,)
-        for uid in uids:
-            dev = self._getObject(uid)
-            if isinstance(dev, Device):
-                dev.setProdState(int(state))
+        devices = [dev for dev in imap(self._getObject, uids)
+                   if isinstance(dev, Device)]
+        # The router has already audited the change of each device
+        self._dmd.Devices.setProdStateBulk(int(state), devices)
 
     @info
     def moveDevices(self, uids, target, asynchronous=True):
@@ -8,7 +8,6 @@
 ##############################################################################
 
 
-from itertools import islice
 import logging
 from AccessControl import getSecurityManager
 from Products.Zuul.facades import ZuulFacade
@@ -24,19 +23,9 @@ class JobsFacade(ZuulFacade):
     def getJobs(self, start=0, limit=50, sort='scheduled', dir='ASC',
                 createdBy=None):
         start = max(start, 0)
-        if limit is None:
-            stop = None
-        else:
-            stop = start + limit
-        kwargs = dict(sort_on=sort, sort_order='descending' if dir=='DESC' else 'ascending')
-        if createdBy:
-            kwargs['user'] = createdBy
-        brains = self._dmd.JobManager.getCatalog()(
-            **kwargs
-        )
-        total = len(brains)
-        results = islice(brains, start, stop)
-        return [b.getObject() for b in results], total
+        return self._dmd.JobManager.searchJobs(
+            user=createdBy or None, sort_on=sort, reverse=dir == 'DESC',
+            start=start, limit=limit)
 
     @info
     def getInfo(self, jobid):
@@ -64,5 +53,4 @@ class JobsFacade(ZuulFacade):
         user = getSecurityManager().getUser()
         if not isinstance(user, basestring):
             user = user.getId()
-        results = self._dmd.JobManager.getCatalog()(user=user)
-        return [b.getObject() for b in results]
+        return self._dmd.JobManager.searchJobs(user=user)[0]
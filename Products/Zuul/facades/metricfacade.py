@@ -35,6 +35,9 @@ DATE_FORMAT = "%Y/%m/%d-%H:%M:%S"
 METRIC_URL_PATH = "/api/performance/query"
 WILDCARD_URL_PATH = "/api/performance/query2"
 
+# maximum number of (context, datapoint) pairs sent in one bulk query
+BULK_QUERY_SIZE = 500
+
 AGGREGATION_MAPPING = {
     'average': 'avg',
     'minimum': 'min',
@@ -272,6 +275,52 @@ class MetricFacade(ZuulFacade):
             return results.values()[0]
         return {}
 
+    def getBulkValues(self, queries, start=None, end=None, format="%.2lf",
+                      cf="avg", batchSize=BULK_QUERY_SIZE):
+        """
+        Use this method when you need the last value of many different
+        datapoints on many different contexts, each with its own (optional)
+        RPN expression.  This is what reports need: one query per batch of
+        cells instead of one query per cell.
+
+        @param queries: sequence of (context, datapoint, extraRpn) tuples.
+                        The datapoint is the datapoint object itself and
+                        extraRpn may be None.
+        @param start: start of the date range, see getValues
+        @param end: end of the date range, see getValues
+        @param format: the format we are returning the data in
+        @param cf: Consolidation function (avg, min, max or sum)
+        @param batchSize: maximum number of queries sent in one request
+        @return: list of values in the same order as queries, None for every
+                 query the metric service had no value for or whose batch
+                 failed
+        """
+        values = [None] * len(queries)
+        if not queries:
+            return values
+        start, end = self._defaultStartAndEndTime(start, end, "LAST")
+        for offset in xrange(0, len(queries), batchSize):
+            last = min(offset + batchSize, len(queries))
+            try:
+                datapoints = []
+                for index in xrange(offset, last):
+                    context, dp, extraRpn = queries[index]
+                    datapoints.extend(self._buildBulkMetric(
+                        index, context, dp, cf, extraRpn, format))
+                request = self._buildRequest(None, datapoints, start, end, "LAST", None)
+                content = self._metrics_connection.request(METRIC_URL_PATH, request)
+                if not content or content.get('results') is None:
+                    continue
+                for item in content['results']:
+                    if not item.get('datapoints'):
+                        continue
+                    index = int(item['metric'].rsplit('|', 1)[1])
+                    values[index] = float(format % item['datapoints'][0]['value'])
+            except Exception:
+                log.exception("Unable to collect metric values for queries %d to %d",
+                              offset, last - 1)
+        return values
+
     def _defaultStartAndEndTime(self, start, end, returnSet):
         # check to see if the user entered a unix timestamp
         if isinstance(start, (int, long, float)):
@@ -419,6 +468,23 @@ class MetricFacade(ZuulFacade):
             metric['format'] = format
         return combined_metric
 
+    def _buildBulkMetric(self, index, context, dp, cf, extraRpn="", format=""):
+        """
+        Build the metric request for one bulk query.  The names are suffixed
+        with the query index so that the same datapoint can be requested for
+        many contexts (and with different RPN expressions) in one request.
+        """
+        combined_metric = self._buildMetric(context, dp, cf, extraRpn or "", format)
+        name = "%s|%d" % (combined_metric[-1]['name'], index)
+        if extraRpn:
+            raw, expression = combined_metric
+            raw['name'] = "%s-raw%d" % (dp.name(), index)
+            expression['expression'] = "rpn:%s,%s" % (raw['name'], extraRpn)
+            expression['name'] = name
+        else:
+            combined_metric[0]['name'] = name
+        return combined_metric
+
     def _formatTime(self, t):
         """
         Formats a datetime object
@@ -10,6 +10,9 @@
 
 import logging
 import re
+import threading
+import Queue
+from contextlib import contextmanager
 from AccessControl import getSecurityManager
 from zope.interface import implements
 from Products.ZenModel.Device import Device
@@ -30,6 +33,7 @@ from zenoss.protocols.protobufutil import listify
 from Products.ZenUtils import safeTuple
 from Products.ZenUtils.GlobalConfig import getGlobalConfiguration
 from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
+from Products.Zuul.severitycache import SeverityCache
 from zenoss.protocols.protobufs.zep_pb2 import SEVERITY_CRITICAL, SEVERITY_ERROR, SEVERITY_WARNING, SEVERITY_INFO, \
      SEVERITY_DEBUG, SEVERITY_CLEAR, STATUS_NEW, STATUS_ACKNOWLEDGED, STATUS_SUPPRESSED, OR, AND
 from Products.ZenUtils.guid.interfaces import IGUIDManager
@@ -44,6 +48,98 @@ from time import time
 
 log = logging.getLogger(__name__)
 
+_PAGES_DONE = object()
+
+# Worst severity lookups are shared by all users of this process
+_severityCache = SeverityCache(
+    ttl=getGlobalConfiguration().get('zep-severity-cache-ttl', 10))
+
+
+class _ZepClientPool(object):
+    """
+    ZEP clients kept for reuse, so that their HTTP connections can be used
+    from more than one thread without being shared by two at once.
+    """
+
+    def __init__(self, zep_url, schema, size=4):
+        self.zep_url = zep_url
+        self.schema = schema
+        self.size = size
+        self._clients = Queue.LifoQueue()
+
+    @contextmanager
+    def client(self):
+        try:
+            client = self._clients.get_nowait()
+        except Queue.Empty:
+            client = ZepServiceClient(self.zep_url, self.schema)
+        yield client
+        if self._clients.qsize() < self.size:
+            self._clients.put(client)
+
+
+_clientPools = {}
+_clientPoolsLock = threading.Lock()
+
+
+def _getClientPool(zep_url, schema):
+    with _clientPoolsLock:
+        pool = _clientPools.get(zep_url)
+        if pool is None:
+            pool = _clientPools[zep_url] = _ZepClientPool(zep_url, schema)
+        return pool
+
+
+def _fieldTree(fields):
+    """
+    Turn dotted field names into a tree of dictionaries.  What follows
+    'details.' is the name of an event detail, which may contain dots.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        parts = field.split('.')
+        while parts:
+            part = parts.pop(0)
+            if part == 'details' and parts:
+                node.setdefault(part, {})['.'.join(parts)] = {}
+                break
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _project(message, tree):
+    """
+    Convert the fields of message named in tree to a dictionary shaped
+    like the one to_dict returns, leaving all other fields undecoded.
+    """
+    result = {}
+    fields = message.DESCRIPTOR.fields_by_name
+    for name, subtree in tree.iteritems():
+        field = fields.get(name)
+        if field is None:
+            continue
+        value = getattr(message, name)
+        isMessage = field.cpp_type == field.CPPTYPE_MESSAGE
+        if field.label == field.LABEL_REPEATED:
+            if not value:
+                continue
+            if name == 'details' and subtree:
+                result[name] = [to_dict(d) for d in value
+                                if d.name in subtree]
+            elif isMessage:
+                result[name] = [_project(v, subtree) if subtree else
+                                to_dict(v) for v in value]
+            else:
+                result[name] = list(value)
+        elif not isMessage:
+            if message.HasField(name):
+                result[name] = value
+        elif message.HasField(name):
+            result[name] = _project(value, subtree) if subtree else \
+                to_dict(value)
+    return result
+
 
 class InvalidQueryParameterException(Exception):
     """
@@ -116,6 +212,7 @@ class ZepFacade(ZuulFacade):
         zep_url = config.get('zep-uri', 'http://localhost:8084')
         schema = getUtility(IQueueSchema)
         self.client = ZepServiceClient(zep_url, schema)
+        self._clientPool = _getClientPool(zep_url, schema)
         self.configClient = ZepConfigClient(zep_url, schema)
         self.heartbeatClient = ZepHeartbeatClient(zep_url, schema)
         self._guidManager = IGUIDManager(context.dmd)
@@ -397,37 +494,98 @@ class ZepFacade(ZuulFacade):
         return result
 
     def getEventSummariesGenerator(self, filter=None, exclude=None, sort=None, archive=False, timeout=None):
+        for event in self.getEventSummariesStream(filter, exclude, sort,
+                                                  archive, timeout):
+            yield to_dict(event)
+
+    def getEventSummariesStream(self, filter=None, exclude=None, sort=None,
+                                archive=False, timeout=None, fields=None,
+                                limit=1000, prefetch=1):
+        """
+        Iterate over the event summaries matching the filters.
+
+        Pages are fetched by a background thread using a pooled ZEP client,
+        so that up to prefetch pages are requested while the current one is
+        consumed.
+
+        @param fields: dotted names of the fields to return, like
+            'occurrence.actor.element_identifier' or
+            'occurrence.details.zenoss.device.production_state'.  Without
+            fields, EventSummary protobufs are returned as is; with fields,
+            dictionaries shaped like to_dict's holding only those fields.
+        """
         if isinstance(exclude, dict):
             exclude = from_dict(EventFilter, exclude)
         if isinstance(filter, dict):
             filter = from_dict(EventFilter, filter)
         if sort is not None:
             sort = tuple(self._getEventSort(s) for s in safeTuple(sort))
+        tree = _fieldTree(fields) if fields else None
         searchid = self.client.createSavedSearch(event_filter=filter, exclusion_filter=exclude, sort=sort,
                                                  archive=archive, timeout=timeout)
         log.debug("created saved search %s", searchid)
-        eventSearchFn = partial(self.client.savedSearch, searchid, archive=archive)
-        offset = 0
-        limit = 1000
+        pages = Queue.Queue(max(1, prefetch))
+        stop = threading.Event()
+        fetcher = threading.Thread(
+            target=self._fetchSavedSearchPages,
+            args=(searchid, archive, limit, pages, stop))
+        fetcher.setDaemon(True)
+        fetcher.start()
         try:
-            while offset is not None:
-                result = self._getEventSummaries(eventSearchFn, offset, limit)
-                for evt in result['events']:
-                    yield evt
-                offset = result['next_offset']
+            while True:
+                page = pages.get()
+                if page is _PAGES_DONE:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                for event in page:
+                    yield event if tree is None else _project(event, tree)
         finally:
+            stop.set()
+            fetcher.join()
             try:
                 log.debug("closing saved search %s", searchid)
                 self.client.deleteSavedSearch(searchid, archive=archive)
             except Exception as e:
                 log.debug("error closing saved search %s (%s) - %s", searchid, type(e), e)
 
+    def _fetchSavedSearchPages(self, searchid, archive, limit, pages, stop):
+        """
+        Put the pages of a saved search on the pages queue, followed by
+        _PAGES_DONE.  Runs in its own thread until the search is exhausted
+        or stop is set.
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        offset = 0
+        try:
+            with self._clientPool.client() as client:
+                while offset is not None and not stop.is_set():
+                    response, content = client.savedSearch(
+                        searchid, offset=offset, limit=limit, archive=archive)
+                    offset = content.next_offset \
+                        if content.HasField('next_offset') else None
+                    if not put(content.events):
+                        return
+        except Exception as e:
+            put(e)
+            return
+        put(_PAGES_DONE)
+
     def getEventSummary(self, uuid):
         response, content = self.client.getEventSummary(uuid)
         return to_dict(content)
 
     def nextEventSummaryUpdate(self, next_request):
         status, response = self.client.nextEventSummaryUpdate(from_dict(EventSummaryUpdateRequest, next_request))
+        _severityCache.invalidate()
         return status, to_dict(response)
 
     def _processArgs(self, eventFilter, exclusionFilter, userName):
@@ -455,6 +613,7 @@ class ZepFacade(ZuulFacade):
         userUuid = arguments.get('userUuid')
         status, response = self.client.closeEventSummaries(
             userUuid, userName, eventFilter, exclusionFilter, limit, timeout=timeout)
+        _severityCache.invalidate()
         return status, to_dict(response)
 
     def acknowledgeEventSummaries(self, eventFilter=None, exclusionFilter=None, limit=None, userName=None,
@@ -466,6 +625,7 @@ class ZepFacade(ZuulFacade):
         userUuid = arguments.get('userUuid')
         status, response = self.client.acknowledgeEventSummaries(userUuid, userName, eventFilter, exclusionFilter,
                                                                  limit, timeout=timeout)
+        _severityCache.invalidate()
         return status, to_dict(response)
 
     def reopenEventSummaries(self, eventFilter=None, exclusionFilter=None, limit=None, userName=None, timeout=None):
@@ -476,6 +636,7 @@ class ZepFacade(ZuulFacade):
         userUuid = arguments.get('userUuid')
         status, response = self.client.reopenEventSummaries(
             userUuid, userName, eventFilter, exclusionFilter, limit, timeout=timeout)
+        _severityCache.invalidate()
         return status, to_dict(response)
 
     def updateEventSummaries(self, update, eventFilter=None, exclusionFilter=None, limit=None, timeout=None):
@@ -484,6 +645,7 @@ class ZepFacade(ZuulFacade):
         exclusion_filter_pb = None if (exclusionFilter is None) else from_dict(EventFilter, exclusionFilter)
         status, response = self.client.updateEventSummaries(update_pb, event_filter_pb, exclusion_filter_pb,
                                                             limit=limit, timeout=timeout)
+        _severityCache.invalidate()
         return status, to_dict(response)
 
     def getConfig(self):
@@ -633,13 +795,23 @@ class ZepFacade(ZuulFacade):
 
         # Prepopulate the list with defaults
         severities = dict.fromkeys(tagUuids, default)
-        eventTagSeverities = self._getEventTagSeverities(tags=tagUuids)
-        for tag in eventTagSeverities:
-            for sev in tag.severities:
-                if sev.severity not in ignore:
-                    severities[tag.tag_uuid] = max(sev.severity, severities.get(tag.tag_uuid, 0))
+        present = _severityCache.get(tagUuids, self._getPresentSeverities)
+        for uuid, sevs in present.iteritems():
+            for sev in sevs:
+                if sev not in ignore:
+                    severities[uuid] = max(sev, severities[uuid])
         return severities
 
+    def _getPresentSeverities(self, tagUuids):
+        """
+        Return a dictionary of UUID -> severities of the open events.
+        """
+        return dict((tag.tag_uuid, [sev.severity for sev in tag.severities])
+                    for tag in self._getEventTagSeverities(tags=tagUuids))
+
+    def getSeverityCacheStats(self):
+        return _severityCache.stats()
+
     def getSeverityName(self, severity):
         return EventSeverity.getPrettyName(severity)
 
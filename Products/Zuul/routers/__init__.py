@@ -22,6 +22,7 @@ from Products.ZenMessaging.audit import audit
 from Products.ZenUtils.Utils import getDisplayType
 from Products import Zuul
 import logging
+import time
 import zlib
 import base64
 log = logging.getLogger(__name__)
@@ -182,6 +183,7 @@ class TreeRouter(DirectRouter):
         @rtype:   [dictionary]
         @return:  Object representing the immediate children
         """
+        start = time.time()
         showEventSeverityIcons = self.context.dmd.UserInterfaceSettings.getInterfaceSettings().get('showEventSeverityIcons')
         facade = self._getFacade()
         currentNode = facade.getTree(id)
@@ -199,6 +201,7 @@ class TreeRouter(DirectRouter):
                 for child in childNodes:
                     if child.uuid:
                         child.setSeverity(zep.getSeverityName(severities.get(child.uuid, 0)).lower())
+        severityTime = time.time() - start
 
         children = []
         # explicitly marshall the children
@@ -224,7 +227,10 @@ class TreeRouter(DirectRouter):
         if id == primaryId:
             root = Marshaller(currentNode).marshal(keys)
             root['children'] = children
-            return [root]
+            children = [root]
+        log.debug("Rendered %d tree nodes under %s in %.3fs (%.3fs loading"
+                  " severities)", len(childNodes), id, time.time() - start,
+                  severityTime)
         return children
 
     def objectExists(self, uid):
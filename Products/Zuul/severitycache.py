@@ -0,0 +1,174 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """SeverityCache
+
+A short lived, process wide cache of the event severities present for
+element uuids.  Lookups for uuids another thread is already fetching wait
+for that fetch instead of sending the same query to ZEP again.
+"""
+
+import logging
+import threading
+import time
+
+log = logging.getLogger("zen.SeverityCache")
+
+_NONE = frozenset()
+
+
+class _Fetch(object):
+    """
+    An in-flight fetch that other threads can wait for.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+
+
+class SeverityCache(object):
+    """
+    Maps uuids to the frozenset of event severities present for them.
+    """
+
+    def __init__(self, ttl=10, maxSize=100000, statsInterval=300):
+        """
+        @param ttl: seconds severities are cached for
+        @param maxSize: number of uuids above which expired entries are
+                        purged
+        @param statsInterval: seconds between logging cache statistics
+        """
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.statsInterval = statsInterval
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.queries = 0
+        self.queryTime = 0.0
+        self._lastStats = time.time()
+
+    def get(self, uuids, fetch):
+        """
+        Return a dictionary of uuid to the severities present for it.
+
+        @param fetch: called with a list of uuids that are neither cached
+                      nor being fetched, must return a dictionary of uuid
+                      to an iterable of severities
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        waiting = []
+        with self._lock:
+            for uuid in uuids:
+                entry = self._entries.get(uuid)
+                if entry is not None and entry[0] > now:
+                    result[uuid] = entry[1]
+                    continue
+                pending = self._inflight.get(uuid)
+                if pending is not None:
+                    waiting.append((uuid, pending))
+                else:
+                    missing.append(uuid)
+            self.hits += len(result)
+            self.coalesced += len(waiting)
+            self.misses += len(missing)
+            if missing:
+                mine = _Fetch()
+                for uuid in missing:
+                    self._inflight[uuid] = mine
+                generation = self._generation
+        if missing:
+            result.update(self._fetch(missing, fetch, mine, generation))
+        retry = []
+        for uuid, pending in waiting:
+            pending.done.wait()
+            if pending.results is None:
+                # The other fetch failed
+                retry.append(uuid)
+            else:
+                result[uuid] = pending.results.get(uuid, _NONE)
+        if retry:
+            result.update(self.get(retry, fetch))
+        self._logStats()
+        return result
+
+    def _fetch(self, uuids, fetch, mine, generation):
+        start = time.time()
+        try:
+            fetched = fetch(uuids)
+        except Exception:
+            with self._lock:
+                self._release(uuids, mine)
+            mine.done.set()
+            raise
+        results = dict((uuid, frozenset(fetched.get(uuid, ())))
+                       for uuid in uuids)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self.queries += 1
+            self.queryTime += expires - self.ttl - start
+            self._release(uuids, mine)
+            if generation == self._generation:
+                if len(self._entries) + len(results) > self.maxSize:
+                    self._purge()
+                for uuid, severities in results.iteritems():
+                    self._entries[uuid] = (expires, severities)
+        mine.results = results
+        mine.done.set()
+        return results
+
+    def _release(self, uuids, mine):
+        for uuid in uuids:
+            if self._inflight.get(uuid) is mine:
+                del self._inflight[uuid]
+
+    def _purge(self):
+        now = time.time()
+        self._entries = dict((uuid, entry)
+                             for uuid, entry in self._entries.iteritems()
+                             if entry[0] > now)
+        if len(self._entries) > self.maxSize:
+            self._entries = {}
+
+    def invalidate(self):
+        """
+        Forget all cached severities, including those being fetched.
+        """
+        with self._lock:
+            self._entries = {}
+            self._generation += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return dict(size=len(self._entries),
+                    hits=self.hits,
+                    misses=self.misses,
+                    coalesced=self.coalesced,
+                    queries=self.queries,
+                    hitRate=float(self.hits + self.coalesced) / lookups
+                            if lookups else 0.0,
+                    avgQueryTime=self.queryTime / self.queries
+                                 if self.queries else 0.0)
+
+    def _logStats(self):
+        now = time.time()
+        if now - self._lastStats >= self.statsInterval:
+            self._lastStats = now
+            log.info("Severity cache: %(size)d uuids, hit rate %(hitRate).2f"
+                     " (%(hits)d hits, %(coalesced)d coalesced, %(misses)d"
+                     " misses), %(queries)d ZEP queries averaging"
+                     " %(avgQueryTime).3fs", self.stats())
@@ -0,0 +1,164 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import time
+import logging
+import unittest
+from zope.interface import implements
+from Products.ZCatalog.interfaces import ICatalogBrain
+from Products.Zuul.interfaces import IInfo
+from Products.Zuul.tree import CatalogTool, registerInfoColumn, _infoColumns
+from Products.Zuul.catalog.global_catalog import DEVICE_GRID_COLUMNS
+
+log = logging.getLogger('zen.testCatalogTool')
+
+
+class Component(object):
+    """
+    Info and object in one, so that IInfo(component) is the component.
+    """
+    implements(IInfo)
+
+    def __init__(self, i):
+        self.id = 'comp%d' % i
+        self.speed = i * 7 % 1000
+        self.vendor = 'vendor%d' % (i % 10)
+
+    def getPrimaryPath(self):
+        return ('', 'zport', 'dmd', self.id)
+
+
+class Brain(object):
+    implements(ICatalogBrain)
+
+    def __init__(self, component, catalog):
+        self._component = component
+        self._catalog = catalog
+        self.id = component.id
+        self.speed = str(component.speed)
+
+    def getObject(self):
+        self._catalog.loaded += 1
+        return self._component
+
+
+class StandInCatalog(object):
+    """
+    Returns all of its brains for any query.
+    """
+
+    def __init__(self, count):
+        self._catalog = self
+        self.indexes = {'id': None}
+        self.schema = {'id': 0, 'speed': 1}
+        self.loaded = 0
+        self.brains = [Brain(Component(i), self) for i in range(count)]
+
+    def evalAdvancedQuery(self, query, sort=None):
+        return list(self.brains)
+
+    def hasIndexForTypes(self, types, index):
+        return index in self.indexes
+
+
+class StandInCatalogTool(CatalogTool):
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def _buildQuery(self, types, paths, depth, query, filterPermissions):
+        return query
+
+
+class TestCatalogTool(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = StandInCatalog(1000)
+        self.tool = StandInCatalogTool(self.catalog)
+        registerInfoColumn('speed', convert=int)
+
+    def tearDown(self):
+        # tests without the column remove it
+        _infoColumns.pop('speed', None)
+
+    def speeds(self, results):
+        return [getattr(r, '_component', r).speed for r in results]
+
+    def test_sort_on_column_loads_no_objects(self):
+        results = self.tool.search(start=10, limit=5, orderby='speed')
+        self.assertTrue(results.areBrains)
+        self.assertEquals(results.total, 1000)
+        expected = sorted(c.speed for c in
+                          (b._component for b in self.catalog.brains))
+        self.assertEquals(self.speeds(results), expected[10:15])
+        self.assertEquals(self.catalog.loaded, 0)
+
+        results = self.tool.search(limit=3, orderby='speed', reverse=True)
+        self.assertEquals(self.speeds(results), expected[::-1][:3])
+
+    def test_sort_without_column_matches_column_sort(self):
+        withColumn = self.speeds(self.tool.search(limit=20, orderby='speed'))
+        del _infoColumns['speed']
+        results = self.tool.search(limit=20, orderby='speed')
+        self.assertFalse(results.areBrains)
+        self.assertEquals(self.speeds(results), withColumn)
+        self.assertEquals(self.catalog.loaded, 1000)
+
+    def test_filter_on_column(self):
+        results = self.tool.search(globFilters={'speed': '99'})
+        self.assertEquals(sorted(self.speeds(results)),
+                          sorted(s for s in self.speeds(self.catalog.brains)
+                                 if '99' in str(s)))
+        self.assertEquals(self.catalog.loaded, 0)
+
+        # filters without a column still work, and keep the catalog order
+        results = self.tool.search(globFilters={'speed': '99',
+                                                'vendor': 'vendor3'})
+        self.assertTrue(results.areBrains)
+        results = list(results)
+        self.assertEquals([b.id for b in results],
+                          [b.id for b in self.catalog.brains
+                           if '99' in b.speed and
+                           b._component.vendor == 'vendor3'])
+        # only the 19 brains matching the column filter were woken up
+        self.assertEquals(self.catalog.loaded, 19)
+
+    def test_device_grid_columns(self):
+        for column in DEVICE_GRID_COLUMNS:
+            self.assertEquals(_infoColumns[column][0], column)
+
+    def ftest_page_latency(self):
+        """
+        Compares getting one 50 row page sorted on an info attribute with
+        and without a metadata column for it.
+        """
+        catalog = StandInCatalog(100000)
+        tool = StandInCatalogTool(catalog)
+        timings = {}
+        for label, loaded in (('column', 0), ('objects', 100000)):
+            if label == 'objects':
+                del _infoColumns['speed']
+            catalog.loaded = 0
+            start = time.time()
+            page = list(tool.search(start=500, limit=50, orderby='speed'))
+            timings[label] = time.time() - start
+            log.info("%s: %.3fs for a page of %d, %d objects loaded",
+                     label, timings[label], len(page), catalog.loaded)
+            self.assertEquals(len(page), 50)
+            self.assertEquals(catalog.loaded, loaded)
+        self.assertTrue(timings['column'] < timings['objects'])
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(TestCatalogTool),))
+
+
+if __name__=="__main__":
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,114 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import unittest
+from Products.Zuul.componentindex import (
+    ComponentIndex, componentsChanged, getComponentIndex, _indexes
+)
+
+
+class MonitoredIndex(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def getEntryForObject(self, rid, default=None):
+        return self.values.get(rid, default)
+
+
+class Brain(object):
+
+    def __init__(self, rid):
+        self.rid = rid
+
+    def getRID(self):
+        return self.rid
+
+
+class StandInCatalog(object):
+    """
+    The parts of a componentSearch ZCatalog a ComponentIndex reads.
+    """
+
+    _p_jar = object()
+    _p_oid = '\0' * 8
+
+    def __init__(self, names):
+        self._catalog = self
+        self.schema = {'id': 0, 'titleOrId': 1, 'meta_type': 2,
+                       'getUUID': 3}
+        self.data = {}
+        monitored = {}
+        for rid, name in enumerate(names):
+            self.data[rid] = (name, name, 'IpInterface', 'uuid%d' % rid)
+            monitored[rid] = bool(rid % 2)
+        self.indexes = {'monitored': MonitoredIndex(monitored)}
+
+    def getPhysicalPath(self):
+        return ('', 'zport', 'dmd', 'Devices', 'devices', 'dev',
+                'componentSearch')
+
+
+class TestComponentIndex(unittest.TestCase):
+
+    def setUp(self):
+        _indexes.clear()
+        self.names = ['eth%d' % i for i in range(12)]
+        self.catalog = StandInCatalog(self.names)
+
+    def test_natural_name_order(self):
+        index = ComponentIndex(self.catalog, None)
+        brains = [Brain(rid) for rid in range(12)]
+        total, page = index.select(brains, 'name', start=1, limit=3)
+        self.assertEquals(total, 12)
+        self.assertEquals([self.names[b.rid] for b in page],
+                          ['eth1', 'eth2', 'eth3'])
+        total, page = index.select(brains, 'name', reverse=True, limit=2)
+        self.assertEquals([self.names[b.rid] for b in page],
+                          ['eth11', 'eth10'])
+
+    def test_only_query_results_are_returned(self):
+        index = ComponentIndex(self.catalog, None)
+        brains = [Brain(rid) for rid in (3, 7, 10)]
+        total, page = index.select(brains, 'monitored')
+        self.assertEquals(total, 3)
+        self.assertEquals([b.rid for b in page], [10, 3, 7])
+
+    def test_status_order_is_cached(self):
+        calls = []
+
+        def getStatuses(rows):
+            calls.append(len(rows))
+            return dict((rid, 'Down' if rid == 5 else 'Up') for rid in rows)
+
+        index = ComponentIndex(self.catalog, None)
+        brains = [Brain(rid) for rid in range(12)]
+        total, page = index.select(brains, 'status', limit=1,
+                                   getStatuses=getStatuses)
+        self.assertEquals([b.rid for b in page], [5])
+        index.select(brains, 'status', getStatuses=getStatuses)
+        self.assertEquals(calls, [12])
+
+    def test_rebuilt_when_components_change(self):
+        index = getComponentIndex(self.catalog)
+        self.assertTrue(getComponentIndex(self.catalog) is index)
+        componentsChanged(self.catalog)
+        # changed in this transaction, so not cached
+        changed = getComponentIndex(self.catalog)
+        self.assertFalse(changed is index)
+        self.assertFalse(getComponentIndex(self.catalog) is changed)
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(TestComponentIndex),))
+
+
+if __name__=="__main__":
+    unittest.main(defaultTest='test_suite')
@@ -18,6 +18,7 @@ from Products.Zuul.tests.base import ZuulFacadeTestCase
 from Products.Zuul.interfaces import IDeviceInfo
 from Products.Zuul.infos.device import DeviceInfo
 from Products.ZenModel.Location import manage_addLocation
+from Products.ZenModel.EventView import EventView
 from Products.Zuul.catalog.events import IndexingEvent
 
 
@@ -169,6 +170,36 @@ class DeviceFacadeTest(ZuulFacadeTestCase):
 
         zope.component.getGlobalSiteManager().unregisterHandler(_indexed)
 
+    def test_sortIpInterfacesByStatus(self):
+        """
+        IpInterface.getStatus is Unknown for ignored interfaces, which the
+        component index doesn't know about, so they are sorted on their
+        infos.
+        """
+        dev = self.dmd.Devices.createInstance('dev')
+        for name in ('eth0', 'eth1', 'eth2'):
+            dev.os.addIpInterface(name, True)
+        ignored = dev.os.interfaces.eth1
+        ignored.adminStatus = 2
+        self.assertTrue(ignored.snmpIgnore())
+        for iface in dev.os.interfaces():
+            iface.index_object()
+        # Everything is Up to ZEP, the index only knows what it monitors
+        self.facade._getComponentStatuses = lambda device, rows: dict(
+            (rid, 'Up') for rid in rows)
+        getStatus = EventView.getStatus
+        EventView.getStatus = lambda self, *args, **kwargs: 0
+        try:
+            results = self.facade.getComponents(
+                uid=dev.getPrimaryId(), meta_type='IpInterface',
+                sort='status')
+            statuses = [(info.name, info.status) for info in results]
+        finally:
+            EventView.getStatus = getStatus
+        self.assertEqual(statuses[0][0], 'eth1')
+        self.assertNotEqual(statuses[0][1], 'Up')
+        self.assertEqual(sorted(statuses[1:]), [('eth0', 'Up'), ('eth2', 'Up')])
+
 def test_suite():
     return unittest.TestSuite((unittest.makeSuite(DeviceFacadeTest),))
 
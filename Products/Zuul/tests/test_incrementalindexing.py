@@ -0,0 +1,138 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import unittest
+import transaction
+from ZODB import DB
+from persistent import Persistent
+from persistent.list import PersistentList
+from zope.interface import implements
+from zope.component import provideAdapter, getGlobalSiteManager
+from Products.ZenUtils.Search import makeCaseSensitiveFieldIndex
+from Products.ZenUtils.Search import makeCaseSensitiveKeywordIndex
+from Products.Zuul.catalog.interfaces import IIndexableWrapper
+from Products.Zuul.catalog.global_catalog import GlobalCatalog, indexingStats
+
+
+class Part(Persistent):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Thing(Persistent):
+
+    def __init__(self, id, values):
+        self.id = id
+        self.title = id
+        self.parts = PersistentList(Part(v) for v in values)
+
+    def getPhysicalPath(self):
+        return ('', 'zport', 'dmd', self.id)
+
+
+class ThingWrapper(object):
+    """
+    Counts how often each index is computed.
+    """
+    implements(IIndexableWrapper)
+
+    indexInputs = {
+        'id': ('id',),
+        'title': ('title',),
+        'partValues': ('parts.*',),
+    }
+    computed = []
+
+    def __init__(self, context):
+        self._context = context
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def title(self):
+        self.computed.append('title')
+        return self._context.title
+
+    def partValues(self):
+        self.computed.append('partValues')
+        return [p.value for p in self._context.parts]
+
+
+class TestIncrementalIndexing(unittest.TestCase):
+
+    def setUp(self):
+        provideAdapter(ThingWrapper, (Thing,), IIndexableWrapper)
+        indexingStats.reset()
+        del ThingWrapper.computed[:]
+        self.db = DB(None)
+        self.conn = self.db.open()
+        root = self.conn.root()
+        catalog = GlobalCatalog()
+        catalog.addIndex('id', makeCaseSensitiveFieldIndex('id'))
+        catalog.addIndex('title', makeCaseSensitiveFieldIndex('title'))
+        catalog.addIndex('partValues',
+                         makeCaseSensitiveKeywordIndex('partValues'))
+        catalog.addColumn('id')
+        root['catalog'] = self.catalog = catalog
+        root['thing'] = self.thing = Thing('thing', ['a', 'b'])
+        transaction.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        getGlobalSiteManager().unregisterAdapter(
+            ThingWrapper, (Thing,), IIndexableWrapper)
+
+    def catalogChanges(self):
+        del ThingWrapper.computed[:]
+        self.catalog.catalog_changes(self.thing)
+        transaction.commit()
+        return sorted(set(ThingWrapper.computed))
+
+    def search(self, **kw):
+        return [b.id for b in self.catalog.unrestrictedSearchResults(**kw)]
+
+    def test_only_changed_indexes_are_recomputed(self):
+        self.assertEquals(self.catalogChanges(), ['partValues', 'title'])
+        self.assertEquals(self.catalogChanges(), [])
+        self.thing.parts[0].value = 'c'
+        transaction.commit()
+        self.assertEquals(self.catalogChanges(), ['partValues'])
+        self.assertEquals(self.search(partValues='c'), ['thing'])
+        self.assertEquals(self.search(partValues='a'), [])
+        self.thing.title = 'renamed'
+        transaction.commit()
+        self.assertEquals(self.catalogChanges(), ['title'])
+        self.assertEquals(self.search(title='renamed'), ['thing'])
+        stats = self.catalog.getIndexingStats()
+        self.assertEquals(stats['objects'], 4)
+        self.assertEquals(stats['fullObjects'], 1)
+        self.assertEquals(stats['unchangedObjects'], 1)
+        self.assertEquals(stats['indexesSkipped'], 7)
+        self.assertEquals(stats['metadataSkipped'], 3)
+
+    def test_changes_in_this_transaction_are_recomputed(self):
+        self.catalogChanges()
+        self.thing.parts.append(Part('d'))
+        self.assertEquals(self.catalogChanges(), ['partValues'])
+        self.assertEquals(self.search(partValues='d'), ['thing'])
+        # the part was new when cataloged, so it is recomputed once more
+        self.assertEquals(self.catalogChanges(), ['partValues'])
+        self.assertEquals(self.catalogChanges(), [])
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(TestIncrementalIndexing),))
+
+
+if __name__=="__main__":
+    unittest.main(defaultTest='test_suite')
@@ -46,6 +46,42 @@ class MetricFacadeTest(BaseTestCase):
         self.assertEquals(metric[0]['metric'], "device1/test_test")
         self.assertEquals(metric[0]['aggregator'], 'avg')
 
+    def testBulkValues(self):
+        dev1 = self.dmd.Devices.createInstance('device1')
+        dev2 = self.dmd.Devices.createInstance('device2')
+        templateFac = Zuul.getFacade('template', self.dmd)
+        template = templateFac.addTemplate('test', '/zport/dmd/Devices')._object
+        templateFac.addDataSource(template.getPrimaryId(), 'test', 'SNMP')
+        dp = template.datasources()[0].datapoints()[0]
+        requests = []
+        def request(path, request, timeout=10):
+            requests.append(request)
+            names = [m['name'] for m in request['metrics']
+                     if m.get('emit') != 'false']
+            return {'results': [
+                {'metric': name, 'datapoints': [{'value': float(i)}]}
+                for i, name in enumerate(names)]}
+        self.facade._metrics_connection.request = request
+        queries = [(dev1, dp, None), (dev2, dp, None), (dev1, dp, '8,*')]
+        values = self.facade.getBulkValues(queries, batchSize=2)
+        self.assertEquals(2, len(requests))
+        self.assertEquals([0.0, 1.0, 0.0], values)
+        # the rpn expression references its own uniquely named raw metric
+        raw, expression = requests[1]['metrics']
+        self.assertEquals('false', raw['emit'])
+        self.assertEquals('rpn:%s,8,*' % raw['name'], expression['expression'])
+        # a failed batch leaves its values out, the others are still returned
+        batches = []
+        def failFirst(path, request, timeout=10):
+            batches.append(request)
+            if len(batches) == 1:
+                raise IOError('metric service is down')
+            return {'results': [{'metric': request['metrics'][-1]['name'],
+                                 'datapoints': [{'value': 3.0}]}]}
+        self.facade._metrics_connection.request = failFirst
+        values = self.facade.getBulkValues(queries, batchSize=2)
+        self.assertEquals([None, None, 3.0], values)
+
     def testRequestBuilder(self):
         metric = ["laLoadInt1_laLoadInt1"]
         dev = self.dmd.Devices.createInstance('device1')
@@ -0,0 +1,98 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import threading
+import time
+import unittest
+from Products.Zuul.severitycache import SeverityCache
+
+
+class Fetcher(object):
+    """
+    Records the uuids it is asked for and answers from a dictionary.
+    """
+
+    def __init__(self, severities, delay=0):
+        self.severities = severities
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, uuids):
+        self.calls.append(sorted(uuids))
+        time.sleep(self.delay)
+        return dict((uuid, self.severities[uuid]) for uuid in uuids
+                    if uuid in self.severities)
+
+
+class TestSeverityCache(unittest.TestCase):
+
+    def test_cached_until_expired(self):
+        cache = SeverityCache(ttl=0.2)
+        fetch = Fetcher({'a': [5, 3], 'b': [2]})
+        result = cache.get(['a', 'b', 'c'], fetch)
+        self.assertEquals(result, {'a': frozenset([3, 5]),
+                                   'b': frozenset([2]),
+                                   'c': frozenset()})
+        cache.get(['a', 'c'], fetch)
+        self.assertEquals(fetch.calls, [['a', 'b', 'c']])
+        time.sleep(0.3)
+        cache.get(['a'], fetch)
+        self.assertEquals(fetch.calls, [['a', 'b', 'c'], ['a']])
+
+    def test_invalidate(self):
+        cache = SeverityCache(ttl=60)
+        fetch = Fetcher({'a': [5]})
+        cache.get(['a'], fetch)
+        fetch.severities['a'] = [2]
+        cache.invalidate()
+        self.assertEquals(cache.get(['a'], fetch), {'a': frozenset([2])})
+        self.assertEquals(len(fetch.calls), 2)
+
+    def test_concurrent_lookups_share_a_query(self):
+        cache = SeverityCache(ttl=60)
+        fetch = Fetcher({'a': [4], 'b': [3]}, delay=0.2)
+        results = []
+
+        def lookup():
+            results.append(cache.get(['a', 'b'], fetch))
+
+        threads = [threading.Thread(target=lookup) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(fetch.calls, [['a', 'b']])
+        self.assertEquals(len(results), 5)
+        for result in results:
+            self.assertEquals(result, {'a': frozenset([4]),
+                                       'b': frozenset([3])})
+        stats = cache.stats()
+        self.assertEquals(stats['queries'], 1)
+        self.assertEquals(stats['misses'], 2)
+        self.assertEquals(stats['coalesced'], 8)
+        self.assertEquals(stats['hitRate'], 0.8)
+
+    def test_failed_query_is_not_cached(self):
+        cache = SeverityCache(ttl=60)
+
+        def fail(uuids):
+            raise IOError("ZEP is down")
+
+        self.assertRaises(IOError, cache.get, ['a'], fail)
+        fetch = Fetcher({'a': [1]})
+        self.assertEquals(cache.get(['a'], fetch), {'a': frozenset([1])})
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(TestSeverityCache),))
+
+
+if __name__=="__main__":
+    unittest.main(defaultTest='test_suite')
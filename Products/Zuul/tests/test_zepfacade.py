@@ -8,15 +8,67 @@
 ##############################################################################
 
 
+import time
+import logging
 import unittest
+from contextlib import contextmanager
+from itertools import islice
 import zope.component
 import zope.component.event
+from zenoss.protocols.protobufs.zep_pb2 import (
+    EventSummary, EventSummaryResult, STATUS_NEW
+)
 from Products.Zuul.tests.base import ZuulFacadeTestCase
 from Products.ZenUtils.guid import generate
 from Products.Zuul.interfaces import *
 from Products.Zuul import getFacade
 from Products.ZenEvents.ZenEventClasses import Unknown
 
+log = logging.getLogger('zen.testZepFacade')
+
+
+class StandInZep(object):
+    """
+    Answers saved search requests the way ZEP does, from a list of events.
+    """
+
+    def __init__(self, count, delay=0):
+        self.delay = delay
+        self.events = []
+        for i in range(count):
+            event = EventSummary(uuid='uuid%d' % i, status=STATUS_NEW,
+                                 first_seen_time=i)
+            occurrence = event.occurrence.add()
+            occurrence.event_class = '/App'
+            occurrence.actor.element_identifier = 'device%d' % (i % 10)
+            for name in ('zenoss.device.production_state', 'other'):
+                detail = occurrence.details.add()
+                detail.name = name
+                detail.value.append('1000')
+            self.events.append(event)
+        self.requests = 0
+        self.deleted = []
+
+    @contextmanager
+    def client(self):
+        yield self
+
+    def createSavedSearch(self, **kwargs):
+        return 'search'
+
+    def savedSearch(self, searchid, offset=0, limit=1000, archive=False):
+        time.sleep(self.delay)
+        self.requests += 1
+        result = EventSummaryResult(total=len(self.events), limit=limit)
+        for event in self.events[offset:offset + limit]:
+            result.events.add().CopyFrom(event)
+        if offset + limit < len(self.events):
+            result.next_offset = offset + limit
+        return None, result
+
+    def deleteSavedSearch(self, searchid, archive=False):
+        self.deleted.append(searchid)
+
 
 class TestZepFacade(ZuulFacadeTestCase):
 
@@ -46,6 +98,68 @@ class TestZepFacade(ZuulFacadeTestCase):
         # verify the msg
         self.assertTrue('is not of the class Unknown' in msg)
 
+    def _standIn(self, count, delay=0):
+        zep = StandInZep(count, delay)
+        self.zep.client = self.zep._clientPool = zep
+        return zep
+
+    def test_event_summaries_stream(self):
+        zep = self._standIn(2500)
+        events = list(self.zep.getEventSummariesStream(limit=1000))
+        self.assertEqual([e.uuid for e in events],
+                         ['uuid%d' % i for i in range(2500)])
+        self.assertEqual(zep.requests, 3)
+        self.assertEqual(zep.deleted, ['search'])
+        events = list(self.zep.getEventSummariesGenerator())
+        self.assertEqual(events[1]['occurrence'][0]['actor'],
+                         {'element_identifier': 'device1'})
+
+    def test_event_summaries_stream_fields(self):
+        self._standIn(3)
+        events = list(self.zep.getEventSummariesStream(fields=(
+            'uuid', 'occurrence.actor.element_identifier',
+            'occurrence.details.zenoss.device.production_state')))
+        self.assertEqual(events[2], {
+            'uuid': 'uuid2',
+            'occurrence': [{
+                'actor': {'element_identifier': 'device2'},
+                'details': [{'name': 'zenoss.device.production_state',
+                             'value': ['1000']}],
+            }],
+        })
+
+    def test_event_summaries_stream_stop(self):
+        zep = self._standIn(50)
+        stream = self.zep.getEventSummariesStream(limit=10, prefetch=1)
+        self.assertEqual(len(list(islice(stream, 5))), 5)
+        stream.close()
+        self.assertEqual(zep.deleted, ['search'])
+        self.assertTrue(zep.requests < 5)
+
+    def ftest_event_summaries_stream_pipelining(self):
+        """
+        Benchmark: with ZEP and the consumer both taking 10ms per page,
+        pipelined paging takes about half the time of sequential paging.
+        """
+        zep = self._standIn(20000, delay=0.01)
+
+        def consume(events):
+            start = time.time()
+            for i, event in enumerate(events):
+                if i % 100 == 0:
+                    time.sleep(0.01)
+            return time.time() - start
+
+        start = time.time()
+        for offset in range(0, 20000, 100):
+            response, content = zep.savedSearch('search', offset, 100)
+            consume(content.events)
+        sequential = time.time() - start
+        pipelined = consume(self.zep.getEventSummariesStream(limit=100))
+        log.info("200 pages: sequential %.2fs, pipelined %.2fs",
+                 sequential, pipelined)
+        self.assertTrue(pipelined < sequential * 0.75)
+
 def test_suite():
     return unittest.TestSuite((unittest.makeSuite(TestZepFacade),))
 
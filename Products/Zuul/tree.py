@@ -10,7 +10,9 @@
 
 import time
 import re
+import heapq
 import sre_constants
+from functools import cmp_to_key
 from itertools import islice
 from zope.interface import implements
 from BTrees.OOBTree import OOBTree
@@ -52,6 +54,11 @@ class TreeNode(object):
         self._object = ob
         self._parent = parent or None
         self._severity = None
+        # Nodes whose severity hasn't been loaded yet; the first one that
+        # needs its severity loads it for all of them with one query
+        if getattr(self._root, '_severityPending', None) is None:
+            self._root._severityPending = []
+        self._root._severityPending.append(self)
         # allow showing the event severity icons to be configurable
         if not hasattr(self._root, '_showSeverityIcons'):
             self._root._showSeverityIcons = self._shouldShowSeverityIcons()
@@ -111,9 +118,16 @@ class TreeNode(object):
     def _loadSeverity(self):
         if self._severity is None:
             if self.uuid:
+                nodes = [n for n in self._root._severityPending
+                         if n._severity is None and n.uuid]
+                if self not in nodes:
+                    nodes.append(self)
+                self._root._severityPending = []
                 zep = getFacade('zep')
-                sev = zep.getSeverityName(zep.getWorstSeverity([self.uuid]).get(self.uuid, 0)).lower()
-                self._severity = sev
+                severities = zep.getWorstSeverity([n.uuid for n in nodes])
+                for node in nodes:
+                    node._severity = zep.getSeverityName(
+                        severities.get(node.uuid, 0)).lower()
         return self._severity
 
     @property
@@ -227,6 +241,71 @@ class CountCache(PathIndexCache):
         return time.time() >= self.expires
 
 
+# Info attributes that have a catalog metadata column with the same value,
+# mapped to the column and a function converting the column's value.
+_infoColumns = {}
+
+
+def registerInfoColumn(attribute, column=None, convert=None):
+    """
+    Declare that the info attribute C{attribute} can be sorted and filtered
+    on using the catalog metadata column C{column} (by default the column of
+    the same name) instead of waking up every object to get its info.  The
+    column is only used by catalogs that have it.
+
+    @param convert: called with the column value to get the value of the
+                    info attribute, when they differ
+    """
+    _infoColumns[attribute] = (column or attribute, convert)
+
+
+def _toInt(value):
+    return int(value) if value else None
+
+
+def _lower(value):
+    # names of info objects are sorted on lower case, see _sortQueryResults
+    return value.lower() if value else value
+
+
+registerInfoColumn('uuid')
+registerInfoColumn('meta_type')
+registerInfoColumn('monitored', convert=bool)
+registerInfoColumn('productionState', convert=_toInt)
+# Columns of the device grid, see DEVICE_GRID_COLUMNS of the global catalog
+registerInfoColumn('collector')
+registerInfoColumn('priority')
+registerInfoColumn('snmpSysName')
+registerInfoColumn('serialNumber')
+registerInfoColumn('tagNumber')
+registerInfoColumn('hwManufacturer', convert=_lower)
+registerInfoColumn('hwModel', convert=_lower)
+registerInfoColumn('osManufacturer', convert=_lower)
+registerInfoColumn('osModel', convert=_lower)
+
+_naturalKey = cmp_to_key(natural_compare)
+
+
+def _topResults(results, getValue, reverse, limit):
+    """
+    The first limit results in natural order of getValue.  When only a
+    page is needed a heap is used instead of sorting everything, and
+    integers are compared directly since their natural order is numeric.
+    """
+    keys = [getValue(result) for result in results]
+    if not (all(type(key) in (int, long) for key in keys) or
+            all(type(key) is bool for key in keys)):
+        keys = [_naturalKey(key) for key in keys]
+    indexes = xrange(len(results))
+    if limit is None or limit >= len(results):
+        ordered = sorted(indexes, key=keys.__getitem__, reverse=reverse)
+    elif reverse:
+        ordered = heapq.nlargest(limit, indexes, key=keys.__getitem__)
+    else:
+        ordered = heapq.nsmallest(limit, indexes, key=keys.__getitem__)
+    return [results[i] for i in ordered]
+
+
 class CatalogTool(object):
     implements(ICatalogTool)
 
@@ -341,10 +420,13 @@ class CatalogTool(object):
                hashcheck=None, filterPermissions=True, globFilters=None):
 
         # if orderby is not an index then _queryCatalog, then query results
-        # will be unbrained and sorted
-        areBrains = orderby in self.catalog._catalog.indexes or orderby is None
-        queryOrderby = orderby if areBrains else None
+        # will be sorted on a metadata column, or unbrained and sorted
+        indexed = orderby in self.catalog._catalog.indexes or orderby is None
+        queryOrderby = orderby if indexed else None
+        sortColumn = None if indexed else self._getInfoColumn(orderby)
+        areBrains = indexed or sortColumn is not None
         infoFilters = {}
+        columnFilters = {}
 
         if globFilters:
             for key, value in globFilters.iteritems():
@@ -353,8 +435,9 @@ class CatalogTool(object):
                         query = And(query, MatchRegexp(key, '(?i).*%s.*' % value))
                     else:
                         query = MatchRegexp(key, '(?i).*%s.*' % value)
+                elif self._getInfoColumn(key) is not None:
+                    columnFilters[key] = value
                 else:
-                    areBrains = False
                     infoFilters[key] = value
         try:
             queryResults = self._queryCatalog(types, queryOrderby, reverse, paths, depth, query, filterPermissions)
@@ -363,31 +446,48 @@ class CatalogTool(object):
             log.error("Invalid regex in the following query: %s" % query)
             queryResults = []
 
-        # see if we need to filter by waking up every object
+        # filter on metadata first so fewer objects have to be woken up
+        if columnFilters:
+            queryResults = self._filterColumnResults(queryResults, columnFilters)
         if infoFilters:
             queryResults = self._filterQueryResults(queryResults, infoFilters)
 
         totalCount = len(queryResults)
         hash_ = totalCount
-        if areBrains or not queryResults:
-            allResults = queryResults
-        else:
-            allResults = self._sortQueryResults(queryResults, orderby, reverse)
 
         if hashcheck is not None:
             if hash_ != int(hashcheck):
                 raise StaleResultsException("Search results do not match")
 
-        # Return a slice
         start = max(start, 0)
         if limit is None:
             stop = None
         else:
             stop = start + limit
+
+        # Only the results up to the requested page are sorted
+        if indexed or not queryResults:
+            allResults = queryResults
+        elif sortColumn is not None:
+            allResults = self._sortColumnResults(queryResults, sortColumn, reverse, stop)
+        else:
+            allResults = self._sortQueryResults(queryResults, orderby, reverse, stop)
+
+        # Return a slice
         results = islice(allResults, start, stop)
 
         return SearchResults(results, totalCount, str(hash_), areBrains)
 
+    def _getInfoColumn(self, attribute):
+        """
+        The (column, convert) metadata column registered for an info
+        attribute, or None if there is none or this catalog doesn't have it.
+        """
+        infoColumn = _infoColumns.get(attribute)
+        if infoColumn is not None and \
+                infoColumn[0] in self.catalog._catalog.schema:
+            return infoColumn
+
     def update(self, obj):
         self.catalog.catalog_object(obj, idxs=())
 
@@ -404,11 +504,11 @@ class CatalogTool(object):
             return list(queryResults)
 
         #Optimizing!
-        results = { brain: [True, IInfo(brain.getObject())] for brain in queryResults }
+        results = [[brain, True, IInfo(brain.getObject())] for brain in queryResults]
         for key, value in infoFilters.iteritems():
             valRe = re.compile(".*" + unicode(value) + ".*", re.IGNORECASE)
             for result in results:
-                match, info = results[result]
+                brain, match, info = result
                 if not match:
                     continue
 
@@ -422,7 +522,7 @@ class CatalogTool(object):
                 if isinstance(testvalues, dict):
                     val = testvalues.get(key, testvalues.get('name'))
                     if not (val and valRe.match(str(val))):
-                        results[result][0] = False
+                        result[1] = False
                 else:
                     # if anyone of these values is satisfied then include the object
                     isMatch = False
@@ -433,10 +533,53 @@ class CatalogTool(object):
                             isMatch = True
                             break
                     if not isMatch:
-                        results[result][0] = False
-        return [key for key,matches in results.iteritems() if matches[0]]
+                        result[1] = False
+        # keep the catalog's order
+        return [brain for brain, match, info in results if match]
+
+    def _filterColumnResults(self, queryResults, columnFilters):
+        """
+        Like _filterQueryResults, but reads the attribute values from
+        metadata columns registered with registerInfoColumn so that no
+        objects are woken up.
+        @param queryResults list of brains
+        @param columnFilters dict: key/value pairs of filters
+        @return list of brains
+        """
+        results = list(queryResults)
+        for key, value in columnFilters.iteritems():
+            valRe = re.compile(".*" + unicode(value) + ".*", re.IGNORECASE)
+            column, convert = self._getInfoColumn(key)
+            matches = []
+            for brain in results:
+                testvalues = getattr(brain, column, None)
+                if convert is not None:
+                    testvalues = convert(testvalues)
+                if not isinstance(testvalues, (list, tuple)):
+                    testvalues = [testvalues]
+                for testVal in testvalues:
+                    if valRe.match(str(testVal)):
+                        matches.append(brain)
+                        break
+            results = matches
+        return results
+
+    def _sortColumnResults(self, queryResults, infoColumn, reverse, limit=None):
+        """
+        Sort brains on a registered metadata column, returning the first
+        limit brains.
+        """
+        column, convert = infoColumn
+
+        def getValue(brain):
+            value = getattr(brain, column, None)
+            if convert is not None:
+                value = convert(value)
+            return value
+
+        return _topResults(list(queryResults), getValue, reverse, limit)
 
-    def _sortQueryResults(self, queryResults, orderby, reverse):
+    def _sortQueryResults(self, queryResults, orderby, reverse, limit=None):
 
         # save the values during sorting in case getting the value is slow
         savedValues = {}
@@ -455,8 +598,8 @@ class CatalogTool(object):
                 savedValues[key] = value
             return value
 
-        return sorted((unbrain(brain) for brain in queryResults),
-                        key=getValue, reverse=reverse, cmp=natural_compare)
+        return _topResults([unbrain(brain) for brain in queryResults],
+                           getValue, reverse, limit)
 
 
 class PermissionedCatalogTool(CatalogTool):